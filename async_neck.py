@@ -0,0 +1,382 @@
+"""
+Controlador asyncio del cuello ESP32 sin hilos.
+
+AsyncESP32NeckController ofrece los mismos comandos que ESP32NeckController
+pero trabaja sobre el descriptor del puerto en modo no bloqueante, registrado
+en el event loop con add_reader/add_writer:
+
+    async with AsyncESP32NeckController("/dev/esp32") as neck:
+        done = await neck.move_angles([45, 0, 0])   # Espera a que se envíe
+        await done                                   # Espera a que termine
+
+        async for event in neck.events():
+            print(event.type, event.raw)
+
+Los envíos aplican backpressure: si hay más de `high_water` bytes sin
+escribir en el puerto, la corrutina espera a que el buffer se vacíe.
+"""
+import asyncio
+import errno
+import os
+import termios
+import time
+import tty
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Union
+
+import neck_config
+import neck_protocol
+from epj_neck import Command, NeckEvent, _CommandBuilder, _ReplyTracker, parse_line
+from neck_config import NeckConfig
+from neck_telemetry import DEFAULT_CAPACITY, TelemetryRing
+
+
+class AsyncESP32NeckController(_CommandBuilder):
+    """
+    Versión asyncio de ESP32NeckController.
+
+    Args:
+        port: Puerto serie (ej: '/dev/ttyUSB0' o el pty de neck_emulator.py)
+        baudrate: Velocidad de comunicación (default: 115200)
+        binary: Usar el protocolo binario compacto (default: False)
+        setpoint_buffer_size: Capacidad del buffer de setpoints del firmware
+            (por defecto communication.setpoint_buffer_size)
+        reset_delay: Espera tras abrir el puerto mientras el ESP32 se reinicia
+        high_water: Bytes pendientes a partir de los que send() espera
+        event_queue_size: Eventos que se guardan por suscriptor de events()
+        config: Configuración del firmware (por defecto neck_config.load_config_or_default())
+        num_servos: Servos del firmware, si no son los de config
+    """
+
+    def __init__(self, port: str, baudrate: int = 115200, binary: bool = False,
+                 setpoint_buffer_size: Optional[int] = None, reset_delay: float = 2.0,
+                 high_water: int = 4096, event_queue_size: int = 1024,
+                 config: Optional[NeckConfig] = None, num_servos: Optional[int] = None):
+        self.config = config or neck_config.load_config_or_default()
+        if setpoint_buffer_size is None:
+            setpoint_buffer_size = self.config.communication.setpoint_buffer_size
+        self.port = port
+        self.baudrate = baudrate
+        self.binary = binary
+        self.setpoint_buffer_size = setpoint_buffer_size
+        self.reset_delay = reset_delay
+        self.high_water = high_water
+        self.event_queue_size = event_queue_size
+        self.num_servos = num_servos or self.config.num_servos
+        self.is_connected = False
+        self._fd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tracker: Optional[_ReplyTracker] = None
+        self._rx = bytearray()
+        self._tx = bytearray()
+        self._drained: Optional[asyncio.Event] = None
+        self._subscribers: List[asyncio.Queue] = []
+        self.telemetry: Optional[TelemetryRing] = None
+
+    # ---------- Conexión ----------
+    def _configure_port(self, fd: int):
+        speed = getattr(termios, f"B{self.baudrate}", None)
+        if speed is None:
+            raise ValueError(f"Baudrate no soportado: {self.baudrate}")
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+    async def connect(self) -> bool:
+        """
+        Abre el puerto en modo no bloqueante y empieza a leer eventos.
+
+        Returns:
+            bool: True si la conexión fue exitosa
+        """
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+            self._configure_port(self._fd)
+        except (OSError, ValueError, termios.error) as e:
+            print(f"❌ Error conectando a {self.port}: {e}")
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            return False
+
+        await asyncio.sleep(self.reset_delay)  # Esperar a que el ESP32 se reinicie
+        termios.tcflush(self._fd, termios.TCIFLUSH)  # Descartar mensajes de arranque
+        self._tracker = _ReplyTracker(self._loop.create_future)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._loop.add_reader(self._fd, self._on_readable)
+        self.is_connected = True
+        print(f"✅ Conectado a {self.port} a {self.baudrate} baudios")
+        return True
+
+    async def disconnect(self):
+        """Vacía lo pendiente de enviar y cierra el puerto."""
+        if self._fd is None:
+            return
+        if self._tx:
+            try:
+                await asyncio.wait_for(self.drain(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+        self._close(ConnectionError("Conexión cerrada"))
+        print("🔌 Desconectado")
+
+    def _close(self, exc: Exception):
+        if self._fd is None:
+            return
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self.is_connected = False
+        self._tx.clear()
+        self._drained.set()
+        self._tracker.fail_all(exc)
+        for queue in self._subscribers:
+            self._publish(queue, None)
+
+    # ---------- Lectura ----------
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            print(f"❌ Error leyendo de {self.port}: {e}")
+            self._close(ConnectionError(str(e)))
+            return
+        if not data:
+            self._close(ConnectionError("El puerto se cerró"))
+            return
+        self._rx.extend(data)
+        while True:
+            item = neck_protocol.split_serial(self._rx)
+            if item is None:
+                break
+            if neck_protocol.is_telemetry(item):
+                if self.telemetry is None:
+                    self.telemetry = self._telemetry_ring(None, DEFAULT_CAPACITY)
+                self.telemetry.append(item)
+                continue
+            line = item.decode("utf-8", errors="replace").strip()
+            if line:
+                self._dispatch(parse_line(line))
+
+    def _dispatch(self, event: NeckEvent):
+        self._tracker.handle(event)
+        for queue in self._subscribers:
+            self._publish(queue, event)
+
+    @staticmethod
+    def _publish(queue: asyncio.Queue, event: Optional[NeckEvent]):
+        if queue.full():
+            queue.get_nowait()  # Un suscriptor lento pierde los eventos más antiguos
+        queue.put_nowait(event)
+
+    async def events(self) -> AsyncIterator[NeckEvent]:
+        """
+        Iterador asíncrono con todos los eventos del firmware desde la llamada.
+
+        Termina cuando se cierra la conexión.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.event_queue_size)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.remove(queue)
+
+    # ---------- Escritura ----------
+    def _on_writable(self):
+        self._write_pending()
+
+    def _write_pending(self):
+        try:
+            written = os.write(self._fd, self._tx)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                written = 0
+            else:
+                print(f"❌ Error escribiendo en {self.port}: {e}")
+                self._close(ConnectionError(str(e)))
+                return
+        del self._tx[:written]
+        if self._tx:
+            self._drained.clear()
+            self._loop.add_writer(self._fd, self._on_writable)
+        else:
+            self._loop.remove_writer(self._fd)
+            self._drained.set()
+
+    async def drain(self):
+        """Espera a que todo lo enviado se haya escrito en el puerto."""
+        await self._drained.wait()
+
+    def _enqueue(self, command: Command) -> bool:
+        if not self.is_connected:
+            print("❌ No hay conexión establecida")
+            return False
+        data = command if isinstance(command, bytes) else f"{command}\n".encode()
+        pending = bool(self._tx)
+        self._tx.extend(data)
+        if not pending:
+            self._write_pending()
+        return self.is_connected
+
+    async def _send_command(self, command: Command) -> bool:
+        """Encola el comando y espera si el buffer de salida supera high_water."""
+        if not self._enqueue(command):
+            return False
+        if len(self._tx) > self.high_water:
+            await self.drain()
+        return self.is_connected
+
+    async def _request(self, command: Command, register) -> Optional[asyncio.Future]:
+        if not self.is_connected:
+            print("❌ No hay conexión establecida")
+            return None
+        # Registrar antes de escribir: la respuesta puede llegar en la misma vuelta del loop
+        future = register()
+        if not await self._send_command(command):
+            self._tracker.discard(future)
+            return None
+        return future
+
+    # ---------- Comandos ----------
+    async def set_pwm(self, pwm_values: List[Union[int, float]]) -> bool:
+        """Establece valores PWM directos para todos los servos."""
+        command = self._build_set_pwm(pwm_values)
+        return command is not None and await self._send_command(command)
+
+    async def move_angles(self, angles: List[Union[int, float]]) -> Optional[asyncio.Future]:
+        """
+        Mueve los servos por ángulos relativos.
+
+        Returns:
+            Future que se resuelve con {servo: ángulo final} al terminar, o
+            None si el comando no se pudo enviar
+        """
+        built = self._build_move_angles(angles)
+        if built is None:
+            return None
+        command, sent_angles = built
+        return await self._request(command, lambda: self._tracker.expect_move(sent_angles))
+
+    async def queue_setpoint(self, t_ms: int, angles: Sequence[Union[int, float]]) -> bool:
+        """Encola un setpoint absoluto en el buffer del firmware."""
+        command = self._build_queue_setpoint(t_ms, angles)
+        return command is not None and await self._send_command(command)
+
+    async def stream_trajectory(self, trajectory: Iterable[Sequence[Union[int, float]]],
+                                rate_hz: float) -> Optional[asyncio.Future]:
+        """
+        Envía una trayectoria de ángulos absolutos manteniendo lleno el buffer
+        del firmware (ver ESP32NeckController.stream_trajectory).
+
+        Returns:
+            Future que se resuelve cuando el firmware termina de reproducirla
+        """
+        if rate_hz <= 0:
+            print(f"❌ Frecuencia inválida: {rate_hz}")
+            return None
+
+        period = 1.0 / rate_hz
+        lead = max(self.setpoint_buffer_size - 2, 1) * period
+        points = iter(trajectory)
+        angles = next(points, None)
+        if angles is None:
+            return None
+        done = None
+        start = time.monotonic()
+        k = 0
+        while angles is not None:
+            next_angles = next(points, None)
+            delay = start + k * period - lead - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if next_angles is None:
+                done = self._tracker.expect_stream()
+            if not await self.queue_setpoint(round(k * period * 1000), angles):
+                if done is not None:
+                    self._tracker.discard(done)
+                return None
+            angles = next_angles
+            k += 1
+        return done
+
+    async def upload_gesture(self, slot: int, period_ms: int,
+                             offsets: Sequence[Sequence[float]]) -> Optional[asyncio.Future]:
+        """Carga un gesto en la tabla del firmware (ver ESP32NeckController.upload_gesture)."""
+        commands = self._build_gesture_upload(slot, period_ms, offsets)
+        if commands is None:
+            return None
+        if not self.is_connected:
+            print("❌ No hay conexión establecida")
+            return None
+        future = self._tracker.expect_gesture()
+        for command in commands:
+            if not await self._send_command(command):
+                self._tracker.discard(future)
+                return None
+        return future
+
+    async def play_gesture(self, slot: int) -> Optional[asyncio.Future]:
+        """Future que se resuelve cuando termina el gesto (ver ESP32NeckController.play_gesture)."""
+        return await self._request(self._build_play_gesture(slot), self._tracker.expect_stream)
+
+    async def test_servo(self, servo_num: int, angle: Union[int, float]) -> bool:
+        """Prueba un servo individual con un ángulo específico."""
+        command = self._build_test_servo(servo_num, angle)
+        return command is not None and await self._send_command(command)
+
+    async def calibrate_speed(self, factor: float) -> bool:
+        """Ajusta el factor de calibración de velocidad."""
+        command = self._build_calibrate_speed(factor)
+        return command is not None and await self._send_command(command)
+
+    async def get_positions(self) -> Optional[asyncio.Future]:
+        """Future con la lista de ángulos actuales."""
+        return await self._request(self._build_positions(), self._tracker.expect_positions)
+
+    async def reset_positions(self) -> bool:
+        """Reinicia todas las posiciones a 0°."""
+        return await self._send_command(self._build_reset())
+
+    async def toggle_debug(self) -> bool:
+        """Alterna la salida del firmware entre códigos cortos y texto."""
+        return await self._send_command("D")
+
+    async def set_verbose(self, verbose: bool) -> bool:
+        """Fija el nivel de registro del firmware (ver ESP32NeckController.set_verbose)."""
+        return await self._send_command(self._build_log_level(verbose))
+
+    async def set_telemetry(self, hz: int, capacity: int = DEFAULT_CAPACITY) -> Optional[TelemetryRing]:
+        """Activa la telemetría periódica (ver ESP32NeckController.set_telemetry)."""
+        command = self._build_telemetry(hz)
+        if command is None:
+            return None
+        self.telemetry = self._telemetry_ring(self.telemetry, capacity)
+        if not await self._send_command(command):
+            return None
+        return self.telemetry
+
+    async def stop_all(self) -> bool:
+        """Detiene inmediatamente todos los servos."""
+        return await self._send_command(self._build_stop())
+
+    async def get_system_info(self) -> Optional[asyncio.Future]:
+        """Future con la información del sistema como dict."""
+        return await self._request("I", self._tracker.expect_info)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del camino de control serie contra neck_emulator.py.
+
+Mide, para cada combinación de número de servos, baudrate y protocolo:
+- Latencia de ida y vuelta (percentiles) comando → respuesta y comando → fin de movimiento
+- Comandos por segundo sostenidos para set_pwm y move_angles
+- Bytes en el cable por setpoint
+
+El resultado es JSON para poder comparar ejecuciones:
+
+    python bench_neck.py -o actual.json
+    python bench_neck.py --compare actual.json
+
+Con --fanout mide NeckPool contra N emuladores: tiempo de conexión en
+paralelo y desfase entre cuellos de un mismo broadcast.
+
+    python bench_neck.py --fanout 2 4 8
+
+Con --udp mide el canal UDP de setpoints contra UdpEmulator con varias
+condiciones de red simuladas: fracción entregada, descartes por llegar
+atrasados y latencia de ida y vuelta.
+
+    python bench_neck.py --udp --rate 100
+"""
+import contextlib
+import json
+import platform
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from epj_neck import ESP32NeckController, EventType, NeckEvent
+from neck_emulator import PtyEmulator, UdpEmulator
+from neck_pool import NeckPool
+from neck_transport import UdpTransport
+
+DEFAULT_SERVO_COUNTS = [3, 6]
+DEFAULT_BAUDRATES = [115200, 921600]
+DEFAULT_MOVE_COUNT = 50  # Cada A genera un ▶️ por servo: más lento que set_pwm
+# (pérdida, retardo s, jitter s) de la red simulada en --udp
+UDP_CONDITIONS = [(0.0, 0.0, 0.0), (0.01, 0.002, 0.002), (0.05, 0.005, 0.010)]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Resumen de una lista de latencias en segundos, devuelto en ms."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        'p50_ms': round(rank(50), 3),
+        'p90_ms': round(rank(90), 3),
+        'p99_ms': round(rank(99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+class _EventCounter:
+    """Listener que cuenta eventos de un tipo y avisa al llegar a un objetivo."""
+
+    def __init__(self, event_type: EventType):
+        self.event_type = event_type
+        self.count = 0
+        self.first_at: Optional[float] = None
+        self.target = 0
+        self.reached = threading.Event()
+
+    def __call__(self, event: NeckEvent):
+        if event.type != self.event_type:
+            return
+        self.count += 1
+        if self.first_at is None:
+            self.first_at = event.timestamp
+        if self.target and self.count >= self.target:
+            self.reached.set()
+
+    def expect(self, target: int):
+        self.count = 0
+        self.first_at = None
+        self.target = target
+        self.reached.clear()
+
+
+def bench_roundtrip(controller: ESP32NeckController, samples: int) -> Dict[str, Dict[str, float]]:
+    """Latencias P → 📍, A → primer ▶️ y A → fin de movimiento."""
+    ack = []
+    for _ in range(samples):
+        start = time.monotonic()
+        controller.get_positions().result(timeout=5)
+        ack.append(time.monotonic() - start)
+
+    started = _EventCounter(EventType.MOVE_STARTED)
+    controller.add_listener(started)
+    move_ack, move_done = [], []
+    angles = [1.0] * controller.num_servos
+    try:
+        for _ in range(samples):
+            started.expect(1)
+            start = time.monotonic()
+            controller.move_angles(angles).result(timeout=5)
+            move_done.append(time.monotonic() - start)
+            if started.first_at is not None:
+                move_ack.append(started.first_at - start)
+    finally:
+        controller.remove_listener(started)
+
+    return {
+        'positions_ack': percentiles(ack),
+        'move_ack': percentiles(move_ack),
+        'move_complete': percentiles(move_done),
+    }
+
+
+def bench_throughput(controller: ESP32NeckController, emulator: PtyEmulator,
+                     command: str, count: int) -> Dict[str, float]:
+    """
+    Envía `count` comandos seguidos y espera a que el firmware los procese todos.
+
+    Args:
+        command: 'set_pwm' o 'move_angles'
+    """
+    n = controller.num_servos
+    if command == 'set_pwm':
+        counter = _EventCounter(EventType.PWM_SET)
+        send = lambda k: controller.set_pwm([95 + k % 2] * n)
+        per_command = 1
+    else:
+        # Cada A replanifica los servos en marcha: un ▶️ por servo y comando
+        counter = _EventCounter(EventType.MOVE_STARTED)
+        send = lambda k: controller.move_angles([1.0 if k % 2 else -1.0] * n)
+        per_command = n
+
+    controller.add_listener(counter)
+    counter.expect(count * per_command)
+    bytes_before = emulator.bytes_in
+    replies_before = emulator.bytes_out
+    start = time.monotonic()
+    try:
+        for k in range(count):
+            send(k)
+        completed = counter.reached.wait(timeout=30 + count * 0.1)
+        elapsed = time.monotonic() - start
+        reply_bytes = emulator.bytes_out - replies_before
+    finally:
+        controller.remove_listener(counter)
+    controller.stop_all()
+    return {
+        'commands': count,
+        'completed': counter.count // per_command,
+        'timed_out': not completed,
+        'seconds': round(elapsed, 4),
+        'commands_per_s': round(counter.count / per_command / elapsed, 2) if elapsed else 0.0,
+        'wire_bytes_per_command': round((emulator.bytes_in - bytes_before) / count, 2),
+        'reply_bytes_per_command': round(reply_bytes / count, 2),
+    }
+
+
+def run_case(num_servos: int, baudrate: int, binary: bool, samples: int, count: int,
+             move_count: int = DEFAULT_MOVE_COUNT) -> Dict:
+    """
+    Ejecuta todas las medidas para una combinación de parámetros.
+
+    Args:
+        count: Comandos de la medida de throughput de set_pwm
+        move_count: Comandos de la de move_angles (cada A lleva un ▶️ por servo)
+    """
+    with PtyEmulator(baudrate=baudrate, num_servos=num_servos) as emulator:
+        controller = ESP32NeckController(emulator.port, baudrate=baudrate, binary=binary, reset_delay=0.1,
+                                         num_servos=num_servos)
+        with controller:
+            return {
+                'num_servos': num_servos,
+                'baudrate': baudrate,
+                'protocol': 'binary' if binary else 'ascii',
+                'latency': bench_roundtrip(controller, samples),
+                'set_pwm': bench_throughput(controller, emulator, 'set_pwm', count),
+                'move_angles': bench_throughput(controller, emulator, 'move_angles', move_count),
+            }
+
+
+def run_suite(servo_counts: List[int], baudrates: List[int], samples: int, count: int,
+              move_count: int = DEFAULT_MOVE_COUNT) -> Dict:
+    results = []
+    for num_servos in servo_counts:
+        for baudrate in baudrates:
+            for binary in (False, True):
+                print(f"⏱️  servos={num_servos} baud={baudrate} {'binary' if binary else 'ascii'}",
+                      file=sys.stderr)
+                results.append(run_case(num_servos, baudrate, binary, samples, count, move_count))
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'count': count,
+        'move_count': move_count,
+        'results': results,
+    }
+
+
+def bench_fanout(num_necks: int, samples: int, baudrate: int = 115200,
+                 reset_delay: float = 0.5) -> Dict:
+    """
+    Conecta un NeckPool a `num_necks` emuladores y mide el desfase de broadcast.
+
+    - host_skew: entre la escritura del primer y del último cuello
+    - rx_skew: entre la llegada del comando al primer y al último emulador
+      (incluye el reparto del planificador entre los hilos de los emuladores)
+    """
+    emulators = [PtyEmulator(baudrate=baudrate) for _ in range(num_necks)]
+    try:
+        ports = [emulator.start() for emulator in emulators]
+        pool = NeckPool.from_ports(ports, baudrate=baudrate, reset_delay=reset_delay)
+        start = time.monotonic()
+        pool.connect()
+        connect_seconds = time.monotonic() - start
+
+        counters = {name: _EventCounter(EventType.PWM_SET) for name in pool}
+        for name, counter in counters.items():
+            pool[name].add_listener(counter)
+        host_skew, rx_skew = [], []
+        for k in range(samples):
+            for counter in counters.values():
+                counter.expect(1)
+            pool.broadcast("set_pwm", [95 + k % 2] * 3)
+            host_skew.append(pool.last_skew)
+            if all(c.reached.wait(timeout=5) for c in counters.values()):
+                arrivals = [emulator.last_rx_at for emulator in emulators]
+                rx_skew.append(max(arrivals) - min(arrivals))
+        pool.disconnect()
+    finally:
+        for emulator in emulators:
+            emulator.stop()
+
+    return {
+        'necks': num_necks,
+        'baudrate': baudrate,
+        'connect_seconds': round(connect_seconds, 3),
+        'serial_connect_seconds': round(num_necks * reset_delay, 3),
+        'host_skew': percentiles(host_skew),
+        'rx_skew': percentiles(rx_skew),
+    }
+
+
+def run_fanout_suite(neck_counts: List[int], samples: int) -> Dict:
+    results = []
+    for num_necks in neck_counts:
+        print(f"⏱️  necks={num_necks}", file=sys.stderr)
+        results.append(bench_fanout(num_necks, samples))
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'fanout': results,
+    }
+
+
+def bench_udp(rate_hz: float, seconds: float, loss: float, delay: float, jitter: float,
+              binary: bool = True) -> Dict:
+    """
+    Envía setpoints por UDP a ritmo fijo, como un seguimiento de cabeza, y
+    cuenta qué llega al firmware emulado.
+    """
+    with UdpEmulator(loss=loss, delay=delay, jitter=jitter, seed=0) as emulator:
+        transport = UdpTransport(emulator.url, request_ack=True)
+        controller = ESP32NeckController(emulator.url, binary=binary, transport=transport)
+        controller.connect()
+        sent_before, applied_before = transport.sent, emulator.applied
+        transport.rtt_samples.clear()
+        count = int(rate_hz * seconds)
+        period = 1.0 / rate_hz
+        start = time.perf_counter()
+        for k in range(count):
+            phase = k / rate_hz
+            angles = [20 * ((phase * (i + 1)) % 1.0 - 0.5) for i in range(controller.num_servos)]
+            controller.queue_setpoint(int(phase * 1000), angles)
+            delay_s = start + (k + 1) * period - time.perf_counter()
+            if delay_s > 0:
+                time.sleep(delay_s)
+        elapsed = time.perf_counter() - start
+        time.sleep(delay + jitter + 0.1)  # Que lleguen los últimos
+        sent = transport.sent - sent_before
+        applied = emulator.applied - applied_before
+        rtt = list(transport.rtt_samples)
+        stale = emulator.stale
+        controller.disconnect()
+
+    return {
+        'rate_hz': rate_hz,
+        'loss': loss,
+        'delay_ms': delay * 1000,
+        'jitter_ms': jitter * 1000,
+        'protocol': 'binary' if binary else 'ascii',
+        'sent': sent,
+        'send_rate_hz': round(sent / elapsed, 1),
+        'delivered_ratio': round(applied / sent, 4) if sent else 0.0,
+        'stale_dropped': stale,
+        'rtt': percentiles(rtt),
+    }
+
+
+def run_udp_suite(rate_hz: float, seconds: float) -> Dict:
+    results = []
+    for loss, delay, jitter in UDP_CONDITIONS:
+        print(f"⏱️  udp loss={loss:.0%} delay={delay * 1000:.0f}ms jitter={jitter * 1000:.0f}ms",
+              file=sys.stderr)
+        results.append(bench_udp(rate_hz, seconds, loss, delay, jitter))
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'udp': results,
+    }
+
+
+def _case_key(case: Dict) -> str:
+    return f"servos={case['num_servos']} baud={case['baudrate']} {case['protocol']}"
+
+
+def _flatten(case: Dict) -> Dict[str, float]:
+    """Aplana un caso a métricas escalares 'seccion.metrica'."""
+    flat = {}
+    for name, data in case['latency'].items():
+        for metric, value in data.items():
+            flat[f"{name}.{metric}"] = value
+    for name in ('set_pwm', 'move_angles'):
+        flat[f"{name}.commands_per_s"] = case[name]['commands_per_s']
+        flat[f"{name}.wire_bytes_per_command"] = case[name]['wire_bytes_per_command']
+        if 'reply_bytes_per_command' in case[name]:
+            flat[f"{name}.reply_bytes_per_command"] = case[name]['reply_bytes_per_command']
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """
+    Compara dos ejecuciones y devuelve las líneas con cambios mayores que `threshold`.
+
+    Para latencias y bytes, subir es peor; para commands_per_s, bajar es peor.
+    """
+    base_cases = {_case_key(c): _flatten(c) for c in baseline['results']}
+    lines = []
+    for case in current['results']:
+        key = _case_key(case)
+        if key not in base_cases:
+            continue
+        for metric, value in _flatten(case).items():
+            old = base_cases[key].get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            if abs(change) < threshold:
+                continue
+            worse = change < 0 if metric.endswith('commands_per_s') else change > 0
+            mark = "🔺" if worse else "🟢"
+            lines.append(f"{mark} {key} {metric}: {old} → {value} ({change:+.0%})")
+    return lines
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks del camino de control serie")
+    parser.add_argument("--servos", type=int, nargs='+', default=DEFAULT_SERVO_COUNTS,
+                        help="Números de servos a probar")
+    parser.add_argument("--baudrates", type=int, nargs='+', default=DEFAULT_BAUDRATES,
+                        help="Baudrates a probar")
+    parser.add_argument("--samples", type=int, default=50,
+                        help="Muestras por medida de latencia")
+    parser.add_argument("--count", type=int, default=500,
+                        help="Comandos por medida de throughput de set_pwm")
+    parser.add_argument("--move-count", type=int, default=DEFAULT_MOVE_COUNT,
+                        help="Comandos por medida de throughput de move_angles")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Guardar el resultado JSON en un archivo")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--fanout", type=int, nargs='+', default=None,
+                        help="Medir el broadcast de NeckPool con estos números de cuellos")
+    parser.add_argument("--udp", action="store_true",
+                        help="Medir el canal UDP de setpoints con varias condiciones de red")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="Con --udp: setpoints por segundo")
+    parser.add_argument("--seconds", type=float, default=3,
+                        help="Con --udp: duración de cada medida")
+    args = parser.parse_args()
+
+    # Los mensajes del controlador van a stderr para no mezclarse con el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.udp:
+            report = run_udp_suite(args.rate, args.seconds)
+        elif args.fanout:
+            report = run_fanout_suite(args.fanout, args.samples)
+        else:
+            report = run_suite(args.servos, args.baudrates, args.samples, args.count, args.move_count)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"✅ Resultados guardados en: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare and not (args.fanout or args.udp):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changes = compare(report, baseline)
+        for line in changes:
+            print(line, file=sys.stderr)
+        if any(line.startswith("🔺") for line in changes):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
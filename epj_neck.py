@@ -1,10 +1,783 @@
+import re
+import numpy as np
 import serial
 import time
 import threading
-from typing import List, Optional, Union
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import motion_planner
+import neck_config
+import neck_protocol
+import servo_tables
+from neck_config import NeckConfig
+from neck_gestures import GestureLibrary
+from neck_ik_table import IKTable
+from neck_kinematics import NeckKinematics
+from neck_metrics import NeckMetrics
+from neck_session import SessionRecorder
+from neck_telemetry import DEFAULT_CAPACITY, TelemetryRing
+from neck_transport import SerialTransport, Transport, make_transport
+
+MIN_MOVE_THRESHOLD = 0.5  # Igual que MIN_MOVE_THRESHOLD en el firmware
+
+
+class EventType(Enum):
+    """Tipos de evento que emite el firmware por el puerto serie."""
+    MOVE_STARTED = "move_started"
+    MOVE_FINISHED = "move_finished"
+    ALL_STOPPED = "all_stopped"
+    PWM_SET = "pwm_set"
+    POSITIONS_RESET = "positions_reset"
+    POSITION_REPORT = "position_report"
+    SYSTEM_INFO = "system_info"
+    STREAM_FINISHED = "stream_finished"
+    GESTURE_LOADED = "gesture_loaded"
+    GESTURE_STARTED = "gesture_started"
+    ERROR = "error"
+    MESSAGE = "message"
+
+
+@dataclass
+class NeckEvent:
+    """Línea del firmware ya interpretada."""
+    type: EventType
+    raw: str
+    servo: Optional[int] = None          # Índice 0-based del servo
+    angle: Optional[float] = None
+    duration_ms: Optional[int] = None
+    values: Optional[List[float]] = None  # También [hueco, puntos, periodo] de un gesto cargado
+    info: Optional[Dict[str, str]] = None
+    timestamp: float = field(default_factory=time.monotonic)
+    firmware_ms: Optional[int] = None    # millis() del firmware (debug.show_timing)
+
+
+class MoveInterrupted(Exception):
+    """El movimiento se cortó (stop, u otro objetivo para el mismo servo) antes de completarse."""
+
+
+_RE_MOVE_STARTED = re.compile(r"Servo (\d+): \S+ (-?\d+(?:\.\d+)?)° \((\d+) ms\)")
+_RE_MOVE_FINISHED = re.compile(r"Servo (\d+) detenido en (-?\d+(?:\.\d+)?)°")
+_RE_FLOAT = re.compile(r"-?\d+(?:\.\d+)?")
+_RE_INFO = re.compile(r"(\w+)=(\S+)")
+_RE_TIMING = re.compile(r"@(\d+) ")
+# Códigos cortos del firmware con debug.verbose_output: false (LOG_TERSE)
+_RE_CODE_MOVE_STARTED = re.compile(r"m (\d+) (-?\d+(?:\.\d+)?) (\d+)$")
+_RE_CODE_MOVE_FINISHED = re.compile(r"d (\d+) (-?\d+(?:\.\d+)?)$")
+_RE_CODE_GESTURE_LOADED = re.compile(r"k (\d+) (\d+) (\d+)$")
+_RE_CODE_GESTURE_STARTED = re.compile(r"g (\d+) (\d+)$")
+_RE_GESTURE_LOADED = re.compile(r"Gesto (\d+) cargado: (\d+) puntos cada (\d+) ms")
+_RE_GESTURE_STARTED = re.compile(r"Gesto (\d+): (\d+) ms")
+_CODE_EVENTS = {
+    's': EventType.ALL_STOPPED,
+    'r': EventType.POSITIONS_RESET,
+    'f': EventType.STREAM_FINISHED,
+}
+
+
+def parse_line(line: str) -> NeckEvent:
+    """
+    Convierte una línea de salida del firmware en un NeckEvent.
+
+    Entiende los dos niveles de registro del firmware: el texto con emojis
+    y los códigos cortos ("m 1 90.0 266" equivale a "▶️  Servo 1: ↻ 90.0°
+    (266 ms)"), con o sin el prefijo "@<millis> " de debug.show_timing.
+
+    Args:
+        line: Línea recibida, sin el salto de línea final
+
+    Returns:
+        NeckEvent: Evento tipado (MESSAGE si la línea no se reconoce); raw
+        es la línea sin el prefijo de tiempo
+    """
+    match = _RE_TIMING.match(line)
+    if match:
+        event = _parse_event(line[match.end():])
+        event.firmware_ms = int(match.group(1))
+        return event
+    return _parse_event(line)
+
+
+def _parse_code(line: str) -> Optional[NeckEvent]:
+    """Evento de un código corto (LOG_TERSE), o None si la línea no lo es."""
+    code = line[0]
+    if code == 'm':
+        match = _RE_CODE_MOVE_STARTED.match(line)
+        if match:
+            return NeckEvent(EventType.MOVE_STARTED, line, servo=int(match.group(1)) - 1,
+                             angle=float(match.group(2)), duration_ms=int(match.group(3)))
+    elif code == 'd':
+        match = _RE_CODE_MOVE_FINISHED.match(line)
+        if match:
+            return NeckEvent(EventType.MOVE_FINISHED, line, servo=int(match.group(1)) - 1,
+                             angle=float(match.group(2)))
+    elif code == 'v':
+        return NeckEvent(EventType.PWM_SET, line, values=[float(v) for v in _RE_FLOAT.findall(line)])
+    elif code == 'p':
+        return NeckEvent(EventType.POSITION_REPORT, line, values=[float(v) for v in _RE_FLOAT.findall(line)])
+    elif code == 'i':
+        return NeckEvent(EventType.SYSTEM_INFO, line, info=dict(_RE_INFO.findall(line)))
+    elif code == 'k':
+        match = _RE_CODE_GESTURE_LOADED.match(line)
+        if match:
+            return NeckEvent(EventType.GESTURE_LOADED, line, values=[float(v) for v in match.groups()])
+    elif code == 'g':
+        match = _RE_CODE_GESTURE_STARTED.match(line)
+        if match:
+            return NeckEvent(EventType.GESTURE_STARTED, line, values=[float(match.group(1))],
+                             duration_ms=int(match.group(2)))
+    elif code in _CODE_EVENTS and len(line) == 1:
+        return NeckEvent(_CODE_EVENTS[code], line)
+    return None
+
+
+def _parse_event(line: str) -> NeckEvent:
+    if len(line) == 1 or line[1:2] == " ":
+        event = _parse_code(line)
+        if event is not None:
+            return event
+    if line.startswith("▶️"):
+        match = _RE_MOVE_STARTED.search(line)
+        if match:
+            return NeckEvent(EventType.MOVE_STARTED, line, servo=int(match.group(1)) - 1,
+                             angle=float(match.group(2)), duration_ms=int(match.group(3)))
+    elif line.startswith("✅ Servo"):
+        match = _RE_MOVE_FINISHED.search(line)
+        if match:
+            return NeckEvent(EventType.MOVE_FINISHED, line, servo=int(match.group(1)) - 1,
+                             angle=float(match.group(2)))
+    elif line.startswith("✅ PWM directo:"):
+        values = [float(v) for v in _RE_FLOAT.findall(line.split(":", 1)[1])]
+        return NeckEvent(EventType.PWM_SET, line, values=values)
+    elif line.startswith("⏹️"):
+        return NeckEvent(EventType.ALL_STOPPED, line)
+    elif line.startswith("🔄"):
+        return NeckEvent(EventType.POSITIONS_RESET, line)
+    elif line.startswith("📍"):
+        values = [float(v) for v in _RE_FLOAT.findall(line.split(":", 1)[1])]
+        return NeckEvent(EventType.POSITION_REPORT, line, values=values)
+    elif line.startswith("ℹ️"):
+        return NeckEvent(EventType.SYSTEM_INFO, line, info=dict(_RE_INFO.findall(line)))
+    elif line.startswith("🏁"):
+        return NeckEvent(EventType.STREAM_FINISHED, line)
+    elif line.startswith("🎭"):
+        match = _RE_GESTURE_LOADED.search(line)
+        if match:
+            return NeckEvent(EventType.GESTURE_LOADED, line, values=[float(v) for v in match.groups()])
+        match = _RE_GESTURE_STARTED.search(line)
+        if match:
+            return NeckEvent(EventType.GESTURE_STARTED, line, values=[float(match.group(1))],
+                             duration_ms=int(match.group(2)))
+    elif line.startswith("❌") or line.startswith("❓"):
+        return NeckEvent(EventType.ERROR, line)
+    return NeckEvent(EventType.MESSAGE, line)
+
+
+class _PendingMove:
+    """Movimiento enviado con 'A' que espera sus líneas de inicio y fin."""
+
+    def __init__(self, future: Future, expected: set):
+        self.future = future
+        self.expected = expected
+        self.started = set()
+        self.finished: Dict[int, float] = {}
+
+
+class _ReplyTracker:
+    """
+    Empareja los eventos del firmware con las peticiones pendientes.
+
+    El firmware responde en orden, así que cada tipo de petición se guarda en
+    una cola FIFO y el primer evento que encaja resuelve la más antigua.
+    """
+
+    def __init__(self, future_factory: Callable[[], Future] = Future):
+        self._future_factory = future_factory
+        self._moves: Deque[_PendingMove] = deque()
+        self._positions: Deque[Future] = deque()
+        self._info: Deque[Future] = deque()
+        self._streams: Deque[Future] = deque()
+        self._gestures: Deque[Future] = deque()
+
+    def expect_move(self, angles: List[float]) -> Future:
+        future = self._future_factory()
+        expected = {i for i, angle in enumerate(angles) if abs(angle) >= MIN_MOVE_THRESHOLD}
+        if expected:
+            self._moves.append(_PendingMove(future, expected))
+        else:
+            future.set_result({})
+        return future
+
+    def expect_positions(self) -> Future:
+        future = self._future_factory()
+        self._positions.append(future)
+        return future
+
+    def expect_info(self) -> Future:
+        future = self._future_factory()
+        self._info.append(future)
+        return future
+
+    def expect_stream(self) -> Future:
+        future = self._future_factory()
+        self._streams.append(future)
+        return future
+
+    def expect_gesture(self) -> Future:
+        future = self._future_factory()
+        self._gestures.append(future)
+        return future
+
+    def discard(self, future: Future):
+        """Olvida una petición cuyo comando no llegó a enviarse."""
+        self._moves = deque(m for m in self._moves if m.future is not future)
+        for queue in (self._positions, self._info, self._streams, self._gestures):
+            if future in queue:
+                queue.remove(future)
+
+    def handle(self, event: NeckEvent):
+        if event.type == EventType.MOVE_STARTED:
+            for move in list(self._moves):
+                if event.servo in move.expected and event.servo not in move.started:
+                    move.started.add(event.servo)
+                    break
+                if event.servo in move.started and event.servo not in move.finished:
+                    # El firmware ha cambiado el objetivo de este servo: el
+                    # movimiento anterior ya no terminará con su propio ✅
+                    self._moves.remove(move)
+                    _fail(move.future, MoveInterrupted(f"Movimiento reemplazado: {move.finished}"))
+        elif event.type == EventType.MOVE_FINISHED:
+            for move in self._moves:
+                if event.servo in move.started and event.servo not in move.finished:
+                    move.finished[event.servo] = event.angle
+                    if len(move.finished) == len(move.expected):
+                        self._moves.remove(move)
+                        _resolve(move.future, move.finished)
+                    break
+        elif event.type == EventType.ALL_STOPPED:
+            # El stop corta los movimientos que ya arrancaron; los que aún no
+            # han recibido su '▶️' se enviaron después del stop.
+            interrupted = [m for m in self._moves if m.started]
+            for move in interrupted:
+                self._moves.remove(move)
+                _fail(move.future, MoveInterrupted(f"Movimiento interrumpido: {move.finished}"))
+        elif event.type == EventType.POSITION_REPORT and self._positions:
+            _resolve(self._positions.popleft(), event.values)
+        elif event.type == EventType.SYSTEM_INFO and self._info:
+            _resolve(self._info.popleft(), event.info)
+        elif event.type == EventType.STREAM_FINISHED and self._streams:
+            _resolve(self._streams.popleft(), True)
+        elif event.type == EventType.GESTURE_LOADED and self._gestures:
+            _resolve(self._gestures.popleft(), event.values)
+        elif event.type == EventType.ERROR and event.raw[:3] in ("❌ K", "❌ W") and self._gestures:
+            _fail(self._gestures.popleft(), RuntimeError(event.raw))
+        elif event.type == EventType.ERROR and event.raw.startswith("❌ G") and self._streams:
+            # El G rechazado es la última reproducción pedida
+            _fail(self._streams.pop(), RuntimeError(event.raw))
+        elif event.type == EventType.ERROR and event.raw.startswith("❌ A"):
+            for move in self._moves:
+                if not move.started:
+                    self._moves.remove(move)
+                    _fail(move.future, RuntimeError(event.raw))
+                    break
+
+    def pending_count(self) -> int:
+        """Número de peticiones esperando respuesta."""
+        return (len(self._moves) + len(self._positions) + len(self._info) + len(self._streams)
+                + len(self._gestures))
+
+    def fail_all(self, exc: Exception):
+        """Falla todas las peticiones pendientes (p.ej. al desconectar)."""
+        for move in self._moves:
+            _fail(move.future, exc)
+        for future in list(self._positions) + list(self._info) + list(self._streams) + list(self._gestures):
+            _fail(future, exc)
+        self._moves.clear()
+        self._positions.clear()
+        self._info.clear()
+        self._streams.clear()
+        self._gestures.clear()
+
+
+# STREAM_IDLE_MS del firmware, en segundos
+STREAM_IDLE = 0.04
+
+
+class NeckStateModel:
+    """
+    Estado de los servos tal como lo ve el firmware, estimado en el host.
+
+    Reproduce currentAngle/targetAngle/moving/stopAt y los perfiles con
+    rampas del firmware (motion_planner.py, con las mismas tablas por servo de
+    servo_tables.py) a partir de los comandos enviados, y se corrige con las
+    líneas que llegan (▶️ trae la duración real, ✅ el ángulo final, 📍 las
+    posiciones). Los movimientos con V no tienen ángulo asociado y no se
+    siguen, igual que en el firmware.
+
+    Args:
+        num_servos: Número de servos
+        ms_per_deg: MS_PER_DEG del firmware, uno por servo (o uno para
+            todos); None hasta conocerlo (con I)
+        ramp_ms: RAMP_MS del firmware, uno por servo (o uno para todos);
+            lo actualiza I
+        calibration_factor: calibrationFactor del firmware
+        setpoint_buffer_size: Capacidad del buffer de setpoints del firmware
+        clock: Reloj monótono en segundos, el mismo que NeckEvent.timestamp
+        tables: Tablas del firmware (servo_tables.ServoTables); con ellas
+            las duraciones son exactas aunque haya velocity_table, sin ellas
+            se supone velocidad constante con ms_per_deg. Su
+            calibration_factor sustituye al argumento
+
+    Con report_completions, el modelo genera las líneas ✅ y 🏁 que el
+    firmware imprimiría al terminar (completed_events), para transportes que
+    no las reciben.
+    """
+
+    def __init__(self, num_servos: int, ms_per_deg: Union[float, Sequence[float], None] = None,
+                 calibration_factor: float = 1.2, setpoint_buffer_size: int = 32,
+                 clock: Callable[[], float] = time.monotonic,
+                 tables: Optional[servo_tables.ServoTables] = None,
+                 ramp_ms: Union[float, Sequence[float]] = servo_tables.DEFAULT_RAMP_MS):
+        self.num_servos = num_servos
+        self.tables = tables
+        self.ms_per_deg: Optional[List[float]] = None
+        self._duration_luts: List[Tuple[float, ...]] = []
+        if ms_per_deg is not None:
+            self.set_ms_per_deg(ms_per_deg)
+        self.ramp_ms = self._per_servo(tables.ramp_ms if tables is not None else ramp_ms, "ramp_ms")
+        self.calibration_factor = tables.calibration_factor if tables is not None else calibration_factor
+        self.setpoint_buffer_size = setpoint_buffer_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.current_angle = [0.0] * num_servos
+        self.target_angle = [0.0] * num_servos
+        self.moving = [False] * num_servos
+        self.start_at = [0.0] * num_servos
+        self.stop_at = [0.0] * num_servos
+        self.profiles = [motion_planner.Profile() for _ in range(num_servos)]
+        self._requested = [0.0] * num_servos  # Ángulo de la última A, para reconocer su ▶️
+        self.report_move = [False] * num_servos
+        self.report_completions = False
+        self._completed: Deque[NeckEvent] = deque()
+        self._setpoints: Deque[Tuple[float, List[float]]] = deque()
+        self._stream_base = 0.0
+        self._stream_last_t = 0.0
+        self._streaming = False
+        self._expected_stops = 0  # '⏹️' ya aplicados al enviar S
+        self._expected_resets = 0  # '🔄' ya aplicados al enviar R
+
+    # ---------- Modelo del firmware ----------
+    def _per_servo(self, value: Union[float, Sequence[float]], name: str) -> List[float]:
+        values = [value] * self.num_servos if isinstance(value, (int, float)) else list(value)
+        if len(values) != self.num_servos:
+            raise ValueError(f"Se esperaban {self.num_servos} valores de {name}, llegaron {len(values)}")
+        return [float(v) for v in values]
+
+    def set_ms_per_deg(self, ms_per_deg: Union[float, Sequence[float]]):
+        """Fija el MS_PER_DEG de cada servo (un número vale para todos)."""
+        self.ms_per_deg = self._per_servo(ms_per_deg, "ms_per_deg")
+        self._duration_luts = [servo_tables.duration_lut(v) for v in self.ms_per_deg]
+
+    @property
+    def timing_known(self) -> bool:
+        """True si el modelo sabe calcular duraciones (tablas o ms_per_deg)."""
+        return self.tables is not None or self.ms_per_deg is not None
+
+    def duration(self, angle_deg: float, idx: int = 0) -> Optional[float]:
+        """Duración de un movimiento en segundos, como la calcula moveDuration()."""
+        if not self.timing_known:
+            return None
+        return self._duration_ms(angle_deg, idx) / 1000
+
+    def _duration_ms(self, angle_deg: float, idx: int) -> int:
+        if self.tables is not None:
+            return self.tables.duration_ms(idx, angle_deg, self.calibration_factor)
+        return servo_tables.lookup_duration_ms(self._duration_luts[idx], self.ms_per_deg[idx],
+                                               angle_deg, self.calibration_factor)
+
+    def _state_at(self, idx: int, at: float) -> Tuple[float, float]:
+        """(ángulo, velocidad en °/ms) del servo en el instante at."""
+        if not self.moving[idx] or at <= self.start_at[idx]:
+            return self.current_angle[idx], 0.0
+        x, v = self.profiles[idx].state((at - self.start_at[idx]) * 1000)
+        return self.current_angle[idx] + x, v
+
+    def _plan(self, idx: int, target: float, at: float, report: bool):
+        """planMove(): perfil desde el estado del servo en at hasta target."""
+        position, velocity = self._state_at(idx, at)
+        if self.tables is not None:
+            profile = motion_planner.plan_move(self.tables, idx, position, velocity, target,
+                                               self.calibration_factor)
+        else:
+            ms_per_deg = self.ms_per_deg[idx]
+            accel = motion_planner.acceleration(ms_per_deg, self.calibration_factor, self.ramp_ms[idx])
+            cruise = lambda dist: motion_planner.cruise_speed(lambda angle: self._duration_ms(angle, idx), dist)
+            profile = motion_planner.plan(position, velocity, target, accel, cruise)
+        self._set_profile(idx, profile, position, target, at, report)
+
+    def _set_profile(self, idx: int, profile: motion_planner.Profile, position: float, target: float,
+                     at: float, report: bool):
+        self.profiles[idx] = profile
+        self.current_angle[idx] = position
+        self.target_angle[idx] = target
+        self.moving[idx] = True
+        self.report_move[idx] = report
+        self.start_at[idx] = at
+        self.stop_at[idx] = at + profile.duration_ms / 1000
+
+    def _start_move(self, idx: int, angle_deg: float, at: float, report: bool = True):
+        if abs(angle_deg) < MIN_MOVE_THRESHOLD or not self.timing_known:
+            return  # Sin tiempos conocidos, el ▶️ del firmware lo registrará
+        origin = self.target_angle[idx] if self.moving[idx] else self.current_angle[idx]
+        self._requested[idx] = angle_deg
+        self._plan(idx, origin + angle_deg, at, report)
+
+    def _stop_all(self, at: float):
+        for i in range(self.num_servos):
+            if self.moving[i]:
+                self.current_angle[i] = self.target_angle[i] = self._state_at(i, at)[0]
+                self.moving[i] = False
+
+    def _stream_to(self, idx: int, angle: float, at: float):
+        origin = self.target_angle[idx] if self.moving[idx] else self.current_angle[idx]
+        if abs(angle - origin) < MIN_MOVE_THRESHOLD or not self.timing_known:
+            return
+        self._plan(idx, angle, at, report=False)
+
+    def _complete(self, line: str, at: float):
+        if self.report_completions:
+            event = parse_line(line)
+            event.timestamp = at
+            self._completed.append(event)
+
+    def _advance(self, now: float):
+        """Aplica, en orden, las paradas y setpoints que el firmware ya ha ejecutado."""
+        while True:
+            stops = [(self.stop_at[i], i) for i in range(self.num_servos) if self.moving[i]]
+            next_stop = min(stops) if stops else None
+            next_setpoint = self._stream_base + self._setpoints[0][0] if self._setpoints else None
+            if next_setpoint is not None and next_setpoint <= now and \
+                    (next_stop is None or next_setpoint < next_stop[0]):
+                self._stream_last_t, angles = self._setpoints.popleft()
+                for i in range(self.num_servos):
+                    self._stream_to(i, angles[i], next_setpoint)
+            elif next_stop is not None and next_stop[0] <= now:
+                at, i = next_stop
+                self.moving[i] = False
+                self.current_angle[i] = self.target_angle[i]
+                if self.report_move[i]:
+                    self._complete(f"✅ Servo {i + 1} detenido en {self.current_angle[i]:.1f}°", at)
+            else:
+                break
+        finished_at = self._stream_base + self._stream_last_t + STREAM_IDLE
+        if self._streaming and not self._setpoints and now >= finished_at:
+            self._streaming = False
+            self._complete("🏁 Trayectoria completada", finished_at)
+
+    # ---------- Comandos enviados por el host ----------
+    def command_move(self, angles: Sequence[float], at: float):
+        """moveAngles(): cada servo enlaza con su movimiento en curso."""
+        with self._lock:
+            self._advance(at)
+            for i, angle in enumerate(angles):
+                self._start_move(i, angle, at)
+
+    def command_setpoint(self, t_ms: int, angles: Sequence[float], at: float):
+        with self._lock:
+            self._advance(at)
+            if len(self._setpoints) == self.setpoint_buffer_size:
+                return  # El firmware lo rechaza con "❌ Buffer de setpoints lleno"
+            if not self._streaming:
+                self._stream_base = at - t_ms / 1000
+                self._streaming = True
+            self._setpoints.append((t_ms / 1000, list(angles)))
+
+    def command_gesture(self, period_ms: int, offsets: Sequence[Sequence[float]], at: float):
+        """playGesture(): los puntos del gesto como setpoints desde la posición en at."""
+        with self._lock:
+            self._advance(at)
+            self._setpoints.clear()
+            origin = [self.target_angle[i] if self.moving[i] else self.current_angle[i]
+                      for i in range(self.num_servos)]
+            self._stream_base = at
+            self._stream_last_t = 0.0
+            self._streaming = True
+            for k, row in enumerate(offsets):
+                self._setpoints.append((k * period_ms / 1000, [origin[i] + row[i] for i in range(self.num_servos)]))
+
+    def command_stop(self, at: float):
+        with self._lock:
+            self._advance(at)
+            self._setpoints.clear()
+            self._streaming = False
+            self._stop_all(at)
+            self._expected_stops += 1
+
+    def command_reset(self, at: float):
+        with self._lock:
+            self._advance(at)
+            self._reset(at)
+            self._expected_resets += 1
+
+    def _reset(self, at: float):
+        """La posición en at pasa a ser 0; los servos en marcha siguen su perfil."""
+        for i in range(self.num_servos):
+            offset = self._state_at(i, at)[0]
+            self.current_angle[i] -= offset
+            self.target_angle[i] -= offset
+
+    # ---------- Correcciones desde el firmware ----------
+    def handle(self, event: NeckEvent):
+        """Corrige el modelo con una línea del firmware."""
+        with self._lock:
+            i = event.servo
+            if event.type == EventType.MOVE_STARTED:
+                duration = event.duration_ms / 1000
+                if self.moving[i] and abs(self._requested[i] - event.angle) < 0.05:
+                    # Movimiento previsto: la duración del firmware manda
+                    self.stop_at[i] = self.start_at[i] + duration
+                else:
+                    # Movimiento que no originó este host (web, T, ...)
+                    self._advance(event.timestamp)
+                    origin = self.target_angle[i] if self.moving[i] else self.current_angle[i]
+                    self._requested[i] = event.angle
+                    if self.timing_known:
+                        self._plan(i, origin + event.angle, event.timestamp, True)
+                    else:
+                        # Sin tablas, velocidad constante durante lo que anuncia el firmware
+                        ms = max(event.duration_ms, 1)
+                        position = self._state_at(i, event.timestamp)[0]
+                        profile = motion_planner.Profile(
+                            (origin + event.angle - position) / ms,
+                            [(float(ms), 0.0)] + [(0.0, 0.0)] * (motion_planner.MAX_SEGMENTS - 1))
+                        self._set_profile(i, profile, position, origin + event.angle, event.timestamp, True)
+                    self.stop_at[i] = event.timestamp + duration
+            elif event.type == EventType.MOVE_FINISHED:
+                self._advance(event.timestamp)
+                self.moving[i] = False
+                # La línea trae 1 decimal; conservar el valor interno si coincide
+                if abs(self.target_angle[i] - event.angle) > 0.05:
+                    self.target_angle[i] = event.angle
+                self.current_angle[i] = self.target_angle[i]
+            elif event.type == EventType.ALL_STOPPED:
+                if self._expected_stops:
+                    self._expected_stops -= 1  # Stop de un comando de este host, ya aplicado
+                else:
+                    self._advance(event.timestamp)
+                    self._stop_all(event.timestamp)
+            elif event.type == EventType.POSITIONS_RESET:
+                if self._expected_resets:
+                    self._expected_resets -= 1  # Reset de un comando de este host, ya aplicado
+                else:
+                    self._advance(event.timestamp)
+                    self._reset(event.timestamp)
+            elif event.type == EventType.POSITION_REPORT and event.values:
+                for i, value in enumerate(event.values[:self.num_servos]):
+                    if not self.moving[i] and abs(self.current_angle[i] - value) > 0.05:
+                        self.current_angle[i] = self.target_angle[i] = value
+            elif event.type == EventType.SYSTEM_INFO and event.info:
+                try:
+                    if 'ms_per_deg' in event.info:
+                        values = [float(v) for v in event.info['ms_per_deg'].split(',')]
+                        self.set_ms_per_deg(values[0] if len(values) == 1 else values)
+                    if 'ramp_ms' in event.info and self.tables is None:
+                        values = [float(v) for v in event.info['ramp_ms'].split(',')]
+                        self.ramp_ms = self._per_servo(values[0] if len(values) == 1 else values, "ramp_ms")
+                    if 'calibration' in event.info:
+                        self.calibration_factor = float(event.info['calibration'])
+                except ValueError:
+                    pass
+            elif event.type == EventType.STREAM_FINISHED:
+                self._advance(event.timestamp)
+                self._setpoints.clear()
+                self._streaming = False
+
+    # ---------- Consultas ----------
+    def completed_events(self, now: Optional[float] = None) -> List[NeckEvent]:
+        """
+        Eventos ✅/🏁 que el firmware ya habrá impreso y el transporte no
+        trae (sólo con report_completions), en orden y una sola vez.
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._advance(now)
+            events = list(self._completed)
+            self._completed.clear()
+            return events
+
+    def estimated_positions(self, now: Optional[float] = None) -> List[float]:
+        """
+        Ángulo estimado de cada servo, interpolando los que están en marcha.
+
+        Args:
+            now: Instante de la estimación (por defecto, ahora)
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._advance(now)
+            return [self._state_at(i, now)[0] for i in range(self.num_servos)]
+
+    def is_moving(self, servo: Optional[int] = None, now: Optional[float] = None) -> bool:
+        """
+        True si algún servo (o el servo dado, 0-based) está en marcha o
+        tiene un movimiento o setpoint pendiente.
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._advance(now)
+            if servo is not None:
+                return self.moving[servo] or bool(self._setpoints)
+            return any(self.moving) or bool(self._setpoints)
+
+
+def _resolve(future: Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _fail(future: Future, exc: Exception):
+    if not future.done():
+        future.set_exception(exc)
+
+
+def _command_label(command: Union[str, bytes]) -> str:
+    """Tipo de comando para las métricas: 'A', 'V', ... tanto en ASCII como en binario."""
+    if isinstance(command, bytes):
+        if command[:1] != bytes((neck_protocol.FRAME_SYNC,)):
+            # Comando ASCII ya codificado (send_raw, sesiones grabadas)
+            return command.decode("ascii", errors="replace").strip().split(" ", 1)[0]
+        return neck_protocol.OPCODE_COMMANDS.get(command[1], "?") if len(command) > 1 else "?"
+    return command.split(" ", 1)[0]
+
+
+Command = Union[str, bytes]
+
+
+class _CommandBuilder:
+    """
+    Validación y codificación de comandos, compartida por el controlador
+    síncrono y AsyncESP32NeckController. Usa self.num_servos y self.binary.
+    Cada método imprime el error y devuelve None si los argumentos no valen.
+    """
+    num_servos: int
+    binary: bool
+
+    def _build_set_pwm(self, pwm_values: Sequence[Union[int, float]]) -> Optional[Command]:
+        if len(pwm_values) != self.num_servos:
+            print(f"❌ Se esperaban {self.num_servos} valores PWM, se recibieron {len(pwm_values)}")
+            return None
+
+        # Validar rango PWM
+        for i, pwm in enumerate(pwm_values):
+            if not (0 <= pwm <= 180):
+                print(f"❌ PWM fuera de rango para servo {i + 1}: {pwm} (debe estar entre 0-180)")
+                return None
+
+        if self.binary:
+            return neck_protocol.encode_set_pwm(pwm_values)
+
+        pwm_str = " ".join(map(str, pwm_values))
+        return f"V {pwm_str}"
 
+    def _build_move_angles(self, angles: Sequence[Union[int, float]]) -> Optional[Tuple[Command, List[float]]]:
+        """Devuelve el comando y los ángulos tal como los recibirá el firmware."""
+        if len(angles) != self.num_servos:
+            print(f"❌ Se esperaban {self.num_servos} ángulos, se recibieron {len(angles)}")
+            return None
+
+        if self.binary:
+            try:
+                command = neck_protocol.encode_move_angles(angles)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return None
+            return command, self._sent_angles(angles)
+
+        angles_str = " ".join(map(str, angles))
+        return f"A {angles_str}", list(angles)
+
+    def _sent_angles(self, angles: Sequence[Union[int, float]]) -> List[float]:
+        """Ángulos tal como los recibe el firmware (en binario, redondeados a la resolución del protocolo)."""
+        if not self.binary:
+            return list(angles)
+        scale = neck_protocol.ANGLE_SCALE
+        return [round(a * scale) / scale for a in angles]
+
+    def _build_queue_setpoint(self, t_ms: int, angles: Sequence[Union[int, float]]) -> Optional[Command]:
+        if len(angles) != self.num_servos:
+            print(f"❌ Se esperaban {self.num_servos} ángulos, se recibieron {len(angles)}")
+            return None
+
+        if self.binary:
+            try:
+                return neck_protocol.encode_queue_setpoint(t_ms, angles)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return None
+
+        angles_str = " ".join(map(str, angles))
+        return f"Q {t_ms} {angles_str}"
+
+    def _build_test_servo(self, servo_num: int, angle: Union[int, float]) -> Optional[Command]:
+        if not (1 <= servo_num <= self.num_servos):
+            print(f"❌ Servo inválido: {servo_num} (debe estar entre 1-{self.num_servos})")
+            return None
+        return f"T {servo_num} {angle}"
 
-class ESP32NeckController:
+    def _build_calibrate_speed(self, factor: float) -> Optional[Command]:
+        if not (0.1 <= factor <= 5.0):
+            print(f"❌ Factor de calibración fuera de rango: {factor} (debe estar entre 0.1-5.0)")
+            return None
+        return f"C {factor}"
+
+    def _build_telemetry(self, hz: int) -> Optional[Command]:
+        if not (0 <= hz <= neck_protocol.TELEMETRY_MAX_HZ) or hz != int(hz):
+            print(f"❌ Frecuencia de telemetría inválida: {hz} (debe ser un entero entre 0-"
+                  f"{neck_protocol.TELEMETRY_MAX_HZ})")
+            return None
+        return f"M {int(hz)}"
+
+    def _telemetry_ring(self, ring: Optional[TelemetryRing], capacity: int) -> TelemetryRing:
+        """El buffer de telemetría actual, o uno nuevo si no hay o cambia la capacidad."""
+        if ring is None or ring.capacity != capacity or ring.num_servos != self.num_servos:
+            ring = TelemetryRing(self.num_servos, capacity)
+        return ring
+
+    def _build_gesture_upload(self, slot: int, period_ms: int,
+                              offsets: Sequence[Sequence[float]]) -> Optional[List[Command]]:
+        """K y un W por punto; los desplazamientos viajan con 0.1° de resolución."""
+        if slot < 0 or period_ms < 1 or not offsets:
+            print(f"❌ Gesto inválido: hueco {slot}, periodo {period_ms} ms, {len(offsets)} puntos")
+            return None
+        commands = [f"K {slot} {int(period_ms)} {len(offsets)}"]
+        for k, row in enumerate(offsets):
+            if len(row) != self.num_servos:
+                print(f"❌ Se esperaban {self.num_servos} desplazamientos, se recibieron {len(row)}")
+                return None
+            commands.append(f"W {slot} {k} " + " ".join(f"{a:.1f}" for a in row))
+        return commands
+
+    def _build_play_gesture(self, slot: int) -> Command:
+        return f"G {slot}"
+
+    def _build_log_level(self, verbose: bool) -> Command:
+        return f"D {1 if verbose else 0}"
+
+    def _build_positions(self) -> Command:
+        return neck_protocol.encode_positions() if self.binary else "P"
+
+    def _build_reset(self) -> Command:
+        return neck_protocol.encode_reset() if self.binary else "R"
+
+    def _build_stop(self) -> Command:
+        return neck_protocol.encode_stop() if self.binary else "S"
+
+
+class ESP32NeckController(_CommandBuilder):
     """
     Wrapper de Python para controlar el sistema de servos del cuello ESP32.
 
@@ -15,78 +788,338 @@ class ESP32NeckController:
     - C: Calibración de velocidad
     - P: Consultar posiciones actuales
     - R: Reset de posiciones
-    - D: Toggle modo debug
+    - D: Alterna los eventos entre códigos cortos y texto (D 0 / D 1 lo fija)
     - S: Stop inmediato
     - I: Info del sistema
+    - Q: Encolar setpoint de trayectoria
+    - M: Telemetría periódica (tramas OP_TELEMETRY en self.telemetry)
+    - K/W: Cargar un gesto en la tabla del firmware (ver neck_gestures.py)
+    - G: Reproducir un gesto cargado
+
+    Un hilo lector interpreta todo lo que envía el firmware (ver parse_line).
+    move_angles, get_positions y get_system_info devuelven un Future que se
+    resuelve cuando llega la respuesta correspondiente.
+
+    Con binary=True, V/A/S/R/P se envían como tramas de neck_protocol.py
+    (el firmware debe generarse con communication.binary_protocol: true).
+
+    El controlador mantiene una réplica del estado de los servos
+    (NeckStateModel): estimated_positions() e is_moving() no generan tráfico.
     """
 
-    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1.0):
+    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1.0,
+                 binary: bool = False, setpoint_buffer_size: Optional[int] = None,
+                 reset_delay: float = 2.0, metrics: Optional[NeckMetrics] = None,
+                 ms_per_deg: Union[float, Sequence[float], None] = None, calibration_factor: float = 1.2,
+                 transport: Optional[Transport] = None,
+                 tables: Optional[servo_tables.ServoTables] = None,
+                 recorder: Optional[SessionRecorder] = None, config: Optional[NeckConfig] = None,
+                 num_servos: Optional[int] = None):
         """
-        Inicializa la conexión serie con el ESP32.
+        Inicializa la conexión con el ESP32.
 
         Args:
-            port: Puerto serie (ej: 'COM3', '/dev/ttyUSB0')
+            port: Puerto serie (ej: 'COM3', '/dev/ttyUSB0') o URL del
+                firmware por WiFi (ej: 'http://10.0.0.1')
             baudrate: Velocidad de comunicación (default: 115200)
             timeout: Timeout para operaciones serie (default: 1.0s)
+            binary: Usar el protocolo binario compacto (default: False)
+            setpoint_buffer_size: Capacidad del buffer de setpoints del
+                firmware (por defecto communication.setpoint_buffer_size)
+            reset_delay: Espera tras abrir el puerto mientras el ESP32 se
+                reinicia (default: 2.0s; 0 para neck_emulator.py)
+            metrics: Registro de métricas (neck_metrics.py); None las desactiva
+            ms_per_deg: MS_PER_DEG del firmware para estimar posiciones, uno
+                por servo (o uno para todos); con None se pide con I al conectar
+            calibration_factor: calibrationFactor inicial del firmware
+            transport: Transporte a usar (neck_transport.py); por defecto se
+                elige según `port`
+            tables: Tablas del firmware flasheado
+                (ServoTables.from_config); hacen falta para estimar bien las
+                posiciones con velocity_table
+            recorder: Log donde grabar todo lo enviado y recibido
+                (neck_session.py); None no graba
+            config: Configuración del firmware (por defecto
+                neck_config.load_config_or_default()); de ella salen el número de servos
+                y el tamaño de los buffers
+            num_servos: Servos del firmware, si no son los de config (p. ej.
+                PtyEmulator con num_servos)
         """
+        self.config = config or neck_config.load_config_or_default()
+        if setpoint_buffer_size is None:
+            setpoint_buffer_size = self.config.communication.setpoint_buffer_size
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
-        self.serial_connection = None
+        self.binary = binary
+        self.setpoint_buffer_size = setpoint_buffer_size
+        self.reset_delay = reset_delay
+        self.metrics = metrics
+        self.recorder = recorder
+        self._move_started_at: Dict[int, float] = {}
+        self.transport = transport or make_transport(port, baudrate, timeout)
+        if binary and not self.transport.binary_safe:
+            raise ValueError(f"{self.transport!r} no admite el protocolo binario")
         self.is_connected = False
-        self.num_servos = 3  # Según tu configuración
+        self.num_servos = num_servos or self.config.num_servos
+        self.state = NeckStateModel(self.num_servos, ms_per_deg, calibration_factor, setpoint_buffer_size,
+                                    tables=tables)
+        # Sin canal de vuelta continuo, el final de los movimientos sale del modelo
+        self.state.report_completions = not self.transport.streams_events
+        self._write_lock = threading.RLock()
+        self._tracker = _ReplyTracker()
+        self._listeners: List[Callable[[NeckEvent], None]] = []
+        self._reader_thread: Optional[threading.Thread] = None
+        self._stop_reader = threading.Event()
+        self._defer_flush = False
+        # Tramas de telemetría recibidas (ver set_telemetry); se crea con la primera
+        self.telemetry: Optional[TelemetryRing] = None
+        # Gestos cargados en el firmware: hueco -> (periodo en ms, desplazamientos)
+        self._gestures: Dict[int, Tuple[int, List[List[float]]]] = {}
 
     def connect(self) -> bool:
         """
-        Establece la conexión serie con el ESP32.
+        Establece la conexión con el ESP32.
 
         Returns:
             bool: True si la conexión fue exitosa
         """
         try:
-            self.serial_connection = serial.Serial(
-                port=self.port,
-                baudrate=self.baudrate,
-                timeout=self.timeout
-            )
-            time.sleep(2)  # Esperar a que el ESP32 se reinicie
+            self.transport.open()
+            if self.transport.resets_on_open:
+                time.sleep(self.reset_delay)  # Esperar a que el ESP32 se reinicie
+            self.transport.reset_input_buffer()  # Descartar mensajes de arranque
+            if self.recorder is not None:
+                self.recorder.start_session(port=self.port, baudrate=self.baudrate, binary=self.binary,
+                                            num_servos=self.num_servos)
             self.is_connected = True
-            print(f"✅ Conectado a {self.port} a {self.baudrate} baudios")
+            self._start_reader()
+            if isinstance(self.transport, SerialTransport):
+                print(f"✅ Conectado a {self.port} a {self.baudrate} baudios")
+            else:
+                print(f"✅ Conectado a {self.port}")
+            if not self.state.timing_known:
+                self._sync_state_timing()
             return True
         except Exception as e:
             print(f"❌ Error conectando a {self.port}: {e}")
             self.is_connected = False
             return False
 
+    def _sync_state_timing(self):
+        """Pide I para que el modelo de estado conozca MS_PER_DEG y la calibración."""
+        info = self.get_system_info()
+        try:
+            info.result(timeout=self.timeout)
+        except Exception:
+            print("⚠️  Sin respuesta a I: las posiciones estimadas sólo se actualizarán con los eventos")
+
     def disconnect(self):
-        """Cierra la conexión serie."""
-        if self.serial_connection and self.serial_connection.is_open:
-            self.serial_connection.close()
+        """Cierra la conexión."""
+        self._stop_reader.set()
+        if self.transport.is_open:
+            self.transport.close()
             self.is_connected = False
             print("🔌 Desconectado")
+        if self._reader_thread and self._reader_thread is not threading.current_thread():
+            self._reader_thread.join(timeout=self.timeout + 1)
+        self._reader_thread = None
+        self._tracker.fail_all(ConnectionError("Conexión cerrada"))
 
-    def _send_command(self, command: str) -> bool:
+    def add_listener(self, callback: Callable[[NeckEvent], None]):
+        """
+        Registra una función que recibirá cada evento del firmware.
+
+        El callback se ejecuta en el hilo lector, así que debe ser rápido.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[NeckEvent], None]):
+        """Elimina un callback registrado con add_listener."""
+        self._listeners.remove(callback)
+
+    def _start_reader(self):
+        self._stop_reader.clear()
+        self._reader_thread = threading.Thread(target=self._reader_loop,
+                                               name=f"neck-reader-{self.port}", daemon=True)
+        self._reader_thread.start()
+
+    @property
+    def serial_connection(self) -> Optional[serial.Serial]:
+        """Puerto pyserial subyacente (None si el transporte no es serie)."""
+        return getattr(self.transport, 'connection', None)
+
+    def _reader_loop(self):
+        """Lee líneas del ESP32 y las despacha como eventos hasta desconectar."""
+        synthesize = not self.transport.streams_events
+        while not self._stop_reader.is_set():
+            if synthesize:
+                self._dispatch_completions()
+            try:
+                line = self.transport.readline()
+            except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+                if not self._stop_reader.is_set():
+                    print(f"❌ Error leyendo de {self.port}: {e}")
+                    self.is_connected = False
+                    self._tracker.fail_all(ConnectionError(str(e)))
+                break
+            if line and self.recorder is not None:
+                self.recorder.record_rx(line)
+            if neck_protocol.is_telemetry(line):
+                self._record_telemetry(line)
+                continue
+            text = line.decode("utf-8", errors="replace").strip()
+            if text:
+                event = parse_line(text)
+                if self.metrics is not None:
+                    self._record_event(event, len(line))
+                self._dispatch(event)
+
+    def _record_event(self, event: NeckEvent, size: int):
+        """Métricas de lo recibido, incluida la duración ▶️ → ✅ en el firmware."""
+        kind = event.type.value
+        self.metrics.inc("events_total", event=kind)
+        self.metrics.inc("bytes_in_total", size, event=kind)
+        if event.type == EventType.MOVE_STARTED:
+            self._move_started_at[event.servo] = event.timestamp
+        elif event.type == EventType.MOVE_FINISHED:
+            started = self._move_started_at.pop(event.servo, None)
+            if started is not None:
+                self.metrics.observe("firmware_move_seconds", event.timestamp - started,
+                                     servo=str(event.servo + 1))
+        elif event.type == EventType.ALL_STOPPED:
+            self._move_started_at.clear()
+
+    def _record_telemetry(self, frame: bytes):
+        """Guarda una trama OP_TELEMETRY en self.telemetry sin pasar por parse_line."""
+        if self.telemetry is None:
+            # El firmware puede arrancar con telemetría (communication.telemetry_hz)
+            self.telemetry = self._telemetry_ring(None, DEFAULT_CAPACITY)
+        valid = self.telemetry.append(frame)
+        if self.metrics is not None:
+            kind = "telemetry" if valid else "telemetry_error"
+            self.metrics.inc("events_total", event=kind)
+            self.metrics.inc("bytes_in_total", len(frame), event=kind)
+
+    def _dispatch_completions(self):
+        """Despacha los ✅/🏁 que estima el modelo (transportes sin eventos)."""
+        with self._write_lock:
+            # Las líneas ya recibidas (▶️ de la misma petición) van antes
+            if self.transport.in_waiting:
+                return
+            events = self.state.completed_events()
+        for event in events:
+            self._dispatch(event)
+
+    def _dispatch(self, event: NeckEvent):
+        with self._write_lock:
+            self._tracker.handle(event)
+            self.state.handle(event)
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"❌ Error en listener: {e}")
+
+    def _request(self, command: Union[str, bytes], register: Callable[[], Future]) -> Optional[Future]:
+        """
+        Registra la respuesta esperada y envía el comando de forma atómica.
+
+        Returns:
+            Future o None si el comando no se pudo enviar
+        """
+        with self._write_lock:
+            future = register()
+            if not self._send_command(command):
+                self._tracker.discard(future)
+                return None
+        return future
+
+    @contextmanager
+    def batch_writes(self):
+        """
+        Agrupa envíos: dentro del bloque los comandos se escriben sin esperar
+        a que salgan por el puerto y se vacían todos al salir. Mantiene el
+        lock de escritura durante todo el bloque (lo usa NeckPool).
+        """
+        with self._write_lock:
+            self._defer_flush = True
+            try:
+                yield self
+            finally:
+                self._defer_flush = False
+                if self.is_connected and self.transport.is_open:
+                    try:
+                        self.transport.flush()
+                    except Exception as e:
+                        print(f"❌ Error vaciando {self.port}: {e}")
+
+    def _arrival_time(self, command: Union[str, bytes]) -> float:
+        """Instante estimado en que el firmware termina de recibir el comando."""
+        size = len(command) if isinstance(command, bytes) else len(command) + 1
+        return time.monotonic() + self.transport.delivery_delay(size)
+
+    def _send_tracked(self, command: Union[str, bytes], update: Callable[[float], None]) -> bool:
+        """Envía un comando y aplica su efecto al modelo de estado."""
+        with self._write_lock:
+            at = self._arrival_time(command)
+            if not self._send_command(command):
+                return False
+            update(at)
+        return True
+
+    def _send_command(self, command: Union[str, bytes]) -> bool:
         """
         Envía un comando al ESP32.
 
         Args:
-            command: Comando a enviar
+            command: Comando ASCII (se añade el salto de línea) o trama binaria
 
         Returns:
             bool: True si el comando se envió correctamente
         """
-        if not self.is_connected or not self.serial_connection:
+        metrics = self.metrics
+        if not self.is_connected or not self.transport.is_open:
             print("❌ No hay conexión establecida")
+            if metrics is not None:
+                metrics.inc("command_failures_total", command=_command_label(command), reason="not_connected")
             return False
 
         try:
-            self.serial_connection.write(f"{command}\n".encode())
-            self.serial_connection.flush()
+            with self._write_lock:
+                data = command if isinstance(command, bytes) else f"{command}\n".encode()
+                if metrics is None:
+                    self.transport.write(data)
+                    if not self._defer_flush:
+                        self.transport.flush()
+                else:
+                    start = time.perf_counter()
+                    self.transport.write(data)
+                    if not self._defer_flush:
+                        self.transport.flush()
+                    elapsed = time.perf_counter() - start
+                    self._record_send(command, len(data), elapsed)
+                if self.recorder is not None:
+                    self.recorder.record_tx(data)
             return True
         except Exception as e:
             print(f"❌ Error enviando comando '{command}': {e}")
+            if metrics is not None:
+                metrics.inc("command_failures_total", command=_command_label(command), reason="write_error")
             return False
 
+    def _record_send(self, command: Union[str, bytes], size: int, elapsed: float):
+        label = _command_label(command)
+        protocol = "binary" if isinstance(command, bytes) else "ascii"
+        self.metrics.inc("commands_total", command=label, protocol=protocol)
+        self.metrics.inc("bytes_out_total", size, command=label)
+        self.metrics.observe("send_seconds", elapsed, command=label)
+        self.metrics.max_gauge("pending_replies_max", self._tracker.pending_count())
+        try:
+            self.metrics.max_gauge("output_queue_bytes_max", self.transport.out_waiting)
+        except (AttributeError, OSError, serial.SerialException):
+            pass
+
     def set_pwm(self, pwm_values: List[Union[int, float]]) -> bool:
         """
         Establece valores PWM directos para todos los servos.
@@ -100,21 +1133,10 @@ class ESP32NeckController:
         Example:
             controller.set_pwm([95, 120, 80])  # Servo 1 parado, 2 girando CW, 3 girando CCW
         """
-        if len(pwm_values) != self.num_servos:
-            print(f"❌ Se esperaban {self.num_servos} valores PWM, se recibieron {len(pwm_values)}")
-            return False
-
-        # Validar rango PWM
-        for i, pwm in enumerate(pwm_values):
-            if not (0 <= pwm <= 180):
-                print(f"❌ PWM fuera de rango para servo {i + 1}: {pwm} (debe estar entre 0-180)")
-                return False
+        command = self._build_set_pwm(pwm_values)
+        return command is not None and self._send_command(command)
 
-        pwm_str = " ".join(map(str, pwm_values))
-        command = f"V {pwm_str}"
-        return self._send_command(command)
-
-    def move_angles(self, angles: List[Union[int, float]]) -> bool:
+    def move_angles(self, angles: List[Union[int, float]]) -> Optional[Future]:
         """
         Mueve los servos por ángulos específicos con temporización automática.
 
@@ -122,18 +1144,142 @@ class ESP32NeckController:
             angles: Lista de ángulos relativos para cada servo (positivo = CW, negativo = CCW)
 
         Returns:
-            bool: True si el comando se envió correctamente
+            Future que se resuelve con {servo: ángulo final} cuando todos los
+            servos movidos informan que se han detenido, o None si el comando
+            no se pudo enviar. Si un stop corta el movimiento, o otro A cambia
+            el objetivo de uno de sus servos antes de que llegue, el Future
+            falla con MoveInterrupted.
 
         Example:
-            controller.move_angles([45, -30, 90])  # Servo 1: +45°, Servo 2: -30°, Servo 3: +90°
+            controller.move_angles([45, -30, 90]).result(timeout=5)  # Espera a que termine
         """
-        if len(angles) != self.num_servos:
-            print(f"❌ Se esperaban {self.num_servos} ángulos, se recibieron {len(angles)}")
+        built = self._build_move_angles(angles)
+        if built is None:
+            return None
+        command, sent_angles = built
+        with self._write_lock:
+            at = self._arrival_time(command)
+            future = self._request(command, lambda: self._tracker.expect_move(sent_angles))
+            if future is not None:
+                self.state.command_move(sent_angles, at)
+        return future
+
+    def queue_setpoint(self, t_ms: int, angles: Sequence[Union[int, float]]) -> bool:
+        """
+        Encola un setpoint absoluto en el buffer del firmware.
+
+        Args:
+            t_ms: Instante del setpoint en ms desde el inicio de la trayectoria
+            angles: Ángulo absoluto objetivo de cada servo
+
+        Returns:
+            bool: True si el comando se envió correctamente
+        """
+        command = self._build_queue_setpoint(t_ms, angles)
+        if command is None:
             return False
+        sent_angles = self._sent_angles(angles)
+        return self._send_tracked(command, lambda at: self.state.command_setpoint(t_ms, sent_angles, at))
 
-        angles_str = " ".join(map(str, angles))
-        command = f"A {angles_str}"
-        return self._send_command(command)
+    def stream_trajectory(self, trajectory: Iterable[Sequence[Union[int, float]]],
+                          rate_hz: float) -> Optional[Future]:
+        """
+        Envía una trayectoria de ángulos absolutos al buffer del firmware.
+
+        El firmware reproduce los setpoints con su propio reloj; este método
+        sólo se encarga de enviarlos con la antelación justa para mantener el
+        buffer lleno sin desbordarlo. Bloquea hasta enviar el último punto.
+
+        Args:
+            trajectory: Iterable de listas de ángulos absolutos (uno por servo)
+            rate_hz: Frecuencia de muestreo de la trayectoria
+
+        Returns:
+            Future que se resuelve cuando el firmware termina de reproducirla,
+            o None si algún setpoint no se pudo enviar
+
+        Example:
+            points = ([30 * math.sin(k / 20), 0, 0] for k in range(200))
+            controller.stream_trajectory(points, rate_hz=50).result(timeout=10)
+        """
+        if rate_hz <= 0:
+            print(f"❌ Frecuencia inválida: {rate_hz}")
+            return None
+
+        period = 1.0 / rate_hz
+        # Dejar margen de 2 huecos para el jitter del enlace
+        lead = max(self.setpoint_buffer_size - 2, 1) * period
+        points = iter(trajectory)
+        angles = next(points, None)
+        if angles is None:
+            return None
+        done = None
+        start = time.monotonic()
+        k = 0
+        while angles is not None:
+            next_angles = next(points, None)
+            delay = start + k * period - lead - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._write_lock:
+                if next_angles is None:
+                    # Registrar la espera antes de enviar el último punto
+                    done = self._tracker.expect_stream()
+                if not self.queue_setpoint(round(k * period * 1000), angles):
+                    if done is not None:
+                        self._tracker.discard(done)
+                    return None
+            angles = next_angles
+            k += 1
+        return done
+
+    def upload_gesture(self, slot: int, period_ms: int,
+                       offsets: Sequence[Sequence[float]]) -> Optional[Future]:
+        """
+        Carga una trayectoria en la tabla de gestos del firmware.
+
+        Args:
+            slot: Hueco de la tabla (0 a communication.gesture_slots - 1)
+            period_ms: ms entre puntos
+            offsets: Desplazamiento de cada servo en cada punto, en grados,
+                respecto a la posición al empezar el gesto
+
+        Returns:
+            Future que se resuelve con [hueco, puntos, periodo] cuando el
+            firmware confirma la carga, o None si no se pudo enviar
+        """
+        commands = self._build_gesture_upload(slot, period_ms, offsets)
+        if commands is None:
+            return None
+        with self.batch_writes():
+            future = self._tracker.expect_gesture()
+            for command in commands:
+                if not self._send_command(command):
+                    self._tracker.discard(future)
+                    return None
+            self._gestures[slot] = (int(period_ms), [[round(a, 1) for a in row] for row in offsets])
+        return future
+
+    def play_gesture(self, slot: int) -> Optional[Future]:
+        """
+        Reproduce un gesto ya cargado con un solo comando; el firmware lo
+        sigue con su reloj, sin más tráfico. Corta la trayectoria en curso.
+
+        Returns:
+            Future que se resuelve cuando termina (🏁), o None si el comando
+            no se pudo enviar
+        """
+        command = self._build_play_gesture(slot)
+        with self._write_lock:
+            at = self._arrival_time(command)
+            future = self._tracker.expect_stream()
+            if not self._send_command(command):
+                self._tracker.discard(future)
+                return None
+            if slot in self._gestures:
+                period_ms, offsets = self._gestures[slot]
+                self.state.command_gesture(period_ms, offsets, at)
+        return future
 
     def test_servo(self, servo_num: int, angle: Union[int, float]) -> bool:
         """
@@ -149,12 +1295,8 @@ class ESP32NeckController:
         Example:
             controller.test_servo(1, 45)  # Mueve servo 1 por 45°
         """
-        if not (1 <= servo_num <= self.num_servos):
-            print(f"❌ Servo inválido: {servo_num} (debe estar entre 1-{self.num_servos})")
-            return False
-
-        command = f"T {servo_num} {angle}"
-        return self._send_command(command)
+        command = self._build_test_servo(servo_num, angle)
+        return command is not None and self._send_command(command)
 
     def calibrate_speed(self, factor: float) -> bool:
         """
@@ -169,21 +1311,18 @@ class ESP32NeckController:
         Example:
             controller.calibrate_speed(1.5)  # Movimientos 50% más lentos
         """
-        if not (0.1 <= factor <= 5.0):
-            print(f"❌ Factor de calibración fuera de rango: {factor} (debe estar entre 0.1-5.0)")
-            return False
+        command = self._build_calibrate_speed(factor)
+        return command is not None and self._send_command(command)
 
-        command = f"C {factor}"
-        return self._send_command(command)
-
-    def get_positions(self) -> bool:
+    def get_positions(self) -> Optional[Future]:
         """
         Solicita las posiciones actuales de todos los servos.
 
         Returns:
-            bool: True si el comando se envió correctamente
+            Future que se resuelve con la lista de ángulos, o None si el
+            comando no se pudo enviar
         """
-        return self._send_command("P")
+        return self._request(self._build_positions(), self._tracker.expect_positions)
 
     def reset_positions(self) -> bool:
         """
@@ -192,17 +1331,70 @@ class ESP32NeckController:
         Returns:
             bool: True si el comando se envió correctamente
         """
-        return self._send_command("R")
+        return self._send_tracked(self._build_reset(), self.state.command_reset)
 
     def toggle_debug(self) -> bool:
         """
-        Activa/desactiva el modo debug.
+        Alterna la salida del firmware entre códigos cortos y texto con emojis.
 
         Returns:
             bool: True si el comando se envió correctamente
         """
         return self._send_command("D")
 
+    def set_verbose(self, verbose: bool) -> bool:
+        """
+        Fija el nivel de registro del firmware: texto con emojis (True) o
+        códigos cortos (False, menos bytes por evento). parse_line entiende
+        los dos, así que no cambia nada para el controlador.
+
+        Returns:
+            bool: True si el comando se envió correctamente
+        """
+        return self._send_command(self._build_log_level(verbose))
+
+    def send_raw(self, data: bytes) -> bool:
+        """
+        Envía bytes tal cual: líneas ASCII con su '\\n' o tramas binarias ya
+        codificadas (lo usa neck_session.replay). No pasan por el modelo de
+        estado, que sólo se entera por los eventos que provoquen.
+
+        Returns:
+            bool: True si los bytes se enviaron correctamente
+        """
+        return self._send_command(bytes(data))
+
+    def set_telemetry(self, hz: int, capacity: int = DEFAULT_CAPACITY) -> Optional[TelemetryRing]:
+        """
+        Activa la telemetría periódica del firmware (0 la desactiva).
+
+        Las tramas llegan por el puerto serie mezcladas con las líneas de
+        texto; el hilo lector las guarda en self.telemetry sin generar
+        eventos. Sólo SerialTransport las recibe.
+
+        Args:
+            hz: Tramas por segundo (0-TELEMETRY_MAX_HZ)
+            capacity: Tramas que conserva el buffer
+
+        Returns:
+            TelemetryRing donde se guardan, o None si el comando no se pudo enviar
+
+        Example:
+            ring = controller.set_telemetry(100)
+            angles = ring.view()['angle']   # (tramas, servos), sin copiar
+        """
+        if not self.transport.streams_events:
+            print(f"❌ {self.transport!r} no recibe tramas de telemetría")
+            return None
+        command = self._build_telemetry(hz)
+        if command is None:
+            return None
+        with self._write_lock:
+            self.telemetry = self._telemetry_ring(self.telemetry, capacity)
+        if not self._send_command(command):
+            return None
+        return self.telemetry
+
     def stop_all(self) -> bool:
         """
         Detiene inmediatamente todos los servos.
@@ -210,16 +1402,36 @@ class ESP32NeckController:
         Returns:
             bool: True si el comando se envió correctamente
         """
-        return self._send_command("S")
+        return self._send_tracked(self._build_stop(), self.state.command_stop)
 
-    def get_system_info(self) -> bool:
+    def get_system_info(self) -> Optional[Future]:
         """
         Solicita información del sistema.
 
         Returns:
-            bool: True si el comando se envió correctamente
+            Future que se resuelve con un dict clave → valor, o None si el
+            comando no se pudo enviar
         """
-        return self._send_command("I")
+        return self._request("I", self._tracker.expect_info)
+
+    def estimated_positions(self) -> List[float]:
+        """
+        Posición estimada de cada servo sin consultar al firmware.
+
+        Returns:
+            Lista de ángulos; los servos en marcha se interpolan según el
+            modelo de tiempos del firmware
+        """
+        return self.state.estimated_positions()
+
+    def is_moving(self, servo_num: Optional[int] = None) -> bool:
+        """
+        Indica, sin consultar al firmware, si hay servos en marcha.
+
+        Args:
+            servo_num: Número del servo (1-3); None para cualquiera
+        """
+        return self.state.is_moving(None if servo_num is None else servo_num - 1)
 
     def __enter__(self):
         """Soporte para context manager."""
@@ -233,43 +1445,107 @@ class ESP32NeckController:
 
 # Funciones de conveniencia para movimientos comunes
 class NeckMovements:
-    """Clase con movimientos predefinidos para el cuello."""
+    """
+    Clase con movimientos predefinidos para el cuello.
+
+    Los movimientos se expresan como orientaciones de la cabeza (yaw, pitch,
+    roll) y se convierten a ángulos de motor con la cinemática inversa de la
+    articulación esférica (neck_kinematics.py). Como el comando A es relativo,
+    la clase recuerda los ángulos de motor ya enviados y manda sólo la
+    diferencia; lo que queda por debajo de MIN_MOVE_THRESHOLD se acumula.
 
-    def __init__(self, controller: ESP32NeckController):
+    Con ik_table (neck_ik_table.py) las orientaciones dentro de la rejilla se
+    resuelven por interpolación; fuera de ella se usa el solver exacto.
+
+    nod_yes, shake_no, ... van a una orientación y se quedan en ella; gesture()
+    reproduce el gesto completo desde la tabla del firmware (neck_gestures.py).
+    """
+
+    def __init__(self, controller: ESP32NeckController, kinematics: Optional[NeckKinematics] = None,
+                 ik_table: Optional[IKTable] = None):
         self.controller = controller
+        self.kinematics = kinematics or NeckKinematics.from_config(controller.config)
+        self.ik_table = ik_table
+        self.orientation = np.zeros(3)  # yaw, pitch, roll en grados
+        self._motors = np.zeros(self.kinematics.num_legs)
+        self._gestures: Optional[GestureLibrary] = None
+
+    def look_at(self, yaw: float = 0, pitch: float = 0, roll: float = 0) -> Optional[Future]:
+        """
+        Lleva la cabeza a una orientación absoluta.
 
-    def nod_yes(self, intensity: float = 30) -> bool:
+        Args:
+            yaw: Giro horizontal en grados
+            pitch: Cabeceo en grados
+            roll: Inclinación lateral en grados
+        """
+        target = np.array([yaw, pitch, roll], dtype=float)
+        motors = np.array(self.ik_table.solve(yaw, pitch, roll)) if self.ik_table else None
+        if motors is None or np.isnan(motors).any():
+            motors = self.kinematics.inverse(target)
+        if np.isnan(motors).any():
+            print(f"❌ Orientación fuera del espacio de trabajo: {target.tolist()}")
+            return None
+        # Camino más corto para cada motor
+        delta = np.round((motors - self._motors + 180.0) % 360.0 - 180.0, 1)
+        future = self.controller.move_angles(delta.tolist())
+        if future:
+            self.orientation = target
+            self._motors += np.where(np.abs(delta) >= MIN_MOVE_THRESHOLD, delta, 0.0)
+        return future
+
+    def _look_relative(self, d_yaw: float = 0, d_pitch: float = 0, d_roll: float = 0) -> Optional[Future]:
+        yaw, pitch, roll = self.orientation + [d_yaw, d_pitch, d_roll]
+        return self.look_at(yaw, pitch, roll)
+
+    def nod_yes(self, intensity: float = 30) -> Optional[Future]:
         """
         Movimiento de asentimiento (sí).
 
         Args:
             intensity: Intensidad del movimiento en grados
         """
-        return self.controller.move_angles([intensity, 0, 0])
+        return self._look_relative(d_pitch=intensity)
 
-    def shake_no(self, intensity: float = 30) -> bool:
+    def shake_no(self, intensity: float = 30) -> Optional[Future]:
         """
         Movimiento de negación (no).
 
         Args:
             intensity: Intensidad del movimiento en grados
         """
-        return self.controller.move_angles([0, intensity, 0])
+        return self._look_relative(d_yaw=intensity)
 
-    def tilt_head(self, intensity: float = 30) -> bool:
+    def tilt_head(self, intensity: float = 30) -> Optional[Future]:
         """
         Inclinar la cabeza hacia un lado.
 
         Args:
             intensity: Intensidad del movimiento en grados
         """
-        return self.controller.move_angles([0, 0, intensity])
+        return self._look_relative(d_roll=intensity)
+
+    def gesture(self, name: str, intensity: float = 30, duration_ms: int = 1200) -> Optional[Future]:
+        """
+        Reproduce un gesto de neck_gestures.GESTURES (nod_yes, shake_no,
+        tilt_head, look_around). La primera vez con unos parámetros se carga
+        en el firmware; las siguientes son un solo comando G. Termina donde
+        empezó, así que la orientación no cambia.
+
+        Args:
+            name: Nombre del gesto
+            intensity: Amplitud en grados
+            duration_ms: Duración total
+        """
+        if self._gestures is None:
+            self._gestures = GestureLibrary(self.controller, self.kinematics)
+        return self._gestures.play(name, intensity, duration_ms)
 
-    def center_all(self) -> bool:
-        """Centra todos los servos."""
-        return self.controller.reset_positions()
+    def center_all(self) -> Optional[Future]:
+        """Vuelve a la orientación de reposo."""
+        return self.look_at(0, 0, 0)
 
-    def look_around(self, pan: float = 45, tilt: float = 20) -> bool:
+    def look_around(self, pan: float = 45, tilt: float = 20) -> Optional[Future]:
         """
         Movimiento de "mirar alrededor".
 
@@ -277,7 +1553,7 @@ class NeckMovements:
             pan: Movimiento horizontal
             tilt: Movimiento de inclinación
         """
-        return self.controller.move_angles([tilt, pan, 0])
+        return self._look_relative(d_yaw=pan, d_pitch=tilt)
 
 
 def test_servos():
@@ -289,8 +1565,12 @@ def test_servos():
                           -a, -a,  a,  a]:
                 angles = [0, 0, 0]
                 angles[servo] = angle
-                controller.move_angles(angles)
-                time.sleep(0.3)
+                move = controller.move_angles(angles)
+                if move:
+                    try:
+                        print(f"  Posición final: {move.result(timeout=5)}")
+                    except MoveInterrupted as e:
+                        print(f"  ⚠️  {e}")
 
 def test_velocities():
     with ESP32NeckController("/dev/esp32") as controller:
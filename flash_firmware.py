@@ -1,51 +1,67 @@
-import yaml
+import hashlib
+import json
+import re
+import shutil
 import subprocess
 import os
 import sys
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Optional
+
+import ino_generator
+import neck_config
+from neck_config import NeckConfig
 
 WORKDIR = Path(__file__).parent.absolute()
 DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+DEFAULT_TEMPLATE = WORKDIR / 'ino_template.ino'
+DEFAULT_HTML = WORKDIR / 'index.html'
 DEFAULT_DEV = "/dev/esp32"
-DEFAULT_BAUDRATE = 115200
+# Estado de la caché de build, dentro del directorio del sketch
+BUILD_CACHE = '.build_cache.json'
+_RE_BUILD_HASH = re.compile(r'#define BUILD_HASH "(\w*)"')
 
 
 class FirmwareFlasher:
-    """Clase para compilar y subir firmware a ESP32 basado en configuración YAML"""
+    """
+    Clase para generar, compilar y subir firmware a ESP32 basado en configuración YAML.
+
+    Cada etapa se salta si su salida ya está al día:
+    - generate: no reescribe el .ino si el renderizado no cambia
+    - compile: no recompila si el .ino y el FQBN son los de la última compilación
+    - upload: no sube si la placa ya informa (con 'I') el mismo hash de build
+    """
 
     def __init__(self, config_file: Optional[str] = None):
         self.config_file = Path(config_file) if config_file else DEFAULT_CONFIG
         self.settings = self._load_settings()
         self.arduino_cli = self._resolve_cli()
-        self.board = self.settings['board_settings']
-        self.fqbn = self.board['fqbn']
-        self.sketch_path = Path(self.board['sketch'])
-        self.ino_file = Path(self.board.get('ino_file', f"{self.sketch_path}/{self.sketch_path.name}.ino"))
+        self.board = self.settings.board
+        self.fqbn = self.board.fqbn
+        self.sketch_path = Path(self.board.sketch)
+        self.ino_file = Path(self.board.ino_file or f"{self.sketch_path}/{self.sketch_path.name}.ino")
         self.port = self._resolve_port()
-        self.baudrate = self.board.get('baudrate', DEFAULT_BAUDRATE)
-
+        self.baudrate = self.board.baudrate
+        self.build_dir = self.sketch_path / "build"
+        self.cache_file = self.sketch_path / BUILD_CACHE
 
-    def _load_settings(self) -> Dict[str, Any]:
-        """Carga la configuración desde el archivo YAML"""
+    def _load_settings(self) -> NeckConfig:
+        """Carga y valida la configuración (neck_config.load_config)"""
         try:
-            with open(self.config_file, 'r') as f:
-                return yaml.safe_load(f)
+            return neck_config.load_config(self.config_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"❌ Archivo de configuración no encontrado: {self.config_file}")
-        except yaml.YAMLError as e:
-            raise ValueError(f"❌ Error al parsear YAML: {e}")
 
     def _resolve_cli(self) -> str:
         """Resuelve la ruta del Arduino CLI"""
-        cli_path = self.settings.get('arduino_cli_path')
+        cli_path = self.settings.arduino_cli_path
         if cli_path and cli_path.lower() != "none":
             return cli_path
         return "arduino-cli"
 
     def _resolve_port(self) -> str:
         """Resuelve el puerto serie para la ESP32"""
-        port = self.board.get('port')
+        port = self.board.port
         if port and os.path.exists(port):
             return port
         elif os.path.exists(DEFAULT_DEV):
@@ -91,72 +107,164 @@ class FirmwareFlasher:
 
 
     def validate_config(self) -> bool:
-        """Valida la configuración antes de proceder"""
+        """Valida la configuración antes de proceder (la relee si el YAML cambió)"""
         try:
-            # Validar que existan las secciones principales
-            required_sections = ['board_settings', 'servo_settings']
-            for section in required_sections:
-                if section not in self.settings:
-                    print(f"❌ Falta sección '{section}' en configuración")
-                    return False
-
-            # Validar configuración de servos
-            servo_settings = self.settings['servo_settings']
-            if not servo_settings:
-                print("❌ No hay servos configurados")
-                return False
-
-            # Validar cada servo
-            for servo_id, config in servo_settings.items():
-                if 'gpio' not in config:
-                    print(f"❌ Servo {servo_id}: falta GPIO")
-                    return False
-                if 'type' not in config:
-                    print(f"❌ Servo {servo_id}: falta tipo")
-                    return False
-
-            print("✅ Configuración válida")
-            return True
+            self.settings = self._load_settings()
+            self.settings.check_firmware()
+        except FileNotFoundError as e:
+            print(e)
+            return False
+        except neck_config.ConfigError as e:
+            print(f"❌ {e}")
+            return False
+        if self.settings.board.fqbn != self.fqbn or Path(self.settings.board.sketch) != self.sketch_path:
+            print("❌ board_settings cambió desde que se cargó la configuración; vuelve a ejecutar")
+            return False
+        print(f"✅ Configuración válida: {self.settings.num_servos} servos")
+        return True
 
+    # ---------- Caché de build ----------
+    def _load_cache(self) -> Dict[str, str]:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_cache(self, stage: str, key: str):
+        cache = self._load_cache()
+        cache[stage] = key
+        with open(self.cache_file, 'w') as f:
+            json.dump(cache, f, indent=2)
+
+    def _ino_key(self) -> Optional[str]:
+        """Hash del .ino en disco y del FQBN: la entrada de compile y upload."""
+        if not self.ino_file.exists():
+            return None
+        return hashlib.sha256(self.fqbn.encode() + b"\n" + self.ino_file.read_bytes()).hexdigest()
+
+    def _upload_key(self) -> Optional[str]:
+        """Entrada de upload: el mismo .ino subido al mismo puerto."""
+        key = self._ino_key()
+        return f"{self.port} {key}" if key else None
+
+    def stamped_build_hash(self) -> Optional[str]:
+        """Hash de build sellado en el .ino en disco."""
+        if not self.ino_file.exists():
+            return None
+        match = _RE_BUILD_HASH.search(self.ino_file.read_text())
+        return match.group(1) if match else None
+
+    def _has_build_outputs(self) -> bool:
+        return any(self.build_dir.glob("*.bin"))
+
+    def board_build_hash(self, timeout: float = 3.0) -> Optional[str]:
+        """Hash de build que informa la placa con 'I', o None si no responde."""
+        from epj_neck import ESP32NeckController
+        controller = None
+        try:
+            controller = ESP32NeckController(self.port, self.baudrate, config=self.settings)
+            if not controller.connect():
+                return None
+            future = controller.get_system_info()
+            info = future.result(timeout=timeout) if future else None
+            return info.get('build') if isinstance(info, dict) else None
         except Exception as e:
-            print(f"❌ Error validando configuración: {e}")
+            print(f"⚠️  No se pudo leer el build de la placa: {e}")
+            return None
+        finally:
+            if controller is not None:
+                controller.disconnect()
+
+    # ---------- Etapas ----------
+    def generate(self, force: bool = False) -> bool:
+        """Minifica la web y renderiza el .ino; no lo reescribe si no cambia"""
+        try:
+            budget = self.settings.gzip_budget_bytes
+            page_size = len(ino_generator.load_page(DEFAULT_HTML))
+            if budget is not None and page_size > budget:
+                print(f"❌ La página supera el presupuesto: {page_size} B > {budget} B")
+                return False
+            ino_code, build_hash = ino_generator.render_ino(self.settings, DEFAULT_TEMPLATE, DEFAULT_HTML)
+        except Exception as e:
+            print(f"❌ Error generando el .ino: {e}")
             return False
 
-    def compile(self) -> bool:
-        """Compila el sketch"""
+        if not force and self.ino_file.exists() and self.ino_file.read_text() == ino_code:
+            print(f"⏭️  {self.ino_file} al día (build {build_hash})")
+            return True
+        self.ino_file.parent.mkdir(parents=True, exist_ok=True)
+        if self.ino_file.exists():
+            shutil.copyfile(self.ino_file, f"{self.ino_file}.backup")
+        self.ino_file.write_text(ino_code)
+        print(f"✅ INO generado en: {self.ino_file} (build {build_hash})")
+        return True
+
+    def compile(self, force: bool = False) -> bool:
+        """Compila el sketch si el .ino o el FQBN cambiaron desde la última compilación"""
+        key = self._ino_key()
+        if not force and key and self._load_cache().get('compile') == key and self._has_build_outputs():
+            print(f"⏭️  Compilación al día (build {self.stamped_build_hash()})")
+            return True
         try:
-            self._run_command(["compile", "--fqbn", self.fqbn, str(self.sketch_path)],
+            self._run_command(["compile", "--fqbn", self.fqbn, "--output-dir", str(self.build_dir),
+                               str(self.sketch_path)],
                               f"📦 Compilando sketch en {self.sketch_path} para {self.fqbn}...")
+            if key:
+                self._save_cache('compile', key)
             print("✅ Compilación exitosa")
             return True
         except subprocess.CalledProcessError:
             print("❌ Error en compilación")
             return False
 
-    def upload(self) -> bool:
-        """Sube el firmware a la ESP32"""
+    def upload(self, force: bool = False) -> bool:
+        """Sube el firmware a la ESP32 si la placa no tiene ya este build"""
+        stamped = self.stamped_build_hash()
+        key = self._upload_key()
+        # Abrir el puerto reinicia la placa: si el último upload a este puerto fue este .ino, ni se pregunta
+        if not force and key and self._load_cache().get('upload') == key:
+            print(f"⏭️  Último upload a {self.port}: build {stamped} (--force para subir igual)")
+            return True
+        if not force and stamped:
+            on_board = self.board_build_hash()
+            if on_board == stamped:
+                print(f"⏭️  La placa ya tiene el build {stamped}")
+                if key:
+                    self._save_cache('upload', key)
+                return True
+            if on_board:
+                print(f"🔁 Build en la placa: {on_board}, nuevo: {stamped}")
+        args = ["upload", "-p", self.port, "--fqbn", self.fqbn]
+        if self._has_build_outputs():
+            args += ["--input-dir", str(self.build_dir)]
         try:
-            self._run_command(["upload", "-p", self.port, "--fqbn", self.fqbn, str(self.sketch_path)],
-                              f"⚡ Subiendo firmware a {self.port}...")
+            self._run_command(args + [str(self.sketch_path)], f"⚡ Subiendo firmware a {self.port}...")
+            if key:
+                self._save_cache('upload', key)
             print("✅ Firmware subido exitosamente")
             return True
         except subprocess.CalledProcessError:
             print("❌ Error subiendo firmware")
             return False
 
-    def flash(self) -> bool:
-        """Proceso completo: validar, generar, compilar y subir"""
+    def flash(self, force: bool = False) -> bool:
+        """Proceso completo: validar, generar, compilar y subir (saltando lo que está al día)"""
         try:
             # Validar configuración
             if not self.validate_config():
                 return False
 
+            # Generar
+            if not self.generate(force):
+                return False
+
             # Compilar
-            if not self.compile():
+            if not self.compile(force):
                 return False
 
             # Subir
-            if not self.upload():
+            if not self.upload(force):
                 return False
 
             print("🎉 Proceso completo exitoso!")
@@ -214,11 +322,12 @@ class FirmwareFlasher:
         """Limpia archivos temporales de compilación"""
         try:
             # Limpiar directorio de build
-            build_dir = self.sketch_path / "build"
-            if build_dir.exists():
-                import shutil
-                shutil.rmtree(build_dir)
-                print(f"🧹 Directorio de build limpiado: {build_dir}")
+            if self.build_dir.exists():
+                shutil.rmtree(self.build_dir)
+                print(f"🧹 Directorio de build limpiado: {self.build_dir}")
+            if self.cache_file.exists():
+                self.cache_file.unlink()
+                print(f"🧹 Caché de build eliminada: {self.cache_file}")
 
             # Limpiar archivos temporales
             temp_files = list(self.sketch_path.glob("*.tmp"))
@@ -294,6 +403,8 @@ def main():
                         help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="Salida detallada")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Repetir las etapas aunque estén al día")
 
     args = parser.parse_args()
 
@@ -303,11 +414,13 @@ def main():
 
         # Ejecutar comando
         if args.command == "flash":
-            success = flasher.flash()
+            success = flasher.flash(args.force)
+        elif args.command == "generate":
+            success = flasher.generate(args.force)
         elif args.command == "compile":
-            success = flasher.compile()
+            success = flasher.compile(args.force)
         elif args.command == "upload":
-            success = flasher.upload()
+            success = flasher.upload(args.force)
         elif args.command == "monitor":
             flasher.monitor()
             success = True
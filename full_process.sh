@@ -1,5 +1,5 @@
+set -e
 sudo bash install_udev_rule.sh
 python minify.py index.html
-python ino_generator.py
-python flash_firmware.py
-python epj_neck.py
\ No newline at end of file
+python flash_firmware.py flash
+python epj_neck.py
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Fuzz y rendimiento del parser de comandos del firmware (neck_core.h)
+a través de su réplica en neck_emulator.py.
+
+Comprueba:
+- strtof: el de neck_emulator.py contra strtod de la libc redondeado a float,
+  que es lo que hace el strtof de newlib en el ESP32
+- Entrada malformada: bytes al azar, líneas de más de command_buffer_size,
+  '\\0', inf/nan, bytes de sincronía de trama... El parser nunca pasa del
+  buffer y la línea que sigue a la basura se ejecuta igual
+- Líneas al límite: command_buffer_size - 1 bytes se ejecutan, uno más no
+- Que una línea a medio llegar no bloquee loop(): los movimientos terminan
+  a su hora mientras tanto
+- Rendimiento: comandos por segundo del parser, y comandos enviados al
+  máximo ritmo del puerto serie a un PtyEmulator sin que se pierda ninguno
+
+    python fuzz_neck.py
+    python fuzz_neck.py --iterations 20000 --seed 7
+"""
+import ctypes
+import ctypes.util
+import math
+import os
+import random
+import select
+import struct
+import sys
+import time
+from typing import List, Optional
+
+import ino_generator
+from neck_emulator import (DEFAULT_CONFIG, LOG_VERBOSE, FirmwareEmulator, PtyEmulator, _f32,
+                           _strtof, emulated_constants)
+import neck_protocol
+
+# Piezas con las que se arman números válidos e inválidos
+NUMBER_PARTS = ["", "+", "-", "0", "1", "9", "42", "007", ".", "..", "e", "E", "e+", "e-",
+                "e38", "e39", "e-45", "e-46", "e999", "x", "X", "0x", "1p", "p-3", "a", "F",
+                "inf", "INF", "infinity", "iNfInItY", "nan", "NaN", "nan(", "nan(1)", ")",
+                "3.4028235e38", "3.40282357e38", "1.17549435e-38", "1.4e-45",
+                "123456789012345678901234567890", "0.000000000000000000000001"]
+GARBAGE_PARTS = [b"A ", b"V ", b"Q ", b"S", b"P", b"a ", b"A  ", b"A\t", b" ", b"\t", b"\r",
+                 b"\x0b", b"\x0c", b"\0", b";", b"\xff", b"\xc3\xa9", b"\xaa",
+                 bytes([neck_protocol.FRAME_SYNC]), b"1", b"-2.5", b"1e3", b"inf", b"nan", b"0x1p4"]
+
+
+class FakeClock:
+    """Reloj que solo avanza cuando se le pide."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _emulator(constants: dict, clock: FakeClock, output: bytearray) -> FirmwareEmulator:
+    # Las comprobaciones buscan los mensajes de texto, no los códigos cortos
+    firmware = FirmwareEmulator({**constants, 'LOG_LEVEL': LOG_VERBOSE}, output.extend, clock=clock)
+    # delay() del firmware sin dormir de verdad
+    firmware.delay = lambda ms: setattr(clock, 'now', clock.now + ms / 1000)
+    firmware.setup()
+    return firmware
+
+
+def _drain(firmware: FirmwareEmulator):
+    """loop() hasta que no queden bytes sin leer."""
+    firmware.loop()
+    while firmware._rx:
+        firmware.loop()
+
+
+def _load_libc():
+    path = ctypes.util.find_library("c")
+    if not path:
+        return None
+    libc = ctypes.CDLL(path)
+    libc.strtod.restype = ctypes.c_double
+    libc.strtod.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_char_p)]
+    return libc
+
+
+def _newlib_strtof(libc, text: str):
+    """strtof de newlib: strtod y conversión a float, ±inf si se sale de rango."""
+    raw = ctypes.create_string_buffer(text.encode())
+    end = ctypes.c_char_p()
+    value = libc.strtod(raw, ctypes.byref(end))
+    used = ctypes.cast(end, ctypes.c_void_p).value - ctypes.addressof(raw)
+    try:
+        value = struct.unpack("f", struct.pack("f", value))[0]
+    except OverflowError:
+        value = math.copysign(math.inf, value)
+    return value, used
+
+
+def _same_float(a: float, b: float) -> bool:
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return a == b and math.copysign(1, a) == math.copysign(1, b)
+
+
+def check_strtof(rng: random.Random, iterations: int) -> bool:
+    """Compara _strtof con la libc sobre números armados al azar."""
+    libc = _load_libc()
+    if libc is None:
+        print("⚠️  Sin libc: se omite la comparación de strtof")
+        return True
+    errors = 0
+    for _ in range(iterations):
+        text = "".join(rng.choice(NUMBER_PARTS) for _ in range(rng.randint(1, 5)))
+        expected = _newlib_strtof(libc, text)
+        got = _strtof(text)
+        if got[1] != expected[1] or not _same_float(got[0], expected[0]):
+            errors += 1
+            if errors <= 5:
+                print(f"❌ strtof({text!r}): emulador {got}, libc {expected}")
+    status = "✅" if not errors else "❌"
+    print(f"{status} strtof: {iterations} entradas, {errors} diferencias con la libc")
+    return not errors
+
+
+def _random_garbage(rng: random.Random, size: int) -> bytes:
+    out = bytearray()
+    while len(out) < size:
+        if rng.random() < 0.3:
+            out.extend(rng.randbytes(rng.randint(1, 8)))
+        else:
+            out.extend(rng.choice(GARBAGE_PARTS))
+    return bytes(out[:size])
+
+
+def fuzz_parser(constants: dict, rng: random.Random, iterations: int) -> bool:
+    """
+    Basura al azar por Serial seguida de un '\\n' y un comando P: el parser no
+    pasa del buffer y el P siempre se ejecuta.
+    """
+    clock, output = FakeClock(), bytearray()
+    firmware = _emulator(constants, clock, output)
+    size = firmware.command_buffer_size
+    errors = 0
+    for _ in range(iterations):
+        garbage = _random_garbage(rng, rng.choice([rng.randint(0, 16), rng.randint(0, 3 * size)]))
+        # Repartida en trozos como llegaría al UART
+        cut = sorted(rng.randint(0, len(garbage)) for _ in range(3))
+        for start, end in zip([0] + cut, cut + [len(garbage)]):
+            firmware.receive(garbage[start:end])
+            firmware.loop()
+            if len(firmware._serial_line.buf) > size - 1:
+                errors += 1
+                print(f"❌ El buffer pasó de {size - 1} bytes con {garbage!r}")
+        clock.now += 1.0
+        # Una trama a medias puede tragarse el '\n': se vacía antes con bytes de relleno.
+        # D 1 por si la basura traía un D que deja los eventos en códigos cortos
+        firmware.receive(b"\n" * (2 * firmware.num_servos + 8) + b"\nD 1\nP\n")
+        del output[:]
+        _drain(firmware)
+        if "📍 Posiciones" not in output.decode("utf-8", errors="replace"):
+            errors += 1
+            if errors <= 5:
+                print(f"❌ P no se ejecutó tras {garbage!r}")
+    status = "✅" if not errors else "❌"
+    print(f"{status} Entrada malformada: {iterations} ráfagas, {errors} fallos")
+    return not errors
+
+
+def check_values(constants: dict, rng: random.Random, iterations: int) -> bool:
+    """Comandos A con números en cualquier sintaxis de float: se mueven los ángulos escritos."""
+    clock, output = FakeClock(), bytearray()
+    firmware = _emulator(constants, clock, output)
+    n = firmware.num_servos
+    errors = 0
+    formats = ["{:g}", "{:.3f}", "{:e}", "{:+.1f}", "{:.2E}", "{!r}"]
+    for _ in range(iterations):
+        angles = [round(rng.uniform(-120, 120), rng.randint(0, 3)) for _ in range(n)]
+        tokens = [rng.choice(formats).format(a) for a in angles]
+        text = " ".join(tokens)
+        pad = rng.choice(["", " ", "  ", "\t", "\r"])
+        firmware.reset_positions()
+        del output[:]
+        firmware.receive(f"A {text}{pad}\n".encode())
+        _drain(firmware)
+        clock.now += 1.0
+        firmware.loop()
+        expected = [_f32(float(t)) if abs(float(t)) >= 0.5 else 0.0 for t in tokens]
+        if firmware.current_angle != expected:
+            errors += 1
+            if errors <= 5:
+                print(f"❌ A {text}: {firmware.current_angle} != {expected}")
+    status = "✅" if not errors else "❌"
+    print(f"{status} Valores: {iterations} comandos A, {errors} fallos")
+    return not errors
+
+
+def check_limits(constants: dict) -> bool:
+    """Líneas al límite del buffer, '\\0' y valores no finitos."""
+    clock, output = FakeClock(), bytearray()
+    firmware = _emulator(constants, clock, output)
+    size = firmware.command_buffer_size
+    n = firmware.num_servos
+    ok = True
+
+    def run(line: bytes) -> str:
+        del output[:]
+        firmware.receive(line + b"\n")
+        _drain(firmware)
+        return output.decode("utf-8", errors="replace")
+
+    longest = b"P" + b" " * (size - 2)
+    cases = [
+        (longest, "📍 Posiciones"),
+        (longest + b" ", "❌ Comando demasiado largo"),
+        (b"P" * (4 * size), "❌ Comando demasiado largo"),
+        (b"P\0basura", "📍 Posiciones"),
+        (b"A " + b" ".join([b"inf"] * n), "❌ A espera"),
+        (b"A " + b" ".join([b"nan"] * n), "❌ A espera"),
+        (b"A " + b" ".join([b"1e39"] * n), "❌ A espera"),
+        (b"A " + b" ".join([b"10x"] * n), "❌ A espera"),
+        (b"A " + b" ".join([b"0x14"] * n), "▶️  Servo 1: ↻ 20.0°"),
+        (b"A " + b" ".join([b"1e1"] * n) + b" 99", "▶️  Servo 1: ↻ 10.0°"),
+        (b" \t p \r", "📍 Posiciones"),
+        (b"PP", "❓ Comando no reconocido"),
+    ]
+    for line, expected in cases:
+        got = run(line)
+        if expected not in got:
+            ok = False
+            print(f"❌ {line[:40]!r}: se esperaba {expected!r}, salió {got.strip()!r}")
+    # Tras un desbordamiento la siguiente línea empieza limpia
+    if "📍 Posiciones" not in run(b"x" * (2 * size)) + run(b"P"):
+        ok = False
+        print("❌ La línea tras un desbordamiento no se ejecutó")
+    print(f"{'✅' if ok else '❌'} Límites: {len(cases) + 1} casos")
+    return ok
+
+
+def check_non_blocking(constants: dict) -> bool:
+    """Una línea a medio llegar no retrasa el final de un movimiento."""
+    clock, output = FakeClock(), bytearray()
+    firmware = _emulator(constants, clock, output)
+    n = firmware.num_servos
+    firmware.receive(("A " + " ".join(["30"] * n) + "\n").encode())
+    _drain(firmware)
+    stop_at = max(firmware.stop_at)
+    firmware.receive(b"V 90")  # Sin '\n': con readStringUntil, loop() esperaría el timeout
+    firmware.loop()
+    clock.now = firmware._t0 + (stop_at + 0.5) / 1000
+    firmware.loop()
+    ok = not any(firmware.moving) and firmware.pwm == list(firmware.tables.stop_pwm)
+    print(f"{'✅' if ok else '❌'} Línea parcial: el movimiento terminó a los "
+          f"{firmware.millis() - stop_at} ms de su hora")
+    return ok
+
+
+def parser_throughput(constants: dict, count: int) -> float:
+    """Comandos por segundo que procesa la réplica del parser (sin E/S)."""
+    clock, output = FakeClock(), bytearray()
+    firmware = _emulator(constants, clock, output)
+    n = firmware.num_servos
+    data = ("V " + " ".join(["90"] * n) + "\n").encode() * count
+    start = time.perf_counter()
+    firmware.receive(data)
+    _drain(firmware)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"⏱️  Parser: {rate:,.0f} comandos/s ({elapsed / count * 1e6:.1f} µs por comando)")
+    return rate
+
+
+def serial_throughput(count: int, baudrate: int, config_file: Optional[str] = None) -> bool:
+    """
+    Envía count comandos V seguidos a un PtyEmulator con el ritmo del
+    baudrate y cuenta las respuestas: no debe perderse ninguno.
+    """
+    import tty
+
+    with PtyEmulator(config_file, baudrate=baudrate) as emulator:
+        fd = os.open(emulator.port, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(fd)
+            n = emulator.firmware.num_servos
+            command = ("V " + " ".join(["90"] * n) + "\n").encode()
+            data = command * count
+            received = bytearray()
+            start = time.monotonic()
+            sent = 0
+            # Una línea de respuesta por comando, en códigos o en texto
+            if emulator.firmware.log_level == LOG_VERBOSE:
+                reply = f"✅ PWM directo: {'90 ' * n}\n".encode()
+            else:
+                reply = ("v " + " ".join(["90"] * n) + "\n").encode()
+            while received.count(reply) < count:
+                readable, writable, _ = select.select([fd], [fd] if sent < len(data) else [], [], 5.0)
+                if not readable and not writable:
+                    break
+                if writable:
+                    sent += os.write(fd, data[sent:sent + 4096])
+                if readable:
+                    received.extend(os.read(fd, 65536))
+            elapsed = time.monotonic() - start
+        finally:
+            os.close(fd)
+    replies = received.count(reply)
+    # El cuello de botella es la salida: cada respuesta es más larga que el comando
+    limit = baudrate / 10 / max(len(command), len(reply))
+    ok = replies == count
+    print(f"{'✅' if ok else '❌'} Serie a {baudrate} baudios: {replies}/{count} comandos, "
+          f"{replies / elapsed:,.0f} comandos/s (límite del cable {limit:,.0f}/s)")
+    return ok
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fuzz y rendimiento del parser de comandos")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("--iterations", type=int, default=5000,
+                        help="Entradas al azar por prueba (default: 5000)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla para repetir una ejecución")
+    parser.add_argument("--count", type=int, default=500,
+                        help="Comandos de la prueba de rendimiento serie (default: 500)")
+    parser.add_argument("--baudrate", type=int, default=921600,
+                        help="Baudios de la prueba de rendimiento serie (default: 921600)")
+    parser.add_argument("--no-serial", action="store_true",
+                        help="No lanzar la prueba sobre el pty")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    print(f"🎲 Semilla: {seed}")
+    rng = random.Random(seed)
+    constants = emulated_constants(ino_generator.load_config(args.config or DEFAULT_CONFIG))
+    print(f"📏 command_buffer_size: {constants['COMMAND_BUFFER_SIZE']}")
+
+    results: List[bool] = [
+        check_strtof(rng, args.iterations),
+        check_limits(constants),
+        check_values(constants, rng, args.iterations // 5),
+        fuzz_parser(constants, rng, args.iterations),
+        check_non_blocking(constants),
+    ]
+    parser_throughput(constants, args.count * 20)
+    if not args.no_serial:
+        results.append(serial_throughput(args.count, args.baudrate, args.config))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
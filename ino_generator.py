@@ -1,45 +1,125 @@
-import yaml
+import hashlib
+from pathlib import Path
+from typing import Tuple
+
 from jinja2 import Template
 
-def generate_ino(config_path, template_path, output_path, html_path):
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+import minify
+import neck_config
+import neck_protocol
+import servo_tables
+from neck_config import NeckConfig
+
+# Caracteres del hash de build que se sellan en el firmware (y que informa 'I')
+BUILD_HASH_LEN = 12
+# Núcleo del firmware sin hardware; se renderiza dentro del .ino y neck_native.py lo compila en el PC
+CORE_TEMPLATE = Path(__file__).parent / 'neck_core.h'
+
+
+def load_config(config_path) -> NeckConfig:
+    """neck_config.yaml validado (ver neck_config.load_config)."""
+    return neck_config.load_config(config_path)
 
-    servo_settings = config['servo_settings']
-    first_servo = list(servo_settings.values())[0]
 
+def build_constants(config: NeckConfig):
+    """Constantes que se renderizan en el firmware (también las usa neck_emulator.py)."""
+    config.check_firmware()
+    comm = config.communication
     constants = {
-        'NUM_SERVOS': len(servo_settings),
-        'STOP_PWM': first_servo['pwm_config']['stop'],
-        'MAX_CW_PWM': first_servo['pwm_config']['max_cw'],
-        'MAX_CCW_PWM': first_servo['pwm_config']['max_ccw'],
-        'MS_PER_DEG': int(1000 / first_servo['degrees_per_second'] * first_servo['calibration_factor']),
-        'DEADZONE': first_servo['deadzone'],
-        'SERVO_PINS': ', '.join(str(s['gpio']) for s in servo_settings.values()),
+        'NUM_SERVOS': config.num_servos,
+        'SERVO_PINS': ', '.join(str(s.gpio) for s in config.servos),
         'AP_SSID': 'SPJ-Platform',
         'AP_PASSWORD': 'spjp1234',
+        'COMMAND_BUFFER_SIZE': comm.command_buffer_size,
+        'SETPOINT_BUFFER_SIZE': comm.setpoint_buffer_size,
+        'BINARY_PROTOCOL': int(comm.binary_protocol),
+        'UDP_PORT': comm.udp_port,
+        'TELEMETRY_HZ': comm.telemetry_hz,
+        'GESTURE_SLOTS': comm.gesture_slots,
+        'GESTURE_MAX_POINTS': comm.gesture_max_points,
+        # Nivel de registro inicial y extras compilados (ver neck_core.h)
+        'LOG_LEVEL': int(config.debug.verbose_output),
+        'LOG_TIMING': int(config.debug.show_timing),
+        'LOG_COMMANDS': int(config.debug.log_commands),
     }
+    constants.update(neck_protocol.firmware_constants())
+    # Cada servo con su calibración; el emulador usa las mismas tablas
+    constants['SERVO_TABLES'] = servo_tables.ServoTables.from_config(config)
+    constants.update(servo_tables.firmware_constants(constants['SERVO_TABLES']))
+    return constants
+
+
+def page_etag(page_gz: bytes) -> str:
+    """ETag (entre comillas, como va en la cabecera) de la página comprimida."""
+    return f'"{hashlib.sha256(page_gz).hexdigest()[:16]}"'
+
+
+def page_array(page_gz: bytes) -> str:
+    """Página comprimida como array PROGMEM, con su longitud y su ETag."""
+    etag = page_etag(page_gz).replace('"', '\\"')
+    rows = ',\n'.join('  ' + ', '.join(f"0x{b:02X}" for b in page_gz[i:i + 16])
+                      for i in range(0, len(page_gz), 16))
+    return (f'#define INDEX_HTML_GZ_LEN {len(page_gz)}\n'
+            f'#define INDEX_HTML_ETAG "{etag}"\n'
+            f'const uint8_t index_html_gz[INDEX_HTML_GZ_LEN] PROGMEM = {{\n{rows}\n}};')
 
-    with open(html_path, 'r') as f:
-        html_content = f.read().replace('"""', '\"\"\"')
 
-    # Wrap as rawliteral
-    index_html_literal = f'const char index_html[] PROGMEM = R"rawliteral({html_content})rawliteral";'
-    constants['INDEX_HTML'] = index_html_literal
+def load_page(html_path) -> bytes:
+    """Página en gzip: el .gz de minify.py tal cual, o un .html minificado ahora."""
+    path = Path(html_path)
+    if path.suffix == '.gz':
+        return path.read_bytes()
+    _, page_gz = minify.build_page(path.read_text(encoding='utf-8'))
+    return page_gz
 
+
+def render_core(constants, build_hash="", core_path=CORE_TEMPLATE) -> str:
+    """Renderiza neck_core.h con las constantes de build_constants."""
+    with open(core_path, 'r') as f:
+        return Template(f.read()).render({**constants, 'BUILD_HASH': build_hash})
+
+
+def render_ino(config: NeckConfig, template_path, html_path, core_path=CORE_TEMPLATE) -> Tuple[str, str]:
+    """
+    Renderiza el firmware (con neck_core.h dentro) y calcula su hash de build.
+
+    El hash sale del propio .ino renderizado (sin el sello) y del FQBN, así
+    que sólo cambia con lo que de verdad acaba en el firmware: las claves del
+    YAML que no usa build_constants no cuentan.
+
+    Returns:
+        (código del .ino, hash de build de BUILD_HASH_LEN caracteres)
+    """
+    constants = build_constants(config)
+    constants['INDEX_HTML'] = page_array(load_page(html_path))
     with open(template_path, 'r') as f:
         template = Template(f.read())
 
-    ino_code = template.render(**constants)
+    def render(build_hash: str) -> str:
+        core = render_core(constants, build_hash, core_path)
+        return template.render(**constants, NECK_CORE=core, BUILD_HASH=build_hash)
+
+    unstamped = render("")
+    build_hash = hashlib.sha256(f"{config.board.fqbn}\n{unstamped}".encode()).hexdigest()[:BUILD_HASH_LEN]
+    return render(build_hash), build_hash
+
+
+def generate_ino(config_path, template_path, output_path, html_path) -> str:
+    """Escribe el .ino y devuelve su hash de build."""
+    ino_code, build_hash = render_ino(load_config(config_path), template_path, html_path)
 
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     with open(output_path, 'w') as f:
         f.write(ino_code)
-    print(f"✅ INO generado en: {output_path}")
+    print(f"✅ INO generado en: {output_path} (build {build_hash})")
+    return build_hash
 
 if __name__ == '__main__':
+    # El .gz de minify.py si existe; si no, se minifica index.html ahora
+    page = Path('index_minified.html.gz')
     generate_ino(
         config_path='neck_config.yaml',
         template_path='ino_template.ino',
         output_path='epj-neck/epj-neck.ino',
-        html_path='index_minified.html'
+        html_path=page if page.exists() else 'index.html'
     )
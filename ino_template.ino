@@ -1,6 +1,7 @@
 #include <ESP32Servo.h>
 #include <WiFi.h>
 #include <WebServer.h>
+#include <WiFiUdp.h>
 
 // ---------- WiFi Config ----------
 const char* ap_ssid = "{{AP_SSID}}";
@@ -9,238 +10,164 @@ IPAddress local_ip(10, 0, 0, 1);
 IPAddress gateway(10, 0, 0, 1);
 IPAddress subnet(255, 255, 255, 0);
 WebServer server(80);
-
-// ---------- Configuración dinámica ----------
-#define NUM_SERVOS {{NUM_SERVOS}}
-#define STOP_PWM   {{STOP_PWM}}
-#define MAX_CW_PWM {{MAX_CW_PWM}}
-#define MAX_CCW_PWM {{MAX_CCW_PWM}}
-#define MS_PER_DEG {{MS_PER_DEG}}
-#define MIN_MOVE_THRESHOLD 0.5
-#define RAMP_TIME 50
-#define DEADZONE {{DEADZONE}}
-#define LED_PIN 2
-#define LED_BLINK_DURATION 100
-const int PINS[NUM_SERVOS] = { {{SERVO_PINS}} };
-#define LOOP_INTERVAL 20
-
-Servo servos[NUM_SERVOS];
-bool moving[NUM_SERVOS];
-unsigned long stopAt[NUM_SERVOS];
-float targetAngle[NUM_SERVOS];
-float currentAngle[NUM_SERVOS];
-unsigned long ledOffTime = 0;
-bool ledState = false;
-unsigned long lastLoopTime = 0;
-float calibrationFactor = 1.2;
-bool debugMode = false;
-
-// ---------- Helpers ----------
-void blinkLED() {
-  digitalWrite(LED_PIN, HIGH);
-  ledState = true;
-  ledOffTime = millis() + LED_BLINK_DURATION;
-}
-
-void updateLED() {
-  if (ledState && millis() >= ledOffTime) {
-    digitalWrite(LED_PIN, LOW);
-    ledState = false;
-  }
-}
-
-void stopAll() {
-  for (int i = 0; i < NUM_SERVOS; ++i) {
-    servos[i].write(STOP_PWM);
-    moving[i] = false;
-  }
-  blinkLED();
-  Serial.println("⏹️  Todos los servos detenidos");
-}
-
-int calculatePWM(float angleDeg) {
-  if (abs(angleDeg) < MIN_MOVE_THRESHOLD) return STOP_PWM;
-  int pwm;
-  if (angleDeg > 0) {
-    pwm = STOP_PWM + DEADZONE + (int)((MAX_CW_PWM - STOP_PWM - DEADZONE) * min(1.0, abs(angleDeg) / 90.0));
-  } else {
-    pwm = STOP_PWM - DEADZONE - (int)((STOP_PWM - MAX_CCW_PWM - DEADZONE) * min(1.0, abs(angleDeg) / 90.0));
+WiFiUDP udp;
+#define UDP_PORT {{UDP_PORT}}
+
+{{NECK_CORE}}
+
+// ---------- Canal UDP (neck_protocol.py) ----------
+uint8_t udpBuf[UDP_MAX_LEN];
+IPAddress udpPeer;
+uint16_t udpPeerPort = 0;
+uint32_t udpLastSeq = 0;
+LineParser udpLine;
+#if BINARY_PROTOCOL
+FrameParser udpFrame;
+#endif
+
+// Ejecuta los comandos de un datagrama: tramas binarias y/o líneas ASCII
+void processDatagram(const uint8_t* data, int len) {
+  int i = 0;
+  while (i < len) {
+#if BINARY_PROTOCOL
+    if (udpLine.len == 0 && data[i] == FRAME_SYNC) {
+      udpFrame.len = 0;
+      do {
+        feedFrame(udpFrame, data[i++]);
+      } while (i < len && udpFrame.len > 0);
+      udpFrame.len = 0;  // Una trama no continúa en el siguiente datagrama
+      continue;
+    }
+#endif
+    feedLine(udpLine, data[i++]);
   }
-  return constrain(pwm, MAX_CCW_PWM, MAX_CW_PWM);
-}
-
-void startMove(int idx, float angleDeg) {
-  if (idx < 0 || idx >= NUM_SERVOS) return;
-  if (abs(angleDeg) < MIN_MOVE_THRESHOLD) return;
-
-  int pwm = calculatePWM(angleDeg);
-  unsigned long duration = (unsigned long)(abs(angleDeg) * MS_PER_DEG * calibrationFactor);
-
-  servos[idx].write(pwm);
-  blinkLED();
-  moving[idx] = true;
-  stopAt[idx] = millis() + duration;
-  targetAngle[idx] = currentAngle[idx] + angleDeg;
-
-  Serial.printf("▶️  Servo %d: %s %.1f° (%lu ms)\n",
-                idx + 1,
-                (angleDeg > 0) ? "↻" : "↺",
-                angleDeg,
-                duration);
+  endLine(udpLine);  // La última línea no necesita '\n'
 }
 
-void updateMoves() {
-  unsigned long now = millis();
-  for (int i = 0; i < NUM_SERVOS; ++i) {
-    if (moving[i] && now >= stopAt[i]) {
-      servos[i].write(STOP_PWM);
-      blinkLED();
-      moving[i] = false;
-      currentAngle[i] = targetAngle[i];
-      Serial.printf("✅ Servo %d detenido en %.1f°\n", i + 1, currentAngle[i]);
+// Atiende los datagramas pendientes. Gana el más nuevo: los que llegan con
+// una secuencia anterior a la última aplicada se descartan. Un emisor nuevo
+// (otra IP o puerto) reinicia la secuencia.
+void handleUdp() {
+  while (udp.parsePacket() > 0) {
+    int len = udp.read(udpBuf, UDP_MAX_LEN);
+    if (len < UDP_HEADER_LEN) continue;
+    uint32_t seq = (uint32_t)udpBuf[0] | ((uint32_t)udpBuf[1] << 8) |
+                   ((uint32_t)udpBuf[2] << 16) | ((uint32_t)udpBuf[3] << 24);
+    bool samePeer = udp.remoteIP() == udpPeer && udp.remotePort() == udpPeerPort;
+    if (samePeer && (int32_t)(seq - udpLastSeq) <= 0) continue;
+    udpPeer = udp.remoteIP();
+    udpPeerPort = udp.remotePort();
+    udpLastSeq = seq;
+
+    console.captured = "";
+    console.capturing = true;
+    processDatagram(udpBuf + UDP_HEADER_LEN, len - UDP_HEADER_LEN);
+    console.capturing = false;
+    if ((udpBuf[4] & UDP_FLAG_ACK) || console.captured.length() > 0) {
+      // Respuesta: la misma cabecera y lo que se imprimió
+      udp.beginPacket(udpPeer, udpPeerPort);
+      udp.write(udpBuf, UDP_HEADER_LEN);
+      udp.write((const uint8_t*)console.captured.c_str(), console.captured.length());
+      udp.endPacket();
     }
+    console.captured = "";
   }
 }
 
-void resetPositions() {
-  for (int i = 0; i < NUM_SERVOS; ++i) {
-    currentAngle[i] = 0.0;
-    targetAngle[i] = 0.0;
+// ---------- Web Server ----------
+{{INDEX_HTML}}
+// La página va comprimida en flash; con If-None-Match y el mismo ETag basta un 304
+void handleRoot() {
+  server.sendHeader("ETag", INDEX_HTML_ETAG);
+  server.sendHeader("Cache-Control", "no-cache");
+  if (server.header("If-None-Match") == INDEX_HTML_ETAG) {
+    server.send(304);
+    return;
   }
-  Serial.println("🔄 Posiciones reiniciadas a 0°");
+  server.sendHeader("Content-Encoding", "gzip");
+  server.send_P(200, "text/html", (const char*)index_html_gz, INDEX_HTML_GZ_LEN);
 }
 
-// ---------- Comandos ----------
-void process_command(String cmd) {
-  cmd.trim();
-  if (cmd.startsWith("A ")) {
-    String values = cmd.substring(2);
-    float angle_values[NUM_SERVOS];
-    int parsed_count = 0;
-    int start = 0;
-    for (int i = 0; i < NUM_SERVOS && start < values.length(); i++) {
-      int space_pos = values.indexOf(' ', start);
-      String value_str;
-      if (space_pos == -1) {
-        value_str = values.substring(start);
-        start = values.length();
-      } else {
-        value_str = values.substring(start, space_pos);
-        start = space_pos + 1;
+// Añade las líneas de text como un array JSON de strings
+void appendJsonLines(String& json, const String& text) {
+  json += "[";
+  bool first = true;
+  int start = 0;
+  while (start < (int)text.length()) {
+    int end = text.indexOf('\n', start);
+    if (end == -1) end = text.length();
+    if (end > start) {
+      if (!first) json += ",";
+      first = false;
+      json += "\"";
+      for (int i = start; i < end; i++) {
+        char c = text[i];
+        if (c == '"' || c == '\\') json += '\\';
+        if ((uint8_t)c >= 0x20) json += c;
       }
-      if (value_str.length() > 0) {
-        angle_values[i] = value_str.toFloat();
-        parsed_count++;
-      }
-    }
-    if (parsed_count == NUM_SERVOS) {
-      stopAll();
-      delay(50);
-      for (int i = 0; i < NUM_SERVOS; i++) startMove(i, angle_values[i]);
-    } else {
-      Serial.printf("❌ A espera %d valores\n", NUM_SERVOS);
+      json += "\"";
     }
+    start = end + 1;
   }
-  else if (cmd.startsWith("V ")) {
-    String values = cmd.substring(2);
-    float pwm_values[NUM_SERVOS];
-    int parsed_count = 0;
-    int start = 0;
-
-    for (int i = 0; i < NUM_SERVOS && start < values.length(); i++) {
-      int space_pos = values.indexOf(' ', start);
-      String value_str;
-      if (space_pos == -1) {
-        value_str = values.substring(start);
-        start = values.length();
-      } else {
-        value_str = values.substring(start, space_pos);
-        start = space_pos + 1;
-      }
+  json += "]";
+}
 
-      if (value_str.length() > 0) {
-        pwm_values[i] = value_str.toFloat();
-        parsed_count++;
-      }
-    }
+LineParser apiLine;
 
-    if (parsed_count == NUM_SERVOS) {
-      for (int i = 0; i < NUM_SERVOS; i++) {
-        servos[i].write(constrain((int)pwm_values[i], 0, 180));
-      }
-      blinkLED();
-      Serial.print("✅ PWM directo: ");
-      for (int i = 0; i < NUM_SERVOS; i++) {
-        Serial.printf("%d ", (int)pwm_values[i]);
-      }
-      Serial.println();
-    } else {
-      Serial.printf("❌ V espera %d valores\n", NUM_SERVOS);
-    }
-  }
-  else if (cmd.equalsIgnoreCase("S")) {
-    stopAll();
+// /api/cmd: uno o varios comandos separados por '\n' o ';', en q o en el
+// cuerpo de un POST. Responde 204, o con r=1 {"ok":n,"out":[líneas]}
+void handleApiCommand() {
+  String body = server.hasArg("plain") ? server.arg("plain") : server.arg("q");
+  if (body.length() == 0) {
+    server.send(400, "application/json", "{\"error\":\"sin comandos\"}");
+    return;
   }
-  else if (cmd.equalsIgnoreCase("R")) {
-    resetPositions();
+  bool reply = server.arg("r") == "1";
+  server.client().setNoDelay(true);  // Respuestas pequeñas: sin esperar al ACK (Nagle)
+  console.captured = "";
+  console.capturing = reply;
+  int count = 0;
+  for (unsigned int i = 0; i < body.length(); i++) {
+    char c = body[i];
+    if (feedLine(apiLine, c == ';' ? '\n' : c)) count++;
   }
-  else {
-    Serial.println("❓ Comando no reconocido");
-  }
-}
-
-// ---------- Web Server ----------
-{{INDEX_HTML}}
-void handleRoot() {
-  server.send(200, "text/html", index_html);
-}
-
-void handleCommand() {
-  if (server.hasArg("q")) {
-    String cmd = server.arg("q");
-    process_command(cmd);
-    handleRoot();
-  } else {
-    server.send(400, "text/plain", "❌ Falta 'q'");
+  if (endLine(apiLine)) count++;
+  console.capturing = false;
+  if (!reply) {
+    server.send(204);
+    return;
   }
+  String json = "{\"ok\":" + String(count) + ",\"out\":";
+  appendJsonLines(json, console.captured);
+  json += "}";
+  console.captured = "";
+  server.send(200, "application/json", json);
 }
 
 // ---------- Setup ----------
 void setup() {
   Serial.begin(115200);
-  pinMode(LED_PIN, OUTPUT);
-  digitalWrite(LED_PIN, LOW);
-  lastLoopTime = millis();
-
-  for (int i = 0; i < NUM_SERVOS; ++i) {
-    servos[i].attach(PINS[i]);
-    moving[i] = false;
-    stopAt[i] = 0;
-    currentAngle[i] = 0.0;
-    targetAngle[i] = 0.0;
-  }
-
-  stopAll();
+  coreSetup();
 
   // WiFi AP + IP
   WiFi.softAPConfig(local_ip, gateway, subnet);
   WiFi.softAP(ap_ssid, ap_password);
-  Serial.print("📡 AP iniciado. IP: ");
-  Serial.println(WiFi.softAPIP());
+  console.print("📡 AP iniciado. IP: ");
+  console.println(WiFi.softAPIP());
 
+  const char* headerKeys[] = {"If-None-Match"};
+  server.collectHeaders(headerKeys, 1);
   server.on("/", handleRoot);
-  server.on("/cmd", handleCommand);
+  server.on("/api/cmd", handleApiCommand);
+  server.on("/cmd", handleApiCommand);  // Ruta antigua de la interfaz web
   server.begin();
-  Serial.printf("🌐 Web server listo. SSID: %s, PASS: %s\n", ap_ssid, ap_password);
+  udp.begin(UDP_PORT);
+  console.printf("🌐 Web server listo. SSID: %s, PASS: %s, UDP: %d\n", ap_ssid, ap_password, UDP_PORT);
 }
 
 // ---------- Loop ----------
 void loop() {
-  if (Serial.available()) {
-    String cmd = Serial.readStringUntil('\n');
-    process_command(cmd);
-  }
-  updateMoves();
-  updateLED();
+  coreLoop();
+  handleUdp();
   server.handleClient();
 }
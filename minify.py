@@ -1,30 +1,270 @@
 #!/usr/bin/env python3
-import sys
+"""
+Paso de assets de la interfaz web.
+
+Minifica el HTML y su CSS/JS embebido con tokenizadores que respetan
+strings, template literals y expresiones regulares (una URL como
+"http://..." dentro de un string no es un comentario), comprime el
+resultado con gzip y comprueba el presupuesto de tamaño:
+
+    python minify.py index.html            # index_minified.html(.gz)
+    python minify.py index.html --budget 4096
+
+ino_generator.py embebe el .gz como array de bytes y el firmware lo sirve
+con Content-Encoding: gzip. Si el .gz supera el presupuesto
+(web_ui.gzip_budget_bytes en neck_config.yaml) el script termina con
+error para que falle el build.
+"""
+import argparse
+import gzip
 import re
+import sys
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+import neck_config
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+
+# Elementos en línea: el espacio entre ellos se ve, así que se conserva uno
+INLINE_TAGS = {'a', 'b', 'code', 'em', 'i', 'input', 'label', 'small', 'span', 'strong'}
+
+_WORD = re.compile(r"[A-Za-z0-9_$\\]")
+_CSS_BLOCK_END = re.compile(r"[{;}]")
+# Tras estas palabras clave una '/' empieza una expresión regular
+_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete',
+                   'void', 'throw', 'case', 'do', 'else', 'yield', 'await'}
+# Tras estos caracteres una '/' empieza una expresión regular
+_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^")
+# Un salto de línea entre estos caracteres puede ser un ';' implícito (ASI)
+_ASI_BEFORE = set(")]}'\"`+-") | set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+_ASI_AFTER = set("([{'\"`+-/!~") | set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$")
+
+
+def _is_word(char: str) -> bool:
+    return bool(char) and (_WORD.match(char) is not None or ord(char) > 127)
+
+
+def _scan_string(src: str, i: int) -> int:
+    """Índice tras el string que empieza en src[i] (' o ")."""
+    quote = src[i]
+    i += 1
+    while i < len(src):
+        if src[i] == '\\':
+            i += 2
+        elif src[i] == quote or src[i] == '\n':
+            return i + 1
+        else:
+            i += 1
+    return i
+
+
+def _scan_template(src: str, i: int) -> int:
+    """Índice tras el template literal que empieza en src[i] (`), con ${...} anidados."""
+    i += 1
+    while i < len(src):
+        if src[i] == '\\':
+            i += 2
+        elif src[i] == '`':
+            return i + 1
+        elif src.startswith('${', i):
+            i = _scan_braces(src, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _scan_braces(src: str, i: int) -> int:
+    """Índice tras la '}' que cierra una expresión ${...} de un template."""
+    depth = 1
+    while i < len(src) and depth:
+        char = src[i]
+        if char in '\'"':
+            i = _scan_string(src, i)
+            continue
+        if char == '`':
+            i = _scan_template(src, i)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        i += 1
+    return i
+
+
+def _scan_regex(src: str, i: int) -> int:
+    """Índice tras la expresión regular /.../flags que empieza en src[i]."""
+    i += 1
+    in_class = False
+    while i < len(src) and src[i] != '\n':
+        char = src[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            while i < len(src) and _is_word(src[i]):
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def minify_js(src: str) -> str:
+    """
+    Quita comentarios y espacios de un script sin tocar strings, template
+    literals ni expresiones regulares.
+
+    Los saltos de línea que podrían ser un ';' implícito se conservan.
+    """
+    out: List[str] = []
+    last_word = ''  # Última palabra emitida (para distinguir '/' de una regex)
+    space = newline = False
+    i = 0
+    while i < len(src):
+        char = src[i]
+        if char in ' \t\r\n':
+            space = True
+            newline = newline or char == '\n'
+            i += 1
+            continue
+        if src.startswith('//', i):
+            end = src.find('\n', i)
+            i = len(src) if end == -1 else end
+            continue
+        if src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            i = len(src) if end == -1 else end + 2
+            space = True
+            continue
+
+        prev = out[-1][-1] if out else ''
+        if space and prev:
+            if newline and prev in _ASI_BEFORE and char in _ASI_AFTER:
+                out.append('\n')
+            elif (_is_word(prev) and _is_word(char)) or (prev in '+-' and char == prev):
+                out.append(' ')
+        space = newline = False
+
+        if char in '\'"':
+            end = _scan_string(src, i)
+        elif char == '`':
+            end = _scan_template(src, i)
+        elif char == '/' and (not prev or prev in _REGEX_AFTER or
+                              (_is_word(prev) and last_word in _REGEX_KEYWORDS)):
+            end = _scan_regex(src, i)
+        elif _is_word(char):
+            end = i
+            while end < len(src) and _is_word(src[end]):
+                end += 1
+        else:
+            end = i + 1
+        token = src[i:end]
+        last_word = token if _is_word(char) else ''
+        out.append(token)
+        i = end
+    return ''.join(out)
 
-def minify_html(html):
-    # Eliminar comentarios HTML
+
+def _is_declaration_colon(src: str, i: int) -> bool:
+    """El ':' de src[i] separa propiedad y valor: llega antes un ';' o '}' que un '{'."""
+    match = _CSS_BLOCK_END.search(src, i)
+    return match is None or match.group() != '{'
+
+
+def minify_css(src: str) -> str:
+    """Quita comentarios y espacios de una hoja de estilos sin tocar strings."""
+    out: List[str] = []
+    space = False
+    i = 0
+    while i < len(src):
+        char = src[i]
+        if src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            i = len(src) if end == -1 else end + 2
+            space = True
+            continue
+        if char in ' \t\r\n':
+            space = True
+            i += 1
+            continue
+        prev = out[-1][-1] if out else ''
+        # En los selectores ':' sólo se aprieta por detrás: '.a :hover' no es '.a:hover'
+        if space and prev and prev not in '{};,>:' and char not in '{};,>' \
+                and not (char == ':' and _is_declaration_colon(src, i)):
+            out.append(' ')
+        space = False
+        if char in '\'"':
+            end = _scan_string(src, i)
+            out.append(src[i:end])
+            i = end
+            continue
+        if char == '}' and prev == ';':
+            out[-1] = out[-1][:-1]  # El último ';' de un bloque sobra
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def _tag_name(tag: str) -> str:
+    match = re.match(r"</?\s*([A-Za-z0-9]+)", tag)
+    return match.group(1).lower() if match else ''
+
+
+def _minify_markup(html: str) -> str:
+    """Espacios del HTML fuera de <script>/<style>."""
     html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
 
-    # Minificar contenido de <script>...</script>
-    def minify_script(match):
-        script = match.group(1)
-        # Quitar comentarios de línea
-        script = re.sub(r'//.*', '', script)
-        # Quitar comentarios multilínea
-        script = re.sub(r'/\*.*?\*/', '', script, flags=re.DOTALL)
-        # Quitar espacios y líneas en blanco
-        script = re.sub(r'\s+', ' ', script)
-        return f"<script>{script.strip()}</script>"
-
-    html = re.sub(r"<script>(.*?)</script>", minify_script, html, flags=re.DOTALL)
-
-    # Quitar espacios entre tags
-    html = re.sub(r'>\s+<', '><', html)
-    # Quitar espacios múltiples
-    html = re.sub(r'\s{2,}', ' ', html)
-    return html.strip()
+    def between_tags(match):
+        text = match.string
+        left = text[text.rfind('<', 0, match.start()):match.start() + 1]
+        right = text[match.end() - 1:text.find('>', match.end()) + 1]
+        if _tag_name(left) in INLINE_TAGS or _tag_name(right) in INLINE_TAGS:
+            return '> <'
+        return '><'
+
+    html = re.sub(r'>\s+<', between_tags, html)
+    return re.sub(r'\s+', ' ', html)
+
+
+def minify_html(html: str) -> str:
+    """Minifica un documento HTML con su CSS y JS embebidos."""
+    parts = re.split(r'(<(script|style)\b[^>]*>)(.*?)(</\2>)', html, flags=re.DOTALL | re.IGNORECASE)
+    out = []
+    # re.split con 4 grupos: texto, etiqueta de apertura, nombre, contenido, cierre
+    for k in range(0, len(parts), 5):
+        out.append(_minify_markup(parts[k]).strip())
+        if k + 1 < len(parts):
+            opening, name, body, closing = parts[k + 1:k + 5]
+            body = minify_js(body) if name.lower() == 'script' else minify_css(body)
+            out.append(f"{opening}{body}{closing}")
+    return ''.join(out).strip()
+
+
+def gzip_bytes(data: bytes) -> bytes:
+    """gzip reproducible: mtime 0 para que el mismo HTML dé el mismo firmware."""
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def build_page(html: str) -> Tuple[str, bytes]:
+    """Devuelve (HTML minificado, HTML minificado en gzip)."""
+    minified = minify_html(html)
+    return minified, gzip_bytes(minified.encode("utf-8"))
+
+
+def load_budget(config_file: Optional[str] = None) -> Optional[int]:
+    """web_ui.gzip_budget_bytes de la configuración, o None si no hay."""
+    path = Path(config_file) if config_file else DEFAULT_CONFIG
+    if not path.is_file():
+        return None
+    return neck_config.load_config(path).gzip_budget_bytes
+
 
 def format_size(bytes_count):
     if bytes_count < 1024:
@@ -34,31 +274,46 @@ def format_size(bytes_count):
     else:
         return f"{bytes_count / 1024**2:.1f} MB"
 
+
 def main():
-    if len(sys.argv) != 2:
-        print("Uso: minify.py archivo.html")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Minifica, comprime y comprueba el tamaño de la interfaz web")
+    parser.add_argument("html", type=str, help="Archivo HTML de entrada")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Tamaño máximo del .gz en bytes (por defecto: web_ui.gzip_budget_bytes)")
+    args = parser.parse_args()
 
-    input_path = Path(sys.argv[1])
+    input_path = Path(args.html)
     if not input_path.is_file():
         print(f"❌ Archivo no encontrado: {input_path}")
         sys.exit(1)
 
     output_path = input_path.with_name(input_path.stem + "_minified.html")
+    gzip_path = output_path.with_name(output_path.name + ".gz")
     original = input_path.read_text(encoding="utf-8")
-    minified = minify_html(original)
+    minified, compressed = build_page(original)
+    output_path.write_text(minified, encoding="utf-8")
+    gzip_path.write_bytes(compressed)
 
     input_size = len(original.encode("utf-8"))
     output_size = len(minified.encode("utf-8"))
-    saved_bytes = input_size - output_size
-    saved_pct = 100 * saved_bytes / input_size if input_size else 0
-
-    output_path.write_text(minified, encoding="utf-8")
+    gzip_size = len(compressed)
+    saved_pct = 100 * (input_size - gzip_size) / input_size if input_size else 0
 
-    print(f"✅ HTML minificado guardado en: {output_path}")
+    print(f"✅ HTML minificado guardado en: {output_path} (+ {gzip_path.name})")
     print(f"📦 Tamaño original:  {format_size(input_size)}")
     print(f"📉 Tamaño minificado: {format_size(output_size)}")
-    print(f"💾 Ahorro: {format_size(saved_bytes)} ({saved_pct:.1f}%)")
+    print(f"🗜️  Tamaño gzip:       {format_size(gzip_size)}")
+    print(f"💾 Ahorro: {format_size(input_size - gzip_size)} ({saved_pct:.1f}%)")
+
+    budget = args.budget if args.budget is not None else load_budget(args.config)
+    if budget is not None:
+        if gzip_size > budget:
+            print(f"❌ La página supera el presupuesto: {gzip_size} B > {budget} B")
+            sys.exit(1)
+        print(f"🎯 Presupuesto: {gzip_size} / {budget} B ({100 * gzip_size / budget:.0f}%)")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+"""
+Planificador de movimientos con rampas de aceleración.
+
+Réplica de planMove(), profileState() y profilePWM() de neck_core.h para
+neck_emulator.py y el modelo de estado de epj_neck.py. Cada movimiento es un
+perfil trapezoidal de velocidad de hasta MAX_SEGMENTS tramos de aceleración
+constante:
+
+    1. frenada hasta 0, si el servo va en sentido contrario al objetivo o
+       ya no le da para parar en él
+    2. aceleración (o deceleración) hasta la velocidad de pico
+    3. crucero a la velocidad que dan las tablas de duración
+    4. frenada final, que deja el servo parado justo en el objetivo
+
+Un objetivo nuevo con el servo en marcha se planifica desde su posición y
+velocidad de ese instante, sin pararlo antes. La aceleración sale del
+ramp_time_ms de cada servo: lo que tarda en pasar de parado a la velocidad
+máxima (1 / MS_PER_DEG). El firmware sólo cambia el PWM cada LOOP_INTERVAL,
+con la velocidad del perfil en el centro del intervalo.
+
+Las unidades son grados y ms, y las cuentas reproducen el float de 32 bits
+del ESP32 operación a operación.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence, Tuple
+
+import servo_tables
+from servo_tables import MIN_MOVE_THRESHOLD, _f32
+
+MAX_SEGMENTS = 4
+
+# Velocidad de crucero (°/ms) y entrada de la LUT de PWM para una distancia con signo
+CruiseFunction = Callable[[float], Tuple[float, int]]
+
+
+@dataclass
+class Profile:
+    """Perfil de velocidad de un movimiento, relativo a su inicio."""
+    v0: float = 0.0  # °/ms al empezar
+    segments: List[Tuple[float, float]] = field(
+        default_factory=lambda: [(0.0, 0.0)] * MAX_SEGMENTS)  # (ms, °/ms²) de cada tramo
+    cruise: float = 0.0  # °/ms de crucero, para escalar el PWM
+    lut_k: int = 0       # Entrada de PWM_*_LUT a la velocidad de crucero
+
+    def state(self, t: float) -> Tuple[float, float]:
+        """(posición relativa al inicio, velocidad) t ms después de empezar."""
+        x = 0.0
+        v = self.v0
+        t = _f32(t)
+        for dur, acc in self.segments:
+            d = t if t < dur else dur
+            x = _f32(x + _f32(_f32(v + _f32(_f32(0.5 * acc) * d)) * d))
+            v = _f32(v + _f32(acc * d))
+            t = _f32(t - d)
+            if t <= 0:
+                break
+        if t > 0:
+            v = 0.0
+        return x, v
+
+    @property
+    def total_ms(self) -> float:
+        total = 0.0
+        for dur, _ in self.segments:
+            total = _f32(total + dur)
+        return total
+
+    @property
+    def duration_ms(self) -> int:
+        """Duración redondeada hacia arriba, como la anuncia el ▶️."""
+        return math.ceil(self.total_ms)
+
+    @property
+    def peak(self) -> float:
+        """Mayor |velocidad| del perfil en °/ms."""
+        v = self.v0
+        peak = abs(v)
+        for dur, acc in self.segments:
+            v = _f32(v + _f32(acc * dur))
+            peak = max(peak, abs(v))
+        return peak
+
+
+def acceleration(ms_per_deg: float, calibration_factor: float, ramp_ms: float) -> float:
+    """°/ms² con los que se llega de 0 a la velocidad máxima (1 / ms_per_deg) en ramp_ms."""
+    return _f32(1.0 / _f32(_f32(_f32(ms_per_deg) * _f32(calibration_factor)) * _f32(ramp_ms)))
+
+
+def ramp_accel(tables: servo_tables.ServoTables, idx: int, calibration_factor: float) -> float:
+    """rampAccel(): aceleración del servo con su sentido más lento."""
+    ms_per_deg = max(_f32(tables.ms_per_deg_cw[idx]), _f32(tables.ms_per_deg_ccw[idx]))
+    return acceleration(ms_per_deg, calibration_factor, tables.ramp_ms[idx])
+
+
+def cruise_speed(duration_ms: Callable[[float], int], dist: float) -> Tuple[float, int]:
+    """
+    cruiseSpeed(): velocidad de crucero para recorrer dist grados en lo que
+    dicen las tablas (duration_ms, como moveDuration()); por debajo de
+    MIN_MOVE_THRESHOLD se usa la del umbral.
+    """
+    ref = abs(dist) if abs(dist) > MIN_MOVE_THRESHOLD else MIN_MOVE_THRESHOLD
+    ms = duration_ms(ref if dist > 0 else -ref)
+    return _f32(ref / (ms if ms > 0 else 1)), servo_tables.lut_index(ref)
+
+
+def plan(position: float, velocity: float, target: float, accel: float,
+         cruise: CruiseFunction) -> Profile:
+    """
+    planMove(): perfil que lleva el servo de position (con velocity °/ms) a
+    target, parado al final.
+    """
+    dist = _f32(target - position)
+    s = 1.0 if dist > 0 or (dist == 0 and velocity > 0) else -1.0
+    u = _f32(velocity * s)  # Velocidad en el sentido del objetivo
+    length = _f32(dist * s)
+    segments = []
+    if u < 0 or _f32(u * u) > _f32(_f32(2 * accel) * length):
+        # Va al revés o no le da para parar: primero frena hasta 0
+        tb = _f32(abs(u) / accel)
+        segments.append((tb, -accel if velocity > 0 else accel))
+        length = _f32(length - _f32(_f32(u * tb) * 0.5))
+        if length < 0:
+            s = -s
+            length = -length
+        u = 0.0
+    vc, lut_k = cruise(_f32(s * length))
+    peak = _f32(math.sqrt(_f32(_f32(accel * length) + _f32(_f32(u * u) * 0.5))))
+    if peak > vc:
+        peak = vc
+    t1 = _f32(abs(_f32(peak - u)) / accel)
+    segments.append((t1, _f32((accel if peak >= u else -accel) * s)))
+    t3 = _f32(peak / accel)
+    cruise_len = _f32(_f32(length - _f32(_f32(_f32(u + peak) * 0.5) * t1)) - _f32(_f32(peak * t3) * 0.5))
+    segments.append((_f32(cruise_len / peak) if cruise_len > 0 and peak > 0 else 0.0, 0.0))
+    segments.append((t3, _f32(-accel * s)))
+    segments += [(0.0, 0.0)] * (MAX_SEGMENTS - len(segments))
+    return Profile(velocity, segments, vc, lut_k)
+
+
+def plan_move(tables: servo_tables.ServoTables, idx: int, position: float, velocity: float,
+              target: float, calibration_factor: float) -> Profile:
+    """plan() con la aceleración y las duraciones de las tablas del servo."""
+    return plan(position, velocity, target, ramp_accel(tables, idx, calibration_factor),
+                lambda dist: cruise_speed(lambda a: tables.duration_ms(idx, a, calibration_factor), dist))
+
+
+def profile_pwm(pwm_cw: Sequence[int], pwm_ccw: Sequence[int], stop_pwm: int,
+                profile: Profile, t: float) -> int:
+    """
+    profilePWM(): PWM para la velocidad del perfil en t, la entrada de
+    crucero de la LUT escalada por la fracción de la velocidad de crucero.
+    Nunca baja de la entrada del umbral, la primera fuera de la zona muerta.
+    """
+    _, v = profile.state(t)
+    if v == 0 or profile.cruise <= 0:
+        return stop_pwm
+    f = _f32(_f32(_f32(profile.lut_k * abs(v)) / profile.cruise) + 0.5)
+    k = int(f) if f < servo_tables.LUT_SIZE - 1 else servo_tables.LUT_SIZE - 1
+    k = max(k, servo_tables.lut_index(MIN_MOVE_THRESHOLD))
+    return (pwm_cw if v > 0 else pwm_ccw)[k]
@@ -0,0 +1,190 @@
+// Banco de pruebas de neck_core.h en el PC. Lo compila neck_native.py junto
+// al núcleo renderizado y a native_stubs.h.
+//
+//   harness script [tick_us]
+//       Ejecuta los comandos que llegan por stdin y escribe la salida del
+//       firmware por stdout, avanzando el reloj virtual tick_us por vuelta
+//       (1000 por defecto) hasta que no quede nada en curso.
+//
+//   harness bench <segundos> <baudios> <comandos/s> <carga> <tick_us> <semilla>
+//       Llena el UART al ritmo de los baudios (comandos/s = 0: todo lo que
+//       quepa) con comandos de la carga (moves, stream, mixed) durante
+//       <segundos> de reloj virtual. Mide cada vuelta de coreLoop() (loop_us:
+//       CPU más lo que esperó en delay(); cpu_us: sólo CPU de este PC) y con
+//       qué retraso se para cada servo respecto a su stopAt. La salida también
+//       sale al ritmo de los baudios: con la FIFO del UART llena, write()
+//       espera (tx_wait_us). Entre vueltas el reloj avanza además tick_us, lo
+//       que el ESP32 gasta en WiFi y web. Escribe un JSON por stdout.
+#include "native_stubs.h"
+#include "neck_core.h"
+
+#include <algorithm>
+#include <chrono>
+#include <iostream>
+#include <iterator>
+#include <random>
+#include <vector>
+
+// Retrasos de parada en µs, para el hook de Servo::write
+std::vector<double> stopLateUs;
+
+void recordStop(Servo* servo, int pwm) {
+  int idx = (int)(servo - servos);
+  if (idx < 0 || idx >= NUM_SERVOS || !moving[idx] || pwm != STOP_PWM[idx]) return;
+  uint64_t due = (uint64_t)stopAt[idx] * 1000;
+  if (hostMicros >= due) stopLateUs.push_back((double)(hostMicros - due));
+}
+
+bool busy() {
+  if (Serial.available() || streaming) return true;
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    if (moving[i]) return true;
+  }
+  return false;
+}
+
+int runScript(uint64_t tickUs) {
+  std::string input((std::istreambuf_iterator<char>(std::cin)), std::istreambuf_iterator<char>());
+  coreSetup();
+  Serial.tx.clear();
+  Serial.feed(input);
+  // Tope por si un comando deja algo en marcha para siempre
+  for (long n = 0; busy() && n < 10000000; n++) {
+    coreLoop();
+    hostMicros += tickUs;
+  }
+  std::cout << Serial.tx;
+  return 0;
+}
+
+// ---------- Carga ----------
+std::string angles(std::mt19937& rng, float range) {
+  std::uniform_real_distribution<float> dist(-range, range);
+  std::string out;
+  char buf[16];
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    snprintf(buf, sizeof(buf), " %.1f", dist(rng));
+    out += buf;
+  }
+  return out;
+}
+
+std::string nextCommand(const std::string& load, std::mt19937& rng, unsigned long& streamT) {
+  std::uniform_int_distribution<int> pick(0, 99);
+  int p = pick(rng);
+  if (load == "moves" || (load == "mixed" && p < 10)) return "A" + angles(rng, 45) + "\n";
+  if (load == "stream" || (load == "mixed" && p < 70)) {
+    streamT += LOOP_INTERVAL;
+    return "Q " + std::to_string(streamT) + angles(rng, 30) + "\n";
+  }
+  if (p < 80) {
+    std::string cmd = "V";
+    for (int i = 0; i < NUM_SERVOS; i++) cmd += " " + std::to_string(STOP_PWM[i]);
+    return cmd + "\n";
+  }
+  if (p < 95) return "P\n";
+  return "S\n";
+}
+
+struct Stats {
+  double mean, p50, p99, max;
+  size_t count;
+};
+
+Stats summarize(std::vector<double> v) {
+  Stats s = {0, 0, 0, 0, v.size()};
+  if (v.empty()) return s;
+  std::sort(v.begin(), v.end());
+  double sum = 0;
+  for (double x : v) sum += x;
+  s.mean = sum / v.size();
+  s.p50 = v[v.size() / 2];
+  s.p99 = v[std::min(v.size() - 1, (size_t)(0.99 * v.size()))];
+  s.max = v.back();
+  return s;
+}
+
+void printStats(const char* name, const Stats& s, double scale, bool last) {
+  printf("  \"%s\": {\"count\": %zu, \"mean\": %.3f, \"p50\": %.3f, \"p99\": %.3f, \"max\": %.3f}%s\n",
+         name, s.count, s.mean * scale, s.p50 * scale, s.p99 * scale, s.max * scale, last ? "" : ",");
+}
+
+int runBench(double seconds, long baud, double rate, const std::string& load, uint64_t tickUs,
+             unsigned seed) {
+  std::mt19937 rng(seed);
+  servoWriteHook = recordStop;
+  coreSetup();
+  Serial.tx.clear();
+  Serial.begin(baud);
+
+  const double usPerByte = 10e6 / baud;  // 8N1
+  uint64_t end = hostMicros + (uint64_t)(seconds * 1e6);
+  double lineFree = (double)hostMicros;   // Cuándo termina de llegar lo ya enviado
+  double nextCommandAt = (double)hostMicros;
+  unsigned long streamT = 0;
+  std::string pending;
+  size_t pendingPos = 0;
+  size_t bytesIn = 0, bytesOut = 0, commands = 0, backlogMax = 0;
+  std::vector<double> loopUs, cpuUs;
+  double carryUs = 0;  // Fracción de µs de CPU aún no sumada al reloj
+
+  while (hostMicros < end) {
+    // Bytes que han llegado al UART hasta ahora
+    std::string arrived;
+    while (true) {
+      if (pendingPos == pending.size()) {
+        if (rate > 0 && nextCommandAt > hostMicros) break;
+        pending = nextCommand(load, rng, streamT);
+        pendingPos = 0;
+        commands++;
+        lineFree = std::max(lineFree, nextCommandAt);
+        nextCommandAt += rate > 0 ? 1e6 / rate : 0;
+      }
+      if (lineFree + usPerByte > hostMicros) break;
+      arrived += pending[pendingPos++];
+      lineFree += usPerByte;
+    }
+    Serial.feed(arrived);
+    bytesIn += arrived.size();
+
+    uint64_t before = hostMicros;
+    auto t0 = std::chrono::steady_clock::now();
+    coreLoop();
+    auto t1 = std::chrono::steady_clock::now();
+    double ns = (double)std::chrono::duration_cast<std::chrono::nanoseconds>(t1 - t0).count();
+    // La vuelta dura lo que esperó en delay() más lo que tardó la CPU
+    cpuUs.push_back(ns / 1000);
+    loopUs.push_back((double)(hostMicros - before) + ns / 1000);
+    backlogMax = std::max(backlogMax, (size_t)Serial.available());
+    bytesOut += Serial.tx.size();
+    Serial.tx.clear();
+    carryUs += ns / 1000;
+    hostMicros += tickUs + (uint64_t)carryUs;
+    carryUs -= (uint64_t)carryUs;
+  }
+
+  printf("{\n");
+  printf("  \"workload\": \"%s\", \"seconds\": %.3f, \"baudrate\": %ld, \"rate\": %.1f, "
+         "\"tick_us\": %llu, \"seed\": %u, \"num_servos\": %d,\n",
+         load.c_str(), seconds, baud, rate, (unsigned long long)tickUs, seed, NUM_SERVOS);
+  printf("  \"iterations\": %zu, \"commands_sent\": %zu, \"bytes_in\": %zu, \"bytes_out\": %zu, "
+         "\"rx_backlog_max\": %zu, \"tx_wait_us\": %llu,\n",
+         loopUs.size(), commands, bytesIn, bytesOut, backlogMax, (unsigned long long)Serial.txWaitUs);
+  printStats("loop_us", summarize(loopUs), 1, false);
+  printStats("cpu_us", summarize(cpuUs), 1, false);
+  printStats("stop_late_ms", summarize(stopLateUs), 1e-3, true);
+  printf("}\n");
+  return 0;
+}
+
+int main(int argc, char** argv) {
+  std::string mode = argc > 1 ? argv[1] : "";
+  if (mode == "script") return runScript(argc > 2 ? strtoull(argv[2], nullptr, 10) : 1000);
+  if (mode == "bench" && argc == 8) {
+    return runBench(atof(argv[2]), atol(argv[3]), atof(argv[4]), argv[5],
+                    strtoull(argv[6], nullptr, 10), (unsigned)strtoul(argv[7], nullptr, 10));
+  }
+  fprintf(stderr, "uso: %s script [tick_us] | bench <s> <baudios> <cmd/s> <carga> <tick_us> <semilla>\n",
+          argv[0]);
+  return 2;
+}
@@ -0,0 +1,146 @@
+// Lo mínimo de la API de Arduino/ESP32 que usa neck_core.h, para compilarlo
+// con g++ en el PC (neck_native.py). El tiempo es virtual: millis() y
+// micros() sólo avanzan con delay() o cuando el programa mueve hostMicros.
+#pragma once
+
+#include <cctype>
+#include <cmath>
+#include <cstdarg>
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+
+using std::abs;
+using std::isfinite;
+
+// ---------- Tiempo ----------
+uint64_t hostMicros = 0;
+
+unsigned long millis() { return (unsigned long)(hostMicros / 1000); }
+unsigned long micros() { return (unsigned long)hostMicros; }
+void delay(unsigned long ms) { hostMicros += (uint64_t)ms * 1000; }
+
+// ---------- Pines y flash ----------
+#define HIGH 1
+#define LOW 0
+#define OUTPUT 1
+#define PROGMEM
+#define pgm_read_byte(addr) (*(const uint8_t*)(addr))
+#define pgm_read_float(addr) (*(const float*)(addr))
+
+void pinMode(int, int) {}
+void digitalWrite(int, int) {}
+
+template <typename T, typename L, typename H>
+T constrain(T value, L low, H high) {
+  return value < low ? low : (value > high ? high : value);
+}
+
+// ---------- String y Print ----------
+class String {
+ public:
+  String(const char* s = "") : s_(s) {}
+  String& operator+=(char c) { s_ += c; return *this; }
+  String& operator+=(const char* s) { s_ += s; return *this; }
+  bool operator==(const char* s) const { return s_ == s; }
+  unsigned int length() const { return s_.size(); }
+  const char* c_str() const { return s_.c_str(); }
+  char operator[](unsigned int i) const { return s_[i]; }
+
+ private:
+  std::string s_;
+};
+
+class Print {
+ public:
+  virtual ~Print() {}
+  virtual size_t write(uint8_t c) = 0;
+  virtual size_t write(const uint8_t* buffer, size_t size) {
+    for (size_t i = 0; i < size; i++) write(buffer[i]);
+    return size;
+  }
+  size_t print(const char* s) { return write((const uint8_t*)s, strlen(s)); }
+  size_t println(const char* s) { return print(s) + println(); }
+  size_t println() { return print("\r\n"); }
+  size_t printf(const char* format, ...) __attribute__((format(printf, 2, 3))) {
+    char buf[256];
+    va_list args;
+    va_start(args, format);
+    int len = vsnprintf(buf, sizeof(buf), format, args);
+    va_end(args);
+    if (len < 0) return 0;
+    return write((const uint8_t*)buf, (size_t)len < sizeof(buf) ? len : sizeof(buf) - 1);
+  }
+};
+
+// ---------- Serial ----------
+// rx lo llena el programa; lo que escribe el firmware se acumula en tx.
+// Tras begin(baudios), write() espera como el UART del ESP32 cuando su FIFO
+// de transmisión (TX_FIFO_SIZE bytes) está llena; sin begin() no espera
+#define TX_FIFO_SIZE 128
+class HostSerial {
+ public:
+  std::string rx;
+  size_t rxPos = 0;
+  std::string tx;
+  double usPerByte = 0;
+  double txDoneAt = 0;   // µs en que termina de salir lo ya escrito
+  uint64_t txWaitUs = 0;  // µs que el firmware ha esperado en write()
+
+  void begin(unsigned long baud) { usPerByte = baud ? 10e6 / baud : 0; }  // 8N1
+  int available() const { return (int)(rx.size() - rxPos); }
+  int peek() const { return available() ? (uint8_t)rx[rxPos] : -1; }
+  int read() { return available() ? (uint8_t)rx[rxPos++] : -1; }
+  size_t write(uint8_t c) {
+    pace(1);
+    tx += (char)c;
+    return 1;
+  }
+  size_t write(const uint8_t* buffer, size_t size) {
+    pace(size);
+    tx.append((const char*)buffer, size);
+    return size;
+  }
+
+  // Avanza el reloj lo que tarda en haber sitio en la FIFO para size bytes
+  void pace(size_t size) {
+    if (!usPerByte) return;
+    double now = (double)hostMicros;
+    if (txDoneAt < now) txDoneAt = now;
+    txDoneAt += size * usPerByte;
+    double wait = txDoneAt - TX_FIFO_SIZE * usPerByte - now;
+    if (wait > 0) {
+      hostMicros += (uint64_t)ceil(wait);
+      txWaitUs += (uint64_t)ceil(wait);
+    }
+  }
+
+  void feed(const std::string& data) {
+    // Compacta lo ya leído para que rx no crezca sin límite
+    if (rxPos > 4096) {
+      rx.erase(0, rxPos);
+      rxPos = 0;
+    }
+    rx += data;
+  }
+};
+HostSerial Serial;
+
+// ---------- Servo ----------
+class Servo;
+// Si está puesto, se llama en cada write() antes de cambiar el PWM
+void (*servoWriteHook)(Servo* servo, int pwm) = nullptr;
+
+class Servo {
+ public:
+  int pin = -1;
+  int pwm = -1;
+
+  void attach(int p) { pin = p; }
+  void write(int value) {
+    if (servoWriteHook) servoWriteHook(this, value);
+    pwm = value;
+  }
+};
@@ -0,0 +1,630 @@
+"""
+Configuración del cuello (neck_config.yaml) en un solo sitio.
+
+Todas las herramientas (flash_firmware.py, ino_generator.py, el emulador, el
+controlador, servo_characterize.py, ...) leen el YAML con load_config, que
+lo valida entero y lo convierte en dataclasses inmutables con __slots__:
+
+    config = load_config()
+    config.num_servos                      # 3
+    config.servos[0].pwm.max_cw            # 140
+    config.communication.gesture_slots     # 8
+
+La validación no se para en el primer fallo: ConfigError lleva la lista de
+todos los problemas (límites de cada servo, orden de los PWM, GPIO
+repetidos, tamaños del firmware, ...).
+
+load_config guarda lo leído por ruta junto con el mtime y el tamaño del
+archivo: mientras el YAML no cambie, las siguientes llamadas devuelven el
+mismo objeto sin volver a parsearlo. Como todo es inmutable, se puede
+compartir entre hilos y herramientas sin copiarlo.
+
+Las claves de cada servo que faltan se toman de servo_defaults (salvo
+calibration_factor, que ahí es el factor global del firmware). Los
+controladores usan load_config_or_default: sin neck_config.yaml se conectan
+con DEFAULT_DOCUMENT, tres servos con los PWM de fábrica.
+
+dataclass(slots=True) necesita Python 3.10 o posterior.
+"""
+import math
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+import neck_protocol
+from servo_tables import DEFAULT_CALIBRATION_FACTOR, DEFAULT_RAMP_MS
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+
+DEFAULT_BAUDRATE = 115200
+SERVO_TYPES = ('continuous_rotation',)
+PWM_MAX = 180  # Servo.write() del firmware recibe 0-180
+# GPIO que pueden generar PWM en cada chip (sufijo del FQBN); el resto no se comprueba
+OUTPUT_GPIOS = {
+    'esp32': tuple(range(0, 34)),  # 34-39 son sólo de entrada
+    'esp32s3': tuple(range(0, 22)) + tuple(range(26, 49)),  # 22-25 no existen
+}
+GESTURE_SLOTS_MAX = 31  # loadedGestures() devuelve la máscara en un int
+GESTURE_POINTS_MAX = 65535  # count y loaded son uint16_t en el firmware
+
+# Articulación "agile eye": ejes de motor ortogonales entre sí
+DEFAULT_GEOMETRY = {
+    'alpha1_deg': 90.0,
+    'alpha2_deg': 90.0,
+    'beta_deg': 54.7356,
+    'gamma_deg': 54.7356,
+    'leg_azimuths_deg': [0.0, 120.0, 240.0],
+    'branch': 1,
+    'motor_signs': [1, 1, 1],
+}
+DEFAULT_WORKSPACE = {
+    'yaw': [-60.0, 60.0],
+    'pitch': [-40.0, 40.0],
+    'roll': [-30.0, 30.0],
+    'step_deg': 2.0,
+}
+# Configuración con la que se conecta el host cuando no hay neck_config.yaml
+DEFAULT_DOCUMENT = {
+    'board_settings': {'fqbn': 'esp32:esp32:esp32s3', 'sketch': 'epj-neck'},
+    'servo_defaults': {'stop_pwm': 95, 'max_cw_pwm': 140, 'max_ccw_pwm': 50,
+                       'degrees_per_second': 600.0, 'deadzone': 2},
+    'servo_settings': {1: {}, 2: {}, 3: {}},
+}
+
+
+class ConfigError(ValueError):
+    """
+    Configuración inválida.
+
+    Attributes:
+        source: Archivo (o descripción) de donde salió la configuración
+        problems: Todos los problemas encontrados, uno por entrada
+    """
+
+    def __init__(self, source, problems: List[str]):
+        self.source = source
+        self.problems = list(problems)
+        count = len(self.problems)
+        lines = [f"Configuración inválida en {source} ({count} problema{'s' if count != 1 else ''}):"]
+        super().__init__("\n".join(lines + [f"  - {p}" for p in self.problems]))
+
+
+@dataclass(frozen=True, slots=True)
+class BoardSettings:
+    """board_settings: placa, puerto y sketch."""
+    fqbn: str
+    sketch: str
+    port: Optional[str] = None
+    ino_file: Optional[str] = None
+    baudrate: int = DEFAULT_BAUDRATE
+
+    @property
+    def chip(self) -> str:
+        """Última parte del FQBN ('esp32s3' en esp32:esp32:esp32s3)."""
+        return self.fqbn.rsplit(':', 1)[-1]
+
+
+@dataclass(frozen=True, slots=True)
+class PwmConfig:
+    """pwm_config de un servo: parada y extremos de cada sentido."""
+    stop: int
+    max_cw: int
+    max_ccw: int
+
+
+@dataclass(frozen=True, slots=True)
+class ServoSettings:
+    """Una entrada de servo_settings, ya con los valores de servo_defaults."""
+    key: str  # Clave en servo_settings
+    type: str
+    gpio: Optional[int]  # Sólo hace falta para generar el firmware
+    degrees_per_second: float
+    calibration_factor: float
+    deadzone: int
+    pwm: PwmConfig
+    min_move_threshold: float = 0.5
+    max_rotation_time_ms: Optional[int] = None
+    ramp_time_ms: float = DEFAULT_RAMP_MS
+    velocity_cw: Tuple[Tuple[int, float], ...] = ()  # (PWM, grados/s) medidos, por PWM
+    velocity_ccw: Tuple[Tuple[int, float], ...] = ()
+
+    @property
+    def characterized(self) -> bool:
+        """True si tiene velocity_table (servo_characterize.py)."""
+        return bool(self.velocity_cw or self.velocity_ccw)
+
+
+@dataclass(frozen=True, slots=True)
+class WorkspaceSettings:
+    """kinematics.workspace: rejilla de neck_ik_table.py."""
+    yaw: Tuple[float, float]
+    pitch: Tuple[float, float]
+    roll: Tuple[float, float]
+    step_deg: float
+
+
+@dataclass(frozen=True, slots=True)
+class KinematicsSettings:
+    """kinematics: geometría de la articulación (ver neck_kinematics.py)."""
+    alpha1_deg: float
+    alpha2_deg: float
+    beta_deg: float
+    gamma_deg: float
+    leg_azimuths_deg: Tuple[float, ...]
+    branch: int
+    motor_signs: Tuple[int, ...]
+    workspace: WorkspaceSettings
+
+
+@dataclass(frozen=True, slots=True)
+class CommunicationSettings:
+    """communication: buffers y canales del firmware."""
+    command_buffer_size: int = 64
+    setpoint_buffer_size: int = 32
+    binary_protocol: bool = False
+    udp_port: int = neck_protocol.UDP_PORT
+    telemetry_hz: int = 0
+    gesture_slots: int = 8
+    gesture_max_points: int = 64
+
+
+@dataclass(frozen=True, slots=True)
+class SafetySettings:
+    """safety."""
+    enable_watchdog: bool = False
+    max_idle_time_ms: int = 0
+    emergency_stop_pin: int = -1
+
+
+@dataclass(frozen=True, slots=True)
+class DebugSettings:
+    """debug: nivel de registro con que arranca el firmware."""
+    verbose_output: bool = False
+    show_timing: bool = False
+    log_commands: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class NeckConfig:
+    """neck_config.yaml validado."""
+    board: BoardSettings
+    servos: Tuple[ServoSettings, ...]
+    kinematics: KinematicsSettings
+    communication: CommunicationSettings = CommunicationSettings()
+    safety: SafetySettings = SafetySettings()
+    debug: DebugSettings = DebugSettings()
+    calibration_factor: float = DEFAULT_CALIBRATION_FACTOR  # servo_defaults.calibration_factor
+    arduino_cli_path: Optional[str] = None
+    gzip_budget_bytes: Optional[int] = None  # web_ui.gzip_budget_bytes
+    source: Optional[str] = None
+
+    @property
+    def num_servos(self) -> int:
+        return len(self.servos)
+
+    def servo(self, key) -> ServoSettings:
+        """Servo por su clave en servo_settings."""
+        for servo in self.servos:
+            if servo.key == str(key):
+                return servo
+        raise KeyError(f"servo {key} no está en servo_settings")
+
+    def check_firmware(self):
+        """
+        Comprueba lo que sólo hace falta para generar el firmware (el host no
+        usa los GPIO).
+
+        Raises:
+            ConfigError: Si algún servo no tiene gpio
+        """
+        problems = [f"servo_settings.{s.key}.gpio: falta (hace falta para generar el firmware)"
+                    for s in self.servos if s.gpio is None]
+        if problems:
+            raise ConfigError(self.source, problems)
+
+
+# ---------- Validación ----------
+
+_REQUIRED = object()
+# Claves válidas de cada sección; cualquier otra es un problema
+_TOP_KEYS = ('board_settings', 'arduino_cli_path', 'servo_defaults', 'servo_settings', 'kinematics',
+             'communication', 'web_ui', 'safety', 'debug')
+_BOARD_KEYS = ('fqbn', 'sketch', 'port', 'ino_file', 'baudrate')
+_DEFAULTS_KEYS = ('type', 'stop_pwm', 'max_cw_pwm', 'max_ccw_pwm', 'degrees_per_second', 'calibration_factor',
+                  'deadzone', 'min_move_threshold', 'ramp_time_ms')
+_SERVO_KEYS = ('type', 'gpio', 'degrees_per_second', 'calibration_factor', 'min_move_threshold', 'deadzone',
+               'ramp_time_ms', 'pwm_config', 'safety_limits', 'velocity_table')
+_PWM_KEYS = ('stop', 'max_cw', 'max_ccw')
+_LIMITS_KEYS = ('max_rotation_time_ms',)
+_VELOCITY_KEYS = ('cw', 'ccw')
+_KINEMATICS_KEYS = ('alpha1_deg', 'alpha2_deg', 'beta_deg', 'gamma_deg', 'leg_azimuths_deg', 'branch',
+                    'motor_signs', 'workspace')
+_WORKSPACE_KEYS = ('yaw', 'pitch', 'roll', 'step_deg')
+_COMMUNICATION_KEYS = ('command_buffer_size', 'setpoint_buffer_size', 'binary_protocol', 'udp_port',
+                       'telemetry_hz', 'gesture_slots', 'gesture_max_points')
+_WEB_UI_KEYS = ('gzip_budget_bytes',)
+_SAFETY_KEYS = ('enable_watchdog', 'max_idle_time_ms', 'emergency_stop_pin')
+_DEBUG_KEYS = ('verbose_output', 'show_timing', 'log_commands')
+_KIND_NAMES = {bool: "true o false", int: "un entero", float: "un número", str: "un texto"}
+
+
+class _Checker:
+    """Lee valores del YAML y acumula los problemas en vez de parar en el primero."""
+
+    def __init__(self):
+        self.problems: List[str] = []
+
+    def fail(self, path: str, message: str):
+        self.problems.append(f"{path}: {message}")
+
+    def section(self, parent: Dict, key, path: str) -> Dict:
+        value = parent.get(key)
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            self.fail(path, f"debe ser una sección, no {value!r}")
+            return {}
+        return value
+
+    def known(self, section: Dict, path: str, keys: Tuple[str, ...]):
+        """Apunta cada clave de section que no está en keys (casi siempre, una errata)."""
+        for key in section:
+            if key not in keys:
+                name = f"{path}.{key}" if path else str(key)
+                self.fail(name, f"clave desconocida (valen: {', '.join(keys)})")
+
+    def value(self, section: Dict, key: str, path: str, kind=float, default: Any = _REQUIRED,
+              low: Optional[float] = None, high: Optional[float] = None) -> Any:
+        """
+        Valor de section[key] convertido a kind, o default si falta.
+
+        Devuelve None si el valor es inválido (o falta y es obligatorio); el
+        problema queda apuntado.
+        """
+        name = f"{path}.{key}" if path else str(key)
+        raw = section.get(key)
+        if raw is None:
+            if default is _REQUIRED:
+                self.fail(name, "falta")
+                return None
+            return default
+        if kind is bool:
+            ok = isinstance(raw, bool)
+        elif kind is int:
+            ok = isinstance(raw, int) and not isinstance(raw, bool)
+        elif kind is float:
+            ok = isinstance(raw, (int, float)) and not isinstance(raw, bool) and math.isfinite(raw)
+        else:
+            ok = isinstance(raw, kind)
+        if not ok:
+            self.fail(name, f"debe ser {_KIND_NAMES[kind]}, no {raw!r}")
+            return None
+        value = kind(raw)
+        if (low is not None and value < low) or (high is not None and value > high):
+            bounds = f"entre {low} y {high}" if low is not None and high is not None else \
+                f">= {low}" if low is not None else f"<= {high}"
+            self.fail(name, f"{value} fuera de rango (debe ser {bounds})")
+            return None
+        return value
+
+    def numbers(self, section: Dict, key: str, path: str, kind=float, default: Any = _REQUIRED,
+                length: Optional[int] = None) -> Optional[Tuple]:
+        """Lista de números como tupla; None si no vale."""
+        name = f"{path}.{key}"
+        raw = section.get(key)
+        if raw is None:
+            if default is _REQUIRED:
+                self.fail(name, "falta")
+                return None
+            return tuple(default)
+        if not isinstance(raw, (list, tuple)):
+            self.fail(name, f"debe ser una lista, no {raw!r}")
+            return None
+        values = [self.value({i: v}, i, name, kind) for i, v in enumerate(raw)]
+        if any(v is None for v in values):
+            return None
+        if length is not None and len(values) != length:
+            self.fail(name, f"debe tener {length} valores, no {len(values)}")
+            return None
+        return tuple(values)
+
+
+def _parse_board(c: _Checker, data: Dict) -> BoardSettings:
+    if 'board_settings' not in data:
+        c.fail('board_settings', "falta la sección")
+    board = c.section(data, 'board_settings', 'board_settings')
+    path = 'board_settings'
+    c.known(board, path, _BOARD_KEYS)
+    return BoardSettings(
+        fqbn=c.value(board, 'fqbn', path, str),
+        sketch=c.value(board, 'sketch', path, str),
+        port=c.value(board, 'port', path, str, default=None),
+        ino_file=c.value(board, 'ino_file', path, str, default=None),
+        baudrate=c.value(board, 'baudrate', path, int, default=DEFAULT_BAUDRATE, low=1),
+    )
+
+
+def _parse_velocity(c: _Checker, table: Dict, path: str) -> Tuple[Tuple[int, float], ...]:
+    """Puntos (PWM, grados/s) de una dirección de velocity_table, ordenados por PWM."""
+    if table is None:
+        return ()
+    if not isinstance(table, dict):
+        c.fail(path, f"debe ser una sección PWM: grados/s, no {table!r}")
+        return ()
+    points = []
+    for pwm, dps in table.items():
+        if isinstance(pwm, bool) or not isinstance(pwm, int) or not 0 <= pwm <= PWM_MAX:
+            c.fail(f"{path}.{pwm}", f"PWM inválido (debe ser un entero entre 0 y {PWM_MAX})")
+            continue
+        dps = c.value(table, pwm, path, float)
+        if dps is not None and dps <= 0:
+            c.fail(f"{path}.{pwm}", f"velocidad no positiva: {dps}")
+        elif dps is not None:
+            points.append((pwm, dps))
+    return tuple(sorted(points))
+
+
+def _parse_servo(c: _Checker, key, entry, fallback: Dict) -> Optional[ServoSettings]:
+    path = f"servo_settings.{key}"
+    if not isinstance(entry, dict):
+        c.fail(path, f"debe ser una sección, no {entry!r}")
+        return None
+    problems = len(c.problems)
+    c.known(entry, path, _SERVO_KEYS)
+    pwm_section = c.section(entry, 'pwm_config', f"{path}.pwm_config")
+    pwm_path = f"{path}.pwm_config"
+    c.known(pwm_section, pwm_path, _PWM_KEYS)
+    pwm = PwmConfig(
+        stop=c.value(pwm_section, 'stop', pwm_path, int, fallback.get('stop_pwm', _REQUIRED), 0, PWM_MAX),
+        max_cw=c.value(pwm_section, 'max_cw', pwm_path, int, fallback.get('max_cw_pwm', _REQUIRED), 0, PWM_MAX),
+        max_ccw=c.value(pwm_section, 'max_ccw', pwm_path, int, fallback.get('max_ccw_pwm', _REQUIRED),
+                        0, PWM_MAX),
+    )
+    servo_type = c.value(entry, 'type', path, str, fallback.get('type', SERVO_TYPES[0]))
+    if servo_type is not None and servo_type not in SERVO_TYPES:
+        c.fail(f"{path}.type", f"tipo desconocido {servo_type!r} (hay {', '.join(SERVO_TYPES)})")
+    deadzone = c.value(entry, 'deadzone', path, int, fallback.get('deadzone', 0), low=0)
+    limits = c.section(entry, 'safety_limits', f"{path}.safety_limits")
+    velocity = c.section(entry, 'velocity_table', f"{path}.velocity_table")
+    c.known(limits, f"{path}.safety_limits", _LIMITS_KEYS)
+    c.known(velocity, f"{path}.velocity_table", _VELOCITY_KEYS)
+    servo = ServoSettings(
+        key=str(key),
+        type=servo_type,
+        gpio=c.value(entry, 'gpio', path, int, default=None, low=0),
+        degrees_per_second=c.value(entry, 'degrees_per_second', path, float,
+                                   fallback.get('degrees_per_second', _REQUIRED), low=1e-3),
+        # Sin factor propio sólo cuenta el global (servo_defaults.calibration_factor)
+        calibration_factor=c.value(entry, 'calibration_factor', path, float, 1.0, 0.1, 5.0),
+        deadzone=deadzone,
+        pwm=pwm,
+        min_move_threshold=c.value(entry, 'min_move_threshold', path, float,
+                                   fallback.get('min_move_threshold', 0.5), low=0),
+        max_rotation_time_ms=c.value(limits, 'max_rotation_time_ms', f"{path}.safety_limits", int,
+                                     default=None, low=1),
+        ramp_time_ms=c.value(entry, 'ramp_time_ms', path, float,
+                             fallback.get('ramp_time_ms', DEFAULT_RAMP_MS), low=1e-3),
+        velocity_cw=_parse_velocity(c, velocity.get('cw'), f"{path}.velocity_table.cw"),
+        velocity_ccw=_parse_velocity(c, velocity.get('ccw'), f"{path}.velocity_table.ccw"),
+    )
+    if len(c.problems) > problems or None in (pwm.stop, pwm.max_cw, pwm.max_ccw, deadzone):
+        return None
+    # Orden de los PWM: el giro ↻ por encima de la parada y el ↺ por debajo, fuera de la zona muerta
+    if not pwm.max_ccw < pwm.stop < pwm.max_cw:
+        c.fail(pwm_path, f"debe cumplirse max_ccw < stop < max_cw ({pwm.max_ccw}, {pwm.stop}, {pwm.max_cw})")
+    elif deadzone >= min(pwm.max_cw - pwm.stop, pwm.stop - pwm.max_ccw):
+        c.fail(f"{path}.deadzone", f"la zona muerta ({deadzone}) no deja PWM útil entre "
+                                   f"{pwm.max_ccw} y {pwm.max_cw} alrededor de {pwm.stop}")
+    return servo
+
+
+def _parse_servos(c: _Checker, data: Dict, chip: Optional[str],
+                  emergency_stop_pin: Optional[int]) -> Tuple[ServoSettings, ...]:
+    defaults = c.section(data, 'servo_defaults', 'servo_defaults')
+    c.known(defaults, 'servo_defaults', _DEFAULTS_KEYS)
+    fallback = {}
+    for key, kind, low, high in (('stop_pwm', int, 0, PWM_MAX), ('max_cw_pwm', int, 0, PWM_MAX),
+                                 ('max_ccw_pwm', int, 0, PWM_MAX), ('degrees_per_second', float, 1e-3, None),
+                                 ('ramp_time_ms', float, 1e-3, None), ('deadzone', int, 0, None),
+                                 ('min_move_threshold', float, 0, None), ('type', str, None, None)):
+        if key in defaults:
+            fallback[key] = c.value(defaults, key, 'servo_defaults', kind, low=low, high=high)
+
+    entries = c.section(data, 'servo_settings', 'servo_settings')
+    if not entries:
+        c.fail('servo_settings', "no hay servos configurados")
+    servos = []
+    owners: Dict[int, str] = {}
+    if emergency_stop_pin is not None and emergency_stop_pin >= 0:
+        owners[emergency_stop_pin] = "safety.emergency_stop_pin"
+    for key, entry in entries.items():
+        servo = _parse_servo(c, key, entry, fallback)
+        if servo is None:
+            continue
+        servos.append(servo)
+        if servo.gpio is None:
+            continue
+        path = f"servo_settings.{key}.gpio"
+        if servo.gpio in owners:
+            c.fail(path, f"GPIO {servo.gpio} repetido (ya lo usa {owners[servo.gpio]})")
+        owners.setdefault(servo.gpio, f"servo {key}")
+        if chip in OUTPUT_GPIOS and servo.gpio not in OUTPUT_GPIOS[chip]:
+            c.fail(path, f"GPIO {servo.gpio} no puede generar PWM en {chip}")
+    return tuple(servos)
+
+
+def _parse_kinematics(c: _Checker, data: Dict, num_servos: Optional[int]) -> KinematicsSettings:
+    section = c.section(data, 'kinematics', 'kinematics')
+    path = 'kinematics'
+    c.known(section, path, _KINEMATICS_KEYS)
+    g = DEFAULT_GEOMETRY
+    azimuths = c.numbers(section, 'leg_azimuths_deg', path, float, g['leg_azimuths_deg'])
+    legs = len(azimuths) if azimuths is not None else None
+    # Sin servo_settings válido no hay con qué comparar (el problema ya está apuntado)
+    if 'leg_azimuths_deg' in section and None not in (legs, num_servos) and legs != num_servos:
+        c.fail(f"{path}.leg_azimuths_deg", f"tiene {legs} patas y hay {num_servos} servos")
+    signs = c.numbers(section, 'motor_signs', path, int, g['motor_signs'], length=legs)
+    if signs is not None and any(s not in (1, -1) for s in signs):
+        c.fail(f"{path}.motor_signs", f"cada signo debe ser 1 o -1: {list(signs)}")
+    branch = c.value(section, 'branch', path, int, g['branch'])
+    if branch is not None and branch not in (1, -1):
+        c.fail(f"{path}.branch", f"debe ser 1 o -1, no {branch}")
+
+    ws = c.section(section, 'workspace', f"{path}.workspace")
+    ws_path = f"{path}.workspace"
+    c.known(ws, ws_path, _WORKSPACE_KEYS)
+    ranges = {}
+    for axis in ('yaw', 'pitch', 'roll'):
+        bounds = c.numbers(ws, axis, ws_path, float, DEFAULT_WORKSPACE[axis], length=2)
+        if bounds is not None and bounds[0] >= bounds[1]:
+            c.fail(f"{ws_path}.{axis}", f"el mínimo debe ser menor que el máximo: {list(bounds)}")
+        ranges[axis] = bounds
+    workspace = WorkspaceSettings(step_deg=c.value(ws, 'step_deg', ws_path, float, DEFAULT_WORKSPACE['step_deg'],
+                                                   low=1e-3), **ranges)
+    return KinematicsSettings(
+        alpha1_deg=c.value(section, 'alpha1_deg', path, float, g['alpha1_deg'], 0, 180),
+        alpha2_deg=c.value(section, 'alpha2_deg', path, float, g['alpha2_deg'], 0, 180),
+        beta_deg=c.value(section, 'beta_deg', path, float, g['beta_deg'], 0, 180),
+        gamma_deg=c.value(section, 'gamma_deg', path, float, g['gamma_deg'], 0, 180),
+        leg_azimuths_deg=azimuths,
+        branch=branch,
+        motor_signs=signs,
+        workspace=workspace,
+    )
+
+
+def _parse_communication(c: _Checker, data: Dict, num_servos: Optional[int]) -> CommunicationSettings:
+    section = c.section(data, 'communication', 'communication')
+    path = 'communication'
+    c.known(section, path, _COMMUNICATION_KEYS)
+    d = CommunicationSettings()
+    settings = CommunicationSettings(
+        command_buffer_size=c.value(section, 'command_buffer_size', path, int, d.command_buffer_size, 16, 4096),
+        setpoint_buffer_size=c.value(section, 'setpoint_buffer_size', path, int, d.setpoint_buffer_size, 2, 4096),
+        binary_protocol=c.value(section, 'binary_protocol', path, bool, d.binary_protocol),
+        udp_port=c.value(section, 'udp_port', path, int, d.udp_port, 1, 65535),
+        telemetry_hz=c.value(section, 'telemetry_hz', path, int, d.telemetry_hz, 0, neck_protocol.TELEMETRY_MAX_HZ),
+        gesture_slots=c.value(section, 'gesture_slots', path, int, d.gesture_slots, 1, GESTURE_SLOTS_MAX),
+        gesture_max_points=c.value(section, 'gesture_max_points', path, int, d.gesture_max_points,
+                                   2, GESTURE_POINTS_MAX),
+    )
+    # La línea W más larga (desplazamientos de ±180.0°) tiene que caber en el buffer de comandos
+    if None not in (num_servos, settings.command_buffer_size, settings.gesture_slots, settings.gesture_max_points):
+        longest = len(f"W {settings.gesture_slots - 1} {settings.gesture_max_points - 1}") + num_servos * len(" -180.0")
+        if longest >= settings.command_buffer_size:
+            c.fail(f"{path}.command_buffer_size", f"{settings.command_buffer_size} bytes no bastan para "
+                                                  f"las líneas W de los gestos ({longest + 1} con el '\\0')")
+    return settings
+
+
+def parse_config(data: Any, source="<config>") -> NeckConfig:
+    """
+    Valida un neck_config.yaml ya parseado (el dict de yaml.safe_load).
+
+    Raises:
+        ConfigError: Con todos los problemas encontrados
+    """
+    c = _Checker()
+    if not isinstance(data, dict):
+        raise ConfigError(source, [f"debe ser un documento YAML con secciones, no {type(data).__name__}"])
+    c.known(data, '', _TOP_KEYS)
+    board = _parse_board(c, data)
+
+    safety_section = c.section(data, 'safety', 'safety')
+    c.known(safety_section, 'safety', _SAFETY_KEYS)
+    safety = SafetySettings(
+        enable_watchdog=c.value(safety_section, 'enable_watchdog', 'safety', bool, False),
+        max_idle_time_ms=c.value(safety_section, 'max_idle_time_ms', 'safety', int, 0, low=0),
+        emergency_stop_pin=c.value(safety_section, 'emergency_stop_pin', 'safety', int, -1, low=-1),
+    )
+    servos = _parse_servos(c, data, board.chip if board.fqbn else None, safety.emergency_stop_pin)
+
+    # Los servos inválidos no están en servos, pero cuentan para comprobar el resto
+    entries = data.get('servo_settings')
+    num_servos = len(entries) if isinstance(entries, dict) and entries else None
+    defaults = c.section(data, 'servo_defaults', 'servo_defaults')
+    debug_section = c.section(data, 'debug', 'debug')
+    c.known(debug_section, 'debug', _DEBUG_KEYS)
+    web_ui = c.section(data, 'web_ui', 'web_ui')
+    c.known(web_ui, 'web_ui', _WEB_UI_KEYS)
+    config = NeckConfig(
+        board=board,
+        servos=servos,
+        kinematics=_parse_kinematics(c, data, num_servos),
+        communication=_parse_communication(c, data, num_servos),
+        safety=safety,
+        debug=DebugSettings(
+            verbose_output=c.value(debug_section, 'verbose_output', 'debug', bool, False),
+            show_timing=c.value(debug_section, 'show_timing', 'debug', bool, False),
+            log_commands=c.value(debug_section, 'log_commands', 'debug', bool, False),
+        ),
+        calibration_factor=c.value(defaults, 'calibration_factor', 'servo_defaults', float,
+                                   DEFAULT_CALIBRATION_FACTOR, 0.1, 5.0),
+        arduino_cli_path=c.value(data, 'arduino_cli_path', '', str, default=None),
+        gzip_budget_bytes=c.value(web_ui, 'gzip_budget_bytes', 'web_ui', int, default=None, low=1),
+        source=str(source),
+    )
+    if c.problems:
+        raise ConfigError(source, c.problems)
+    return config
+
+
+# ---------- Carga con caché ----------
+
+_cache: Dict[Path, Tuple[Tuple[int, int], NeckConfig]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_config(config_file=None) -> NeckConfig:
+    """
+    Lee y valida el YAML, o devuelve lo ya leído si el archivo no ha cambiado
+    (mismo mtime y tamaño).
+
+    Args:
+        config_file: Ruta del YAML (por defecto neck_config.yaml)
+
+    Raises:
+        FileNotFoundError: Si el archivo no existe
+        ConfigError: Si el YAML no se puede parsear o no es válido
+    """
+    path = Path(config_file or DEFAULT_CONFIG).resolve()
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path, 'r') as f:
+            data = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise ConfigError(path, [f"YAML inválido: {e}"]) from e
+    config = parse_config(data, path)
+    with _cache_lock:
+        _cache[path] = (stamp, config)
+    return config
+
+
+def load_config_or_default(config_file=None) -> NeckConfig:
+    """
+    load_config, o la configuración de DEFAULT_DOCUMENT si el archivo no
+    existe (sin GPIO: vale para el host, no para generar el firmware).
+
+    Raises:
+        ConfigError: Si el YAML existe pero no es válido
+    """
+    try:
+        return load_config(config_file)
+    except FileNotFoundError:
+        return parse_config(DEFAULT_DOCUMENT, "la configuración por defecto")
+
+
+def clear_cache():
+    """Olvida todo lo leído (la próxima load_config vuelve a parsear)."""
+    with _cache_lock:
+        _cache.clear()
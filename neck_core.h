@@ -0,0 +1,889 @@
+// Núcleo del firmware sin hardware: calibración, movimientos, trayectorias,
+// comandos, tramas y telemetría. ino_generator.py lo renderiza dentro del sketch, y
+// neck_native.py lo compila con g++ contra native_stubs.h para medirlo en
+// el PC. Sólo usa la API de Arduino que imitan esos stubs (Servo, Serial,
+// millis, delay, Print, String, PROGMEM); WiFi, UDP y web van en el .ino.
+
+// ---------- Configuración dinámica ----------
+#define NUM_SERVOS {{NUM_SERVOS}}
+#define MIN_MOVE_THRESHOLD 0.5
+#define LED_PIN 2
+#define LED_BLINK_DURATION 100
+const int PINS[NUM_SERVOS] = { {{SERVO_PINS}} };
+#define LOOP_INTERVAL 20
+#define BUILD_HASH "{{BUILD_HASH}}"  // Hash de build de ino_generator.py
+
+// ---------- Protocolo binario (neck_protocol.py) ----------
+#define BINARY_PROTOCOL {{BINARY_PROTOCOL}}
+#define FRAME_SYNC {{FRAME_SYNC}}
+#define ANGLE_SCALE {{ANGLE_SCALE}}
+#define OP_MOVE_ANGLES {{OP_MOVE_ANGLES}}
+#define OP_SET_PWM {{OP_SET_PWM}}
+#define OP_STOP {{OP_STOP}}
+#define OP_RESET {{OP_RESET}}
+#define OP_POSITIONS {{OP_POSITIONS}}
+#define OP_QUEUE_SETPOINT {{OP_QUEUE_SETPOINT}}
+#define OP_TELEMETRY {{OP_TELEMETRY}}
+#define FRAME_MAX_LEN (3 + 4 + NUM_SERVOS * 2)
+#define UDP_HEADER_LEN {{UDP_HEADER_LEN}}
+#define UDP_FLAG_ACK {{UDP_FLAG_ACK}}
+#define UDP_MAX_LEN {{UDP_MAX_LEN}}
+const uint8_t CRC8_TABLE[256] PROGMEM = { {{CRC8_TABLE}} };
+
+// ---------- Telemetría (neck_protocol.py) ----------
+// Con telemetryHz > 0, cada 1000 / telemetryHz ms sale por el puerto serie
+// una trama OP_TELEMETRY con el PWM, el ángulo estimado y el movimiento de
+// cada servo. 0 la desactiva; el comando M la cambia en marcha
+#define TELEMETRY_HZ {{TELEMETRY_HZ}}
+#define TELEMETRY_MAX_HZ {{TELEMETRY_MAX_HZ}}
+#define TELEMETRY_FLAG_MOVING {{TELEMETRY_FLAG_MOVING}}
+#define TELEMETRY_LEN (8 + NUM_SERVOS * 6)
+
+// ---------- Calibración por servo (servo_tables.py) ----------
+// Tablas indexadas por |ángulo| en pasos de 1/LUT_STEPS grados
+#define LUT_STEPS {{LUT_STEPS}}
+#define LUT_MAX_DEG {{LUT_MAX_DEG}}
+#define LUT_SIZE {{LUT_SIZE}}
+const int STOP_PWM[NUM_SERVOS] = { {{STOP_PWM}} };
+// ms por grado con el PWM saturado (más allá de LUT_MAX_DEG)
+const float MS_PER_DEG_CW[NUM_SERVOS] = { {{MS_PER_DEG_CW}} };
+const float MS_PER_DEG_CCW[NUM_SERVOS] = { {{MS_PER_DEG_CCW}} };
+// ms de 0 a la velocidad máxima en las rampas (ramp_time_ms)
+const float RAMP_MS[NUM_SERVOS] = { {{RAMP_MS}} };
+const uint8_t PWM_CW_LUT[NUM_SERVOS][LUT_SIZE] PROGMEM = {
+{{PWM_CW_LUT}}
+};
+const uint8_t PWM_CCW_LUT[NUM_SERVOS][LUT_SIZE] PROGMEM = {
+{{PWM_CCW_LUT}}
+};
+// ms de cada movimiento sin calibrationFactor
+const float DURATION_CW_LUT[NUM_SERVOS][LUT_SIZE] PROGMEM = {
+{{DURATION_CW_LUT}}
+};
+const float DURATION_CCW_LUT[NUM_SERVOS][LUT_SIZE] PROGMEM = {
+{{DURATION_CCW_LUT}}
+};
+
+// ---------- Planificador de movimientos (motion_planner.py) ----------
+// Cada movimiento es un perfil trapezoidal de velocidad de hasta 4 tramos de
+// aceleración constante: frenada si va al revés o no le da para parar,
+// aceleración hasta el pico, crucero y frenada final en el objetivo
+#define MAX_SEGMENTS 4
+struct Profile {
+  float v0;                  // °/ms al empezar
+  float dur[MAX_SEGMENTS];   // ms de cada tramo
+  float acc[MAX_SEGMENTS];   // °/ms² de cada tramo
+  float cruise;              // °/ms de crucero, para escalar el PWM
+  int lutK;                  // Entrada de PWM_*_LUT a la velocidad de crucero
+};
+
+// ---------- Buffer de setpoints ----------
+#define SETPOINT_BUFFER_SIZE {{SETPOINT_BUFFER_SIZE}}
+// Con el buffer vacío, la trayectoria sigue abierta este tiempo tras el último
+// setpoint: los primeros llegan más despacio de lo que se consumen
+#define STREAM_IDLE_MS (2 * LOOP_INTERVAL)
+struct Setpoint {
+  unsigned long t;            // ms desde el inicio de la trayectoria
+  float angle[NUM_SERVOS];    // ángulo absoluto objetivo
+};
+
+// ---------- Gestos (neck_gestures.py) ----------
+// Trayectorias que el host calcula y carga una vez con K y W: cada punto es
+// el desplazamiento de cada servo, en 1/ANGLE_SCALE grados, respecto a donde
+// estaba al empezar el gesto. G <n> lo reproduce con el reloj del firmware
+// por el mismo camino que los setpoints de Q, y termina con el mismo 🏁
+#define GESTURE_SLOTS {{GESTURE_SLOTS}}
+#define GESTURE_MAX_POINTS {{GESTURE_MAX_POINTS}}
+struct Gesture {
+  uint16_t periodMs;   // ms entre puntos
+  uint16_t count;      // Puntos declarados con K
+  uint16_t loaded;     // count al llegar el último W; 0 si no está completo
+  int16_t points[GESTURE_MAX_POINTS][NUM_SERVOS];
+};
+
+// ---------- Comandos ASCII ----------
+// Las líneas se reciben byte a byte en un buffer fijo, sin bloquear el loop
+#define COMMAND_BUFFER_SIZE {{COMMAND_BUFFER_SIZE}}
+struct LineParser {
+  char buf[COMMAND_BUFFER_SIZE];
+  int len = 0;
+  bool overflow = false;  // La línea no cabía: se descarta hasta el '\n'
+};
+
+// ---------- Registro (debug en neck_config.yaml) ----------
+// Con LOG_TERSE los eventos salen como códigos cortos para el host
+// ("m 1 90.0 266" en vez de "▶️  Servo 1: ↻ 90.0° (266 ms)"); con
+// LOG_VERBOSE, como texto. El nivel inicial sale de debug.verbose_output y el
+// comando D lo cambia. Los errores (❌, ❓) siempre van en texto
+#define LOG_TERSE 0
+#define LOG_VERBOSE 1
+#define LOG_LEVEL {{LOG_LEVEL}}
+#define LOG_TIMING {{LOG_TIMING}}      // debug.show_timing: "@<millis> " delante de cada evento
+#define LOG_COMMANDS {{LOG_COMMANDS}}  // debug.log_commands: eco de cada comando recibido
+
+// ---------- Salida ----------
+// Todo lo que imprime el firmware pasa por console: sale por el puerto serie
+// y, durante una petición a /api/cmd con r=1, se guarda para la respuesta
+#define CAPTURE_MAX_LEN 1024
+class Console : public Print {
+ public:
+  String captured;
+  bool capturing = false;
+
+  size_t write(uint8_t c) override {
+    if (capturing && captured.length() < CAPTURE_MAX_LEN) captured += (char)c;
+    return Serial.write(c);
+  }
+
+  size_t write(const uint8_t* buffer, size_t size) override {
+    for (size_t i = 0; i < size; i++) write(buffer[i]);
+    return size;
+  }
+};
+Console console;
+
+Servo servos[NUM_SERVOS];
+int servoPWM[NUM_SERVOS];  // Último PWM escrito en cada servo
+bool moving[NUM_SERVOS];
+bool reportMove[NUM_SERVOS];
+unsigned long stopAt[NUM_SERVOS];
+unsigned long moveStart[NUM_SERVOS];
+Profile profiles[NUM_SERVOS];
+float targetAngle[NUM_SERVOS];
+float currentAngle[NUM_SERVOS];  // En marcha: posición al empezar el perfil
+unsigned long ledOffTime = 0;
+bool ledState = false;
+unsigned long lastLoopTime = 0;
+float calibrationFactor = {{CALIBRATION_FACTOR}};
+int logLevel = LOG_LEVEL;
+Setpoint setpoints[SETPOINT_BUFFER_SIZE];
+int setpointHead = 0;
+int setpointCount = 0;
+unsigned long streamBase = 0;
+unsigned long streamLastT = 0;
+bool streaming = false;
+Gesture gestures[GESTURE_SLOTS];
+int gesturePlaying = -1;           // Hueco del gesto en curso, -1 si ninguno
+int gestureNext = 0;               // Siguiente punto del gesto en curso
+float gestureOrigin[NUM_SERVOS];   // Posición de cada servo al empezar el gesto
+int telemetryHz = TELEMETRY_HZ;
+unsigned long lastTelemetry = 0;
+
+// ---------- Helpers ----------
+void blinkLED() {
+  digitalWrite(LED_PIN, HIGH);
+  ledState = true;
+  ledOffTime = millis() + LED_BLINK_DURATION;
+}
+
+// Empieza una línea de evento (con LOG_TIMING, "@<millis> "); devuelve true
+// si va en texto y false si va como código corto
+bool beginEvent() {
+#if LOG_TIMING
+  console.printf("@%lu ", millis());
+#endif
+  return logLevel >= LOG_VERBOSE;
+}
+
+void updateLED() {
+  if (ledState && millis() >= ledOffTime) {
+    digitalWrite(LED_PIN, LOW);
+    ledState = false;
+  }
+}
+
+void writeServo(int idx, int pwm) {
+  servos[idx].write(pwm);
+  servoPWM[idx] = pwm;
+}
+
+uint8_t crc8(const uint8_t* data, int len) {
+  uint8_t crc = 0;
+  for (int i = 0; i < len; i++) crc = pgm_read_byte(&CRC8_TABLE[crc ^ data[i]]);
+  return crc;
+}
+
+int lutIndex(float absDeg) {
+  int k = (int)(absDeg * LUT_STEPS + 0.5f);
+  return k < LUT_SIZE ? k : LUT_SIZE - 1;
+}
+
+unsigned long moveDuration(int idx, float angleDeg) {
+  const float* lut = angleDeg > 0 ? DURATION_CW_LUT[idx] : DURATION_CCW_LUT[idx];
+  float a = fabsf(angleDeg);
+  float ms;
+  if (a >= LUT_MAX_DEG) {
+    float msPerDeg = angleDeg > 0 ? MS_PER_DEG_CW[idx] : MS_PER_DEG_CCW[idx];
+    ms = pgm_read_float(&lut[LUT_SIZE - 1]) + (a - LUT_MAX_DEG) * msPerDeg;
+  } else {
+    ms = pgm_read_float(&lut[lutIndex(a)]);
+  }
+  return (unsigned long)(ms * calibrationFactor);
+}
+
+// ---------- Planificador ----------
+// °/ms² con los que el servo llega a su velocidad máxima en RAMP_MS
+float rampAccel(int idx) {
+  float msPerDeg = MS_PER_DEG_CW[idx] > MS_PER_DEG_CCW[idx] ? MS_PER_DEG_CW[idx] : MS_PER_DEG_CCW[idx];
+  return 1.0f / (msPerDeg * calibrationFactor * RAMP_MS[idx]);
+}
+
+// Velocidad de crucero (°/ms) para recorrer dist grados en lo que dicen las
+// tablas de duración, y su entrada en la LUT de PWM
+float cruiseSpeed(int idx, float dist, int& k) {
+  float ref = fabsf(dist) > MIN_MOVE_THRESHOLD ? fabsf(dist) : MIN_MOVE_THRESHOLD;
+  unsigned long ms = moveDuration(idx, dist > 0 ? ref : -ref);
+  k = lutIndex(ref);
+  return ref / (float)(ms > 0 ? ms : 1);
+}
+
+// Posición relativa al inicio del perfil t ms después de empezar; deja en v
+// la velocidad en ese instante
+float profileState(const Profile& p, float t, float& v) {
+  float x = 0;
+  v = p.v0;
+  for (int s = 0; s < MAX_SEGMENTS; s++) {
+    float d = t < p.dur[s] ? t : p.dur[s];
+    x += (v + 0.5f * p.acc[s] * d) * d;
+    v += p.acc[s] * d;
+    t -= d;
+    if (t <= 0) break;
+  }
+  if (t > 0) v = 0;
+  return x;
+}
+
+// Ángulo estimado del servo ahora mismo
+float servoAngle(int idx) {
+  if (!moving[idx]) return currentAngle[idx];
+  float v;
+  return currentAngle[idx] + profileState(profiles[idx], (float)(millis() - moveStart[idx]), v);
+}
+
+// PWM para la velocidad del perfil en t: la entrada de crucero de la LUT
+// escalada por la fracción de la velocidad de crucero, sin bajar de la del
+// umbral (la primera fuera de la zona muerta)
+int profilePWM(int idx, float t) {
+  const Profile& p = profiles[idx];
+  float v;
+  profileState(p, t, v);
+  if (v == 0 || p.cruise <= 0) return STOP_PWM[idx];
+  float f = p.lutK * fabsf(v) / p.cruise + 0.5f;
+  int k = f < LUT_SIZE - 1 ? (int)f : LUT_SIZE - 1;
+  int kMin = lutIndex(MIN_MOVE_THRESHOLD);
+  if (k < kMin) k = kMin;
+  return pgm_read_byte(v > 0 ? &PWM_CW_LUT[idx][k] : &PWM_CCW_LUT[idx][k]);
+}
+
+// Planifica el servo hasta target (ángulo absoluto) desde su posición y
+// velocidad actuales, sin pararlo; devuelve la duración en ms
+unsigned long planMove(int idx, float target, bool report) {
+  unsigned long now = millis();
+  Profile& p = profiles[idx];
+  float v = 0;
+  float pos = currentAngle[idx];
+  if (moving[idx]) pos += profileState(p, (float)(now - moveStart[idx]), v);
+
+  float a = rampAccel(idx);
+  float dist = target - pos;
+  float s = dist > 0 || (dist == 0 && v > 0) ? 1.0f : -1.0f;
+  float u = v * s;  // Velocidad en el sentido del objetivo
+  float len = dist * s;
+  int n = 0;
+  p.v0 = v;
+  if (u < 0 || u * u > 2 * a * len) {
+    // Va al revés o no le da para parar: primero frena hasta 0
+    float tb = fabsf(u) / a;
+    p.dur[n] = tb;
+    p.acc[n++] = v > 0 ? -a : a;
+    len -= u * tb * 0.5f;
+    if (len < 0) {
+      s = -s;
+      len = -len;
+    }
+    u = 0;
+  }
+  p.cruise = cruiseSpeed(idx, s * len, p.lutK);
+  float peak = sqrtf(a * len + u * u * 0.5f);
+  if (peak > p.cruise) peak = p.cruise;
+  float t1 = fabsf(peak - u) / a;
+  p.dur[n] = t1;
+  p.acc[n++] = (peak >= u ? a : -a) * s;
+  float t3 = peak / a;
+  float cruiseLen = len - (u + peak) * 0.5f * t1 - peak * t3 * 0.5f;
+  p.dur[n] = cruiseLen > 0 && peak > 0 ? cruiseLen / peak : 0;
+  p.acc[n++] = 0;
+  p.dur[n] = t3;
+  p.acc[n++] = -a * s;
+  for (; n < MAX_SEGMENTS; n++) {
+    p.dur[n] = 0;
+    p.acc[n] = 0;
+  }
+
+  float total = 0;
+  for (int i = 0; i < MAX_SEGMENTS; i++) total += p.dur[i];
+  unsigned long duration = (unsigned long)ceilf(total);
+  currentAngle[idx] = pos;
+  targetAngle[idx] = target;
+  moveStart[idx] = now;
+  stopAt[idx] = now + duration;
+  moving[idx] = true;
+  reportMove[idx] = report;
+  writeServo(idx, profilePWM(idx, LOOP_INTERVAL * 0.5f));
+  blinkLED();
+  return duration;
+}
+
+void stopAll() {
+  for (int i = 0; i < NUM_SERVOS; ++i) {
+    if (moving[i]) {
+      currentAngle[i] = servoAngle(i);
+      targetAngle[i] = currentAngle[i];
+    }
+    writeServo(i, STOP_PWM[i]);
+    moving[i] = false;
+  }
+  blinkLED();
+  console.println(beginEvent() ? "⏹️  Todos los servos detenidos" : "s");
+}
+
+// Mueve el servo angleDeg grados más allá de su objetivo actual
+void startMove(int idx, float angleDeg, bool report) {
+  if (idx < 0 || idx >= NUM_SERVOS) return;
+  if (abs(angleDeg) < MIN_MOVE_THRESHOLD) return;
+
+  float from = moving[idx] ? targetAngle[idx] : currentAngle[idx];
+  unsigned long duration = planMove(idx, from + angleDeg, report);
+
+  if (!report) return;
+  if (beginEvent()) {
+    console.printf("▶️  Servo %d: %s %.1f° (%lu ms)\n",
+                  idx + 1,
+                  (angleDeg > 0) ? "↻" : "↺",
+                  angleDeg,
+                  duration);
+  } else {
+    console.printf("m %d %.1f %lu\n", idx + 1, angleDeg, duration);
+  }
+}
+
+// Para los servos que han llegado y, cada LOOP_INTERVAL, ajusta el PWM de
+// los demás a la velocidad del perfil en el centro del intervalo
+void updateMoves() {
+  unsigned long now = millis();
+  bool tick = now - lastLoopTime >= LOOP_INTERVAL;
+  if (tick) lastLoopTime = now;
+  for (int i = 0; i < NUM_SERVOS; ++i) {
+    if (!moving[i]) continue;
+    if (now >= stopAt[i]) {
+      writeServo(i, STOP_PWM[i]);
+      blinkLED();
+      moving[i] = false;
+      currentAngle[i] = targetAngle[i];
+      if (reportMove[i]) {
+        console.printf(beginEvent() ? "✅ Servo %d detenido en %.1f°\n" : "d %d %.1f\n",
+                      i + 1, currentAngle[i]);
+      }
+    } else if (tick) {
+      writeServo(i, profilePWM(i, (float)(now - moveStart[i]) + LOOP_INTERVAL * 0.5f));
+    }
+  }
+}
+
+// ---------- Reproducción de trayectorias ----------
+void clearSetpoints() {
+  setpointHead = 0;
+  setpointCount = 0;
+  streaming = false;
+  gesturePlaying = -1;
+}
+
+void queueSetpoint(unsigned long t, const float* angles) {
+  if (setpointCount == SETPOINT_BUFFER_SIZE) {
+    console.println("❌ Buffer de setpoints lleno");
+    return;
+  }
+  if (!streaming) {
+    // El primer setpoint fija el reloj de la trayectoria
+    streamBase = millis() - t;
+    streaming = true;
+  }
+  Setpoint& sp = setpoints[(setpointHead + setpointCount) % SETPOINT_BUFFER_SIZE];
+  sp.t = t;
+  for (int i = 0; i < NUM_SERVOS; i++) sp.angle[i] = angles[i];
+  setpointCount++;
+}
+
+// Lleva el servo hacia un ángulo absoluto sin imprimir nada; si ya va hacia
+// él (o está en él) sigue con el perfil que tiene
+void streamTo(int idx, float angle) {
+  float from = moving[idx] ? targetAngle[idx] : currentAngle[idx];
+  if (abs(angle - from) < MIN_MOVE_THRESHOLD) return;
+  planMove(idx, angle, false);
+}
+
+// Aplica el siguiente punto del gesto en curso cuando le llega la hora
+void updateGesture() {
+  Gesture& g = gestures[gesturePlaying];
+  unsigned long t = (unsigned long)gestureNext * g.periodMs;
+  if ((long)(millis() - (streamBase + t)) < 0) return;
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    streamTo(i, gestureOrigin[i] + (float)g.points[gestureNext][i] / ANGLE_SCALE);
+  }
+  streamLastT = t;
+  if (++gestureNext == g.loaded) gesturePlaying = -1;
+}
+
+void updateStream() {
+  if (!streaming) return;
+  if (gesturePlaying >= 0) {
+    updateGesture();
+    return;
+  }
+  if (setpointCount == 0) {
+    if ((long)(millis() - (streamBase + streamLastT)) < STREAM_IDLE_MS) return;
+    streaming = false;
+    console.println(beginEvent() ? "🏁 Trayectoria completada" : "f");
+    return;
+  }
+  Setpoint& sp = setpoints[setpointHead];
+  if ((long)(millis() - (streamBase + sp.t)) < 0) return;
+  for (int i = 0; i < NUM_SERVOS; i++) streamTo(i, sp.angle[i]);
+  streamLastT = sp.t;
+  setpointHead = (setpointHead + 1) % SETPOINT_BUFFER_SIZE;
+  setpointCount--;
+}
+
+// La posición de ahora pasa a ser 0°; un servo en marcha sigue su perfil
+void resetPositions() {
+  for (int i = 0; i < NUM_SERVOS; ++i) {
+    float offset = servoAngle(i);
+    currentAngle[i] -= offset;
+    targetAngle[i] -= offset;
+  }
+  console.println(beginEvent() ? "🔄 Posiciones reiniciadas a 0°" : "r");
+}
+
+void reportPositions() {
+  console.print(beginEvent() ? "📍 Posiciones:" : "p");
+  for (int i = 0; i < NUM_SERVOS; ++i) {
+    console.printf(" %.1f", servoAngle(i));
+  }
+  console.println();
+}
+
+// ---------- Telemetría ----------
+// Escribe directamente en Serial, no en console: las tramas no van en las
+// respuestas de /api/cmd
+void sendTelemetry(unsigned long now) {
+  uint8_t buf[TELEMETRY_LEN];
+  int n = 0;
+  buf[n++] = FRAME_SYNC;
+  buf[n++] = OP_TELEMETRY;
+  for (int b = 0; b < 4; b++) buf[n++] = (uint8_t)(now >> (8 * b));
+  buf[n++] = NUM_SERVOS;
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    long angle = constrain(lroundf(servoAngle(i) * ANGLE_SCALE), -32768L, 32767L);
+    unsigned long remaining = moving[i] && stopAt[i] > now ? stopAt[i] - now : 0;
+    if (remaining > 65535) remaining = 65535;
+    buf[n++] = (uint8_t)servoPWM[i];
+    buf[n++] = moving[i] ? TELEMETRY_FLAG_MOVING : 0;
+    buf[n++] = (uint8_t)(angle & 0xFF);
+    buf[n++] = (uint8_t)((angle >> 8) & 0xFF);
+    buf[n++] = (uint8_t)(remaining & 0xFF);
+    buf[n++] = (uint8_t)(remaining >> 8);
+  }
+  buf[n] = crc8(buf + 1, n - 1);
+  Serial.write(buf, n + 1);
+}
+
+void updateTelemetry() {
+  if (telemetryHz <= 0) return;
+  unsigned long now = millis();
+  unsigned long period = 1000 / telemetryHz;
+  if (now - lastTelemetry < period) return;
+  // Ritmo fijo: una vuelta lenta no retrasa las siguientes tramas, salvo que
+  // se haya perdido más de un periodo
+  lastTelemetry = now - lastTelemetry < 2 * period ? lastTelemetry + period : now;
+  sendTelemetry(now);
+}
+
+void setTelemetry(float hz) {
+  if (!(hz >= 0 && hz <= TELEMETRY_MAX_HZ)) {
+    console.printf("❌ M espera Hz entre 0 y %d\n", TELEMETRY_MAX_HZ);
+    return;
+  }
+  telemetryHz = (int)hz;
+  lastTelemetry = millis() - 1000;  // La primera trama sale en la siguiente vuelta
+  if (!beginEvent()) {
+    console.printf("t %d\n", telemetryHz);
+  } else if (telemetryHz > 0) {
+    console.printf("📈 Telemetría a %d Hz\n", telemetryHz);
+  } else {
+    console.println("📈 Telemetría desactivada");
+  }
+}
+
+// ---------- Gestos ----------
+// K: declara un gesto; sus puntos llegan después con W, en orden
+void defineGesture(int slot, int periodMs, int count) {
+  if (gesturePlaying == slot) clearSetpoints();
+  Gesture& g = gestures[slot];
+  g.periodMs = periodMs;
+  g.count = count;
+  g.loaded = 0;
+  memset(g.points, 0, sizeof(g.points));
+}
+
+// W: guarda un punto; el último deja el gesto listo para G
+bool writeGesturePoint(int slot, int index, const float* offsets) {
+  Gesture& g = gestures[slot];
+  if (index >= g.count) return false;
+  int16_t raw[NUM_SERVOS];
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    long value = lroundf(offsets[i] * ANGLE_SCALE);
+    if (value < -32768L || value > 32767L) return false;
+    raw[i] = (int16_t)value;
+  }
+  for (int i = 0; i < NUM_SERVOS; i++) g.points[index][i] = raw[i];
+  if (index == g.count - 1) {
+    g.loaded = g.count;
+    if (beginEvent()) {
+      console.printf("🎭 Gesto %d cargado: %d puntos cada %d ms\n", slot, g.count, g.periodMs);
+    } else {
+      console.printf("k %d %d %d\n", slot, g.count, g.periodMs);
+    }
+  }
+  return true;
+}
+
+// G: reproduce un gesto desde la posición actual (el objetivo si está en
+// marcha); corta la trayectoria o el gesto que hubiera
+void playGesture(int slot) {
+  clearSetpoints();
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    gestureOrigin[i] = moving[i] ? targetAngle[i] : currentAngle[i];
+  }
+  gesturePlaying = slot;
+  gestureNext = 0;
+  streamBase = millis();
+  streamLastT = 0;
+  streaming = true;
+  unsigned long ms = (unsigned long)(gestures[slot].loaded - 1) * gestures[slot].periodMs;
+  console.printf(beginEvent() ? "🎭 Gesto %d: %lu ms\n" : "g %d %lu\n", slot, ms);
+}
+
+// Gestos listos, un bit por hueco (para I)
+int loadedGestures() {
+  int mask = 0;
+  for (int s = 0; s < GESTURE_SLOTS; s++) {
+    if (gestures[s].loaded) mask |= 1 << s;
+  }
+  return mask;
+}
+
+// ---------- Nivel de registro ----------
+void setLogLevel(int level) {
+  logLevel = level;
+  if (beginEvent()) {
+    console.println("📝 Registro en texto");
+  } else {
+    console.printf("l %d\n", logLevel);
+  }
+}
+
+// ---------- Comandos ----------
+void moveAngles(const float* angle_values) {
+  for (int i = 0; i < NUM_SERVOS; i++) startMove(i, angle_values[i], true);
+}
+
+void setPWM(const float* pwm_values) {
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    writeServo(i, constrain((int)pwm_values[i], 0, 180));
+  }
+  blinkLED();
+  bool verbose = beginEvent();
+  console.print(verbose ? "✅ PWM directo: " : "v");
+  for (int i = 0; i < NUM_SERVOS; i++) {
+    console.printf(verbose ? "%d " : " %d", (int)pwm_values[i]);
+  }
+  console.println();
+}
+
+// Lee hasta max_count números separados por espacios, con la sintaxis de
+// strtof (signo, exponente, hex...); devuelve cuántos leyó. Un token que no
+// es un número finito termina la lectura
+int parseValues(const char* s, float* out, int max_count) {
+  int count = 0;
+  while (count < max_count) {
+    while (isspace((unsigned char)*s)) s++;
+    if (*s == '\0') break;
+    char* end;
+    float value = strtof(s, &end);
+    if (end == s || (*end != '\0' && !isspace((unsigned char)*end)) || !isfinite(value)) break;
+    out[count++] = value;
+    s = end;
+  }
+  return count;
+}
+
+// Quita los espacios de los extremos (como String::trim) sin copiar
+char* trimCommand(char* s) {
+  while (isspace((unsigned char)*s)) s++;
+  char* end = s + strlen(s);
+  while (end > s && isspace((unsigned char)end[-1])) *--end = '\0';
+  return s;
+}
+
+bool hasArgs(const char* cmd, char name) {
+  return cmd[0] == name && cmd[1] == ' ';
+}
+
+bool isCommand(const char* cmd, char name) {
+  return toupper((unsigned char)cmd[0]) == name && cmd[1] == '\0';
+}
+
+// Ejecuta una línea de comando; devuelve false si estaba vacía
+bool process_command(char* cmd) {
+  cmd = trimCommand(cmd);
+  if (*cmd == '\0') return false;
+#if LOG_COMMANDS
+  console.printf(beginEvent() ? "⌨️  %s\n" : "> %s\n", cmd);
+#endif
+  if (hasArgs(cmd, 'A')) {
+    float angle_values[NUM_SERVOS];
+    if (parseValues(cmd + 2, angle_values, NUM_SERVOS) == NUM_SERVOS) {
+      moveAngles(angle_values);
+    } else {
+      console.printf("❌ A espera %d valores\n", NUM_SERVOS);
+    }
+  }
+  else if (hasArgs(cmd, 'V')) {
+    float pwm_values[NUM_SERVOS];
+    if (parseValues(cmd + 2, pwm_values, NUM_SERVOS) == NUM_SERVOS) {
+      setPWM(pwm_values);
+    } else {
+      console.printf("❌ V espera %d valores\n", NUM_SERVOS);
+    }
+  }
+  else if (hasArgs(cmd, 'Q')) {
+    float values[NUM_SERVOS + 1];
+    if (parseValues(cmd + 2, values, NUM_SERVOS + 1) == NUM_SERVOS + 1 && values[0] >= 0) {
+      queueSetpoint((unsigned long)values[0], values + 1);
+    } else {
+      console.printf("❌ Q espera t y %d valores\n", NUM_SERVOS);
+    }
+  }
+  else if (hasArgs(cmd, 'M')) {
+    float hz;
+    if (parseValues(cmd + 2, &hz, 1) == 1) {
+      setTelemetry(hz);
+    } else {
+      console.printf("❌ M espera Hz entre 0 y %d\n", TELEMETRY_MAX_HZ);
+    }
+  }
+  else if (hasArgs(cmd, 'K')) {
+    float values[3];
+    if (parseValues(cmd + 2, values, 3) == 3 && values[0] >= 0 && values[0] < GESTURE_SLOTS &&
+        values[1] >= 1 && values[1] <= 65535 && values[2] >= 1 && values[2] <= GESTURE_MAX_POINTS) {
+      defineGesture((int)values[0], (int)values[1], (int)values[2]);
+    } else {
+      console.printf("❌ K espera gesto (0-%d), periodo en ms y puntos (1-%d)\n",
+                     GESTURE_SLOTS - 1, GESTURE_MAX_POINTS);
+    }
+  }
+  else if (hasArgs(cmd, 'W')) {
+    float values[NUM_SERVOS + 2];
+    if (parseValues(cmd + 2, values, NUM_SERVOS + 2) != NUM_SERVOS + 2 || !(values[0] >= 0) ||
+        values[0] >= GESTURE_SLOTS || !(values[1] >= 0 && values[1] < GESTURE_MAX_POINTS) ||
+        !writeGesturePoint((int)values[0], (int)values[1], values + 2)) {
+      console.printf("❌ W espera gesto, punto de K y %d desplazamientos\n", NUM_SERVOS);
+    }
+  }
+  else if (hasArgs(cmd, 'G')) {
+    float slot;
+    if (parseValues(cmd + 2, &slot, 1) == 1 && slot >= 0 && slot < GESTURE_SLOTS &&
+        gestures[(int)slot].loaded) {
+      playGesture((int)slot);
+    } else {
+      console.printf("❌ G espera un gesto cargado (0-%d)\n", GESTURE_SLOTS - 1);
+    }
+  }
+  else if (isCommand(cmd, 'D')) {
+    setLogLevel(logLevel >= LOG_VERBOSE ? LOG_TERSE : LOG_VERBOSE);
+  }
+  else if (hasArgs(cmd, 'D')) {
+    float level;
+    if (parseValues(cmd + 2, &level, 1) == 1 && (level == LOG_TERSE || level == LOG_VERBOSE)) {
+      setLogLevel((int)level);
+    } else {
+      console.printf("❌ D espera %d (códigos) o %d (texto)\n", LOG_TERSE, LOG_VERBOSE);
+    }
+  }
+  else if (isCommand(cmd, 'S')) {
+    clearSetpoints();
+    stopAll();
+  }
+  else if (isCommand(cmd, 'R')) {
+    resetPositions();
+  }
+  else if (isCommand(cmd, 'P')) {
+    reportPositions();
+  }
+  else if (isCommand(cmd, 'I')) {
+    console.printf(beginEvent() ? "ℹ️  servos=%d ms_per_deg=" : "i servos=%d ms_per_deg=", NUM_SERVOS);
+    for (int i = 0; i < NUM_SERVOS; i++) console.printf(i ? ",%g" : "%g", MS_PER_DEG_CW[i]);
+    console.print(" ramp_ms=");
+    for (int i = 0; i < NUM_SERVOS; i++) console.printf(i ? ",%g" : "%g", RAMP_MS[i]);
+    console.printf(" calibration=%.2f debug=%d telemetry=%d gestures=%d build=%s\n",
+                  calibrationFactor, logLevel, telemetryHz, loadedGestures(), BUILD_HASH);
+  }
+  else {
+    console.println("❓ Comando no reconocido");
+  }
+  return true;
+}
+
+LineParser serialLine;
+
+// Ejecuta la línea acumulada y vacía el buffer; devuelve true si había comando
+bool endLine(LineParser& line) {
+  bool overflow = line.overflow;
+  line.buf[line.len] = '\0';
+  line.len = 0;
+  line.overflow = false;
+  if (overflow) {
+    console.printf("❌ Comando demasiado largo (máx %d)\n", COMMAND_BUFFER_SIZE - 1);
+    return false;
+  }
+  return process_command(line.buf);
+}
+
+// Acumula un byte de comando; ejecuta la línea al llegar el '\n'
+bool feedLine(LineParser& line, uint8_t b) {
+  if (b == '\n') return endLine(line);
+  if (line.len < COMMAND_BUFFER_SIZE - 1) line.buf[line.len++] = (char)b;
+  else line.overflow = true;
+  return false;
+}
+
+// ---------- Tramas binarias ----------
+#if BINARY_PROTOCOL
+// Una trama a medio recibir por canal (serie y UDP no se mezclan)
+struct FrameParser {
+  uint8_t buf[FRAME_MAX_LEN];
+  int len = 0;
+};
+FrameParser serialFrame;
+
+int framePayloadLen(uint8_t opcode) {
+  switch (opcode) {
+    case OP_MOVE_ANGLES: return NUM_SERVOS * 2;
+    case OP_SET_PWM:     return NUM_SERVOS;
+    case OP_QUEUE_SETPOINT: return 4 + NUM_SERVOS * 2;
+    case OP_STOP:
+    case OP_RESET:
+    case OP_POSITIONS:   return 0;
+    default:             return -1;
+  }
+}
+
+void process_frame(uint8_t opcode, const uint8_t* payload) {
+  float values[NUM_SERVOS];
+  unsigned long t;
+#if LOG_COMMANDS
+  console.printf(beginEvent() ? "⌨️  trama 0x%02X\n" : "> 0x%02X\n", opcode);
+#endif
+  switch (opcode) {
+    case OP_MOVE_ANGLES:
+      for (int i = 0; i < NUM_SERVOS; i++) {
+        int16_t raw = (int16_t)(payload[2 * i] | (payload[2 * i + 1] << 8));
+        values[i] = (float)raw / ANGLE_SCALE;
+      }
+      moveAngles(values);
+      break;
+    case OP_SET_PWM:
+      for (int i = 0; i < NUM_SERVOS; i++) values[i] = payload[i];
+      setPWM(values);
+      break;
+    case OP_QUEUE_SETPOINT:
+      t = (unsigned long)payload[0] | ((unsigned long)payload[1] << 8) |
+          ((unsigned long)payload[2] << 16) | ((unsigned long)payload[3] << 24);
+      for (int i = 0; i < NUM_SERVOS; i++) {
+        int16_t raw = (int16_t)(payload[4 + 2 * i] | (payload[5 + 2 * i] << 8));
+        values[i] = (float)raw / ANGLE_SCALE;
+      }
+      queueSetpoint(t, values);
+      break;
+    case OP_STOP:      clearSetpoints(); stopAll(); break;
+    case OP_RESET:     resetPositions(); break;
+    case OP_POSITIONS: reportPositions(); break;
+  }
+}
+
+// Acumula un byte de trama; ejecuta el comando cuando la trama está completa
+// y devuelve true si lo ejecutó
+bool feedFrame(FrameParser& frame, uint8_t b) {
+  frame.buf[frame.len++] = b;
+  if (frame.len < 2) return false;
+  int payloadLen = framePayloadLen(frame.buf[1]);
+  if (payloadLen < 0) {
+    console.println("❌ Opcode desconocido");
+    frame.len = 0;
+  } else if (frame.len == payloadLen + 3) {
+    bool valid = crc8(frame.buf + 1, payloadLen + 1) == frame.buf[frame.len - 1];
+    if (valid) {
+      process_frame(frame.buf[1], frame.buf + 2);
+    } else {
+      console.println("❌ CRC inválido");
+    }
+    frame.len = 0;
+    return valid;
+  }
+  return false;
+}
+#endif
+
+// ---------- Puerto serie ----------
+// Lo que haya en el UART, sin esperar al resto de la línea; como mucho un
+// comando por vuelta para no retrasar updateMoves()
+void handleSerial() {
+  while (Serial.available()) {
+    uint8_t b = Serial.read();
+#if BINARY_PROTOCOL
+    if (serialFrame.len > 0 || (serialLine.len == 0 && b == FRAME_SYNC)) {
+      if (feedFrame(serialFrame, b)) break;
+      continue;
+    }
+#endif
+    if (feedLine(serialLine, b)) break;
+  }
+}
+
+// ---------- Setup y loop del núcleo ----------
+void coreSetup() {
+  pinMode(LED_PIN, OUTPUT);
+  digitalWrite(LED_PIN, LOW);
+  lastLoopTime = millis();
+  lastTelemetry = millis();
+
+  for (int i = 0; i < NUM_SERVOS; ++i) {
+    servos[i].attach(PINS[i]);
+    servoPWM[i] = STOP_PWM[i];
+    moving[i] = false;
+    reportMove[i] = false;
+    stopAt[i] = 0;
+    currentAngle[i] = 0.0;
+    targetAngle[i] = 0.0;
+  }
+
+  stopAll();
+}
+
+void coreLoop() {
+  handleSerial();
+  updateMoves();
+  updateStream();
+  updateTelemetry();
+  updateLED();
+}
@@ -0,0 +1,1258 @@
+#!/usr/bin/env python3
+"""
+Emulador en Python del firmware del cuello (ino_template.ino y neck_core.h).
+
+Reproduce process_command, el planificador de movimientos (con
+motion_planner.py), startMove/updateMoves, el buffer de
+setpoints, las tramas binarias y la telemetría con la misma salida que el
+ESP32.
+Cada servo es un SimulatedServo con su propia curva PWM→velocidad, así que
+el ángulo real puede separarse del que cree el firmware.
+Las constantes se leen de neck_config.yaml igual que en ino_generator.py y el
+emulador se sirve en un pseudo-terminal de Linux, así que ESP32NeckController
+se conecta a él como si fuera /dev/esp32:
+
+    with PtyEmulator() as emulator:
+        with ESP32NeckController(emulator.port, reset_delay=0) as controller:
+            controller.move_angles([45, 0, 0]).result(timeout=5)
+
+Por defecto el tráfico se ritma al baudrate configurado (10 bits por byte)
+para que las medidas de rendimiento sean realistas.
+
+HttpEmulator sirve el mismo firmware por HTTP (/api/cmd), como el WebServer
+del ESP32, para probar HttpTransport sin la red del AP:
+
+    with HttpEmulator() as emulator:
+        transport = HttpTransport(emulator.url)
+
+UdpEmulator hace lo mismo con el canal UDP y puede simular pérdidas y
+desorden de la red para medir UdpTransport.
+"""
+import heapq
+import json
+import math
+import os
+import random
+import re
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import tty
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import ino_generator
+import motion_planner
+import neck_protocol
+import servo_tables
+from neck_config import NeckConfig
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+DEFAULT_TEMPLATE = WORKDIR / 'ino_template.ino'
+DEFAULT_HTML = WORKDIR / 'index.html'
+
+# Valores fijos en neck_core.h
+MIN_MOVE_THRESHOLD = 0.5
+LOOP_INTERVAL = 20
+STREAM_IDLE_MS = 2 * LOOP_INTERVAL
+LOG_TERSE = 0
+LOG_VERBOSE = 1
+BITS_PER_BYTE = 10  # 8N1
+CAPTURE_MAX_LEN = 1024
+
+# Prefijo que acepta strtof: hex, decimal, inf/infinity y nan
+_RE_STRTOF = re.compile(
+    r"[+-]?(?:0[xX](?:[0-9a-fA-F]+\.?[0-9a-fA-F]*|\.[0-9a-fA-F]+)(?:[pP][+-]?\d+)?"
+    r"|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+    r"|[iI][nN][fF](?:[iI][nN][iI][tT][yY])?|[nN][aA][nN](?:\([0-9A-Za-z_]*\))?)")
+_C_SPACE = " \t\n\v\f\r"  # isspace() en la configuración regional "C"
+
+
+def emulated_constants(config: NeckConfig) -> dict:
+    """Constantes del firmware que generaría ino_generator.py, con su BUILD_HASH."""
+    constants = ino_generator.build_constants(config)
+    _, constants['BUILD_HASH'] = ino_generator.render_ino(config, DEFAULT_TEMPLATE, DEFAULT_HTML)
+    return constants
+
+
+def _override_num_servos(constants: dict, num_servos: int):
+    """Cambia el número de servos de unas constantes ya generadas."""
+    constants['NUM_SERVOS'] = num_servos
+    constants['SERVO_TABLES'] = constants['SERVO_TABLES'].resized(num_servos)
+
+
+def _f32(value: float) -> float:
+    """Redondea a float de 32 bits como hace el ESP32."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def _strtof(text: str) -> Tuple[float, int]:
+    """
+    Equivalente a strtof: (valor, caracteres consumidos); (0.0, 0) si no hay
+    número. Como el de newlib en el ESP32, pasa por double y redondea a float;
+    fuera del rango de float da ±inf, como HUGE_VALF.
+    """
+    match = _RE_STRTOF.match(text)
+    if not match:
+        return 0.0, 0
+    token = match.group(0)
+    body = token.lstrip('+-')
+    if body[:2] in ('0x', '0X'):
+        if 'p' not in body.lower():
+            body += 'p0'
+        value = float.fromhex(body)
+        value = -value if token.startswith('-') else value
+    elif body[:1].lower() == 'n':
+        value = float('nan')
+    else:
+        value = float(token.split('(')[0])
+    try:
+        value = _f32(value)
+    except OverflowError:
+        value = math.copysign(math.inf, value)
+    return value, match.end()
+
+
+def _constrain(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+class _LineBuffer:
+    """LineParser del firmware: una línea a medio recibir."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.overflow = False
+
+
+class _Gesture:
+    """Gesture del firmware: un hueco de la tabla de gestos."""
+
+    def __init__(self):
+        self.period_ms = 0
+        self.count = 0
+        self.loaded = 0
+        self.points: List[List[int]] = []
+
+
+class SimulatedServo:
+    """
+    Servo de rotación continua con su curva PWM→velocidad "real".
+
+    El firmware no la conoce (sólo tiene sus tablas), así que el ángulo real
+    se separa del que cree el firmware igual que con el hardware. Sirve de
+    encoder para servo_characterize.py.
+
+    La velocidad es nula dentro de ±deadband PWM alrededor de stop_pwm y
+    crece como frac**exponent hasta max_dps en max_cw_pwm / max_ccw_pwm.
+
+    Args:
+        stop_pwm, max_cw_pwm, max_ccw_pwm: PWM de parada y de velocidad máxima
+        deadband: Zona muerta real en PWM
+        max_dps_cw, max_dps_ccw: Velocidad máxima en grados/s en cada sentido
+        exponent: Curvatura de la respuesta (1 = lineal)
+        clock: Reloj monótono en segundos, el del FirmwareEmulator
+    """
+
+    def __init__(self, stop_pwm: int, max_cw_pwm: int, max_ccw_pwm: int, deadband: int = 3,
+                 max_dps_cw: float = 500.0, max_dps_ccw: float = 450.0, exponent: float = 0.6,
+                 clock: Callable[[], float] = time.monotonic):
+        self.stop_pwm = stop_pwm
+        self.max_cw_pwm = max_cw_pwm
+        self.max_ccw_pwm = max_ccw_pwm
+        self.deadband = deadband
+        self.max_dps_cw = max_dps_cw
+        self.max_dps_ccw = max_dps_ccw
+        self.exponent = exponent
+        self._clock = clock
+        self._pwm = stop_pwm
+        self._angle = 0.0
+        self._since = clock()
+
+    @classmethod
+    def nominal(cls, calibration: servo_tables.ServoCalibration,
+                clock: Callable[[], float] = time.monotonic) -> "SimulatedServo":
+        """
+        Servo "real" para una calibración del YAML: un PWM más de zona muerta,
+        la velocidad nominal en sentido horario, un 10% menos en antihorario y
+        una respuesta no lineal.
+        """
+        max_dps = 1000 / calibration.ms_per_deg
+        return cls(calibration.stop_pwm, calibration.max_cw_pwm, calibration.max_ccw_pwm,
+                   deadband=calibration.deadzone + 1, max_dps_cw=max_dps, max_dps_ccw=0.9 * max_dps,
+                   clock=clock)
+
+    def velocity(self, pwm: int) -> float:
+        """Velocidad real en grados/s (positiva en sentido horario)."""
+        offset = pwm - self.stop_pwm
+        if abs(offset) <= self.deadband:
+            return 0.0
+        if offset > 0:
+            frac = min(1.0, (offset - self.deadband) / (self.max_cw_pwm - self.stop_pwm - self.deadband))
+            return self.max_dps_cw * frac ** self.exponent
+        frac = min(1.0, (-offset - self.deadband) / (self.stop_pwm - self.max_ccw_pwm - self.deadband))
+        return -self.max_dps_ccw * frac ** self.exponent
+
+    def write(self, pwm: int):
+        now = self._clock()
+        self._angle += self.velocity(self._pwm) * (now - self._since)
+        self._since = now
+        self._pwm = pwm
+
+    @property
+    def angle(self) -> float:
+        """Ángulo real acumulado en grados."""
+        return self._angle + self.velocity(self._pwm) * (self._clock() - self._since)
+
+
+class FirmwareEmulator:
+    """
+    Lógica del firmware sin hardware: recibe bytes y produce la salida serie.
+
+    Args:
+        constants: Constantes de ino_generator.build_constants
+        write: Función que recibe los bytes que el firmware escribiría por Serial
+        clock: Reloj monótono en segundos (por defecto time.monotonic)
+        servos: Servos simulados que mueve el PWM; por defecto
+            SimulatedServo.nominal de cada calibración
+    """
+
+    def __init__(self, constants: dict, write: Callable[[bytes], None],
+                 clock: Callable[[], float] = time.monotonic,
+                 servos: Optional[List[SimulatedServo]] = None):
+        self.constants = constants
+        self.num_servos = constants['NUM_SERVOS']
+        self.tables = constants['SERVO_TABLES']
+        self.servos = servos or [SimulatedServo.nominal(c, clock) for c in self.tables.calibrations]
+        self.binary_protocol = bool(constants['BINARY_PROTOCOL'])
+        self.setpoint_buffer_size = constants['SETPOINT_BUFFER_SIZE']
+        self.command_buffer_size = constants['COMMAND_BUFFER_SIZE']
+        self._write = write
+        self._clock = clock
+        self._t0 = clock()
+
+        n = self.num_servos
+        self.pwm = list(self.tables.stop_pwm)
+        self.moving = [False] * n
+        self.report_move = [False] * n
+        self.stop_at = [0] * n
+        self.move_start = [0] * n
+        self.profiles = [motion_planner.Profile() for _ in range(n)]
+        self.last_loop_time = 0
+        self.target_angle = [0.0] * n
+        self.current_angle = [0.0] * n
+        self.calibration_factor = _f32(self.tables.calibration_factor)
+        self.log_level = int(constants.get('LOG_LEVEL', LOG_VERBOSE))
+        self.log_timing = bool(constants.get('LOG_TIMING', 0))
+        self.log_commands = bool(constants.get('LOG_COMMANDS', 0))
+        self.setpoints: Deque[Tuple[int, List[float]]] = deque()
+        self.stream_base = 0
+        self.stream_last_t = 0
+        self.streaming = False
+        self.gesture_slots = constants.get('GESTURE_SLOTS', 8)
+        self.gesture_max_points = constants.get('GESTURE_MAX_POINTS', 64)
+        self.gestures = [_Gesture() for _ in range(self.gesture_slots)]
+        self.gesture_playing = -1
+        self.gesture_next = 0
+        self.gesture_origin = [0.0] * n
+        self.telemetry_hz = int(constants.get('TELEMETRY_HZ', 0))
+        self.last_telemetry = 0
+
+        self._rx = bytearray()
+        self._serial_line = _LineBuffer()
+        self._udp_line = _LineBuffer()
+        self._api_line = _LineBuffer()
+        self._frame = bytearray()
+        self._udp_frame = bytearray()
+        self.udp_peer: Optional[Tuple[str, int]] = None
+        self.udp_last_seq = 0
+
+    # ---------- Helpers ----------
+    def millis(self) -> int:
+        return int((self._clock() - self._t0) * 1000)
+
+    def println(self, text: str = ""):
+        self._write(f"{text}\n".encode("utf-8", errors="surrogateescape"))
+
+    def event(self, verbose: str, terse: str):
+        """Línea de evento según el nivel de registro (beginEvent() del firmware)."""
+        prefix = f"@{self.millis()} " if self.log_timing else ""
+        self.println(prefix + (verbose if self.log_level >= LOG_VERBOSE else terse))
+
+    def servo_write(self, idx: int, pwm: int):
+        self.pwm[idx] = pwm
+        self.servos[idx].write(pwm)
+
+    def setup(self):
+        """Salida de setup() tras un reset."""
+        self.stop_all()
+        self.println("📡 AP iniciado. IP: 10.0.0.1")
+        self.println(f"🌐 Web server listo. SSID: {self.constants['AP_SSID']}, "
+                     f"PASS: {self.constants['AP_PASSWORD']}, UDP: {self.constants['UDP_PORT']}")
+
+    def servo_angle(self, idx: int) -> float:
+        """servoAngle(): ángulo estimado del servo ahora mismo."""
+        if not self.moving[idx]:
+            return self.current_angle[idx]
+        x, _ = self.profiles[idx].state(self.millis() - self.move_start[idx])
+        return _f32(self.current_angle[idx] + x)
+
+    def profile_pwm(self, idx: int, t: float) -> int:
+        return motion_planner.profile_pwm(self.tables.pwm_cw[idx], self.tables.pwm_ccw[idx],
+                                          self.tables.stop_pwm[idx], self.profiles[idx], t)
+
+    def plan_move(self, idx: int, target: float, report: bool) -> int:
+        """planMove(): devuelve la duración en ms."""
+        now = self.millis()
+        velocity = 0.0
+        position = self.current_angle[idx]
+        if self.moving[idx]:
+            x, velocity = self.profiles[idx].state(now - self.move_start[idx])
+            position = _f32(position + x)
+        profile = motion_planner.plan_move(self.tables, idx, position, velocity, target,
+                                           self.calibration_factor)
+        duration = profile.duration_ms
+        self.profiles[idx] = profile
+        self.current_angle[idx] = position
+        self.target_angle[idx] = target
+        self.move_start[idx] = now
+        self.stop_at[idx] = now + duration
+        self.moving[idx] = True
+        self.report_move[idx] = report
+        self.servo_write(idx, self.profile_pwm(idx, LOOP_INTERVAL * 0.5))
+        return duration
+
+    def stop_all(self):
+        for i in range(self.num_servos):
+            if self.moving[i]:
+                self.current_angle[i] = self.target_angle[i] = self.servo_angle(i)
+            self.servo_write(i, self.tables.stop_pwm[i])
+            self.moving[i] = False
+        self.event("⏹️  Todos los servos detenidos", "s")
+
+    def start_move(self, idx: int, angle_deg: float, report: bool = True):
+        if idx < 0 or idx >= self.num_servos or abs(angle_deg) < MIN_MOVE_THRESHOLD:
+            return
+        origin = self.target_angle[idx] if self.moving[idx] else self.current_angle[idx]
+        duration = self.plan_move(idx, _f32(origin + angle_deg), report)
+        if report:
+            direction = "↻" if angle_deg > 0 else "↺"
+            self.event(f"▶️  Servo {idx + 1}: {direction} {angle_deg:.1f}° ({duration} ms)",
+                       f"m {idx + 1} {angle_deg:.1f} {duration}")
+
+    def update_moves(self):
+        now = self.millis()
+        tick = now - self.last_loop_time >= LOOP_INTERVAL
+        if tick:
+            self.last_loop_time = now
+        for i in range(self.num_servos):
+            if not self.moving[i]:
+                continue
+            if now >= self.stop_at[i]:
+                self.servo_write(i, self.tables.stop_pwm[i])
+                self.moving[i] = False
+                self.current_angle[i] = self.target_angle[i]
+                if self.report_move[i]:
+                    self.event(f"✅ Servo {i + 1} detenido en {self.current_angle[i]:.1f}°",
+                               f"d {i + 1} {self.current_angle[i]:.1f}")
+            elif tick:
+                self.servo_write(i, self.profile_pwm(i, now - self.move_start[i] + LOOP_INTERVAL * 0.5))
+
+    def reset_positions(self):
+        for i in range(self.num_servos):
+            offset = self.servo_angle(i)
+            self.current_angle[i] = _f32(self.current_angle[i] - offset)
+            self.target_angle[i] = _f32(self.target_angle[i] - offset)
+        self.event("🔄 Posiciones reiniciadas a 0°", "r")
+
+    def report_positions(self):
+        values = "".join(f" {self.servo_angle(i):.1f}" for i in range(self.num_servos))
+        self.event("📍 Posiciones:" + values, "p" + values)
+
+    # ---------- Telemetría ----------
+    def send_telemetry(self, now: int):
+        """sendTelemetry(): trama OP_TELEMETRY, con el redondeo de lroundf."""
+        servos = []
+        for i in range(self.num_servos):
+            scaled = _f32(self.servo_angle(i) * neck_protocol.ANGLE_SCALE)
+            raw = math.copysign(math.floor(abs(scaled) + 0.5), scaled)
+            remaining = self.stop_at[i] - now if self.moving[i] and self.stop_at[i] > now else 0
+            servos.append((self.pwm[i], self.moving[i], raw / neck_protocol.ANGLE_SCALE, remaining))
+        self._write(neck_protocol.encode_telemetry(now, servos))
+
+    def update_telemetry(self):
+        if self.telemetry_hz <= 0:
+            return
+        now = self.millis()
+        period = 1000 // self.telemetry_hz
+        if now - self.last_telemetry < period:
+            return
+        self.last_telemetry = self.last_telemetry + period if now - self.last_telemetry < 2 * period else now
+        self.send_telemetry(now)
+
+    def set_telemetry(self, hz: float):
+        if not (0 <= hz <= neck_protocol.TELEMETRY_MAX_HZ):
+            self.println(f"❌ M espera Hz entre 0 y {neck_protocol.TELEMETRY_MAX_HZ}")
+            return
+        self.telemetry_hz = int(hz)
+        self.last_telemetry = self.millis() - 1000
+        self.event(f"📈 Telemetría a {self.telemetry_hz} Hz" if self.telemetry_hz > 0
+                   else "📈 Telemetría desactivada", f"t {self.telemetry_hz}")
+
+    # ---------- Trayectorias ----------
+    def clear_setpoints(self):
+        self.setpoints.clear()
+        self.streaming = False
+        self.gesture_playing = -1
+
+    def queue_setpoint(self, t: int, angles: List[float]):
+        if len(self.setpoints) == self.setpoint_buffer_size:
+            self.println("❌ Buffer de setpoints lleno")
+            return
+        if not self.streaming:
+            self.stream_base = self.millis() - t
+            self.streaming = True
+        self.setpoints.append((t, [_f32(a) for a in angles]))
+
+    def stream_to(self, idx: int, angle: float):
+        origin = self.target_angle[idx] if self.moving[idx] else self.current_angle[idx]
+        if abs(_f32(angle - origin)) < MIN_MOVE_THRESHOLD:
+            return
+        self.plan_move(idx, angle, report=False)
+
+    def update_gesture(self):
+        gesture = self.gestures[self.gesture_playing]
+        t = self.gesture_next * gesture.period_ms
+        if self.millis() < self.stream_base + t:
+            return
+        for i, raw in enumerate(gesture.points[self.gesture_next]):
+            self.stream_to(i, _f32(self.gesture_origin[i] + _f32(raw / neck_protocol.ANGLE_SCALE)))
+        self.stream_last_t = t
+        self.gesture_next += 1
+        if self.gesture_next == gesture.loaded:
+            self.gesture_playing = -1
+
+    def update_stream(self):
+        if not self.streaming:
+            return
+        if self.gesture_playing >= 0:
+            self.update_gesture()
+            return
+        if not self.setpoints:
+            if self.millis() - (self.stream_base + self.stream_last_t) < STREAM_IDLE_MS:
+                return
+            self.streaming = False
+            self.event("🏁 Trayectoria completada", "f")
+            return
+        t, angles = self.setpoints[0]
+        if self.millis() < self.stream_base + t:
+            return
+        for i in range(self.num_servos):
+            self.stream_to(i, angles[i])
+        self.stream_last_t = t
+        self.setpoints.popleft()
+
+    # ---------- Gestos ----------
+    def define_gesture(self, slot: int, period_ms: int, count: int):
+        if self.gesture_playing == slot:
+            self.clear_setpoints()
+        gesture = self.gestures[slot]
+        gesture.period_ms = period_ms
+        gesture.count = count
+        gesture.loaded = 0
+        gesture.points = [[0] * self.num_servos for _ in range(count)]
+
+    def write_gesture_point(self, slot: int, index: int, offsets: List[float]) -> bool:
+        """writeGesturePoint(), con el redondeo de lroundf."""
+        gesture = self.gestures[slot]
+        if index >= gesture.count:
+            return False
+        raw = []
+        for offset in offsets:
+            scaled = _f32(offset * neck_protocol.ANGLE_SCALE)
+            value = int(math.copysign(math.floor(abs(scaled) + 0.5), scaled))
+            if not -32768 <= value <= 32767:
+                return False
+            raw.append(value)
+        gesture.points[index] = raw
+        if index == gesture.count - 1:
+            gesture.loaded = gesture.count
+            self.event(f"🎭 Gesto {slot} cargado: {gesture.count} puntos cada {gesture.period_ms} ms",
+                       f"k {slot} {gesture.count} {gesture.period_ms}")
+        return True
+
+    def play_gesture(self, slot: int):
+        self.clear_setpoints()
+        for i in range(self.num_servos):
+            self.gesture_origin[i] = self.target_angle[i] if self.moving[i] else self.current_angle[i]
+        self.gesture_playing = slot
+        self.gesture_next = 0
+        self.stream_base = self.millis()
+        self.stream_last_t = 0
+        self.streaming = True
+        gesture = self.gestures[slot]
+        ms = (gesture.loaded - 1) * gesture.period_ms
+        self.event(f"🎭 Gesto {slot}: {ms} ms", f"g {slot} {ms}")
+
+    def loaded_gestures(self) -> int:
+        return sum(1 << s for s, gesture in enumerate(self.gestures) if gesture.loaded)
+
+    # ---------- Comandos ----------
+    def move_angles(self, angles: List[float]):
+        for i in range(self.num_servos):
+            self.start_move(i, angles[i])
+
+    def set_pwm(self, pwm_values: List[float]):
+        values = [int(v) for v in pwm_values]
+        for i in range(self.num_servos):
+            self.servo_write(i, _constrain(values[i], 0, 180))
+        self.event("✅ PWM directo: " + "".join(f"{v} " for v in values),
+                   "v" + "".join(f" {v}" for v in values))
+
+    def set_log_level(self, level: int):
+        self.log_level = level
+        self.event("📝 Registro en texto", f"l {level}")
+
+    def _parse_values(self, text: str, max_count: int) -> List[float]:
+        """Réplica de parseValues: números de strtof; un token inválido corta la lectura."""
+        values = []
+        i = 0
+        while len(values) < max_count:
+            while i < len(text) and text[i] in _C_SPACE:
+                i += 1
+            if i >= len(text):
+                break
+            value, used = _strtof(text[i:])
+            end = i + used
+            if not used or (end < len(text) and text[end] not in _C_SPACE) or not math.isfinite(value):
+                break
+            values.append(_f32(value))
+            i = end
+        return values
+
+    def process_command(self, cmd: str) -> bool:
+        """process_command(): ejecuta una línea; devuelve False si estaba vacía."""
+        cmd = cmd.strip(_C_SPACE)
+        if not cmd:
+            return False
+        if self.log_commands:
+            self.event(f"⌨️  {cmd}", f"> {cmd}")
+        n = self.num_servos
+        if cmd.startswith("A "):
+            values = self._parse_values(cmd[2:], n)
+            if len(values) == n:
+                self.move_angles([_f32(v) for v in values])
+            else:
+                self.println(f"❌ A espera {n} valores")
+        elif cmd.startswith("V "):
+            values = self._parse_values(cmd[2:], n)
+            if len(values) == n:
+                self.set_pwm(values)
+            else:
+                self.println(f"❌ V espera {n} valores")
+        elif cmd.startswith("Q "):
+            values = self._parse_values(cmd[2:], n + 1)
+            if len(values) == n + 1 and values[0] >= 0:
+                self.queue_setpoint(int(values[0]), values[1:])
+            else:
+                self.println(f"❌ Q espera t y {n} valores")
+        elif cmd.startswith("M "):
+            values = self._parse_values(cmd[2:], 1)
+            if values:
+                self.set_telemetry(values[0])
+            else:
+                self.println(f"❌ M espera Hz entre 0 y {neck_protocol.TELEMETRY_MAX_HZ}")
+        elif cmd.startswith("K "):
+            values = self._parse_values(cmd[2:], 3)
+            if (len(values) == 3 and 0 <= values[0] < self.gesture_slots and 1 <= values[1] <= 65535
+                    and 1 <= values[2] <= self.gesture_max_points):
+                self.define_gesture(int(values[0]), int(values[1]), int(values[2]))
+            else:
+                self.println(f"❌ K espera gesto (0-{self.gesture_slots - 1}), periodo en ms y "
+                             f"puntos (1-{self.gesture_max_points})")
+        elif cmd.startswith("W "):
+            values = self._parse_values(cmd[2:], n + 2)
+            if (len(values) != n + 2 or not 0 <= values[0] < self.gesture_slots
+                    or not 0 <= values[1] < self.gesture_max_points
+                    or not self.write_gesture_point(int(values[0]), int(values[1]), values[2:])):
+                self.println(f"❌ W espera gesto, punto de K y {n} desplazamientos")
+        elif cmd.startswith("G "):
+            values = self._parse_values(cmd[2:], 1)
+            if values and 0 <= values[0] < self.gesture_slots and self.gestures[int(values[0])].loaded:
+                self.play_gesture(int(values[0]))
+            else:
+                self.println(f"❌ G espera un gesto cargado (0-{self.gesture_slots - 1})")
+        elif cmd in ("D", "d"):
+            self.set_log_level(LOG_TERSE if self.log_level >= LOG_VERBOSE else LOG_VERBOSE)
+        elif cmd.startswith("D "):
+            values = self._parse_values(cmd[2:], 1)
+            if values and values[0] in (LOG_TERSE, LOG_VERBOSE):
+                self.set_log_level(int(values[0]))
+            else:
+                self.println(f"❌ D espera {LOG_TERSE} (códigos) o {LOG_VERBOSE} (texto)")
+        elif cmd in ("S", "s"):
+            self.clear_setpoints()
+            self.stop_all()
+        elif cmd in ("R", "r"):
+            self.reset_positions()
+        elif cmd in ("P", "p"):
+            self.report_positions()
+        elif cmd in ("I", "i"):
+            info = (f"servos={n} ms_per_deg={','.join('%g' % v for v in self.tables.ms_per_deg_cw)} "
+                    f"ramp_ms={','.join('%g' % v for v in self.tables.ramp_ms)} "
+                    f"calibration={self.calibration_factor:.2f} debug={self.log_level} "
+                    f"telemetry={self.telemetry_hz} gestures={self.loaded_gestures()} build={self.constants.get('BUILD_HASH', '')}")
+            self.event("ℹ️  " + info, "i " + info)
+        else:
+            self.println("❓ Comando no reconocido")
+        return True
+
+    def end_line(self, line: "_LineBuffer") -> bool:
+        """endLine(): ejecuta la línea acumulada; True si había comando."""
+        data, overflow = bytes(line.buf), line.overflow
+        line.buf.clear()
+        line.overflow = False
+        if overflow:
+            self.println(f"❌ Comando demasiado largo (máx {self.command_buffer_size - 1})")
+            return False
+        # Es una cadena C: termina en el primer '\0'. surrogateescape conserva
+        # los bytes que no son UTF-8 para el eco de LOG_COMMANDS
+        return self.process_command(data.split(b"\0", 1)[0].decode("utf-8", errors="surrogateescape"))
+
+    def feed_line(self, line: "_LineBuffer", byte: int) -> bool:
+        """feedLine(): acumula un byte; ejecuta la línea al llegar el '\\n'."""
+        if byte == 0x0A:
+            return self.end_line(line)
+        if len(line.buf) < self.command_buffer_size - 1:
+            line.buf.append(byte)
+        else:
+            line.overflow = True
+        return False
+
+    # ---------- Tramas binarias ----------
+    def frame_payload_len(self, opcode: int) -> int:
+        n = self.num_servos
+        return {
+            neck_protocol.OP_MOVE_ANGLES: n * 2,
+            neck_protocol.OP_SET_PWM: n,
+            neck_protocol.OP_QUEUE_SETPOINT: 4 + n * 2,
+            neck_protocol.OP_STOP: 0,
+            neck_protocol.OP_RESET: 0,
+            neck_protocol.OP_POSITIONS: 0,
+        }.get(opcode, -1)
+
+    def _decode_angles(self, payload: bytes) -> List[float]:
+        raw = struct.unpack(f"<{self.num_servos}h", payload)
+        return [_f32(v / neck_protocol.ANGLE_SCALE) for v in raw]
+
+    def process_frame(self, opcode: int, payload: bytes):
+        if self.log_commands:
+            self.event(f"⌨️  trama 0x{opcode:02X}", f"> 0x{opcode:02X}")
+        if opcode == neck_protocol.OP_MOVE_ANGLES:
+            self.move_angles(self._decode_angles(payload))
+        elif opcode == neck_protocol.OP_SET_PWM:
+            self.set_pwm(list(payload))
+        elif opcode == neck_protocol.OP_QUEUE_SETPOINT:
+            t, = struct.unpack("<I", payload[:4])
+            self.queue_setpoint(t, self._decode_angles(payload[4:]))
+        elif opcode == neck_protocol.OP_STOP:
+            self.clear_setpoints()
+            self.stop_all()
+        elif opcode == neck_protocol.OP_RESET:
+            self.reset_positions()
+        elif opcode == neck_protocol.OP_POSITIONS:
+            self.report_positions()
+
+    def feed_frame(self, byte: int, frame: Optional[bytearray] = None) -> bool:
+        """feedFrame(): True si completó y ejecutó una trama válida."""
+        frame = self._frame if frame is None else frame
+        frame.append(byte)
+        if len(frame) < 2:
+            return False
+        payload_len = self.frame_payload_len(frame[1])
+        if payload_len < 0:
+            self.println("❌ Opcode desconocido")
+            frame.clear()
+        elif len(frame) == payload_len + 3:
+            body = bytes(frame[1:-1])
+            valid = neck_protocol.crc8(body) == frame[-1]
+            if valid:
+                self.process_frame(body[0], body[1:])
+            else:
+                self.println("❌ CRC inválido")
+            frame.clear()
+            return valid
+        return False
+
+    # ---------- UDP ----------
+    def process_datagram(self, data: bytes):
+        """processDatagram(): tramas binarias y/o líneas ASCII."""
+        i = 0
+        while i < len(data):
+            if self.binary_protocol and not self._udp_line.buf and data[i] == neck_protocol.FRAME_SYNC:
+                self._udp_frame.clear()
+                while True:
+                    self.feed_frame(data[i], self._udp_frame)
+                    i += 1
+                    if i >= len(data) or not self._udp_frame:
+                        break
+                self._udp_frame.clear()
+                continue
+            self.feed_line(self._udp_line, data[i])
+            i += 1
+        self.end_line(self._udp_line)
+
+    def handle_datagram(self, data: bytes, peer: Tuple[str, int]) -> Optional[bytes]:
+        """
+        handleUdp() para un datagrama.
+
+        Returns:
+            Datagrama de respuesta, None si no hay, o b"" si se descartó por
+            atrasado
+        """
+        if len(data) < neck_protocol.UDP_HEADER.size:
+            return None
+        seq, flags, payload = neck_protocol.decode_datagram(data)
+        if peer == self.udp_peer and not neck_protocol.seq_newer(seq, self.udp_last_seq):
+            return b""
+        self.udp_peer = peer
+        self.udp_last_seq = seq
+        captured = bytearray()
+        write = self._write
+
+        def tee(out: bytes):
+            captured.extend(out[:max(0, CAPTURE_MAX_LEN - len(captured))])
+            write(out)
+        self._write = tee
+        try:
+            self.process_datagram(payload)
+        finally:
+            self._write = write
+        if flags & neck_protocol.UDP_FLAG_ACK or captured:
+            return data[:neck_protocol.UDP_HEADER.size] + bytes(captured)
+        return None
+
+    # ---------- Web ----------
+    def handle_api_command(self, body: str, reply: bool) -> Tuple[int, str]:
+        """
+        handleApiCommand(): ejecuta los comandos separados por '\\n' o ';'.
+
+        Returns:
+            (código HTTP, cuerpo JSON)
+        """
+        if not body:
+            return 400, '{"error":"sin comandos"}'
+        captured = bytearray()
+        write = self._write
+        if reply:
+            def tee(data: bytes):
+                captured.extend(data[:max(0, CAPTURE_MAX_LEN - len(captured))])
+                write(data)
+            self._write = tee
+        count = 0
+        try:
+            for byte in body.encode("utf-8"):
+                count += self.feed_line(self._api_line, 0x0A if byte == 0x3B else byte)
+            count += self.end_line(self._api_line)
+        finally:
+            self._write = write
+        if not reply:
+            return 204, ""
+        text = captured.decode("utf-8", errors="replace")
+        lines = ["".join(c for c in line if c >= " ") for line in text.split("\n")]
+        return 200, json.dumps({'ok': count, 'out': [line for line in lines if line]},
+                               ensure_ascii=False, separators=(",", ":"))
+
+    # ---------- Loop ----------
+    def receive(self, data: bytes):
+        """Bytes que llegan al buffer de recepción del UART."""
+        self._rx.extend(data)
+
+    def loop(self):
+        """Una iteración de loop() del firmware."""
+        i = 0
+        while i < len(self._rx):
+            byte = self._rx[i]
+            i += 1
+            if self.binary_protocol and (self._frame or (not self._serial_line.buf and
+                                                         byte == neck_protocol.FRAME_SYNC)):
+                if self.feed_frame(byte):
+                    break
+                continue
+            if self.feed_line(self._serial_line, byte):
+                break
+        del self._rx[:i]
+        self.update_moves()
+        self.update_stream()
+        self.update_telemetry()
+
+    def next_deadline(self) -> Optional[float]:
+        """Segundos hasta el próximo evento temporal (fin de movimiento, setpoint o telemetría)."""
+        if self._rx:
+            return 0.0  # loop() dejó bytes sin leer tras ejecutar un comando
+        now = self.millis()
+        deadlines = [self.stop_at[i] for i in range(self.num_servos) if self.moving[i]]
+        if deadlines:
+            deadlines.append(self.last_loop_time + LOOP_INTERVAL)  # Ajuste del PWM
+        if self.gesture_playing >= 0:
+            gesture = self.gestures[self.gesture_playing]
+            deadlines.append(self.stream_base + self.gesture_next * gesture.period_ms)
+        elif self.streaming:
+            deadlines.append(self.stream_base + (self.setpoints[0][0] if self.setpoints
+                                                 else self.stream_last_t + STREAM_IDLE_MS))
+        if self.telemetry_hz > 0:
+            deadlines.append(self.last_telemetry + 1000 // self.telemetry_hz)
+        if not deadlines:
+            return None
+        return max(0.0, (min(deadlines) - now) / 1000)
+
+
+class PtyEmulator:
+    """
+    Sirve un FirmwareEmulator en un pseudo-terminal de Linux.
+
+    Args:
+        config_file: YAML de configuración (por defecto neck_config.yaml)
+        baudrate: Baudios a emular (por defecto board_settings.baudrate)
+        pacing: Ritmar la entrada y salida al baudrate (default: True)
+        num_servos: Sobrescribe el número de servos de la configuración
+        servos: Servos simulados (SimulatedServo); por defecto los nominales
+    """
+
+    def __init__(self, config_file: Optional[str] = None, baudrate: Optional[int] = None,
+                 pacing: bool = True, num_servos: Optional[int] = None,
+                 servos: Optional[List[SimulatedServo]] = None):
+        self.config_file = Path(config_file) if config_file else DEFAULT_CONFIG
+        config = ino_generator.load_config(self.config_file)
+        self.constants = emulated_constants(config)
+        if num_servos is not None:
+            _override_num_servos(self.constants, num_servos)
+        self.baudrate = baudrate or config.board.baudrate
+        self.pacing = pacing
+        self.servos = servos
+        self.port: Optional[str] = None
+        self.firmware: Optional[FirmwareEmulator] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_rx_at: Optional[float] = None  # time.monotonic() de la última lectura del pty
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+        self._rx_pending: Deque[Tuple[float, bytes]] = deque()
+        self._rx_ready_at = 0.0
+        self._tx_pending = bytearray()
+        self._tx_ready_at = 0.0
+
+    def _byte_time(self, count: int) -> float:
+        return count * BITS_PER_BYTE / self.baudrate if self.pacing else 0.0
+
+    def _queue_output(self, data: bytes):
+        self._tx_pending.extend(data)
+
+    def start(self) -> str:
+        """Crea el pty, arranca el firmware emulado y devuelve la ruta del puerto."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.firmware = FirmwareEmulator(self.constants, self._queue_output,
+                                         servos=self.servos)
+        self.firmware.setup()
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name=f"emulator-{self.port}", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=1)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def _run(self):
+        while self._running.is_set():
+            now = time.monotonic()
+            self._flush_output(now)
+            timeout = 0.01
+            deadline = self.firmware.next_deadline()
+            if deadline is not None:
+                timeout = min(timeout, deadline)
+            if self._rx_pending:
+                timeout = min(timeout, max(0.0, self._rx_pending[0][0] - now))
+            if self._tx_pending:
+                timeout = min(timeout, max(0.0, self._tx_ready_at - now), 0.001)
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            now = time.monotonic()
+            if readable:
+                try:
+                    data = os.read(self._master, 4096)
+                except OSError:
+                    data = b""
+                if data:
+                    # Los bytes llegan al UART al ritmo del baudrate
+                    self._rx_ready_at = max(self._rx_ready_at, now) + self._byte_time(len(data))
+                    self._rx_pending.append((self._rx_ready_at, data))
+                    self.bytes_in += len(data)
+                    self.last_rx_at = now
+            while self._rx_pending and self._rx_pending[0][0] <= now:
+                self.firmware.receive(self._rx_pending.popleft()[1])
+            self.firmware.loop()
+
+    def _flush_output(self, now: float):
+        """Escribe la salida pendiente sin superar el baudrate."""
+        if not self._tx_pending or now < self._tx_ready_at:
+            return
+        if self.pacing:
+            # Enviar en bloques de ~1 ms de línea
+            chunk = max(1, int(self.baudrate / BITS_PER_BYTE / 1000))
+        else:
+            chunk = len(self._tx_pending)
+        data = bytes(self._tx_pending[:chunk])
+        try:
+            written = os.write(self._master, data)
+        except OSError:
+            return
+        del self._tx_pending[:written]
+        self.bytes_out += written
+        self._tx_ready_at = max(self._tx_ready_at, now) + self._byte_time(written)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class HttpEmulator:
+    """
+    Sirve un FirmwareEmulator por HTTP/1.1 con keep-alive.
+
+    Como el WebServer del ESP32, atiende una petición cada vez y bloquea el
+    loop del firmware mientras dura (incluido el delay de moveAngles).
+
+    Args:
+        config_file: YAML de configuración (por defecto neck_config.yaml)
+        host: Dirección en la que escuchar
+        port: Puerto TCP (0 = uno libre)
+        num_servos: Sobrescribe el número de servos de la configuración
+        keep_alive: Mantener la conexión abierta entre peticiones; False
+            responde con "Connection: close" como el WebServer del ESP32
+    """
+
+    def __init__(self, config_file: Optional[str] = None, host: str = "127.0.0.1",
+                 port: int = 0, num_servos: Optional[int] = None, keep_alive: bool = True):
+        self.config_file = Path(config_file) if config_file else DEFAULT_CONFIG
+        config = ino_generator.load_config(self.config_file)
+        self.constants = emulated_constants(config)
+        if num_servos is not None:
+            _override_num_servos(self.constants, num_servos)
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        page_gz = ino_generator.load_page(DEFAULT_HTML)
+        self.page = (page_gz, ino_generator.page_etag(page_gz))
+        self.url: Optional[str] = None
+        self.firmware: Optional[FirmwareEmulator] = None
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server: Optional[HTTPServer] = None
+        self._threads: List[threading.Thread] = []
+        self._running = threading.Event()
+
+    def _handler(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Cabeceras y cuerpo salen en escrituras separadas: sin esto, Nagle
+                # y el ACK retardado añaden ~40 ms a cada respuesta keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                emulator.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _command(self, body: Optional[str]):
+                url = urlsplit(self.path)
+                if url.path not in ("/api/cmd", "/cmd"):
+                    self.send_error(404)
+                    return
+                query = parse_qs(url.query)
+                if body is None:
+                    body = query.get("q", [""])[0]
+                reply = query.get("r", [""])[0] == "1"
+                with emulator._lock:
+                    emulator.requests += 1
+                    status, payload = emulator.firmware.handle_api_command(body, reply)
+                data = payload.encode()
+                self.send_response(status)
+                if data:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if not emulator.keep_alive:
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _root(self):
+                page_gz, etag = emulator.page
+                self.send_response(304 if self.headers.get("If-None-Match") == etag else 200)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(page_gz)))
+                self.end_headers()
+                self.wfile.write(page_gz)
+
+            def do_GET(self):
+                if urlsplit(self.path).path == "/":
+                    self._root()
+                else:
+                    self._command(None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._command(self.rfile.read(length).decode("utf-8", errors="replace"))
+
+        return Handler
+
+    def start(self) -> str:
+        """Arranca el servidor y el loop del firmware; devuelve la URL base."""
+        self.firmware = FirmwareEmulator(self.constants, lambda data: None)
+        self.firmware.setup()
+        self._server = HTTPServer((self.host, self.port), self._handler())
+        self.port = self._server.server_address[1]
+        self.url = f"http://{self.host}:{self.port}"
+        self._running.set()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                             name="neck-http-emulator", daemon=True),
+            threading.Thread(target=self._run, name="neck-http-firmware", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self.url
+
+    def stop(self):
+        self._running.clear()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    def _run(self):
+        while self._running.is_set():
+            with self._lock:
+                self.firmware.loop()
+                deadline = self.firmware.next_deadline()
+            time.sleep(min(deadline if deadline is not None else 0.01, 0.01))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class UdpEmulator:
+    """
+    Sirve un FirmwareEmulator por UDP, como handleUdp() del firmware.
+
+    Puede simular la red del AP: cada datagrama entrante se pierde con
+    probabilidad `loss` y se entrega tras `delay` + uniforme(0, `jitter`)
+    segundos, así que con jitter llegan desordenados.
+
+    Args:
+        config_file: YAML de configuración (por defecto neck_config.yaml)
+        host: Dirección en la que escuchar
+        port: Puerto UDP (0 = uno libre)
+        num_servos: Sobrescribe el número de servos de la configuración
+        loss: Probabilidad de perder cada datagrama entrante
+        delay: Retardo fijo de entrega en segundos
+        jitter: Retardo aleatorio adicional máximo en segundos
+        seed: Semilla de la simulación de red
+    """
+
+    def __init__(self, config_file: Optional[str] = None, host: str = "127.0.0.1",
+                 port: int = 0, num_servos: Optional[int] = None, loss: float = 0.0,
+                 delay: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.config_file = Path(config_file) if config_file else DEFAULT_CONFIG
+        config = ino_generator.load_config(self.config_file)
+        self.constants = emulated_constants(config)
+        if num_servos is not None:
+            _override_num_servos(self.constants, num_servos)
+        self.host = host
+        self.port = port
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.url: Optional[str] = None
+        self.firmware: Optional[FirmwareEmulator] = None
+        self.received = 0   # Datagramas que llegaron al socket
+        self.lost = 0       # Perdidos por la red simulada
+        self.stale = 0      # Descartados por llegar atrasados
+        self.applied = 0    # Ejecutados por el firmware
+        self._random = random.Random(seed)
+        self._in_flight: List[Tuple[float, int, bytes, Tuple[str, int]]] = []
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+
+    def start(self) -> str:
+        """Arranca el socket y el loop del firmware; devuelve 'udp://host:puerto'."""
+        self.firmware = FirmwareEmulator(self.constants, lambda data: None)
+        self.firmware.setup()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self.url = f"udp://{self.host}:{self.port}"
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="neck-udp-emulator", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def _receive(self, now: float):
+        data, peer = self._sock.recvfrom(65535)
+        self.received += 1
+        if self._random.random() < self.loss:
+            self.lost += 1
+            return
+        deliver_at = now + self.delay + self._random.uniform(0.0, self.jitter)
+        heapq.heappush(self._in_flight, (deliver_at, self.received, data, peer))
+
+    def _deliver(self, now: float):
+        while self._in_flight and self._in_flight[0][0] <= now:
+            _, _, data, peer = heapq.heappop(self._in_flight)
+            reply = self.firmware.handle_datagram(data, peer)
+            if reply == b"":
+                self.stale += 1
+                continue
+            self.applied += 1
+            if reply:
+                self._sock.sendto(reply, peer)
+
+    def _run(self):
+        while self._running.is_set():
+            now = time.monotonic()
+            self._deliver(now)
+            self.firmware.loop()
+            timeouts = [0.01]
+            deadline = self.firmware.next_deadline()
+            if deadline is not None:
+                timeouts.append(deadline)
+            if self._in_flight:
+                timeouts.append(max(0.0, self._in_flight[0][0] - now))
+            readable, _, _ = select.select([self._sock], [], [], min(timeouts))
+            if readable:
+                self._receive(time.monotonic())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    """Arranca el emulador y mantiene el pty abierto hasta Ctrl+C."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Emulador del firmware del cuello sobre un pty")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("-b", "--baudrate", type=int, default=None,
+                        help="Baudios a emular (por defecto: board_settings.baudrate)")
+    parser.add_argument("--no-pacing", action="store_true",
+                        help="No limitar el tráfico al baudrate")
+    parser.add_argument("--link", type=str, default=None,
+                        help="Crear un enlace simbólico al pty (ej: /tmp/esp32)")
+    parser.add_argument("--http", type=int, default=None, metavar="PUERTO",
+                        help="Servir el firmware por HTTP en este puerto en lugar de un pty")
+    parser.add_argument("--http-close", action="store_true",
+                        help="Cerrar la conexión tras cada respuesta, como el WebServer del ESP32")
+    parser.add_argument("--udp", type=int, default=None, metavar="PUERTO",
+                        help="Servir el firmware por UDP en este puerto en lugar de un pty")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="Con --udp: probabilidad de perder cada datagrama")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Con --udp: retardo aleatorio máximo de entrega en ms")
+    args = parser.parse_args()
+
+    if args.udp is not None:
+        with UdpEmulator(args.config, port=args.udp, loss=args.loss,
+                         jitter=args.jitter / 1000) as emulator:
+            print(f"🤖 Emulador UDP en {emulator.url}")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                print(f"\n📴 Emulador detenido ({emulator.applied} aplicados, "
+                      f"{emulator.stale} atrasados, {emulator.lost} perdidos)")
+        sys.exit(0)
+
+    if args.http is not None:
+        with HttpEmulator(args.config, port=args.http, keep_alive=not args.http_close) as emulator:
+            print(f"🤖 Emulador HTTP en {emulator.url}/api/cmd")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                print("\n📴 Emulador detenido")
+        sys.exit(0)
+
+    emulator = PtyEmulator(args.config, baudrate=args.baudrate, pacing=not args.no_pacing)
+    port = emulator.start()
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(port, args.link)
+    print(f"🤖 Emulador escuchando en {args.link or port} ({emulator.baudrate} baudios)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n📴 Emulador detenido")
+    finally:
+        emulator.stop()
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
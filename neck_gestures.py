@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Biblioteca de gestos del cuello.
+
+Cada gesto se define con fotogramas clave de orientación de la cabeza (yaw,
+pitch, roll en unidades de intensidad, tiempo en fracción de la duración).
+Se muestrea con interpolación suave entre fotogramas a una trayectoria
+densa, se pasa a ángulos de motor con la cinemática inversa y se guarda en
+caché por (gesto, intensidad, duración). La primera vez que se usa se carga
+en la tabla de gestos del firmware (comandos K/W); después cada reproducción
+es un solo "G <n>" y el firmware la sigue con su reloj:
+
+    gestures = GestureLibrary(controller)
+    gestures.play("nod_yes", intensity=20, duration_ms=1200).result(timeout=5)
+
+Los desplazamientos se calculan alrededor de la orientación de reposo y se
+aplican desde donde esté cada servo al empezar, así que un gesto lejos del
+reposo es una aproximación. Todos empiezan y terminan en reposo, así que la
+cabeza vuelve a donde estaba.
+
+La tabla vive en la RAM del firmware: tras un reinicio, sync() (o
+invalidate()) hace que se vuelvan a cargar.
+
+    python neck_gestures.py          # Tamaño de cada gesto y coste de compilarlo
+"""
+import math
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from neck_kinematics import NeckKinematics
+
+GESTURE_MAX_POINTS = 64  # Valor por defecto de communication.gesture_max_points
+LOOP_INTERVAL_MS = 20  # LOOP_INTERVAL del firmware: el periodo es múltiplo suyo
+ANGLE_RESOLUTION = 0.1  # Grados con que viajan los W (1 / ANGLE_SCALE)
+
+
+@dataclass(frozen=True)
+class Keyframe:
+    """Orientación relativa al reposo, en unidades de intensidad, en t (0-1) de la duración."""
+    t: float
+    yaw: float = 0.0
+    pitch: float = 0.0
+    roll: float = 0.0
+
+
+GESTURES: Dict[str, Tuple[Keyframe, ...]] = {
+    'nod_yes': (Keyframe(0.0), Keyframe(0.2, pitch=1.0), Keyframe(0.4, pitch=-0.3),
+                Keyframe(0.6, pitch=0.8), Keyframe(0.8, pitch=-0.1), Keyframe(1.0)),
+    'shake_no': (Keyframe(0.0), Keyframe(0.15, yaw=1.0), Keyframe(0.4, yaw=-1.0),
+                 Keyframe(0.65, yaw=0.7), Keyframe(0.85, yaw=-0.4), Keyframe(1.0)),
+    'tilt_head': (Keyframe(0.0), Keyframe(0.3, roll=1.0), Keyframe(0.7, roll=1.0), Keyframe(1.0)),
+    'look_around': (Keyframe(0.0), Keyframe(0.25, yaw=1.0, pitch=0.4), Keyframe(0.5, yaw=0.0, pitch=0.5),
+                    Keyframe(0.75, yaw=-1.0, pitch=0.4), Keyframe(1.0)),
+}
+
+
+@dataclass
+class GestureTrajectory:
+    """Un gesto muestreado: desplazamiento de cada motor en cada punto."""
+    name: str
+    intensity: float
+    duration_ms: int
+    period_ms: int
+    offsets: np.ndarray  # (puntos, motores) en grados, redondeados a ANGLE_RESOLUTION
+
+    @property
+    def points(self) -> int:
+        return len(self.offsets)
+
+
+def validate_keyframes(keyframes: Sequence[Keyframe]):
+    """Los fotogramas van de t=0 a t=1 en orden y empiezan y terminan en reposo."""
+    if len(keyframes) < 2:
+        raise ValueError("Un gesto necesita al menos dos fotogramas")
+    times = [k.t for k in keyframes]
+    if times[0] != 0.0 or times[-1] != 1.0 or any(b <= a for a, b in zip(times, times[1:])):
+        raise ValueError(f"Los tiempos deben crecer de 0 a 1: {times}")
+    for k in (keyframes[0], keyframes[-1]):
+        if (k.yaw, k.pitch, k.roll) != (0.0, 0.0, 0.0):
+            raise ValueError(f"El gesto debe empezar y terminar en reposo: {k}")
+
+
+def sample_orientations(keyframes: Sequence[Keyframe], t: np.ndarray) -> np.ndarray:
+    """
+    Orientaciones en t (fracciones de la duración), con smoothstep entre
+    fotogramas: velocidad 0 en cada fotograma, sin saltos de aceleración
+    bruscos para los servos.
+    """
+    times = np.array([k.t for k in keyframes])
+    poses = np.array([[k.yaw, k.pitch, k.roll] for k in keyframes])
+    seg = np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 2)
+    u = np.clip((t - times[seg]) / (times[seg + 1] - times[seg]), 0.0, 1.0)
+    s = u * u * (3 - 2 * u)
+    return poses[seg] + (poses[seg + 1] - poses[seg]) * s[:, None]
+
+
+def gesture_period(duration_ms: int, max_points: int = GESTURE_MAX_POINTS) -> int:
+    """Periodo más corto, múltiplo de LOOP_INTERVAL_MS, con el que la duración cabe en max_points."""
+    steps = math.ceil(duration_ms / (max_points - 1) / LOOP_INTERVAL_MS)
+    return max(1, steps) * LOOP_INTERVAL_MS
+
+
+def compile_gesture(name: str, keyframes: Sequence[Keyframe], intensity: float, duration_ms: int,
+                    kinematics: NeckKinematics, max_points: int = GESTURE_MAX_POINTS) -> GestureTrajectory:
+    """
+    Muestrea un gesto a ángulos de motor relativos al reposo.
+
+    Raises:
+        ValueError: Si alguna orientación queda fuera del espacio de trabajo
+    """
+    period = gesture_period(duration_ms, max_points)
+    count = math.ceil(duration_ms / period) + 1
+    t = np.minimum(np.arange(count) * period / duration_ms, 1.0)
+    orientations = sample_orientations(keyframes, t) * intensity
+    motors = kinematics.inverse(orientations)
+    if np.isnan(motors).any():
+        bad = orientations[np.isnan(motors).any(axis=1)][0]
+        raise ValueError(f"{name} con intensidad {intensity} sale del espacio de trabajo: {bad.round(1).tolist()}")
+    rest = kinematics.inverse(np.zeros(3))
+    # Camino más corto, como NeckMovements.look_at
+    offsets = (motors - rest + 180.0) % 360.0 - 180.0
+    offsets = np.round(offsets / ANGLE_RESOLUTION) * ANGLE_RESOLUTION
+    return GestureTrajectory(name, float(intensity), int(duration_ms), period, offsets)
+
+
+GestureKey = Tuple[str, float, int]
+
+
+class GestureLibrary:
+    """
+    Gestos compilados en caché y cargados bajo demanda en el firmware.
+
+    Args:
+        controller: ESP32NeckController conectado
+        kinematics: Cinemática del cuello (por defecto la de controller.config)
+        slots: Huecos de la tabla (por defecto communication.gesture_slots)
+        max_points: Puntos por gesto (por defecto communication.gesture_max_points)
+        gestures: Definiciones disponibles (por defecto GESTURES)
+
+    Con la tabla llena se reemplaza el gesto usado hace más tiempo.
+    """
+
+    def __init__(self, controller, kinematics: Optional[NeckKinematics] = None,
+                 slots: Optional[int] = None, max_points: Optional[int] = None,
+                 gestures: Optional[Dict[str, Sequence[Keyframe]]] = None):
+        self.controller = controller
+        self.kinematics = kinematics or NeckKinematics.from_config(controller.config)
+        if self.kinematics.num_legs != controller.num_servos:
+            raise ValueError(f"La cinemática tiene {self.kinematics.num_legs} motores y el "
+                             f"controlador {controller.num_servos} servos")
+        self.slots = slots or controller.config.communication.gesture_slots
+        self.max_points = max_points or controller.config.communication.gesture_max_points
+        self.gestures: Dict[str, Tuple[Keyframe, ...]] = {}
+        self._cache: Dict[GestureKey, GestureTrajectory] = {}
+        self._loaded: "OrderedDict[GestureKey, int]" = OrderedDict()  # Más reciente al final
+        for name, keyframes in (gestures or GESTURES).items():
+            self.define(name, keyframes)
+
+    def define(self, name: str, keyframes: Sequence[Keyframe]):
+        """Añade o redefine un gesto (olvida lo compilado con la definición anterior)."""
+        validate_keyframes(keyframes)
+        self.gestures[name] = tuple(keyframes)
+        self._cache = {k: v for k, v in self._cache.items() if k[0] != name}
+        self._loaded = OrderedDict((k, s) for k, s in self._loaded.items() if k[0] != name)
+
+    def trajectory(self, name: str, intensity: float = 30, duration_ms: int = 1200) -> GestureTrajectory:
+        """El gesto muestreado, de la caché si ya se compiló con esos parámetros."""
+        if name not in self.gestures:
+            raise KeyError(f"Gesto desconocido: {name} (hay {', '.join(self.gestures)})")
+        key = (name, round(float(intensity), 3), int(duration_ms))
+        trajectory = self._cache.get(key)
+        if trajectory is None:
+            trajectory = compile_gesture(name, self.gestures[name], key[1], key[2], self.kinematics,
+                                         self.max_points)
+            self._cache[key] = trajectory
+        return trajectory
+
+    def upload(self, name: str, intensity: float = 30, duration_ms: int = 1200,
+               timeout: float = 5.0) -> Optional[int]:
+        """
+        Carga el gesto en el firmware si no lo está ya.
+
+        Returns:
+            int: Hueco de la tabla, o None si la carga falló
+        """
+        trajectory = self.trajectory(name, intensity, duration_ms)
+        key = (trajectory.name, trajectory.intensity, trajectory.duration_ms)
+        if key in self._loaded:
+            self._loaded.move_to_end(key)
+            return self._loaded[key]
+        used = set(self._loaded.values())
+        free = [s for s in range(self.slots) if s not in used]
+        if free:
+            slot = free[0]
+        else:
+            _, slot = self._loaded.popitem(last=False)
+        future = self.controller.upload_gesture(slot, trajectory.period_ms, trajectory.offsets.tolist())
+        if future is None:
+            return None
+        try:
+            future.result(timeout=timeout)
+        except Exception as e:
+            print(f"❌ No se pudo cargar {name} en el hueco {slot}: {e}")
+            return None
+        self._loaded[key] = slot
+        return slot
+
+    def play(self, name: str, intensity: float = 30, duration_ms: int = 1200) -> Optional[Future]:
+        """
+        Reproduce un gesto (cargándolo antes si hace falta).
+
+        Returns:
+            Future que se resuelve al terminar, o None si no se pudo enviar
+        """
+        slot = self.upload(name, intensity, duration_ms)
+        if slot is None:
+            return None
+        return self.controller.play_gesture(slot)
+
+    def invalidate(self):
+        """Olvida qué hay cargado en el firmware (p. ej. tras reiniciarlo)."""
+        self._loaded.clear()
+
+    def sync(self, timeout: float = 2.0) -> bool:
+        """
+        Pregunta al firmware (I) qué huecos siguen cargados y olvida los demás.
+
+        Returns:
+            bool: False si no respondió
+        """
+        try:
+            info = self.controller.get_system_info().result(timeout=timeout)
+            mask = int(info['gestures'])
+        except Exception as e:
+            print(f"❌ No se pudo consultar la tabla de gestos: {e}")
+            return False
+        self._loaded = OrderedDict((k, s) for k, s in self._loaded.items() if mask >> s & 1)
+        return True
+
+    def __repr__(self) -> str:
+        return (f"<GestureLibrary gestures={len(self.gestures)} compiled={len(self._cache)} "
+                f"loaded={len(self._loaded)}/{self.slots}>")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compila los gestos y muestra su tamaño")
+    parser.add_argument("--intensity", type=float, default=30, help="Intensidad en grados (default: 30)")
+    parser.add_argument("--duration", type=int, default=1200, help="Duración en ms (default: 1200)")
+    args = parser.parse_args()
+
+    kinematics = NeckKinematics.from_file()
+    for name, keyframes in GESTURES.items():
+        start = time.perf_counter()
+        try:
+            trajectory = compile_gesture(name, keyframes, args.intensity, args.duration, kinematics)
+        except ValueError as e:
+            print(f"❌ {e}")
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        upload = sum(len(f"W 0 {k} " + " ".join(f"{a:.1f}" for a in row)) + 1
+                     for k, row in enumerate(trajectory.offsets))
+        peak = np.abs(trajectory.offsets).max()
+        print(f"🎭 {name}: {trajectory.points} puntos cada {trajectory.period_ms} ms, "
+              f"máx {peak:.1f}°, {upload} bytes de carga, compilado en {elapsed:.2f} ms; "
+              f"G ocupa 4 bytes")
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Tabla precalculada de cinemática inversa para seguimiento en tiempo real.
+
+En tiempo de build se muestrea el espacio de trabajo (yaw, pitch, roll) en
+una rejilla regular y se guarda como .npy (float32) junto a un .json con los
+rangos, el paso, la huella de la geometría y la cota de error medida contra
+el solver exacto. En ejecución el .npy se abre con mmap, las consultas usan
+interpolación trilineal vectorizada y las consultas sueltas repetidas pasan
+por una caché LRU.
+
+    python neck_ik_table.py build          # Genera neck_ik_table.npy/.json
+    python neck_ik_table.py bench          # Compara con NeckKinematics.inverse
+
+    table = IKTable.load()
+    motors = table.query(orientations)     # (..., 3) → (..., 3)
+    motors = table.solve(yaw, pitch, roll) # Tupla, con caché
+"""
+import dataclasses
+import hashlib
+import json
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import neck_config
+from neck_kinematics import NeckKinematics
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_TABLE = WORKDIR / 'neck_ik_table.npy'
+
+CACHE_SIZE = 4096
+CACHE_RESOLUTION = 0.01  # Grados: las consultas se redondean a esta resolución para la caché
+
+
+def geometry_fingerprint(kinematics: NeckKinematics) -> str:
+    """Huella de la geometría para detectar tablas generadas con otra configuración."""
+    h = hashlib.sha256()
+    for array in (kinematics.u, kinematics.v0, kinematics.motor_signs):
+        h.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    h.update(np.array([kinematics.alpha1, kinematics.alpha2, kinematics.branch], dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _axis(lo: float, hi: float, step: float) -> np.ndarray:
+    count = int(round((hi - lo) / step)) + 1
+    return lo + step * np.arange(count)
+
+
+def build_table(kinematics: NeckKinematics, workspace: Dict) -> Tuple[np.ndarray, Dict]:
+    """
+    Muestrea la IK exacta en una rejilla y mide el error de interpolación.
+
+    Returns:
+        (grid, meta): grid con forma (Ny, Np, Nr, motores) en float32
+    """
+    step = float(workspace['step_deg'])
+    axes = [_axis(*workspace[name], step) for name in ('yaw', 'pitch', 'roll')]
+    mesh = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+    grid = kinematics.inverse(mesh).astype(np.float32)
+
+    meta = {
+        'origin': [float(a[0]) for a in axes],
+        'step_deg': step,
+        'shape': list(grid.shape),
+        'fingerprint': geometry_fingerprint(kinematics),
+    }
+    table = IKTable(grid, meta)
+
+    # El peor caso de la trilineal está en los centros de celda; añadir puntos aleatorios
+    centers = np.stack(np.meshgrid(*[a[:-1] + step / 2 for a in axes], indexing='ij'), axis=-1).reshape(-1, 3)
+    rng = np.random.default_rng(0)
+    lo, hi = [a[0] for a in axes], [a[-1] for a in axes]
+    samples = np.concatenate([centers, rng.uniform(lo, hi, size=(20000, 3))])
+    error = np.abs(table.query(samples) - kinematics.inverse(samples))
+    meta['max_error_deg'] = float(np.nanmax(error)) if np.isfinite(error).any() else None
+    meta['unreachable_cells'] = int(np.isnan(grid).any(axis=-1).sum())
+    return grid, meta
+
+
+class IKTable:
+    """
+    Tabla de IK con interpolación trilineal.
+
+    Args:
+        grid: Array (Ny, Np, Nr, motores), normalmente un np.memmap
+        meta: Metadatos generados por build_table
+    """
+
+    def __init__(self, grid: np.ndarray, meta: Dict):
+        self.grid = grid
+        self.meta = meta
+        self.origin = np.asarray(meta['origin'], dtype=float)
+        self.step = float(meta['step_deg'])
+        self.shape = np.asarray(grid.shape[:3])
+        self.max_error_deg = meta.get('max_error_deg')
+        self._origin = tuple(self.origin.tolist())
+        self._last = tuple(int(n) - 2 for n in grid.shape[:3])
+        self._flat = grid.reshape(-1, grid.shape[-1])
+        ny, nr = grid.shape[1], grid.shape[2]
+        self._strides = np.array([ny * nr, nr, 1])
+        self._corners = np.array([a * ny * nr + b * nr + c for a in (0, 1) for b in (0, 1) for c in (0, 1)])
+        self._cached = lru_cache(maxsize=CACHE_SIZE)(self._solve_quantized)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, kinematics: Optional[NeckKinematics] = None) -> "IKTable":
+        """
+        Abre una tabla con mmap.
+
+        Args:
+            path: Ruta al .npy (el .json va al lado)
+            kinematics: Si se da, se comprueba que la tabla sea de esa geometría
+
+        Raises:
+            FileNotFoundError: Si la tabla no existe
+            ValueError: Si la tabla es de otra geometría
+        """
+        path = Path(path) if path else DEFAULT_TABLE
+        meta_path = path.with_suffix('.json')
+        if not path.exists() or not meta_path.exists():
+            raise FileNotFoundError(f"❌ Tabla de IK no encontrada: {path} (python neck_ik_table.py build)")
+        meta = json.loads(meta_path.read_text())
+        if kinematics is not None and meta['fingerprint'] != geometry_fingerprint(kinematics):
+            raise ValueError(f"❌ La tabla {path} es de otra geometría; regenérala")
+        return cls(np.load(path, mmap_mode='r'), meta)
+
+    def save(self, path: Optional[str] = None):
+        path = Path(path) if path else DEFAULT_TABLE
+        np.save(path, np.ascontiguousarray(self.grid))
+        path.with_suffix('.json').write_text(json.dumps(self.meta, indent=2))
+
+    def query(self, orientations) -> np.ndarray:
+        """
+        Ángulos de motor interpolados para una o muchas orientaciones.
+
+        Args:
+            orientations: (yaw, pitch, roll) en grados, forma (..., 3)
+
+        Returns:
+            np.ndarray: (..., motores); NaN fuera de la rejilla
+        """
+        o = np.asarray(orientations, dtype=float)
+        index = (o - self.origin) / self.step
+        inside = np.all((index >= 0) & (index <= self.shape - 1), axis=-1)
+        base = np.clip(index.astype(np.intp), 0, self.shape - 2)
+        frac = index - base
+        fx, fy, fz = frac[..., 0, None, None], frac[..., 1, None, None], frac[..., 2, None]
+        # Las 8 esquinas de cada celda en una sola indexación sobre la tabla aplanada: (..., 8, motores)
+        c = self._flat[(base @ self._strides)[..., None] + self._corners]
+        c = c[..., :4, :] * (1 - fx) + c[..., 4:, :] * fx
+        c = c[..., :2, :] * (1 - fy) + c[..., 2:, :] * fy
+        result = c[..., 0, :] * (1 - fz) + c[..., 1, :] * fz
+        return np.where(inside[..., None], result, np.nan)
+
+    def _interpolate(self, yaw: float, pitch: float, roll: float) -> Tuple[float, ...]:
+        """Trilineal de un solo punto en Python puro: evita el coste fijo de NumPy."""
+        oy, op, orr = self._origin
+        fi, fj, fk = (yaw - oy) / self.step, (pitch - op) / self.step, (roll - orr) / self.step
+        ni, nj, nk = self._last
+        if not (0 <= fi <= ni + 1 and 0 <= fj <= nj + 1 and 0 <= fk <= nk + 1):
+            return (float('nan'),) * self.grid.shape[-1]
+        i, j, k = min(int(fi), ni), min(int(fj), nj), min(int(fk), nk)
+        fx, fy, fz = fi - i, fj - j, fk - k
+        (c000, c001), (c010, c011) = self.grid[i, j:j + 2, k:k + 2].tolist()
+        (c100, c101), (c110, c111) = self.grid[i + 1, j:j + 2, k:k + 2].tolist()
+        result = []
+        for m in range(len(c000)):
+            c00 = c000[m] + (c100[m] - c000[m]) * fx
+            c01 = c001[m] + (c101[m] - c001[m]) * fx
+            c10 = c010[m] + (c110[m] - c010[m]) * fx
+            c11 = c011[m] + (c111[m] - c011[m]) * fx
+            c0 = c00 + (c10 - c00) * fy
+            c1 = c01 + (c11 - c01) * fy
+            result.append(c0 + (c1 - c0) * fz)
+        return tuple(result)
+
+    def _solve_quantized(self, key: Tuple[int, int, int]) -> Tuple[float, ...]:
+        return self._interpolate(*(v * CACHE_RESOLUTION for v in key))
+
+    def solve(self, yaw: float, pitch: float, roll: float) -> Tuple[float, ...]:
+        """Consulta suelta con caché LRU (redondeada a CACHE_RESOLUTION grados)."""
+        key = (round(yaw / CACHE_RESOLUTION), round(pitch / CACHE_RESOLUTION), round(roll / CACHE_RESOLUTION))
+        return self._cached(key)
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+def _load_workspace(config_file: Optional[str]) -> Tuple[NeckKinematics, Dict]:
+    config = neck_config.load_config(config_file)
+    workspace = dataclasses.asdict(config.kinematics.workspace)
+    return NeckKinematics.from_config(config), workspace
+
+
+def benchmark(table: IKTable, kinematics: NeckKinematics, samples: int = 20000) -> Dict[str, float]:
+    """Tiempos de la tabla frente al solver exacto, en lotes y consulta a consulta."""
+    rng = np.random.default_rng(1)
+    lo = table.origin
+    hi = table.origin + (table.shape - 1) * table.step
+    batch = rng.uniform(lo, hi, size=(samples, 3))
+
+    def timed(fn, *args) -> float:
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    exact_batch = timed(kinematics.inverse, batch)
+    table_batch = timed(table.query, batch)
+
+    singles = batch[:2000]
+    exact_single = timed(lambda: [kinematics.inverse(o) for o in singles])
+    table_single = timed(lambda: [table.solve(*o) for o in singles])
+    # Objetivos repetidos, como al seguir una cara casi quieta
+    repeated = np.repeat(singles[:20], 100, axis=0)
+    table_cached = timed(lambda: [table.solve(*o) for o in repeated])
+
+    error = np.nanmax(np.abs(table.query(batch) - kinematics.inverse(batch)))
+    return {
+        'batch_samples': samples,
+        'exact_batch_ms': round(exact_batch * 1000, 3),
+        'table_batch_ms': round(table_batch * 1000, 3),
+        'batch_speedup': round(exact_batch / table_batch, 2),
+        'exact_single_us': round(exact_single / len(singles) * 1e6, 2),
+        'table_single_us': round(table_single / len(singles) * 1e6, 2),
+        'table_cached_us': round(table_cached / len(repeated) * 1e6, 2),
+        'cached_speedup': round((exact_single / len(singles)) / (table_cached / len(repeated)), 2),
+        'max_error_deg': float(error),
+        'error_bound_deg': table.max_error_deg,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tabla precalculada de IK del cuello")
+    parser.add_argument("command", choices=["build", "bench"], help="Comando a ejecutar")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Ruta del .npy (por defecto: neck_ik_table.npy)")
+    args = parser.parse_args()
+
+    kinematics, workspace = _load_workspace(args.config)
+    if args.command == "build":
+        start = time.perf_counter()
+        grid, meta = build_table(kinematics, workspace)
+        IKTable(grid, meta).save(args.output)
+        print(f"✅ Tabla de IK generada en {time.perf_counter() - start:.2f} s: {args.output or DEFAULT_TABLE}")
+        print(f"📦 Rejilla {meta['shape']} ({grid.nbytes / 1024:.1f} KB)")
+        print(f"📐 Error máximo frente a la IK exacta: {meta['max_error_deg']:.4f}°")
+        if meta['unreachable_cells']:
+            print(f"⚠️  {meta['unreachable_cells']} celdas fuera del espacio de trabajo")
+    else:
+        table = IKTable.load(args.output, kinematics)
+        print(json.dumps(benchmark(table, kinematics), indent=2))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Cinemática de la articulación esférica paralela (3-RRR coaxial) del cuello.
+
+Geometría (todas las articulaciones apuntan al centro de rotación):
+- u_i: eje del motor i, inclinado beta respecto a -z, con acimut eta_i
+- w_i: eje intermedio, a alpha1 de u_i; gira alrededor de u_i con el motor
+- v_i: eje de la plataforma, a gamma de +z en reposo; gira con la cabeza
+- Restricción de cada pata: w_i · v_i = cos(alpha2)
+
+Para cada orientación (yaw, pitch, roll; convención ZYX) la IK de cada pata
+es A cos θ + B sin θ = C, con solución cerrada. Los ángulos de motor se dan
+relativos a la postura de reposo (orientación 0, 0, 0), que es donde el
+firmware tiene sus posiciones a 0° tras un reset.
+
+Todo está vectorizado con NumPy: una trayectoria de N orientaciones con forma
+(N, 3) se convierte en una sola llamada.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+import neck_config
+from neck_config import NeckConfig
+
+
+def rotation_matrices(orientations: np.ndarray) -> np.ndarray:
+    """
+    Matrices de rotación ZYX (yaw, pitch, roll en grados).
+
+    Args:
+        orientations: Array (..., 3)
+
+    Returns:
+        np.ndarray: Array (..., 3, 3)
+    """
+    yaw, pitch, roll = np.moveaxis(np.radians(orientations), -1, 0)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cr, sr = np.cos(roll), np.sin(roll)
+    rows = [
+        [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+        [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+        [-sp, cp * sr, cp * cr],
+    ]
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+
+def _wrap_degrees(angles: np.ndarray) -> np.ndarray:
+    return (angles + 180.0) % 360.0 - 180.0
+
+
+class NeckKinematics:
+    """
+    Cinemática directa e inversa vectorizada.
+
+    Args:
+        alpha1_deg: Arco del eslabón proximal (motor → eje intermedio)
+        alpha2_deg: Arco del eslabón distal (eje intermedio → plataforma)
+        beta_deg: Inclinación de los ejes de motor respecto a -z
+        gamma_deg: Inclinación de los ejes de la plataforma respecto a +z
+        leg_azimuths_deg: Acimut de cada pata (una por servo, en orden)
+        branch: Modo de trabajo de la IK (+1 o -1)
+        motor_signs: Sentido de giro de cada servo respecto al modelo
+    """
+
+    def __init__(self, alpha1_deg: float = 90.0, alpha2_deg: float = 90.0,
+                 beta_deg: float = 54.7356, gamma_deg: float = 54.7356,
+                 leg_azimuths_deg: Sequence[float] = (0.0, 120.0, 240.0),
+                 branch: int = 1, motor_signs: Sequence[int] = (1, 1, 1)):
+        if branch not in (1, -1):
+            raise ValueError(f"branch debe ser 1 o -1, no {branch}")
+        if len(motor_signs) != len(leg_azimuths_deg):
+            raise ValueError("motor_signs y leg_azimuths_deg deben tener la misma longitud")
+
+        self.alpha1 = np.radians(alpha1_deg)
+        self.alpha2 = np.radians(alpha2_deg)
+        self.branch = branch
+        self.motor_signs = np.asarray(motor_signs, dtype=float)
+        self.num_legs = len(leg_azimuths_deg)
+
+        eta = np.radians(np.asarray(leg_azimuths_deg, dtype=float))
+        beta, gamma = np.radians(beta_deg), np.radians(gamma_deg)
+        self.u = np.stack([np.sin(beta) * np.cos(eta), np.sin(beta) * np.sin(eta),
+                           -np.cos(beta) * np.ones_like(eta)], axis=-1)
+        self.v0 = np.stack([np.sin(gamma) * np.cos(eta), np.sin(gamma) * np.sin(eta),
+                            np.cos(gamma) * np.ones_like(eta)], axis=-1)
+        # Base ortonormal perpendicular a cada u_i para medir θ
+        e1 = np.cross(self.u, [0.0, 0.0, 1.0])
+        self.e1 = e1 / np.linalg.norm(e1, axis=-1, keepdims=True)
+        self.e2 = np.cross(self.u, self.e1)
+
+        self._home = np.zeros(self.num_legs)
+        home = self._leg_angles(np.zeros(3))
+        if np.isnan(home).any():
+            raise ValueError("La geometría no se puede montar en la postura de reposo")
+        self._home = home
+
+    @classmethod
+    def from_config(cls, config: NeckConfig) -> "NeckKinematics":
+        """Crea la cinemática a partir de la sección 'kinematics' de la configuración."""
+        k = config.kinematics
+        return cls(k.alpha1_deg, k.alpha2_deg, k.beta_deg, k.gamma_deg, k.leg_azimuths_deg,
+                   k.branch, k.motor_signs)
+
+    @classmethod
+    def from_file(cls, config_file: Optional[str] = None) -> "NeckKinematics":
+        return cls.from_config(neck_config.load_config(config_file))
+
+    def _leg_angles(self, orientations: np.ndarray) -> np.ndarray:
+        """θ absoluto de cada pata en radianes, NaN si la pose no es alcanzable."""
+        v = np.einsum('...ij,kj->...ki', rotation_matrices(orientations), self.v0)
+        a = np.sin(self.alpha1) * np.einsum('kj,...kj->...k', self.e1, v)
+        b = np.sin(self.alpha1) * np.einsum('kj,...kj->...k', self.e2, v)
+        c = np.cos(self.alpha2) - np.cos(self.alpha1) * np.einsum('kj,...kj->...k', self.u, v)
+        r = np.hypot(a, b)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = c / r
+        ratio = np.where(np.abs(ratio) <= 1.0 + 1e-12, np.clip(ratio, -1.0, 1.0), np.nan)
+        return np.arctan2(b, a) + self.branch * np.arccos(ratio) - self._home
+
+    def inverse(self, orientations) -> np.ndarray:
+        """
+        Ángulos de motor para una o muchas orientaciones.
+
+        Args:
+            orientations: (yaw, pitch, roll) en grados, forma (..., 3)
+
+        Returns:
+            np.ndarray: Ángulos de motor en grados relativos al reposo, forma
+            (..., num_legs); NaN en las poses fuera del espacio de trabajo
+        """
+        theta = self._leg_angles(np.asarray(orientations, dtype=float))
+        return _wrap_degrees(np.degrees(theta)) * self.motor_signs
+
+    def forward(self, motor_angles, initial=None, tol: float = 1e-9,
+                max_iter: int = 30) -> np.ndarray:
+        """
+        Orientación para unos ángulos de motor (Newton vectorizado sobre la IK).
+
+        Args:
+            motor_angles: Ángulos de motor en grados, forma (..., num_legs)
+            initial: Orientación inicial (..., 3); por defecto el reposo
+            tol: Tolerancia en grados
+            max_iter: Iteraciones máximas
+
+        Returns:
+            np.ndarray: (yaw, pitch, roll) en grados, forma (..., 3); NaN
+            donde no converge
+
+        Raises:
+            ValueError: Si el cuello no tiene exactamente 3 patas (el
+                Jacobiano de Newton tiene que ser cuadrado)
+        """
+        if self.num_legs != 3:
+            raise ValueError(f"forward() necesita 3 patas (una por grado de libertad), no {self.num_legs}")
+        target = np.asarray(motor_angles, dtype=float)
+        shape = target.shape[:-1]
+        target = target.reshape(-1, self.num_legs)
+        q = np.zeros((target.shape[0], 3)) if initial is None else \
+            np.broadcast_to(np.asarray(initial, dtype=float), shape + (3,)).reshape(-1, 3).copy()
+
+        step = 1e-4
+        offsets = np.eye(3) * step
+        converged = np.zeros(target.shape[0], dtype=bool)
+        for _ in range(max_iter):
+            residual = _wrap_degrees(self.inverse(q) - target)
+            converged = np.abs(residual).max(axis=-1) < tol
+            if converged.all():
+                break
+            # Jacobiano numérico por diferencias centrales: (N, legs, 3)
+            plus = self.inverse(q[:, None, :] + offsets)
+            minus = self.inverse(q[:, None, :] - offsets)
+            jacobian = np.swapaxes(_wrap_degrees(plus - minus) / (2 * step), -1, -2)
+            with np.errstate(invalid='ignore'):
+                try:
+                    delta = np.linalg.solve(jacobian, residual[..., None])[..., 0]
+                except np.linalg.LinAlgError:
+                    delta = (np.linalg.pinv(jacobian) @ residual[..., None])[..., 0]
+            q = np.where(converged[:, None], q, q - delta)
+
+        q[~converged] = np.nan
+        return q.reshape(shape + (3,))
@@ -0,0 +1,245 @@
+"""
+Métricas del camino de control de ESP32NeckController.
+
+NeckMetrics acumula contadores, gauges e histogramas de latencia con
+etiquetas, y los exporta a uno o varios sinks:
+
+- MemorySink: guarda la última instantánea en memoria
+- JsonLinesSink: añade una línea JSON por exportación
+- PrometheusSink: reescribe un fichero en formato de texto de Prometheus
+  (para el textfile collector de node_exporter)
+
+Uso:
+
+    metrics = NeckMetrics([PrometheusSink("/var/lib/node_exporter/neck.prom")])
+    controller = ESP32NeckController("/dev/esp32", metrics=metrics)
+    metrics.start_exporter(interval=10)
+
+Si el controlador no recibe metrics, el coste es una comparación con None
+por comando.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Límites de los buckets en segundos (100 µs a 10 s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, str]) -> _Key:
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(key: _Key) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # El último es +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class NeckMetrics:
+    """
+    Registro de métricas thread-safe.
+
+    Args:
+        sinks: Destinos a los que export() envía cada instantánea
+        buckets: Límites de los histogramas en segundos
+    """
+
+    def __init__(self, sinks: Optional[List["MetricsSink"]] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.sinks = list(sinks) if sinks else []
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+        self._exporter: Optional[threading.Thread] = None
+        self._stop_exporter = threading.Event()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """Incrementa un contador."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """Fija el valor de un gauge."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def max_gauge(self, name: str, value: float, **labels: str):
+        """Guarda el máximo visto de un gauge (p.ej. profundidad de cola)."""
+        key = _key(name, labels)
+        with self._lock:
+            if value > self._gauges.get(key, float("-inf")):
+                self._gauges[key] = value
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        """Añade una muestra de latencia a un histograma."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self) -> dict:
+        """Copia consistente de todas las métricas."""
+        with self._lock:
+            return {
+                'timestamp': time.time(),
+                'counters': {_format_key(k): v for k, v in self._counters.items()},
+                'gauges': {_format_key(k): v for k, v in self._gauges.items()},
+                'histograms': {_format_key(k): h.snapshot() for k, h in self._histograms.items()},
+                '_raw': {
+                    'counters': dict(self._counters),
+                    'gauges': dict(self._gauges),
+                    'histograms': {k: h.snapshot() for k, h in self._histograms.items()},
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def export(self):
+        """Envía una instantánea a todos los sinks."""
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink.write(snapshot)
+            except OSError as e:
+                print(f"❌ Error exportando métricas a {sink}: {e}")
+
+    def start_exporter(self, interval: float = 10.0):
+        """Exporta periódicamente en un hilo de fondo."""
+        if self._exporter:
+            return
+        self._stop_exporter.clear()
+
+        def run():
+            while not self._stop_exporter.wait(interval):
+                self.export()
+
+        self._exporter = threading.Thread(target=run, name="neck-metrics", daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self):
+        """Detiene el hilo de exportación y hace una última exportación."""
+        if self._exporter:
+            self._stop_exporter.set()
+            self._exporter.join()
+            self._exporter = None
+            self.export()
+
+
+class MetricsSink:
+    """Destino de instantáneas de NeckMetrics."""
+
+    def write(self, snapshot: dict):
+        raise NotImplementedError
+
+
+class MemorySink(MetricsSink):
+    """Guarda la última instantánea (útil en tests y dashboards en proceso)."""
+
+    def __init__(self):
+        self.last: Optional[dict] = None
+
+    def write(self, snapshot: dict):
+        self.last = snapshot
+
+
+class JsonLinesSink(MetricsSink):
+    """Añade cada instantánea como una línea JSON."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def write(self, snapshot: dict):
+        public = {k: v for k, v in snapshot.items() if not k.startswith('_')}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(public) + "\n")
+
+    def __repr__(self) -> str:
+        return f"<JsonLinesSink path='{self.path}'>"
+
+
+class PrometheusSink(MetricsSink):
+    """Reescribe un fichero en formato de texto de Prometheus de forma atómica."""
+
+    def __init__(self, path: str, prefix: str = "neck_"):
+        self.path = Path(path)
+        self.prefix = prefix
+
+    def _name(self, name: str) -> str:
+        return self.prefix + name
+
+    def render(self, snapshot: dict) -> str:
+        raw = snapshot['_raw']
+        lines = []
+        seen_types = set()
+
+        def declare(name: str, kind: str):
+            if name not in seen_types:
+                lines.append(f"# TYPE {name} {kind}")
+                seen_types.add(name)
+
+        for (name, labels), value in sorted(raw['counters'].items()):
+            full = self._name(name)
+            declare(full, "counter")
+            lines.append(f"{_format_key((full, labels))} {value}")
+        for (name, labels), value in sorted(raw['gauges'].items()):
+            full = self._name(name)
+            declare(full, "gauge")
+            lines.append(f"{_format_key((full, labels))} {value}")
+        for (name, labels), histogram in sorted(raw['histograms'].items()):
+            full = self._name(name)
+            declare(full, "histogram")
+            for bound, count in histogram['buckets'].items():
+                bucket_labels = tuple(sorted(labels + (("le", bound),)))
+                lines.append(f"{_format_key((full + '_bucket', bucket_labels))} {count}")
+            lines.append(f"{_format_key((full + '_sum', labels))} {histogram['sum']}")
+            lines.append(f"{_format_key((full + '_count', labels))} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, snapshot: dict):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(self.render(snapshot))
+        os.replace(tmp, self.path)
+
+    def __repr__(self) -> str:
+        return f"<PrometheusSink path='{self.path}'>"
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Compila el núcleo del firmware (neck_core.h) con g++ en el PC.
+
+neck_core.h es la parte del firmware que no toca hardware: parser de
+comandos, tablas de calibración, startMove/updateMoves y el buffer de
+setpoints. Se renderiza con las mismas constantes que el sketch y se
+compila contra native_stubs.h (Servo, Serial, millis y delay de mentira)
+junto a native_harness.cpp, que tiene dos modos:
+
+- script: ejecuta comandos y devuelve la salida del firmware. check la
+  compara con la de neck_emulator.py para cazar divergencias entre ambos
+- bench: carga el puerto serie y mide la duración de cada vuelta del loop
+  y el retraso con el que se para cada servo
+
+    python neck_native.py check
+    python neck_native.py bench -o base.json
+    python neck_native.py bench --compare base.json   # sale con 1 si algo empeoró
+
+El binario se guarda en .native_build/ con el hash de lo que lo generó,
+así que sólo se recompila si cambian las fuentes, la configuración o g++.
+"""
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import ino_generator
+import neck_emulator
+import neck_protocol
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+DEFAULT_BUILD_DIR = WORKDIR / '.native_build'
+STUBS = WORKDIR / 'native_stubs.h'
+HARNESS = WORKDIR / 'native_harness.cpp'
+CXXFLAGS = ['-O2', '-std=c++17', '-Wall', '-Wextra']
+# (carga, comandos/s) del banco; 0 = todo lo que quepa en el cable
+BENCH_CASES = [('moves', 5), ('stream', 50), ('mixed', 0)]
+# Cambios menores que esto no cuentan al comparar, por muy grandes que sean en %
+_MIN_DELTA = {'loop_us': 1000.0, 'cpu_us': 20.0, 'stop_late_ms': 0.1, 'rx_backlog_max': 64,
+              'bytes_out': 256, 'tx_wait_us': 1000}
+
+
+class NativeCore:
+    """
+    Núcleo del firmware compilado para el PC.
+
+    Args:
+        config_file: YAML de configuración (por defecto neck_config.yaml)
+        build_dir: Dónde dejar las fuentes renderizadas y el binario
+        cxx: Compilador (por defecto $CXX o g++)
+    """
+
+    def __init__(self, config_file: Optional[str] = None, build_dir: Optional[str] = None,
+                 cxx: Optional[str] = None):
+        self.config_file = Path(config_file) if config_file else DEFAULT_CONFIG
+        self.config = ino_generator.load_config(self.config_file)
+        self.constants = neck_emulator.emulated_constants(self.config)
+        self.build_dir = Path(build_dir) if build_dir else DEFAULT_BUILD_DIR
+        self.cxx = cxx or os.environ.get('CXX', 'g++')
+        self.binary: Optional[Path] = None
+
+    def _sources(self) -> Dict[str, str]:
+        return {
+            'neck_core.h': ino_generator.render_core(self.constants, self.constants['BUILD_HASH']),
+            'native_stubs.h': STUBS.read_text(),
+            'native_harness.cpp': HARNESS.read_text(),
+        }
+
+    def _compiler_version(self) -> Optional[str]:
+        try:
+            result = subprocess.run([self.cxx, '--version'], capture_output=True, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        return result.stdout.splitlines()[0] if result.stdout else self.cxx
+
+    def build(self, force: bool = False) -> bool:
+        """Compila el banco si no hay ya un binario de las mismas fuentes."""
+        version = self._compiler_version()
+        if version is None:
+            print(f"❌ No se encontró el compilador {self.cxx}")
+            return False
+        sources = self._sources()
+        digest = hashlib.sha256(f"{version}\n{' '.join(CXXFLAGS)}".encode())
+        for name in sorted(sources):
+            digest.update(f"\n{name}\n{sources[name]}".encode())
+        key = digest.hexdigest()[:12]
+        src_dir = self.build_dir / key
+        binary = src_dir / 'harness'
+        if binary.exists() and not force:
+            self.binary = binary
+            return True
+
+        src_dir.mkdir(parents=True, exist_ok=True)
+        for name, text in sources.items():
+            (src_dir / name).write_text(text)
+        print(f"🔨 Compilando núcleo nativo en {src_dir}...", file=sys.stderr)
+        result = subprocess.run([self.cxx, *CXXFLAGS, '-o', str(binary), str(src_dir / 'native_harness.cpp')],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"❌ Error compilando el núcleo nativo:\n{result.stderr}")
+            return False
+        self.binary = binary
+        return True
+
+    def run_script(self, data: bytes, tick_us: int = 1000) -> Optional[bytes]:
+        """Salida del firmware tras ejecutar data (tras setup(), sin su salida)."""
+        if self.binary is None and not self.build():
+            return None
+        result = subprocess.run([str(self.binary), 'script', str(tick_us)], input=data,
+                                capture_output=True)
+        if result.returncode != 0:
+            print(f"❌ El banco nativo falló ({result.returncode}): {result.stderr.decode(errors='replace')}")
+            return None
+        return result.stdout
+
+    def bench(self, workload: str, seconds: float = 5.0, baudrate: int = 115200,
+              rate: float = 0.0, tick_us: int = 100, seed: int = 1) -> Optional[Dict]:
+        """Una medida del banco nativo (ver native_harness.cpp)."""
+        if self.binary is None and not self.build():
+            return None
+        args = [str(self.binary), 'bench', str(seconds), str(baudrate), str(rate), workload,
+                str(tick_us), str(seed)]
+        result = subprocess.run(args, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"❌ El banco nativo falló ({result.returncode}): {result.stderr}")
+            return None
+        return json.loads(result.stdout)
+
+    def run_suite(self, seconds: float = 5.0, baudrate: int = 115200, tick_us: int = 100,
+                  seed: int = 1) -> Optional[Dict]:
+        """BENCH_CASES con los mismos parámetros, en el formato de --compare."""
+        results = []
+        for workload, rate in BENCH_CASES:
+            print(f"⏱️  {workload} a {rate or 'máx'} comandos/s", file=sys.stderr)
+            case = self.bench(workload, seconds, baudrate, rate, tick_us, seed)
+            if case is None:
+                return None
+            results.append(case)
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': platform.machine(),
+            'compiler': self._compiler_version(),
+            'results': results,
+        }
+
+
+# ---------- Comparación con neck_emulator.py ----------
+def _random_command(rng: random.Random, n: int) -> str:
+    def values(low: float, high: float, count: int) -> str:
+        return " ".join(rng.choice(["{:.1f}", "{:g}", "{:.3e}"]).format(rng.uniform(low, high))
+                        for _ in range(count))
+
+    kind = rng.random()
+    if kind < 0.3:
+        return f"A {values(-120, 120, n)}"
+    if kind < 0.5:
+        return f"Q {rng.randint(0, 400)} {values(-60, 60, n)}"
+    if kind < 0.6:
+        return f"V {values(0, 200, n)}"
+    if kind < 0.75:
+        return rng.choice(["S", "R", "P", "I", "p", "s"])
+    if kind < 0.8:
+        return rng.choice([f"M {rng.choice([0, 7, 50, 100, 250, 251])}", "D", "d", "D 0", "D 1", "D 2"])
+    if kind < 0.9:
+        # Un gesto: K, sus W (a veces con uno de menos) y G, en varias líneas
+        slot, count = rng.randint(0, 2), rng.randint(1, 5)
+        lines = [f"K {slot} {rng.choice([20, 35, 60])} {count}"]
+        lines += [f"W {slot} {k} {values(-30, 30, n)}" for k in range(count) if rng.random() < 0.9]
+        lines.append(f"G {rng.choice([slot, slot, 1, 9])}")
+        return "\n".join(lines)
+    # Malformados: valores de menos o de más, basura, vacías
+    return rng.choice([f"A {values(-10, 10, n - 1)}", f"A {values(-10, 10, n + 1)}", "Q -5",
+                       "X", "A", "A 1e", "", "  P  ", "V nan 1 2",
+                       "K 0 0 1", "K 8 20 1", "W 0 64 1 2 3", "G -1", "G"])
+
+
+def emulator_output(constants: dict, data: bytes) -> bytes:
+    """Salida de neck_emulator.FirmwareEmulator con el mismo reloj que el banco nativo."""
+    output = bytearray()
+    now = [0]
+    firmware = neck_emulator.FirmwareEmulator(constants, output.extend)
+    firmware.millis = lambda: now[0]
+    firmware.setup()
+    del output[:]
+    firmware.receive(data)
+    while firmware._rx or firmware.streaming or any(firmware.moving):
+        firmware.loop()
+        now[0] += 1
+    return bytes(output)
+
+
+def _split_output(data: bytes) -> List[bytes]:
+    """
+    Separa la salida en líneas y tramas de telemetría. Las líneas se comparan
+    sin el '\\r': println() del ESP32 termina en \\r\\n y el emulador sólo en \\n.
+    """
+    buffer = bytearray(data)
+    items = []
+    while True:
+        item = neck_protocol.split_serial(buffer)
+        if item is None:
+            break
+        items.append(item if neck_protocol.is_telemetry(item) else item.replace(b"\r\n", b"\n"))
+    if buffer:
+        items.append(bytes(buffer))
+    return items
+
+
+def check_emulator(core: NativeCore, iterations: int, seed: int) -> bool:
+    """Ejecuta scripts al azar en el núcleo nativo y en el emulador y compara la salida."""
+    rng = random.Random(seed)
+    n = core.constants['NUM_SERVOS']
+    mismatches = 0
+    for _ in range(iterations):
+        script = "".join(_random_command(rng, n) + "\n" for _ in range(rng.randint(1, 8))).encode()
+        native = core.run_script(script)
+        if native is None:
+            return False
+        native = _split_output(native)
+        emulated = _split_output(emulator_output(core.constants, script))
+        if native != emulated:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"❌ Divergencia con {script!r}:\n   nativo:   {native!r}\n   emulador: {emulated!r}")
+    status = "✅" if not mismatches else "❌"
+    print(f"{status} {iterations} scripts: {mismatches} divergencias entre el núcleo nativo y el emulador")
+    return not mismatches
+
+
+# ---------- Regresiones ----------
+def _flatten(case: Dict) -> Dict[str, float]:
+    flat = {'rx_backlog_max': case['rx_backlog_max']}
+    # Salida y esperas del UART de transmisión (resultados sin ellas no las comparan)
+    for metric in ('bytes_out', 'tx_wait_us'):
+        if metric in case:
+            flat[metric] = case[metric]
+    for section in ('loop_us', 'cpu_us', 'stop_late_ms'):
+        for metric in ('mean', 'p50', 'p99', 'max'):
+            flat[f"{section}.{metric}"] = case[section][metric]
+    # El máximo de CPU es el de la vuelta en que el sistema operativo nos quitó el procesador
+    del flat['cpu_us.max']
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """
+    Compara dos ejecuciones del banco y devuelve las líneas con cambios
+    mayores que `threshold`. Todas las métricas son mejores cuanto más bajas.
+    """
+    base_cases = {c['workload']: _flatten(c) for c in baseline['results']}
+    lines = []
+    for case in current['results']:
+        key = case['workload']
+        if key not in base_cases:
+            continue
+        for metric, value in _flatten(case).items():
+            old = base_cases[key].get(metric)
+            if old is None or abs(value - old) < _MIN_DELTA[metric.split('.')[0]]:
+                continue
+            change = (value - old) / old if old else float('inf')
+            if abs(change) < threshold:
+                continue
+            mark = "🔺" if change > 0 else "🟢"
+            lines.append(f"{mark} {key} {metric}: {old} → {value} ({change:+.0%})")
+    return lines
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Núcleo del firmware compilado en el PC")
+    parser.add_argument("command", nargs='?', default="bench", choices=["build", "check", "bench"],
+                        help="Comando a ejecutar")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Recompilar aunque el binario esté al día")
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="Con check: scripts al azar a comparar (default: 200)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Semilla de los comandos al azar (default: 1)")
+    parser.add_argument("--seconds", type=float, default=5.0,
+                        help="Con bench: segundos de reloj virtual por carga (default: 5)")
+    parser.add_argument("--baudrate", type=int, default=115200,
+                        help="Con bench: baudios del puerto serie (default: 115200)")
+    parser.add_argument("--tick-us", type=int, default=100,
+                        help="Con bench: µs que el resto del loop (WiFi, web) añade a cada vuelta")
+    parser.add_argument("--log-level", type=int, choices=[0, 1], default=None,
+                        help="Nivel de registro del firmware (0: códigos, 1: texto); "
+                             "por defecto el de debug.verbose_output")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Con bench: guardar el resultado JSON en un archivo")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Con bench: JSON de una ejecución anterior con la que comparar")
+    args = parser.parse_args()
+
+    core = NativeCore(args.config)
+    if args.log_level is not None:
+        core.constants['LOG_LEVEL'] = args.log_level
+    if not core.build(args.force):
+        sys.exit(1)
+    if args.command == "build":
+        print(f"✅ Núcleo nativo en {core.binary}")
+        sys.exit(0)
+    if args.command == "check":
+        sys.exit(0 if check_emulator(core, args.iterations, args.seed) else 1)
+
+    report = core.run_suite(args.seconds, args.baudrate, args.tick_us, args.seed)
+    if report is None:
+        sys.exit(1)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"✅ Resultados guardados en: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changes = compare(report, baseline)
+        for line in changes:
+            print(line, file=sys.stderr)
+        if any(line.startswith("🔺") for line in changes):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Varios cuellos ESP32 desde un mismo host.
+
+NeckPool abre todos los controladores en paralelo (las esperas de reset de
+cada ESP32 se solapan en vez de sumarse) y envía comandos a todos o a
+algunos con el mínimo desfase entre sus primeros bytes:
+
+    with NeckPool.discover() as pool:
+        futures = pool.broadcast("move_angles", [30, 0, -30])
+        print(pool.gather(futures, timeout=5))     # {puerto: {servo: ángulo}}
+        pool.send_each("set_pwm", {"/dev/esp32_a": ([95, 95, 95],),
+                                   "/dev/esp32_b": ([120, 95, 70],)})
+
+Para reducir el desfase, el envío se hace en dos fases: primero se escribe
+el comando en todos los puertos sin esperar a que salga (batch_writes) y
+después se vacían todos.
+"""
+import glob
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from epj_neck import ESP32NeckController
+from neck_metrics import NeckMetrics
+
+# Puertos candidatos (la regla udev de install_udev_rule.sh crea /dev/esp32)
+DEFAULT_PATTERNS = ('/dev/esp32*', '/dev/ttyACM*', '/dev/ttyUSB*')
+# Espressif (USB nativo del S3), Silicon Labs CP210x, WCH CH340
+KNOWN_VIDS = (0x303A, 0x10C4, 0x1A86)
+
+
+def discover_ports(patterns: Sequence[str] = DEFAULT_PATTERNS) -> List[str]:
+    """
+    Busca puertos serie que pueden tener un cuello conectado.
+
+    Returns:
+        Lista de rutas sin duplicados (un enlace udev y su destino cuentan
+        como el mismo dispositivo; se conserva el primero encontrado)
+    """
+    candidates = [path for pattern in patterns for path in sorted(glob.glob(pattern))]
+    try:
+        from serial.tools import list_ports
+        candidates += [p.device for p in list_ports.comports() if p.vid in KNOWN_VIDS]
+    except ImportError:
+        pass
+
+    ports, seen = [], set()
+    for path in candidates:
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            ports.append(path)
+    return ports
+
+
+class NeckPool:
+    """
+    Conjunto de ESP32NeckController direccionados por nombre.
+
+    Args:
+        controllers: {nombre: controlador}
+        metrics: Registro para las métricas del pool (desfase de los envíos)
+    """
+
+    def __init__(self, controllers: Dict[str, ESP32NeckController],
+                 metrics: Optional[NeckMetrics] = None):
+        self.controllers = dict(controllers)
+        self.metrics = metrics
+        self.last_skew: Optional[float] = None
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[str], per_device_metrics: bool = False,
+                   **controller_kwargs) -> "NeckPool":
+        """
+        Crea un controlador por puerto, nombrado por su ruta.
+
+        Args:
+            ports: Rutas de los puertos
+            per_device_metrics: Dar a cada controlador su propio NeckMetrics
+            **controller_kwargs: Argumentos para ESP32NeckController
+        """
+        controllers = {}
+        for port in ports:
+            kwargs = dict(controller_kwargs)
+            if per_device_metrics:
+                kwargs['metrics'] = NeckMetrics()
+            controllers[port] = ESP32NeckController(port, **kwargs)
+        return cls(controllers, NeckMetrics() if per_device_metrics else None)
+
+    @classmethod
+    def discover(cls, patterns: Sequence[str] = DEFAULT_PATTERNS, probe: bool = True,
+                 **kwargs) -> "NeckPool":
+        """
+        Descubre, conecta y (con probe) comprueba con I qué puertos son cuellos.
+
+        Los puertos que no se abren o no responden se quitan del pool.
+        """
+        pool = cls.from_ports(discover_ports(patterns), **kwargs)
+        connected = pool.connect()
+        for name, ok in connected.items():
+            if not ok:
+                del pool.controllers[name]
+        if probe:
+            timeout = kwargs.get('timeout', 1.0)
+            replies = pool.gather(pool.broadcast("get_system_info"), timeout=timeout)
+            for name, info in replies.items():
+                if not isinstance(info, dict) or 'servos' not in info:
+                    print(f"⚠️  {name} no responde como un cuello; se descarta")
+                    pool.controllers.pop(name).disconnect()
+        print(f"✅ {len(pool)} cuellos en el pool")
+        return pool
+
+    # ---------- Conexión ----------
+    def connect(self) -> Dict[str, bool]:
+        """
+        Conecta todos los controladores a la vez.
+
+        Returns:
+            {nombre: True si conectó}
+        """
+        if not self.controllers:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(self.controllers)) as executor:
+            results = {name: executor.submit(c.connect) for name, c in self.controllers.items()}
+        return {name: future.result() for name, future in results.items()}
+
+    def disconnect(self):
+        """Desconecta todos los controladores."""
+        for controller in self.controllers.values():
+            controller.disconnect()
+
+    def __len__(self) -> int:
+        return len(self.controllers)
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def __getitem__(self, name: str) -> ESP32NeckController:
+        return self.controllers[name]
+
+    def __enter__(self):
+        if not any(c.is_connected for c in self.controllers.values()):
+            self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    # ---------- Envíos ----------
+    def _select(self, names: Optional[Iterable[str]]) -> Dict[str, ESP32NeckController]:
+        if names is None:
+            return self.controllers
+        selected = {}
+        for name in names:
+            if name not in self.controllers:
+                raise KeyError(f"Cuello desconocido: {name}")
+            selected[name] = self.controllers[name]
+        return selected
+
+    def send_each(self, method: str, args_by_name: Dict[str, Sequence[Any]]) -> Dict[str, Any]:
+        """
+        Llama a `method` en cada controlador con sus propios argumentos.
+
+        Todos los comandos se escriben antes de vaciar ningún puerto, así que
+        el desfase entre cuellos es el de llamar al método, no el de la
+        transmisión.
+
+        Args:
+            method: Nombre de un método de ESP32NeckController (p.ej. 'move_angles')
+            args_by_name: {nombre: tupla de argumentos}
+
+        Returns:
+            {nombre: lo que devuelve el método (bool, Future o None)}
+        """
+        targets = self._select(args_by_name)
+        calls = [(name, getattr(c, method), args_by_name[name]) for name, c in targets.items()]
+        results, sent_at = {}, []
+        with ExitStack() as stack:
+            # Orden fijo al tomar los locks para que dos envíos concurrentes no se bloqueen
+            for name in sorted(targets):
+                stack.enter_context(targets[name].batch_writes())
+            for name, bound, args in calls:
+                results[name] = bound(*args)
+                sent_at.append(time.perf_counter())
+        if sent_at:
+            self.last_skew = sent_at[-1] - sent_at[0]
+            if self.metrics is not None:
+                self.metrics.observe("broadcast_skew_seconds", self.last_skew, command=method)
+        return results
+
+    def broadcast(self, method: str, *args, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Llama a `method` con los mismos argumentos en todos los cuellos (o en `names`).
+
+        Example:
+            pool.broadcast("stop_all")
+            pool.broadcast("move_angles", [0, 45, 0], names=["/dev/esp32_a"])
+        """
+        return self.send_each(method, {name: args for name in self._select(names)})
+
+    @staticmethod
+    def gather(results: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Espera los Future devueltos por broadcast/send_each.
+
+        Args:
+            results: Resultado de broadcast o send_each
+            timeout: Tiempo máximo total en segundos
+
+        Returns:
+            {nombre: valor}; las excepciones (timeout, MoveInterrupted, ...)
+            se devuelven como valor en lugar de lanzarse
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        gathered = {}
+        for name, result in results.items():
+            if not isinstance(result, Future):
+                gathered[name] = result
+                continue
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                gathered[name] = result.result(timeout=remaining)
+            except Exception as e:
+                gathered[name] = e
+        return gathered
+
+    def stop_all(self, names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Detiene todos los servos de todos los cuellos."""
+        return self.broadcast("stop_all", names=names)
+
+    def estimated_positions(self) -> Dict[str, List[float]]:
+        """Posiciones estimadas de cada cuello, sin tráfico serie."""
+        return {name: c.estimated_positions() for name, c in self.controllers.items()}
+
+    def metrics_snapshot(self) -> Dict[str, dict]:
+        """Instantánea de las métricas de cada cuello que las tenga."""
+        return {name: c.metrics.snapshot() for name, c in self.controllers.items()
+                if c.metrics is not None}
@@ -0,0 +1,297 @@
+"""
+Protocolo binario compacto entre el host y el firmware del cuello.
+
+Cada trama tiene el formato:
+
+    SYNC | OPCODE | PAYLOAD | CRC8
+
+- SYNC: byte 0xA5 (nunca aparece al inicio de un comando ASCII)
+- OPCODE: tipo de comando (OP_*)
+- PAYLOAD: longitud fija según el opcode y el número de servos
+- CRC8: polinomio 0x07 sobre OPCODE + PAYLOAD
+
+Por UDP cada datagrama lleva una cabecera con número de secuencia:
+
+    SEQ | FLAGS | COMANDOS
+
+- SEQ: uint32 little-endian, creciente por emisor; el firmware descarta los
+  datagramas que no son más nuevos que el último aplicado (gana el más nuevo)
+- FLAGS: UDP_FLAG_ACK pide respuesta aunque el comando no imprima nada
+- COMANDOS: tramas binarias y/o líneas ASCII terminadas en '\n'
+
+El firmware responde al emisor con la misma cabecera seguida de las líneas
+que imprimió al ejecutar el datagrama.
+
+Con telemetría activa (comando "M <hz>") el firmware envía por el puerto
+serie, entre sus líneas de texto, tramas OP_TELEMETRY con el mismo formato:
+
+    SYNC | OP_TELEMETRY | T_MS | N | N x (PWM | FLAGS | ÁNGULO | RESTANTE) | CRC8
+
+- T_MS: uint32, millis() del firmware
+- N: número de servos, para conocer la longitud sin más contexto
+- PWM: uint8; FLAGS: TELEMETRY_FLAG_*; ÁNGULO: int16 como en los comandos;
+  RESTANTE: uint16, ms hasta el fin del movimiento (saturado a 65535)
+
+Una trama sólo empieza al inicio de una línea: 0xA5 es un byte de
+continuación de UTF-8 y nunca abre una línea de texto. Los opcodes con el bit
+alto (0x80) son del firmware al host.
+
+Los ángulos viajan como int16 little-endian en décimas de grado, así que un
+setpoint de 3 servos ocupa 9 bytes frente a los 20-40 del comando "A x y z".
+Las constantes de este módulo se inyectan en el firmware desde ino_generator.py
+para que host y ESP32 compartan una única definición.
+"""
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+FRAME_SYNC = 0xA5
+ANGLE_SCALE = 10  # Décimas de grado por unidad
+CRC8_POLY = 0x07
+
+OP_MOVE_ANGLES = 0x01
+OP_SET_PWM = 0x02
+OP_STOP = 0x03
+OP_RESET = 0x04
+OP_POSITIONS = 0x05
+OP_QUEUE_SETPOINT = 0x06
+OP_TELEMETRY = 0x80  # Firmware → host
+
+# Comando ASCII equivalente a cada opcode (para logs y métricas)
+OPCODE_COMMANDS = {
+    OP_MOVE_ANGLES: 'A',
+    OP_SET_PWM: 'V',
+    OP_STOP: 'S',
+    OP_RESET: 'R',
+    OP_POSITIONS: 'P',
+    OP_QUEUE_SETPOINT: 'Q',
+}
+
+# Canal UDP
+UDP_PORT = 4210
+UDP_HEADER = struct.Struct("<IB")
+UDP_FLAG_ACK = 0x01
+UDP_MAX_LEN = 512  # Datagrama completo, cabecera incluida
+SEQ_MODULO = 1 << 32
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+# Telemetría periódica
+TELEMETRY_HEADER = struct.Struct("<BBIB")  # SYNC, OP_TELEMETRY, T_MS, N
+TELEMETRY_SERVO = struct.Struct("<BBhH")   # PWM, FLAGS, ÁNGULO, RESTANTE
+TELEMETRY_FLAG_MOVING = 0x01
+TELEMETRY_MAX_HZ = 250
+UINT16_MAX = 65535
+
+
+def _build_crc8_table(poly: int) -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _build_crc8_table(CRC8_POLY)
+
+
+def crc8(data: bytes) -> int:
+    """Calcula el CRC8 (poly 0x07, init 0x00) de un bloque de bytes."""
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(opcode: int, payload: bytes = b"") -> bytes:
+    """
+    Empaqueta un opcode y su payload en una trama completa.
+
+    Args:
+        opcode: Uno de los OP_* de este módulo
+        payload: Bytes del payload ya codificados
+
+    Returns:
+        bytes: Trama lista para escribir en el puerto serie
+    """
+    body = bytes((opcode,)) + payload
+    return bytes((FRAME_SYNC,)) + body + bytes((crc8(body),))
+
+
+def encode_angles(angles: Sequence[Union[int, float]]) -> bytes:
+    """
+    Codifica ángulos como int16 en punto fijo (ANGLE_SCALE unidades por grado).
+
+    Raises:
+        ValueError: Si algún ángulo no cabe en un int16
+    """
+    raw = [int(round(angle * ANGLE_SCALE)) for angle in angles]
+    for angle, value in zip(angles, raw):
+        if not (INT16_MIN <= value <= INT16_MAX):
+            raise ValueError(f"Ángulo fuera de rango para el protocolo binario: {angle}")
+    return struct.pack(f"<{len(raw)}h", *raw)
+
+
+def encode_move_angles(angles: Sequence[Union[int, float]]) -> bytes:
+    """Trama equivalente a 'A x y z'."""
+    return encode_frame(OP_MOVE_ANGLES, encode_angles(angles))
+
+
+def encode_set_pwm(pwm_values: Sequence[Union[int, float]]) -> bytes:
+    """Trama equivalente a 'V a b c' (un byte por servo)."""
+    return encode_frame(OP_SET_PWM, bytes(int(pwm) for pwm in pwm_values))
+
+
+def encode_stop() -> bytes:
+    """Trama equivalente a 'S'."""
+    return encode_frame(OP_STOP)
+
+
+def encode_reset() -> bytes:
+    """Trama equivalente a 'R'."""
+    return encode_frame(OP_RESET)
+
+
+def encode_positions() -> bytes:
+    """Trama equivalente a 'P'."""
+    return encode_frame(OP_POSITIONS)
+
+
+def encode_queue_setpoint(t_ms: int, angles: Sequence[Union[int, float]]) -> bytes:
+    """Trama equivalente a 'Q t x y z' (t como uint32 en ms)."""
+    return encode_frame(OP_QUEUE_SETPOINT, struct.pack("<I", t_ms) + encode_angles(angles))
+
+
+def is_setpoint_frame(data: bytes) -> bool:
+    """True si data es una trama Q completa y con el CRC bien."""
+    return (len(data) >= 7 and data[0] == FRAME_SYNC and data[1] == OP_QUEUE_SETPOINT
+            and (len(data) - 7) % 2 == 0 and crc8(data[1:-1]) == data[-1])
+
+
+def encode_datagram(seq: int, payload: bytes, ack: bool = False) -> bytes:
+    """
+    Datagrama UDP con cabecera de secuencia.
+
+    Raises:
+        ValueError: Si no cabe en UDP_MAX_LEN
+    """
+    data = UDP_HEADER.pack(seq % SEQ_MODULO, UDP_FLAG_ACK if ack else 0) + payload
+    if len(data) > UDP_MAX_LEN:
+        raise ValueError(f"Datagrama de {len(data)} bytes (máximo {UDP_MAX_LEN})")
+    return data
+
+
+def decode_datagram(data: bytes) -> Tuple[int, int, bytes]:
+    """
+    Separa un datagrama en (seq, flags, payload).
+
+    Raises:
+        ValueError: Si es más corto que la cabecera
+    """
+    if len(data) < UDP_HEADER.size:
+        raise ValueError(f"Datagrama demasiado corto: {len(data)} bytes")
+    seq, flags = UDP_HEADER.unpack_from(data)
+    return seq, flags, data[UDP_HEADER.size:]
+
+
+def seq_newer(seq: int, last: int) -> bool:
+    """True si seq es posterior a last (aritmética módulo 2^32, como el firmware)."""
+    return 0 < (seq - last) % SEQ_MODULO < SEQ_MODULO // 2
+
+
+def telemetry_frame_len(num_servos: int) -> int:
+    """Bytes de una trama OP_TELEMETRY con num_servos servos, CRC incluido."""
+    return TELEMETRY_HEADER.size + num_servos * TELEMETRY_SERVO.size + 1
+
+
+def encode_telemetry(t_ms: int, servos: Sequence[Tuple[int, bool, float, int]]) -> bytes:
+    """
+    Trama de telemetría como la envía el firmware.
+
+    Args:
+        t_ms: millis() del firmware
+        servos: (pwm, en marcha, ángulo, ms restantes) de cada servo
+    """
+    payload = struct.pack("<IB", t_ms % SEQ_MODULO, len(servos))
+    for pwm, moving, angle, remaining in servos:
+        raw = max(INT16_MIN, min(INT16_MAX, int(round(angle * ANGLE_SCALE))))
+        payload += TELEMETRY_SERVO.pack(int(pwm), TELEMETRY_FLAG_MOVING if moving else 0,
+                                        raw, min(int(remaining), UINT16_MAX))
+    return encode_frame(OP_TELEMETRY, payload)
+
+
+def decode_telemetry(frame: bytes) -> Tuple[int, List[Tuple[int, bool, float, int]]]:
+    """
+    Inversa de encode_telemetry: (t_ms, [(pwm, en marcha, ángulo, ms restantes)]).
+
+    Raises:
+        ValueError: Si la trama no es de telemetría, está cortada o falla el CRC
+    """
+    if len(frame) < TELEMETRY_HEADER.size + 1:
+        raise ValueError(f"Trama de telemetría demasiado corta: {len(frame)} bytes")
+    sync, opcode, t_ms, count = TELEMETRY_HEADER.unpack_from(frame)
+    if sync != FRAME_SYNC or opcode != OP_TELEMETRY:
+        raise ValueError(f"No es una trama de telemetría: 0x{sync:02X} 0x{opcode:02X}")
+    if len(frame) != telemetry_frame_len(count):
+        raise ValueError(f"Trama de telemetría de {len(frame)} bytes para {count} servos")
+    if crc8(frame[1:-1]) != frame[-1]:
+        raise ValueError("CRC inválido en la trama de telemetría")
+    servos = []
+    for i in range(count):
+        pwm, flags, raw, remaining = TELEMETRY_SERVO.unpack_from(
+            frame, TELEMETRY_HEADER.size + i * TELEMETRY_SERVO.size)
+        servos.append((pwm, bool(flags & TELEMETRY_FLAG_MOVING), raw / ANGLE_SCALE, remaining))
+    return t_ms, servos
+
+
+def split_serial(buffer: bytearray) -> Optional[bytes]:
+    """
+    Saca del principio de buffer la siguiente línea de texto (con su '\n') o
+    trama de telemetría completa; None si aún no ha llegado entera.
+
+    Es el separador del lado del host para el puerto serie, que mezcla las
+    líneas del firmware con las tramas OP_TELEMETRY.
+    """
+    if len(buffer) >= 2 and buffer[0] == FRAME_SYNC and buffer[1] == OP_TELEMETRY:
+        if len(buffer) < TELEMETRY_HEADER.size:
+            return None
+        end = telemetry_frame_len(buffer[TELEMETRY_HEADER.size - 1])
+    else:
+        if buffer[:1] == bytes((FRAME_SYNC,)) and len(buffer) < 2:
+            return None  # Puede ser el principio de una trama
+        end = buffer.find(b"\n") + 1
+        if end == 0:
+            return None
+    if len(buffer) < end:
+        return None
+    item = bytes(buffer[:end])
+    del buffer[:end]
+    return item
+
+
+def is_telemetry(item: bytes) -> bool:
+    """True si item (de split_serial) es una trama de telemetría y no una línea."""
+    return len(item) >= 2 and item[0] == FRAME_SYNC and item[1] == OP_TELEMETRY
+
+
+def firmware_constants() -> Dict[str, Union[int, str]]:
+    """Constantes del protocolo para renderizar en neck_core.h."""
+    return {
+        'FRAME_SYNC': f"0x{FRAME_SYNC:02X}",
+        'ANGLE_SCALE': ANGLE_SCALE,
+        'OP_MOVE_ANGLES': f"0x{OP_MOVE_ANGLES:02X}",
+        'OP_SET_PWM': f"0x{OP_SET_PWM:02X}",
+        'OP_STOP': f"0x{OP_STOP:02X}",
+        'OP_RESET': f"0x{OP_RESET:02X}",
+        'OP_POSITIONS': f"0x{OP_POSITIONS:02X}",
+        'OP_QUEUE_SETPOINT': f"0x{OP_QUEUE_SETPOINT:02X}",
+        'OP_TELEMETRY': f"0x{OP_TELEMETRY:02X}",
+        'TELEMETRY_FLAG_MOVING': f"0x{TELEMETRY_FLAG_MOVING:02X}",
+        'TELEMETRY_MAX_HZ': TELEMETRY_MAX_HZ,
+        'UDP_HEADER_LEN': UDP_HEADER.size,
+        'UDP_FLAG_ACK': f"0x{UDP_FLAG_ACK:02X}",
+        'UDP_MAX_LEN': UDP_MAX_LEN,
+        'CRC8_TABLE': ', '.join(f"0x{value:02X}" for value in CRC8_TABLE),
+    }
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Grabación y reproducción de sesiones de ESP32NeckController.
+
+SessionRecorder guarda todo lo que el controlador envía al firmware y todo lo
+que recibe (líneas y tramas de telemetría) en un log binario de sólo
+añadir, con la hora de time.monotonic_ns() de cada registro:
+
+    recorder = SessionRecorder("cuello.necklog")
+    controller = ESP32NeckController("/dev/esp32", recorder=recorder)
+
+SessionLog abre el log con mmap y replay() vuelve a enviar los comandos con
+sus tiempos originales, más rápido (speed=N) o sin esperas (speed=0), contra
+la placa o un emulador. Así una sesión real sirve de carga para medir el
+camino de control completo:
+
+    python neck_session.py info cuello.necklog
+    python neck_session.py replay cuello.necklog --emulate --speed 4
+
+Formato: MAGIC y luego registros [tipo u8][longitud u32][t_ns i64][datos],
+little-endian. Cada conexión empieza con un registro KIND_SESSION con sus
+datos en JSON; el reloj monotónico sólo vale dentro de una misma sesión. Un
+registro cortado al final (corte de luz, proceso muerto) se ignora al leer.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import neck_protocol
+
+MAGIC = b"NECKLOG\x01"
+RECORD = struct.Struct("<BIq")  # Tipo, longitud de los datos, time.monotonic_ns()
+
+KIND_TX = 0       # Host → firmware, tal cual salió por el transporte
+KIND_RX = 1       # Firmware → host: una línea o una trama de telemetría
+KIND_SESSION = 2  # Inicio de conexión; datos en JSON
+
+DEFAULT_EXTENSION = ".necklog"
+
+
+class SessionRecorder:
+    """
+    Log binario de sólo añadir. Cada registro sale en una única escritura sin
+    buffer, así que lo grabado sobrevive aunque el proceso muera.
+
+    Args:
+        path: Archivo del log; si ya existe, las sesiones nuevas se añaden al final
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "ab", buffering=0)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError(f"{path} no es un log de sesión")
+        self.records = 0
+        self.bytes_written = 0
+
+    def start_session(self, **meta):
+        """Marca el comienzo de una conexión (puerto, baudios, protocolo...)."""
+        meta.setdefault("wall_time", time.time())
+        self._write(KIND_SESSION, json.dumps(meta).encode())
+
+    def record_tx(self, data: bytes):
+        self._write(KIND_TX, data)
+
+    def record_rx(self, data: bytes):
+        self._write(KIND_RX, data)
+
+    def _write(self, kind: int, data: bytes):
+        record = RECORD.pack(kind, len(data), time.monotonic_ns()) + data
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(record)
+            self.records += 1
+            self.bytes_written += len(record)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"<SessionRecorder '{self.path}' records={self.records}>"
+
+
+@dataclass
+class Record:
+    kind: int
+    t_ns: int
+    data: bytes
+
+
+@dataclass
+class Session:
+    """Una conexión del log: sus datos y el rango [first, end) de registros."""
+    meta: Dict
+    first: int
+    end: int
+
+
+class SessionLog:
+    """
+    Log de sesión abierto con mmap. Al abrirlo sólo se recorren las cabeceras
+    para indexar los registros; los datos se leen del mapa al pedirlos.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC):
+            self._file.close()
+            raise ValueError(f"{path} no es un log de sesión")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un log de sesión")
+        self._offsets = array("Q")
+        self.sessions: List[Session] = []
+        self.truncated = False  # El último registro estaba a medias
+        offset = len(MAGIC)
+        while offset < size:
+            if offset + RECORD.size > size:
+                self.truncated = True
+                break
+            kind, length, _ = RECORD.unpack_from(self._mm, offset)
+            if offset + RECORD.size + length > size:
+                self.truncated = True
+                break
+            if kind == KIND_SESSION:
+                if self.sessions:
+                    self.sessions[-1].end = len(self._offsets)
+                meta = json.loads(self._mm[offset + RECORD.size:offset + RECORD.size + length])
+                self.sessions.append(Session(meta, len(self._offsets) + 1, -1))
+            self._offsets.append(offset)
+            offset += RECORD.size + length
+        if self.sessions:
+            self.sessions[-1].end = len(self._offsets)
+        elif self._offsets:
+            # Grabado sin start_session: una sesión sin datos
+            self.sessions.append(Session({}, 0, len(self._offsets)))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Record:
+        offset = self._offsets[index]
+        kind, length, t_ns = RECORD.unpack_from(self._mm, offset)
+        start = offset + RECORD.size
+        return Record(kind, t_ns, self._mm[start:start + length])
+
+    def records(self, session: Optional[int] = None) -> Iterator[Record]:
+        """Registros de una sesión (índice en self.sessions) o de todo el log."""
+        if session is None:
+            first, end = 0, len(self._offsets)
+        else:
+            first, end = self.sessions[session].first, self.sessions[session].end
+        for i in range(first, end):
+            yield self[i]
+
+    def summary(self) -> Dict:
+        """Registros, bytes, duración y comandos/eventos por tipo de cada sesión."""
+        from epj_neck import _command_label, parse_line
+
+        sessions = []
+        for i, session in enumerate(self.sessions):
+            commands, events = Counter(), Counter()
+            sent = received = 0
+            first_t = last_t = None
+            for record in self.records(i):
+                first_t = record.t_ns if first_t is None else first_t
+                last_t = record.t_ns
+                if record.kind == KIND_TX:
+                    sent += len(record.data)
+                    commands[_command_label(record.data)] += 1
+                elif record.kind == KIND_RX:
+                    received += len(record.data)
+                    events[_event_kind(record.data, parse_line)] += 1
+            sessions.append({
+                **session.meta,
+                'records': session.end - session.first,
+                'seconds': round((last_t - first_t) / 1e9, 3) if first_t is not None else 0.0,
+                'bytes_sent': sent,
+                'bytes_received': received,
+                'commands': dict(commands),
+                'events': dict(events),
+            })
+        return {'path': self.path, 'records': len(self), 'truncated': self.truncated,
+                'sessions': sessions}
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"<SessionLog '{self.path}' records={len(self)} sessions={len(self.sessions)}>"
+
+
+def _event_kind(data: bytes, parse_line) -> str:
+    """Tipo de evento de lo recibido, como lo cuentan las métricas del controlador."""
+    if neck_protocol.is_telemetry(data):
+        return "telemetry"
+    text = data.decode("utf-8", errors="replace").strip()
+    return parse_line(text).type.value if text else "empty"
+
+
+def _percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    rank = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+    return {'p50_ms': round(rank(50), 3), 'p99_ms': round(rank(99), 3),
+            'max_ms': round(ordered[-1] * 1000, 3)}
+
+
+def _is_setpoint(data: bytes) -> bool:
+    return neck_protocol.is_setpoint_frame(data) or data.startswith(b"Q ")
+
+
+def _scale_setpoint(data: bytes, speed: float) -> bytes:
+    """
+    Comando grabado con el t_ms de un Q (ASCII o trama) dividido por speed;
+    cualquier otro comando sale tal cual.
+    """
+    if speed == 1:
+        return data
+    if neck_protocol.is_setpoint_frame(data):
+        t_ms = struct.unpack_from("<I", data, 2)[0]
+        return neck_protocol.encode_frame(neck_protocol.OP_QUEUE_SETPOINT,
+                                          struct.pack("<I", round(t_ms / speed)) + data[6:-1])
+    parts = data.split(b" ", 2)
+    if len(parts) == 3 and parts[0] == b"Q" and parts[1].isdigit():
+        return b"Q %d %s" % (round(int(parts[1]) / speed), parts[2])
+    return data
+
+
+def replay(log: SessionLog, controller, speed: float = 1.0, session: Optional[int] = None,
+           drain: float = 1.0) -> Dict:
+    """
+    Vuelve a enviar los comandos grabados por `controller`, ya conectado.
+
+    Los envíos siguen los tiempos originales divididos por speed (speed=0:
+    uno tras otro, sin esperas); los huecos entre sesiones no se esperan.
+    Tras el último comando espera `drain` segundos a las respuestas y compara
+    los eventos recibidos con los grabados. Con speed != 1 el firmware no
+    acelera sus movimientos, así que los eventos pueden no coincidir. Los t_ms
+    de los setpoints (Q) también se dividen por speed, para que el firmware
+    los consuma al mismo ritmo que llegan. speed=0 no vale para sesiones con
+    setpoints: llegarían todos de golpe y desbordarían el buffer.
+
+    Raises:
+        ValueError: Si speed=0 y la sesión tiene setpoints
+
+    Returns:
+        dict con comandos enviados, duración, retraso de cada envío respecto
+        a su hora y eventos por tipo [grabados, reproducidos]
+    """
+    from epj_neck import parse_line
+
+    received = Counter()
+    controller.add_listener(lambda event: received.update((event.type.value,)))
+    telemetry_before = controller.telemetry.total if controller.telemetry is not None else 0
+    recorded = Counter()
+    indices = range(len(log.sessions)) if session is None else [session]
+    if speed <= 0 and any(_is_setpoint(record.data) for i in indices for record in log.records(i)
+                          if record.kind == KIND_TX):
+        raise ValueError("La sesión tiene setpoints (Q): reprodúcela con speed > 0")
+    lag: List[float] = []
+    sent = errors = 0
+    start = time.monotonic()
+    offset = start  # Hora de reproducción del primer registro de la sesión en curso
+    for i in indices:
+        base_ns = None
+        for record in log.records(i):
+            if record.kind == KIND_RX:
+                recorded[_event_kind(record.data, parse_line)] += 1
+                continue
+            if record.kind != KIND_TX:
+                continue
+            if base_ns is None:
+                base_ns = record.t_ns
+                offset = time.monotonic()
+            if speed > 0:
+                due = offset + (record.t_ns - base_ns) / 1e9 / speed
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                lag.append(max(0.0, time.monotonic() - due))
+            if controller.send_raw(_scale_setpoint(record.data, speed)):
+                sent += 1
+            else:
+                errors += 1
+    elapsed = time.monotonic() - start
+    time.sleep(drain)
+    if controller.telemetry is not None:
+        received["telemetry"] = controller.telemetry.total - telemetry_before
+    kinds = sorted(set(recorded) | set(received))
+    return {
+        'speed': speed,
+        'commands_sent': sent,
+        'send_errors': errors,
+        'seconds': round(elapsed, 3),
+        'commands_per_s': round(sent / elapsed, 2) if elapsed else 0.0,
+        'send_lag': _percentiles_ms(lag),
+        'events': {kind: [recorded[kind], received[kind]] for kind in kinds},
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Grabaciones de sesiones del cuello")
+    parser.add_argument("command", choices=["info", "replay"], help="Comando a ejecutar")
+    parser.add_argument("log", help=f"Log de sesión ({DEFAULT_EXTENSION})")
+    parser.add_argument("-p", "--port", type=str, default=None,
+                        help="Con replay: puerto o URL del firmware (por defecto, el de la grabación)")
+    parser.add_argument("--emulate", action="store_true",
+                        help="Con replay: reproducir contra neck_emulator.py")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Con --emulate: configuración YAML del emulador")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Con replay: factor de velocidad (0: sin esperas; default: 1)")
+    parser.add_argument("--session", type=int, default=None,
+                        help="Con replay: reproducir sólo esta sesión (índice de info)")
+    parser.add_argument("--drain", type=float, default=1.0,
+                        help="Con replay: segundos de espera a las respuestas al final")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Con replay: guardar el resultado JSON en un archivo")
+    args = parser.parse_args()
+
+    with SessionLog(args.log) as log:
+        if args.command == "info":
+            print(json.dumps(log.summary(), indent=2, ensure_ascii=False))
+            sys.exit(0)
+        if not log.sessions:
+            print(f"❌ {args.log} no tiene registros")
+            sys.exit(1)
+
+        from epj_neck import ESP32NeckController
+
+        meta = log.sessions[args.session if args.session is not None else 0].meta
+        baudrate = meta.get('baudrate', 115200)
+        binary = meta.get('binary', False)
+        emulator = None
+        if args.emulate:
+            from neck_emulator import PtyEmulator
+            emulator = PtyEmulator(args.config, baudrate=baudrate)
+            port = emulator.start()
+        else:
+            port = args.port or meta.get('port')
+            if not port:
+                print("❌ La grabación no dice el puerto: usa -p")
+                sys.exit(1)
+        try:
+            controller = ESP32NeckController(port, baudrate=baudrate, binary=binary,
+                                             reset_delay=0 if emulator else 2.0)
+            if not controller.connect():
+                sys.exit(1)
+            try:
+                speed = "máx" if args.speed <= 0 else f"{args.speed:g}×"
+                print(f"▶️  Reproduciendo {args.log} a {speed} en {port}")
+                result = replay(log, controller, args.speed, args.session, args.drain)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            finally:
+                controller.disconnect()
+        finally:
+            if emulator is not None:
+                emulator.stop()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Resultados guardados en: {args.output}")
+    sys.exit(0 if not result['send_errors'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Telemetría periódica del firmware en un buffer circular de NumPy.
+
+Con el comando "M <hz>" el firmware envía tramas OP_TELEMETRY (ver
+neck_protocol.py) con su millis(), y por servo el PWM, el ángulo estimado,
+si está en marcha y los ms que le quedan. ESP32NeckController las decodifica
+en el hilo lector y las guarda aquí:
+
+    ring = controller.set_telemetry(100)
+    ...
+    data = ring.view()             # Registros en orden, sin copiar
+    plt.plot(data['t_ms'], data['angle'][:, 0])
+
+El array se reserva una vez y cada registro se escribe dos veces (en i y en
+i + capacity), así que las últimas N tramas siempre son un trozo contiguo y
+view() no copia nada. Guardar una trama es un struct.unpack y dos
+asignaciones de registro (~10 µs), poco para el hilo lector a 100-250 Hz.
+
+Las vistas comparten memoria con el buffer: el hilo lector sigue
+escribiendo en ellas cuando el buffer da la vuelta. Para guardar los datos,
+view().copy().
+"""
+import struct
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+import neck_protocol
+
+DEFAULT_CAPACITY = 60000  # 10 minutos a 100 Hz
+
+
+def record_dtype(num_servos: int) -> np.dtype:
+    """Un registro del buffer: hora de llegada al host y la trama decodificada."""
+    n = num_servos
+    return np.dtype([
+        ('host_time', 'f8'),          # time.monotonic() al recibirla
+        ('t_ms', 'u4'),               # millis() del firmware
+        ('pwm', 'u1', (n,)),
+        ('moving', '?', (n,)),
+        ('angle', 'f4', (n,)),        # Grados
+        ('remaining_ms', 'u2', (n,)),
+    ])
+
+
+def wire_struct(num_servos: int) -> struct.Struct:
+    """La trama OP_TELEMETRY completa, de SYNC a CRC8."""
+    servo = neck_protocol.TELEMETRY_SERVO.format.lstrip("<")
+    return struct.Struct(f"{neck_protocol.TELEMETRY_HEADER.format}{servo * num_servos}B")
+
+
+class TelemetryRing:
+    """
+    Buffer circular de tramas de telemetría.
+
+    Args:
+        num_servos: Servos por trama; las de otro tamaño cuentan como errores
+        capacity: Tramas que se conservan (las más antiguas se sobrescriben)
+    """
+
+    def __init__(self, num_servos: int, capacity: int = DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError(f"Capacidad inválida: {capacity}")
+        self.num_servos = num_servos
+        self.capacity = capacity
+        self.dtype = record_dtype(num_servos)
+        self._wire = wire_struct(num_servos)
+        self._data = np.zeros(2 * capacity, dtype=self.dtype)
+        self._next = 0    # Posición de la próxima escritura, en [0, capacity)
+        self._count = 0
+        self.total = 0    # Tramas guardadas desde el principio
+        self.errors = 0   # Tramas descartadas por longitud o CRC
+        self._lock = threading.Lock()
+
+    def append(self, frame: bytes, host_time: Optional[float] = None) -> bool:
+        """
+        Decodifica una trama OP_TELEMETRY y la guarda.
+
+        Returns:
+            bool: False si la trama estaba cortada o falló el CRC
+        """
+        if (len(frame) != self._wire.size or frame[-1] != neck_protocol.crc8(frame[1:-1])
+                or frame[neck_protocol.TELEMETRY_HEADER.size - 1] != self.num_servos):
+            self.errors += 1
+            return False
+        values = self._wire.unpack(frame)
+        servos = values[4:-1]
+        record = (
+            time.monotonic() if host_time is None else host_time,
+            values[2],
+            servos[0::4],
+            [flags & neck_protocol.TELEMETRY_FLAG_MOVING for flags in servos[1::4]],
+            [raw / neck_protocol.ANGLE_SCALE for raw in servos[2::4]],
+            servos[3::4],
+        )
+        with self._lock:
+            i = self._next
+            self._data[i] = record
+            self._data[i + self.capacity] = record
+            self._next = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.total += 1
+        return True
+
+    def view(self, last: Optional[int] = None) -> np.ndarray:
+        """
+        Las últimas `last` tramas (todas las guardadas si es None), de la más
+        antigua a la más nueva, como vista sin copia del buffer.
+        """
+        with self._lock:
+            count = self._count if last is None else max(0, min(last, self._count))
+            end = self._next + self.capacity
+            return self._data[end - count:end]
+
+    def latest(self) -> Optional[np.void]:
+        """Copia de la última trama, o None si aún no ha llegado ninguna."""
+        with self._lock:
+            if not self._count:
+                return None
+            return self._data[self._next + self.capacity - 1].copy()
+
+    def clear(self):
+        """Olvida las tramas guardadas (no reinicia total ni errors)."""
+        with self._lock:
+            self._next = 0
+            self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return (f"<TelemetryRing servos={self.num_servos} {self._count}/{self.capacity} "
+                f"total={self.total} errors={self.errors}>")
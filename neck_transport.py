@@ -0,0 +1,398 @@
+"""
+Transportes de ESP32NeckController.
+
+Un transporte mueve bytes entre el controlador y el firmware. El controlador
+sólo usa esta interfaz, así que la misma API funciona por USB o por la WiFi
+del AP:
+
+- SerialTransport: puerto serie (pyserial), el de siempre
+- HttpTransport: /api/cmd del WebServer del firmware, con keep-alive
+- UdpTransport: datagramas con número de secuencia; para setpoints continuos
+
+    controller = ESP32NeckController("http://10.0.0.1")   # make_transport elige HttpTransport
+
+Los transportes sin canal de vuelta continuo (streams_events = False) sólo
+devuelven lo que el firmware imprime al ejecutar cada comando; el final de
+los movimientos lo estima el controlador con su modelo de estado.
+"""
+import http.client
+import json
+import queue
+import socket
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import serial
+
+import neck_protocol
+
+# Datagramas con respuesta pedida que se recuerdan a la espera del eco
+MAX_UNACKED = 4096
+
+
+class Transport:
+    """
+    Interfaz común de los transportes.
+
+    Atributos de clase:
+        streams_events: El firmware envía líneas en cualquier momento (✅, 🏁)
+        resets_on_open: Abrir reinicia el ESP32 (hay que esperar al arranque)
+        binary_safe: Admite las tramas binarias de neck_protocol.py
+    """
+    streams_events = True
+    resets_on_open = False
+    binary_safe = True
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    @property
+    def is_open(self) -> bool:
+        raise NotImplementedError
+
+    def write(self, data: bytes):
+        raise NotImplementedError
+
+    def flush(self):
+        """Entrega lo escrito desde el último flush."""
+
+    def readline(self) -> bytes:
+        """
+        Siguiente línea del firmware (o trama de telemetría, ver
+        neck_protocol.split_serial), o b'' si no llega nada a tiempo.
+        """
+        raise NotImplementedError
+
+    def reset_input_buffer(self):
+        """Descarta lo recibido y no leído."""
+
+    @property
+    def in_waiting(self) -> int:
+        """Líneas (o bytes) recibidas y aún no leídas."""
+        return 0
+
+    @property
+    def out_waiting(self) -> int:
+        """Bytes escritos pendientes de salir."""
+        return 0
+
+    def delivery_delay(self, size: int) -> float:
+        """Segundos estimados hasta que el firmware recibe un comando de `size` bytes."""
+        return 0.0
+
+
+class SerialTransport(Transport):
+    """
+    Puerto serie con pyserial.
+
+    readline() separa las líneas y las tramas de telemetría con
+    neck_protocol.split_serial sobre un buffer propio: una trama puede
+    contener bytes '\\n' y una línea a medias se guarda para la siguiente
+    llamada en vez de devolverse cortada.
+
+    Args:
+        port: Puerto serie (ej: 'COM3', '/dev/ttyUSB0')
+        baudrate: Velocidad de comunicación
+        timeout: Timeout de lectura en segundos
+    """
+    resets_on_open = True
+
+    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.connection: Optional[serial.Serial] = None
+        self._rx = bytearray()
+
+    def open(self):
+        self._rx.clear()
+        self.connection = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=self.timeout)
+
+    def close(self):
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.connection and self.connection.is_open)
+
+    def write(self, data: bytes):
+        self.connection.write(data)
+
+    def flush(self):
+        self.connection.flush()
+
+    def readline(self) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        item = neck_protocol.split_serial(self._rx)
+        while item is None:
+            # read() espera como mucho timeout al primer byte
+            chunk = self.connection.read(max(1, self.connection.in_waiting))
+            self._rx.extend(chunk)
+            item = neck_protocol.split_serial(self._rx)
+            if item is None and (not chunk or time.monotonic() >= deadline):
+                return b""
+        return item
+
+    def reset_input_buffer(self):
+        self.connection.reset_input_buffer()
+        self._rx.clear()
+
+    @property
+    def in_waiting(self) -> int:
+        return self.connection.in_waiting + len(self._rx)
+
+    @property
+    def out_waiting(self) -> int:
+        return self.connection.out_waiting
+
+    def delivery_delay(self, size: int) -> float:
+        return size * 10 / self.baudrate  # 8N1
+
+    def __repr__(self) -> str:
+        return f"<SerialTransport port='{self.port}' baudrate={self.baudrate}>"
+
+
+class HttpTransport(Transport):
+    """
+    Comandos por HTTP contra /api/cmd del firmware.
+
+    Lo que se escribe entre dos flush viaja en una sola petición POST (un
+    comando por línea) y la respuesta trae las líneas que imprimió el
+    firmware. La conexión TCP se reutiliza mientras el servidor la mantenga
+    abierta y se reabre sola si la cierra (el WebServer del ESP32 cierra
+    tras cada respuesta).
+
+    Args:
+        url: URL base del firmware (ej: 'http://10.0.0.1')
+        timeout: Timeout de cada petición en segundos
+        poll_interval: Espera máxima de readline() sin líneas pendientes
+    """
+    streams_events = False
+    binary_safe = False
+
+    def __init__(self, url: str, timeout: float = 2.0, poll_interval: float = 0.01):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.requests = 0
+        self.reconnects = 0
+        self._connection: Optional[http.client.HTTPConnection] = None
+        self._pending: List[str] = []
+        self._lines: "queue.Queue[bytes]" = queue.Queue()
+        self._latency: Optional[float] = None  # Media móvil de ida y vuelta
+
+    def open(self):
+        self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._connect()
+
+    def _connect(self):
+        self._connection.connect()
+        # Peticiones pequeñas: que no esperen al ACK retardado del servidor (Nagle)
+        self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._connection is not None
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise ConnectionError("Transporte HTTP cerrado")
+        text = data.decode("utf-8")
+        self._pending.extend(line for line in text.split("\n") if line.strip())
+
+    def flush(self):
+        if not self._pending:
+            return
+        body = "\n".join(self._pending).encode()
+        self._pending = []
+        start = time.perf_counter()
+        reply = self._post(body)
+        elapsed = time.perf_counter() - start
+        self._latency = elapsed if self._latency is None else 0.8 * self._latency + 0.2 * elapsed
+        for line in reply.get('out', []):
+            self._lines.put(line.encode())
+
+    def _post(self, body: bytes) -> dict:
+        for attempt in (1, 2):
+            try:
+                if self._connection.sock is None:
+                    # El servidor respondió con Connection: close (o se cortó): reabrir
+                    self.reconnects += 1
+                    self._connect()
+                self._connection.request("POST", "/api/cmd?r=1", body=body,
+                                         headers={"Content-Type": "text/plain"})
+                response = self._connection.getresponse()
+                payload = response.read()
+                break
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionResetError, BrokenPipeError):
+                # El servidor cerró la conexión keep-alive: reabrir y reintentar una vez
+                if attempt == 2:
+                    raise
+                self._connection.close()
+        self.requests += 1
+        if response.status == 204 or not payload:
+            return {}
+        if response.status != 200:
+            raise ConnectionError(f"HTTP {response.status}: {payload[:80]!r}")
+        return json.loads(payload)
+
+    def readline(self) -> bytes:
+        try:
+            return self._lines.get(timeout=self.poll_interval)
+        except queue.Empty:
+            return b""
+
+    def reset_input_buffer(self):
+        while not self._lines.empty():
+            self._lines.get_nowait()
+
+    @property
+    def in_waiting(self) -> int:
+        return self._lines.qsize()
+
+    def delivery_delay(self, size: int) -> float:
+        # Media ida y vuelta: la petición llega a mitad del viaje
+        return self._latency / 2 if self._latency is not None else 0.0
+
+    def __repr__(self) -> str:
+        return f"<HttpTransport url='{self.url}'>"
+
+
+class UdpTransport(Transport):
+    """
+    Comandos por UDP con el formato de datagrama de neck_protocol.py.
+
+    Lo escrito entre dos flush sale en un datagrama con el siguiente número
+    de secuencia (en varios si no cabe). Cada write() es un comando o una
+    trama entera y nunca se parte entre datagramas: el firmware no continúa
+    un comando en el datagrama siguiente. No hay reintentos: un datagrama
+    perdido o atrasado se pierde y gana el siguiente, que es lo que interesa
+    para setpoints de seguimiento a ritmo fijo. Las órdenes sueltas (A, S)
+    conviene enviarlas por serie o HTTP si no se puede perder ninguna.
+
+    Args:
+        url: 'udp://host:puerto' (puerto por defecto neck_protocol.UDP_PORT)
+        poll_interval: Espera máxima de readline() sin datagramas
+        request_ack: Pedir respuesta a cada datagrama para medir entrega y
+            latencia (acked, rtt_samples)
+    """
+    streams_events = False
+
+    def __init__(self, url: str, poll_interval: float = 0.01, request_ack: bool = False):
+        parts = urlsplit(url if "://" in url else f"udp://{url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or neck_protocol.UDP_PORT
+        self.poll_interval = poll_interval
+        self.request_ack = request_ack
+        self.seq = 0
+        self.sent = 0
+        self.acked = 0
+        self.rtt_samples: Deque[float] = deque(maxlen=10000)
+        self._socket: Optional[socket.socket] = None
+        self._pending: List[bytes] = []  # Un comando o trama por write()
+        self._sent_at: Dict[int, float] = {}
+        self._lines: Deque[bytes] = deque()
+        self._latency: Optional[float] = None
+
+    def open(self):
+        # Socket nuevo = puerto de origen nuevo: el firmware reinicia la secuencia
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.connect((self.host, self.port))
+        self._socket.settimeout(self.poll_interval)
+        self.seq = 0
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._socket is not None
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise ConnectionError("Transporte UDP cerrado")
+        room = neck_protocol.UDP_MAX_LEN - neck_protocol.UDP_HEADER.size
+        if len(data) > room:
+            raise ValueError(f"{len(data)} B no caben en un datagrama (máximo {room} B)")
+        self._pending.append(bytes(data))
+
+    def flush(self):
+        room = neck_protocol.UDP_MAX_LEN - neck_protocol.UDP_HEADER.size
+        while self._pending:
+            # Tantos comandos enteros como quepan (las tramas CRC8 pueden llevar 0x0A)
+            count, size = 0, 0
+            while count < len(self._pending) and size + len(self._pending[count]) <= room:
+                size += len(self._pending[count])
+                count += 1
+            chunk = b"".join(self._pending[:count])
+            del self._pending[:count]
+            self.seq = (self.seq + 1) % neck_protocol.SEQ_MODULO
+            if self.request_ack:
+                self._sent_at[self.seq] = time.perf_counter()
+                if len(self._sent_at) > MAX_UNACKED:
+                    del self._sent_at[next(iter(self._sent_at))]  # Respuesta perdida
+            self._socket.send(neck_protocol.encode_datagram(self.seq, chunk, self.request_ack))
+            self.sent += 1
+
+    def readline(self) -> bytes:
+        if self._lines:
+            return self._lines.popleft()
+        try:
+            data = self._socket.recv(65535)
+        except socket.timeout:
+            return b""
+        try:
+            seq, _, payload = neck_protocol.decode_datagram(data)
+        except ValueError:
+            return b""
+        sent_at = self._sent_at.pop(seq, None)
+        if sent_at is not None:
+            rtt = time.perf_counter() - sent_at
+            self.acked += 1
+            self.rtt_samples.append(rtt)
+            self._latency = rtt if self._latency is None else 0.8 * self._latency + 0.2 * rtt
+        self._lines.extend(line for line in payload.split(b"\n") if line)
+        return self._lines.popleft() if self._lines else b""
+
+    def reset_input_buffer(self):
+        self._lines.clear()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._lines)
+
+    def delivery_delay(self, size: int) -> float:
+        return self._latency / 2 if self._latency is not None else 0.0
+
+    def __repr__(self) -> str:
+        return f"<UdpTransport url='{self.url}'>"
+
+
+def make_transport(port: str, baudrate: int = 115200, timeout: float = 1.0) -> Transport:
+    """
+    Transporte según el puerto: 'http://...' usa HttpTransport, 'udp://...'
+    UdpTransport y cualquier otra cosa se abre como puerto serie.
+    """
+    if port.startswith("http://"):
+        return HttpTransport(port, timeout=max(timeout, 2.0))
+    if port.startswith("udp://"):
+        return UdpTransport(port)
+    return SerialTransport(port, baudrate, timeout)
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Caracterización de la velocidad de los servos.
+
+Recorre el rango de PWM de cada servo en los dos sentidos con movimientos
+'A' de un solo servo: el ángulo de cada movimiento se elige para que las
+tablas del firmware usen el PWM que se quiere medir. El tiempo de giro sale
+de los eventos ▶️ y ✅ del firmware, descontando lo que el perfil pierde en
+las rampas de aceleración (motion_planner.py), y el ángulo girado de una sonda (el
+SimulatedServo del emulador, o el operador midiendo a mano). Con esas
+muestras se ajusta por mínimos cuadrados (np.polyfit) la curva
+PWM→velocidad de cada sentido y se escribe en neck_config.yaml:
+
+    servo_settings.N.velocity_table   grados/s para cada PWM
+    servo_settings.N.deadzone         primer PWM que de verdad mueve el servo
+    servo_settings.N.degrees_per_second, calibration_factor
+    servo_defaults.calibration_factor calibrationFactor global del firmware
+
+servo_tables.py usa la velocity_table para calcular la duración de cada
+movimiento, así que ya no hace falta inflarlos con un factor conservador:
+el factor global pasa a 1.0. Antes de escribir se guarda una copia en
+neck_config.yaml.bak. Después hay que regenerar y flashear el firmware.
+
+    python servo_characterize.py --emulate      # contra neck_emulator.py
+    python servo_characterize.py -p /dev/esp32  # hardware, ángulos a mano
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import yaml
+
+import motion_planner
+import neck_config
+import servo_tables
+from epj_neck import ESP32NeckController, EventType, NeckEvent
+from neck_emulator import PtyEmulator, SimulatedServo
+
+WORKDIR = Path(__file__).parent.absolute()
+DEFAULT_CONFIG = WORKDIR / 'neck_config.yaml'
+
+MIN_SPEED_FRACTION = 0.05  # Por debajo de esta fracción de la máxima, el servo no se mueve
+FIT_DEGREE = 3
+VERIFY_ANGLES = [10, -10, 30, -30, 60, -60, 120, -120]
+TABLE_ITEMS_PER_LINE = 8
+
+
+@dataclass
+class Sample:
+    """Un movimiento medido."""
+    servo: int
+    pwm: int
+    angle: float         # Ángulo pedido con 'A'
+    duration_ms: int     # Duración que anunció el firmware en el ▶️
+    elapsed: float       # Segundos entre el ▶️ y el ✅
+    displacement: float  # Grados girados según la sonda
+    ramp_loss: float = 0.0  # Segundos que el perfil pierde en las rampas frente a ir siempre al pico
+
+    @property
+    def speed(self) -> float:
+        """Velocidad medida en grados/s (positiva en los dos sentidos)."""
+        elapsed = self.elapsed - self.ramp_loss
+        return abs(self.displacement) / elapsed if elapsed > 0 else 0.0
+
+
+class EmulatedProbe:
+    """Lee el ángulo real de los SimulatedServo del emulador, como un encoder."""
+
+    def __init__(self, servos: Sequence[SimulatedServo]):
+        self.servos = servos
+
+    def read(self, idx: int) -> float:
+        return self.servos[idx].angle
+
+
+class ManualProbe:
+    """Pide al operador el ángulo del servo (p. ej. con una marca y un transportador)."""
+
+    def read(self, idx: int) -> float:
+        while True:
+            text = input(f"📐 Ángulo actual del servo {idx + 1} (grados, acumulado): ")
+            try:
+                return float(text)
+            except ValueError:
+                print(f"❌ Valor no válido: {text}")
+
+
+class _MoveTimer:
+    """Guarda los eventos ▶️ y ✅ de un servo."""
+
+    def __init__(self, idx: int):
+        self.idx = idx
+        self.started: Optional[NeckEvent] = None
+        self.finished: Optional[NeckEvent] = None
+        self.done = threading.Event()
+
+    def __call__(self, event: NeckEvent):
+        if event.servo != self.idx:
+            return
+        if event.type == EventType.MOVE_STARTED:
+            self.started = event
+        elif event.type == EventType.MOVE_FINISHED and self.started is not None:
+            self.finished = event
+            self.done.set()
+
+
+def sweep_angles(tables: servo_tables.ServoTables, idx: int, step: int = 1) -> List[Tuple[int, float]]:
+    """
+    (PWM, ángulo) que recorren los PWM de las tablas de un servo, en los dos sentidos.
+
+    Para cada PWM se toma el mayor ángulo que lo usa: el movimiento más largo
+    se mide mejor.
+    """
+    points = []
+    for lut, sign in ((tables.pwm_cw[idx], 1), (tables.pwm_ccw[idx], -1)):
+        longest: Dict[int, int] = {}
+        for k in range(int(servo_tables.MIN_MOVE_THRESHOLD * servo_tables.LUT_STEPS), len(lut)):
+            longest[lut[k]] = k
+        levels = sorted(longest, key=lambda pwm: abs(pwm - tables.stop_pwm[idx]))
+        for pwm in levels[::step] + ([levels[-1]] if (len(levels) - 1) % step else []):
+            points.append((pwm, sign * longest[pwm] / servo_tables.LUT_STEPS))
+    return points
+
+
+def ramp_correction(tables: servo_tables.ServoTables, idx: int, angle: float) -> Tuple[int, float]:
+    """
+    (PWM al pico, segundos perdidos en las rampas) de un movimiento 'A' desde
+    parado, según el perfil que planifica el firmware.
+
+    Con la velocidad proporcional al PWM durante las rampas, el servo gira lo
+    mismo que si fuera al pico durante |ángulo| / pico; el resto de la
+    duración es la pérdida. En movimientos cortos el perfil es triangular y
+    el pico no llega al PWM de crucero de las tablas.
+    """
+    profile = motion_planner.plan_move(tables, idx, 0.0, 0.0, angle, tables.calibration_factor)
+    t_peak = profile.segments[0][0]  # Fin de la aceleración
+    pwm = motion_planner.profile_pwm(tables.pwm_cw[idx], tables.pwm_ccw[idx], tables.stop_pwm[idx],
+                                     profile, t_peak)
+    peak = profile.peak
+    loss_ms = profile.total_ms - abs(angle) / peak if peak > 0 else 0.0
+    return pwm, loss_ms / 1000
+
+
+class VelocityCharacterizer:
+    """
+    Mide la velocidad de los servos con movimientos 'A' de un solo servo.
+
+    Args:
+        controller: Controlador ya conectado
+        tables: Tablas del firmware que está corriendo
+        probe: Sonda con read(idx) -> ángulo real en grados
+        repeats: Movimientos por PWM
+        timeout: Espera máxima del ✅ de cada movimiento
+    """
+
+    def __init__(self, controller: ESP32NeckController, tables: servo_tables.ServoTables,
+                 probe, repeats: int = 1, timeout: float = 5.0):
+        self.controller = controller
+        self.tables = tables
+        self.probe = probe
+        self.repeats = repeats
+        self.timeout = timeout
+
+    def timed_move(self, idx: int, angle: float) -> Optional[Tuple[NeckEvent, NeckEvent, float]]:
+        """Mueve un servo y devuelve (▶️, ✅, grados girados), o None si no terminó."""
+        angles = [0.0] * self.controller.num_servos
+        angles[idx] = angle
+        timer = _MoveTimer(idx)
+        before = self.probe.read(idx)
+        self.controller.add_listener(timer)
+        try:
+            if self.controller.move_angles(angles) is None or not timer.done.wait(self.timeout):
+                return None
+        finally:
+            self.controller.remove_listener(timer)
+        return timer.started, timer.finished, self.probe.read(idx) - before
+
+    def sweep(self, idx: int, step: int = 1) -> List[Sample]:
+        samples = []
+        for pwm, angle in sweep_angles(self.tables, idx, step):
+            for _ in range(self.repeats):
+                result = self.timed_move(idx, angle)
+                if result is None:
+                    print(f"⚠️  Servo {idx + 1}: sin ✅ para PWM {pwm}")
+                    continue
+                started, finished, displacement = result
+                peak_pwm, ramp_loss = ramp_correction(self.tables, idx, angle)
+                samples.append(Sample(idx, peak_pwm, angle, started.duration_ms,
+                                      finished.timestamp - started.timestamp, displacement, ramp_loss))
+        return samples
+
+    def move_errors(self, idx: int, angles: Sequence[float] = VERIFY_ANGLES) -> List[float]:
+        """Error (grados reales - pedidos) de una serie de movimientos."""
+        errors = []
+        for angle in angles:
+            result = self.timed_move(idx, angle)
+            if result is not None:
+                errors.append(result[2] - angle)
+        return errors
+
+
+@dataclass
+class DirectionFit:
+    """Curva ajustada de un sentido de giro."""
+    deadzone: int               # PWM desde stop hasta el primero que mueve
+    table: Dict[int, float]     # PWM -> grados/s
+    rms: float                  # Error cuadrático medio del ajuste en grados/s
+    samples: int
+
+
+def fit_direction(samples: Sequence[Sample], stop_pwm: int, limit_pwm: int,
+                  degree: int = FIT_DEGREE) -> DirectionFit:
+    """
+    Ajusta velocidad = polinomio(|PWM - stop|) con las muestras que se movieron.
+
+    La tabla va del primer PWM que mueve el servo hasta limit_pwm; se fuerza
+    a ser positiva y creciente para que las duraciones sean coherentes.
+
+    Raises:
+        ValueError: Si no hay al menos dos PWM distintos en movimiento
+    """
+    offsets = np.array([abs(s.pwm - stop_pwm) for s in samples], dtype=float)
+    speeds = np.array([s.speed for s in samples], dtype=float)
+    moving = speeds > MIN_SPEED_FRACTION * speeds.max(initial=0.0)
+    if len(np.unique(offsets[moving])) < 2:
+        raise ValueError("no hay suficientes muestras en movimiento para ajustar la curva")
+
+    degree = min(degree, len(np.unique(offsets[moving])) - 1)
+    coeffs = np.polyfit(offsets[moving], speeds[moving], degree)
+    rms = float(np.sqrt(np.mean((np.polyval(coeffs, offsets[moving]) - speeds[moving]) ** 2)))
+
+    deadzone = int(offsets[moving].min())
+    grid = np.arange(deadzone, abs(limit_pwm - stop_pwm) + 1)
+    fitted = np.polyval(coeffs, grid)
+    fitted = np.maximum.accumulate(np.maximum(fitted, speeds[moving].min() / 2))
+    sign = 1 if limit_pwm > stop_pwm else -1
+    table = {int(stop_pwm + sign * o): round(float(v), 1) for o, v in zip(grid, fitted)}
+    return DirectionFit(deadzone, table, rms, int(moving.sum()))
+
+
+def fit_servo(samples: Sequence[Sample], calibration: servo_tables.ServoCalibration,
+              degree: int = FIT_DEGREE) -> Dict:
+    """Ajusta los dos sentidos y devuelve las claves a escribir en servo_settings."""
+    c = calibration
+    cw = fit_direction([s for s in samples if s.angle > 0], c.stop_pwm, c.max_cw_pwm, degree)
+    ccw = fit_direction([s for s in samples if s.angle < 0], c.stop_pwm, c.max_ccw_pwm, degree)
+    return {
+        'deadzone': max(cw.deadzone, ccw.deadzone),
+        'degrees_per_second': round(cw.table[c.max_cw_pwm]),
+        'calibration_factor': 1.0,
+        'velocity_table': {'cw': cw.table, 'ccw': ccw.table},
+        'fits': (cw, ccw),
+    }
+
+
+# ---------- Escritura del YAML ----------
+# Se edita el texto en lugar de volcar el YAML para no perder los comentarios
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(' '))
+
+
+def _is_content(line: str) -> bool:
+    stripped = line.strip()
+    return bool(stripped) and not stripped.startswith('#')
+
+
+def _block_end(lines: List[str], start: int) -> int:
+    """Índice tras el bloque cuya clave está en lines[start]."""
+    indent = _indent(lines[start])
+    end = start + 1
+    for i in range(start + 1, len(lines)):
+        if _is_content(lines[i]):
+            if _indent(lines[i]) <= indent:
+                break
+            end = i + 1
+    return end
+
+
+def _find_key(lines: List[str], start: int, end: int, indent: int, key: str) -> Optional[int]:
+    pattern = re.compile(rf"^ {{{indent}}}{re.escape(str(key))}:(\s|$)")
+    for i in range(start, end):
+        if pattern.match(lines[i]):
+            return i
+    return None
+
+
+def _set_scalar(lines: List[str], start: int, end: int, indent: int, key: str, value) -> int:
+    """Cambia (o añade al final del bloque) 'key: value' conservando su comentario; devuelve el nuevo fin."""
+    i = _find_key(lines, start, end, indent, key)
+    if i is None:
+        lines.insert(end, f"{' ' * indent}{key}: {value}\n")
+        return end + 1
+    match = re.match(r"^(\s*[^:]+:\s*)([^#\n]*?)(\s*#.*)?(\n?)$", lines[i])
+    lines[i] = f"{match.group(1)}{value}{match.group(3) or ''}{match.group(4)}"
+    return end
+
+
+def _flow_mapping(table: Dict[int, float], indent: int) -> str:
+    items = [f"{pwm}: {dps}" for pwm, dps in table.items()]
+    rows = [', '.join(items[i:i + TABLE_ITEMS_PER_LINE]) for i in range(0, len(items), TABLE_ITEMS_PER_LINE)]
+    return '{' + (',\n' + ' ' * indent).join(rows) + '}'
+
+
+def _set_velocity_table(lines: List[str], start: int, end: int, indent: int, table: Dict) -> int:
+    """Sustituye (o añade) el bloque velocity_table; devuelve el nuevo fin."""
+    i = _find_key(lines, start, end, indent, 'velocity_table')
+    if i is not None:
+        block_end = _block_end(lines, i)
+        del lines[i:block_end]
+        end -= block_end - i
+    else:
+        i = end
+    pad = ' ' * indent
+    block = [f"{pad}velocity_table:  # servo_characterize.py: grados/s por PWM\n"]
+    for direction in ('cw', 'ccw'):
+        block.append(f"{pad}  {direction}: {_flow_mapping(table[direction], indent + 4)}\n")
+    lines[i:i] = block
+    return end + len(block)
+
+
+def update_config_text(text: str, results: Dict[str, Dict], global_factor: Optional[float] = None) -> str:
+    """
+    Escribe los resultados de fit_servo en el texto de neck_config.yaml.
+
+    Args:
+        text: Contenido actual del YAML
+        results: Clave del servo en servo_settings -> resultado de fit_servo
+        global_factor: Nuevo servo_defaults.calibration_factor (None = no tocarlo)
+
+    Raises:
+        ValueError: Si falta alguna sección, el resultado no se lee igual o
+            la configuración resultante no es válida (neck_config.ConfigError)
+    """
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+
+    section = _find_key(lines, 0, len(lines), 0, 'servo_settings')
+    if section is None:
+        raise ValueError("no hay sección servo_settings")
+    for key, result in results.items():
+        start = _find_key(lines, section + 1, _block_end(lines, section), 2, key)
+        if start is None:
+            raise ValueError(f"servo {key} no encontrado en servo_settings")
+        end = _block_end(lines, start)
+        for name in ('degrees_per_second', 'calibration_factor', 'deadzone'):
+            end = _set_scalar(lines, start + 1, end, 4, name, result[name])
+        _set_velocity_table(lines, start + 1, end, 4, result['velocity_table'])
+
+    if global_factor is not None:
+        section = _find_key(lines, 0, len(lines), 0, 'servo_defaults')
+        if section is None:
+            lines[0:0] = ["servo_defaults:\n"]
+            section = 0
+        _set_scalar(lines, section + 1, _block_end(lines, section), 2, 'calibration_factor', global_factor)
+
+    new_text = ''.join(lines)
+    config = yaml.safe_load(new_text)
+    neck_config.parse_config(config, "el YAML actualizado")
+    for key, result in results.items():
+        settings = next(s for k, s in config['servo_settings'].items() if str(k) == str(key))
+        for name in ('degrees_per_second', 'calibration_factor', 'deadzone', 'velocity_table'):
+            if settings.get(name) != result[name]:
+                raise ValueError(f"servo {key}: {name} no se escribió correctamente")
+    return new_text
+
+
+def write_config(path: Path, text: str) -> Path:
+    """Escribe el YAML guardando antes una copia en <nombre>.bak; devuelve la copia."""
+    backup = path.with_name(path.name + '.bak')
+    shutil.copy2(path, backup)
+    path.write_text(text)
+    return backup
+
+
+# ---------- Programa ----------
+
+def characterize(controller: ESP32NeckController, tables: servo_tables.ServoTables, probe,
+                 servo_keys: List[str], indices: List[int], step: int, repeats: int,
+                 degree: int) -> Dict[str, Dict]:
+    characterizer = VelocityCharacterizer(controller, tables, probe, repeats)
+    results = {}
+    for idx in indices:
+        print(f"🔍 Servo {idx + 1}: midiendo...")
+        samples = characterizer.sweep(idx, step)
+        try:
+            result = fit_servo(samples, tables.calibrations[idx], degree)
+        except ValueError as e:
+            print(f"❌ Servo {idx + 1}: {e}")
+            continue
+        cw, ccw = result['fits']
+        print(f"✅ Servo {idx + 1}: {len(samples)} muestras, zona muerta {result['deadzone']} PWM, "
+              f"máx {cw.table[max(cw.table)]:.0f}/{ccw.table[min(ccw.table)]:.0f} °/s, "
+              f"RMS {cw.rms:.1f}/{ccw.rms:.1f} °/s (↻/↺)")
+        results[servo_keys[idx]] = result
+    return results
+
+
+def _report_errors(label: str, errors: List[float]):
+    if errors:
+        print(f"   {label}: error medio {np.mean(np.abs(errors)):.1f}°, máximo {np.max(np.abs(errors)):.1f}°")
+
+
+def verify_emulated(new_text: str, servos: List[SimulatedServo], indices: List[int]):
+    """Repite unos movimientos con la configuración nueva sobre los mismos servos simulados."""
+    fd, name = tempfile.mkstemp(suffix='.yaml')
+    new_config = Path(name)
+    with os.fdopen(fd, 'w') as f:
+        f.write(new_text)
+    try:
+        with PtyEmulator(str(new_config), pacing=False, servos=servos) as emulator:
+            tables = servo_tables.ServoTables.from_config(neck_config.load_config(new_config))
+            with ESP32NeckController(emulator.port, reset_delay=0, tables=tables) as controller:
+                characterizer = VelocityCharacterizer(controller, tables, EmulatedProbe(servos))
+                return {idx: characterizer.move_errors(idx) for idx in indices}
+    finally:
+        new_config.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide la curva PWM→velocidad de cada servo y la guarda en el YAML")
+    parser.add_argument("-c", "--config", type=str, default=None,
+                        help="Archivo de configuración YAML (por defecto: neck_config.yaml)")
+    parser.add_argument("-p", "--port", type=str, default=None,
+                        help="Puerto del ESP32 (por defecto: board_settings.port)")
+    parser.add_argument("--emulate", action="store_true",
+                        help="Caracterizar los servos simulados de neck_emulator.py")
+    parser.add_argument("--servos", type=int, nargs='+', default=None,
+                        help="Servos a caracterizar, empezando en 1 (por defecto: todos)")
+    parser.add_argument("--step", type=int, default=2,
+                        help="Medir uno de cada N niveles de PWM (default: 2)")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="Movimientos por nivel de PWM (default: 1)")
+    parser.add_argument("--degree", type=int, default=FIT_DEGREE,
+                        help=f"Grado del polinomio ajustado (default: {FIT_DEGREE})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Mostrar el resultado sin escribir el YAML")
+    args = parser.parse_args()
+
+    config_file = Path(args.config) if args.config else DEFAULT_CONFIG
+    text = config_file.read_text()
+    config = neck_config.load_config(config_file)
+    tables = servo_tables.ServoTables.from_config(config)
+    servo_keys = [servo.key for servo in config.servos]
+    indices = [n - 1 for n in args.servos] if args.servos else list(range(len(servo_keys)))
+    if any(not 0 <= idx < len(servo_keys) for idx in indices):
+        print(f"❌ Servos fuera de rango: {args.servos} (hay {len(servo_keys)})")
+        sys.exit(1)
+
+    emulator = None
+    if args.emulate:
+        servos = [SimulatedServo.nominal(c) for c in tables.calibrations]
+        emulator = PtyEmulator(str(config_file), pacing=False, servos=servos)
+        port = emulator.start()
+        probe = EmulatedProbe(servos)
+    else:
+        port = args.port or config.board.port
+        probe = ManualProbe()
+        print("📐 Marca la posición de cada servo: se pedirá su ángulo antes y después de cada movimiento")
+
+    try:
+        controller = ESP32NeckController(port, reset_delay=0 if args.emulate else 2.0, tables=tables)
+        if not controller.connect():
+            sys.exit(1)
+        try:
+            started = time.monotonic()
+            results = characterize(controller, tables, probe, servo_keys, indices,
+                                   args.step, args.repeats, args.degree)
+            before = ({idx: VelocityCharacterizer(controller, tables, probe).move_errors(idx)
+                       for idx in indices} if args.emulate else {})
+        finally:
+            controller.disconnect()
+    finally:
+        if emulator:
+            emulator.stop()
+    if not results:
+        sys.exit(1)
+    print(f"⏱️  Medida completada en {time.monotonic() - started:.1f} s")
+
+    # Con todos los servos caracterizados sobra el margen global
+    all_done = all(servo.characterized for servo in config.servos if servo.key not in results)
+    new_text = update_config_text(text, results, 1.0 if all_done else None)
+
+    if args.emulate:
+        after = verify_emulated(new_text, servos, indices)
+        print("🎯 Movimientos de prueba (ángulo real - pedido):")
+        for idx in indices:
+            print(f"  Servo {idx + 1}")
+            _report_errors("antes  ", before.get(idx, []))
+            _report_errors("después", after.get(idx, []))
+
+    if args.dry_run:
+        print(new_text)
+        return
+    backup = write_config(config_file, new_text)
+    print(f"💾 {config_file} actualizado (copia en {backup.name}). "
+          f"Regenera y flashea el firmware: python flash_firmware.py flash")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Tablas de calibración por servo.
+
+Cada servo tiene su propia entrada en servo_settings (PWM de parada y
+extremos, zona muerta, velocidad), así que el PWM y la duración de un
+movimiento se precalculan por servo en tablas indexadas por el ángulo:
+
+    PWM_CW_LUT[servo][k], PWM_CCW_LUT[servo][k]   PWM para |ángulo| = k / LUT_STEPS
+    DURATION_CW_LUT[servo][k], DURATION_CCW_LUT[servo][k]
+                                                 ms para |ángulo| = k / LUT_STEPS
+
+ino_generator.py las emite como arrays PROGMEM y el firmware las indexa en
+vez de calcular el PWM y la duración en cada comando; neck_emulator.py y el
+modelo de estado de epj_neck.py usan estas mismas funciones, así que los tres
+calculan igual.
+
+Las tablas cubren 0..LUT_MAX_DEG con la resolución del protocolo binario
+(1/ANGLE_SCALE grados). A partir de LUT_MAX_DEG el PWM está saturado y la
+duración sigue creciendo con el MS_PER_DEG del servo.
+
+Cada servo tiene además su ramp_time_ms (RAMP_MS[servo]): lo que tarda en
+pasar de parado a la velocidad máxima. Con él motion_planner.py y el
+firmware calculan la aceleración de las rampas.
+
+Sin velocity_table, un servo gira a degrees_per_second sea cual sea el PWM
+(el modelo de siempre). Con la velocity_table que escribe
+servo_characterize.py, la duración de cada entrada sale de la velocidad
+medida para su PWM.
+
+Las cuentas en float reproducen el float de 32 bits del ESP32.
+"""
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import neck_protocol
+
+if TYPE_CHECKING:
+    from neck_config import NeckConfig, ServoSettings
+
+LUT_STEPS = neck_protocol.ANGLE_SCALE  # Entradas por grado
+LUT_MAX_DEG = 90  # El PWM llega a su extremo a 90°
+LUT_SIZE = LUT_MAX_DEG * LUT_STEPS + 1
+MIN_MOVE_THRESHOLD = 0.5  # Igual que MIN_MOVE_THRESHOLD en el firmware
+DEFAULT_CALIBRATION_FACTOR = 1.2  # calibrationFactor global si el YAML no lo fija
+DEFAULT_RAMP_MS = 50  # ms de 0 a la velocidad máxima si el YAML no fija ramp_time_ms
+
+
+def _f32(value: float) -> float:
+    """Redondea a float de 32 bits como hace el ESP32."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+@dataclass(frozen=True)
+class ServoCalibration:
+    """Constantes de un servo de servo_settings."""
+    stop_pwm: int
+    max_cw_pwm: int
+    max_ccw_pwm: int
+    deadzone: int
+    ms_per_deg: int  # Con el PWM saturado, ya con el calibration_factor del YAML
+    calibration_factor: float = 1.0
+    velocity_cw: Tuple[Tuple[int, float], ...] = ()  # (PWM, grados/s) medidos
+    velocity_ccw: Tuple[Tuple[int, float], ...] = ()
+    ramp_ms: float = DEFAULT_RAMP_MS  # ms de las rampas de aceleración (motion_planner.py)
+
+    @classmethod
+    def from_settings(cls, settings: "ServoSettings") -> "ServoCalibration":
+        """Calibración de un servo de neck_config.NeckConfig.servos."""
+        return cls(
+            stop_pwm=settings.pwm.stop,
+            max_cw_pwm=settings.pwm.max_cw,
+            max_ccw_pwm=settings.pwm.max_ccw,
+            deadzone=settings.deadzone,
+            ms_per_deg=int(1000 / settings.degrees_per_second * settings.calibration_factor),
+            calibration_factor=settings.calibration_factor,
+            velocity_cw=settings.velocity_cw,
+            velocity_ccw=settings.velocity_ccw,
+            ramp_ms=float(settings.ramp_time_ms),
+        )
+
+
+def velocity_at(points: Sequence[Tuple[int, float]], pwm: int) -> float:
+    """Velocidad (grados/s) para un PWM, interpolando entre los puntos de la tabla."""
+    if pwm <= points[0][0]:
+        return points[0][1]
+    for (p0, v0), (p1, v1) in zip(points, points[1:]):
+        if pwm <= p1:
+            return v0 + (v1 - v0) * (pwm - p0) / (p1 - p0)
+    return points[-1][1]
+
+
+def lut_index(angle_deg: float) -> int:
+    """Entrada de las tablas para un ángulo (redondeada y saturada a LUT_SIZE - 1)."""
+    k = int(_f32(_f32(_f32(abs(angle_deg)) * LUT_STEPS) + 0.5))
+    return k if k < LUT_SIZE else LUT_SIZE - 1
+
+
+@lru_cache(maxsize=None)
+def pwm_lut(calibration: ServoCalibration) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """(PWM_CW_LUT, PWM_CCW_LUT) de un servo; por debajo del umbral, STOP."""
+    c = calibration
+    cw, ccw = [], []
+    for k in range(LUT_SIZE):
+        if k < MIN_MOVE_THRESHOLD * LUT_STEPS:
+            cw.append(c.stop_pwm)
+            ccw.append(c.stop_pwm)
+            continue
+        scale = min(1.0, k / LUT_STEPS / LUT_MAX_DEG)
+        up = c.stop_pwm + c.deadzone + int((c.max_cw_pwm - c.stop_pwm - c.deadzone) * scale)
+        down = c.stop_pwm - c.deadzone - int((c.stop_pwm - c.max_ccw_pwm - c.deadzone) * scale)
+        cw.append(max(c.max_ccw_pwm, min(c.max_cw_pwm, up)))
+        ccw.append(max(c.max_ccw_pwm, min(c.max_cw_pwm, down)))
+    return tuple(cw), tuple(ccw)
+
+
+@lru_cache(maxsize=None)
+def duration_lut(ms_per_deg: float) -> Tuple[float, ...]:
+    """Tabla de duraciones a velocidad constante: ms sin calibrationFactor, en float de 32 bits."""
+    return tuple(_f32(_f32(k / LUT_STEPS) * _f32(ms_per_deg)) for k in range(LUT_SIZE))
+
+
+def _direction_luts(calibration: ServoCalibration, clockwise: bool) -> Tuple[Tuple[float, ...], float]:
+    """(tabla de duraciones, ms por grado con el PWM saturado) de una dirección."""
+    c = calibration
+    points = c.velocity_cw if clockwise else c.velocity_ccw
+    if not points:
+        return duration_lut(c.ms_per_deg), float(c.ms_per_deg)
+    pwm = pwm_lut(c)[0 if clockwise else 1]
+    ms_per_deg = [_f32(1000 / velocity_at(points, p) * c.calibration_factor) for p in pwm]
+    lut = tuple(0.0 if k < MIN_MOVE_THRESHOLD * LUT_STEPS else _f32(_f32(k / LUT_STEPS) * ms_per_deg[k])
+                for k in range(LUT_SIZE))
+    return lut, ms_per_deg[-1]
+
+
+@lru_cache(maxsize=None)
+def servo_duration_luts(calibration: ServoCalibration):
+    """(DURATION_CW_LUT, MS_PER_DEG_CW, DURATION_CCW_LUT, MS_PER_DEG_CCW) de un servo."""
+    return _direction_luts(calibration, True) + _direction_luts(calibration, False)
+
+
+def lookup_duration_ms(lut: Sequence[float], ms_per_deg: float, angle_deg: float,
+                       calibration_factor: float) -> int:
+    """Duración en ms de un movimiento, como moveDuration() en el firmware."""
+    a = _f32(abs(angle_deg))
+    if a >= LUT_MAX_DEG:
+        ms = _f32(lut[-1] + _f32(_f32(a - LUT_MAX_DEG) * _f32(ms_per_deg)))
+    else:
+        ms = lut[lut_index(a)]
+    return int(_f32(ms * _f32(calibration_factor)))
+
+
+class ServoTables:
+    """
+    Tablas de todos los servos, en el orden de servo_settings.
+
+    Args:
+        calibrations: Calibración de cada servo
+        calibration_factor: calibrationFactor global con el que arranca el firmware
+    """
+
+    def __init__(self, calibrations: Sequence[ServoCalibration],
+                 calibration_factor: float = DEFAULT_CALIBRATION_FACTOR):
+        self.calibrations = list(calibrations)
+        self.calibration_factor = calibration_factor
+        luts = [pwm_lut(c) for c in self.calibrations]
+        self.pwm_cw = [cw for cw, _ in luts]
+        self.pwm_ccw = [ccw for _, ccw in luts]
+        durations = [servo_duration_luts(c) for c in self.calibrations]
+        self.durations_cw = [d[0] for d in durations]
+        self.ms_per_deg_cw = [d[1] for d in durations]
+        self.durations_ccw = [d[2] for d in durations]
+        self.ms_per_deg_ccw = [d[3] for d in durations]
+        self.ramp_ms = [_f32(c.ramp_ms) for c in self.calibrations]
+
+    @classmethod
+    def from_config(cls, config: "NeckConfig") -> "ServoTables":
+        """Tablas de una configuración de neck_config.load_config."""
+        return cls([ServoCalibration.from_settings(s) for s in config.servos], config.calibration_factor)
+
+    def __len__(self) -> int:
+        return len(self.calibrations)
+
+    def resized(self, num_servos: int) -> "ServoTables":
+        """Las mismas tablas con num_servos servos; los que faltan copian el último."""
+        calibrations = self.calibrations[:num_servos]
+        calibrations += [self.calibrations[-1]] * (num_servos - len(calibrations))
+        return ServoTables(calibrations, self.calibration_factor)
+
+    @property
+    def stop_pwm(self) -> List[int]:
+        return [c.stop_pwm for c in self.calibrations]
+
+    def pwm(self, idx: int, angle_deg: float) -> int:
+        """PWM de un movimiento, como calculatePWM() en el firmware."""
+        if abs(angle_deg) < MIN_MOVE_THRESHOLD:
+            return self.calibrations[idx].stop_pwm
+        lut = self.pwm_cw[idx] if angle_deg > 0 else self.pwm_ccw[idx]
+        return lut[lut_index(angle_deg)]
+
+    def duration_ms(self, idx: int, angle_deg: float, calibration_factor: Optional[float] = None) -> int:
+        """Duración de un movimiento, como moveDuration() en el firmware."""
+        if calibration_factor is None:
+            calibration_factor = self.calibration_factor
+        if angle_deg > 0:
+            return lookup_duration_ms(self.durations_cw[idx], self.ms_per_deg_cw[idx],
+                                      angle_deg, calibration_factor)
+        return lookup_duration_ms(self.durations_ccw[idx], self.ms_per_deg_ccw[idx],
+                                  angle_deg, calibration_factor)
+
+
+def _c_rows(values: Sequence, fmt: str, per_row: int) -> str:
+    return ',\n'.join('    ' + ', '.join(fmt % v for v in values[i:i + per_row])
+                      for i in range(0, len(values), per_row))
+
+
+def _c_table(rows: Sequence[Sequence], fmt: str, per_row: int) -> str:
+    return ',\n'.join('  {\n' + _c_rows(row, fmt, per_row) + '\n  }' for row in rows)
+
+
+def _c_floats(values: Sequence[float]) -> str:
+    return ', '.join('%.9g' % v for v in values)
+
+
+def firmware_constants(tables: ServoTables) -> dict:
+    """Constantes y tablas para renderizar en neck_core.h."""
+    return {
+        'LUT_STEPS': LUT_STEPS,
+        'LUT_MAX_DEG': LUT_MAX_DEG,
+        'LUT_SIZE': LUT_SIZE,
+        'CALIBRATION_FACTOR': '%g' % tables.calibration_factor,
+        'STOP_PWM': ', '.join(str(v) for v in tables.stop_pwm),
+        # %.9g da el mismo float de 32 bits al compilar
+        'MS_PER_DEG_CW': _c_floats(tables.ms_per_deg_cw),
+        'MS_PER_DEG_CCW': _c_floats(tables.ms_per_deg_ccw),
+        'RAMP_MS': _c_floats(tables.ramp_ms),
+        'PWM_CW_LUT': _c_table(tables.pwm_cw, '%d', 20),
+        'PWM_CCW_LUT': _c_table(tables.pwm_ccw, '%d', 20),
+        'DURATION_CW_LUT': _c_table(tables.durations_cw, '%.9g', 10),
+        'DURATION_CCW_LUT': _c_table(tables.durations_ccw, '%.9g', 10),
+    }